@@ -0,0 +1,59 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+from __future__ import absolute_import, annotations
+
+import argparse
+from typing import List
+
+from memex_logging.benchmark.message import generate_raw_messages, measure_time
+from memex_logging.ws.codec import JsonCodec, StdlibJsonCodec, OrjsonCodec
+
+
+def available_codecs() -> List[JsonCodec]:
+    """
+    :return: the codecs that can be used in the current environment
+    """
+
+    codecs = [StdlibJsonCodec()]
+    try:
+        codecs.append(OrjsonCodec())
+    except ImportError:
+        print("orjson is not installed, only the standard library is measured")
+    return codecs
+
+
+if __name__ == '__main__':
+
+    arg_parser = argparse.ArgumentParser(description="Measure the time taken by the JSON codecs to encode and decode batches of messages")
+    arg_parser.add_argument("-n", "--number_of_messages", type=int, default=1000, help="The number of messages of a batch")
+    arg_parser.add_argument("-r", "--repetitions", type=int, default=20, help="The number of executions of each measurement")
+    args = arg_parser.parse_args()
+
+    # a batch is encoded as the body of `POST /messages` and of the responses of `GET /messages`
+    batch = generate_raw_messages(args.number_of_messages)
+    encoded_batch = StdlibJsonCodec().dumps(batch)
+    timings = [
+        (codec, measure_time(lambda: codec.dumps(batch), args.repetitions), measure_time(lambda: codec.loads(encoded_batch), args.repetitions))
+        for codec in available_codecs()
+    ]
+
+    _, baseline_encoding_time, baseline_decoding_time = timings[0]
+    print(f"Batch of [{args.number_of_messages}] messages, {len(encoded_batch) / 1024:.0f} KiB")
+    for codec, encoding_time, decoding_time in timings:
+        print(f"  {codec.NAME}")
+        print(f"    encoding: {encoding_time * 1000:.2f} ms ({baseline_encoding_time / encoding_time:.1f}x)")
+        print(f"    decoding: {decoding_time * 1000:.2f} ms ({baseline_decoding_time / decoding_time:.1f}x)")
@@ -0,0 +1,196 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, annotations
+
+import argparse
+import gc
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import List, Callable, Iterator, Tuple
+
+from memex_logging.common.model.message import Message
+
+
+def generate_raw_messages(number_of_messages: int) -> List[dict]:
+    """
+    Generate the representations of requests, responses and notifications like the ones stored in Elasticsearch
+
+    :param int number_of_messages: the number of messages
+    :return: the representations of the messages
+    """
+
+    start = datetime(2021, 1, 22)
+    buttons = [{"type": "action", "buttonText": f"button {position}", "buttonId": f"button_id_{position}"} for position in range(3)]
+    raw_messages = []
+    for position in range(number_of_messages):
+        raw_message = {
+            "messageId": f"message_id_{position}",
+            "conversationId": f"conversation_id_{position // 10}",
+            "channel": "telegram",
+            "userId": f"user_id_{position % 100}",
+            "timestamp": (start + timedelta(seconds=position)).isoformat(),
+            "metadata": {"botVersion": "1.0.0"},
+            "project": "project"
+        }
+        if position % 3 == 0:
+            raw_message.update({
+                "type": "request",
+                "content": {"type": "text", "value": f"message {position}"},
+                "domain": "domain",
+                "intent": {"name": "intent", "confidence": 0.9},
+                "entities": [{"type": "@city", "value": "Trento", "confidence": 0.8}, {"type": "@date", "value": "today", "confidence": 0.7}],
+                "language": "en"
+            })
+        elif position % 3 == 1:
+            raw_message.update({
+                "type": "response",
+                "responseTo": f"message_id_{position - 1}",
+                "content": {"type": "text", "value": f"message {position}", "buttons": buttons}
+            })
+        else:
+            raw_message.update({
+                "type": "notification",
+                "content": {"type": "carousel", "cards": [{"title": "title", "imageUrl": None, "subtitle": None, "defaultAction": None, "buttons": buttons}]}
+            })
+        raw_messages.append(raw_message)
+
+    return raw_messages
+
+
+def _iter_model_objects(value) -> Iterator[object]:
+    if isinstance(value, list):
+        for item in value:
+            yield from _iter_model_objects(item)
+    elif hasattr(type(value), "__slots__"):
+        yield value
+        for slot in _slots(value):
+            yield from _iter_model_objects(getattr(value, slot))
+
+
+def _slots(value) -> List[str]:
+    return [slot for cls in type(value).__mro__ for slot in getattr(cls, "__slots__", ())]
+
+
+class _DictBacked:
+    pass
+
+
+def model_size(message: Message) -> int:
+    """
+    :param Message message: the message
+    :return: the number of bytes of the objects of the model making the message, excluding the values of their attributes
+    """
+    return sum(sys.getsizeof(value) for value in _iter_model_objects(message))
+
+
+def dict_backed_model_size(message: Message) -> int:
+    """
+    :param Message message: the message
+    :return: the number of bytes the objects of the model making the message would take if their attributes were stored in a dict
+    """
+
+    size = 0
+    for value in _iter_model_objects(message):
+        dict_backed = _DictBacked()
+        dict_backed.__dict__.update({slot: getattr(value, slot) for slot in _slots(value)})
+        size += sys.getsizeof(dict_backed) + sys.getsizeof(dict_backed.__dict__)
+    return size
+
+
+def _time_execution(function: Callable[[], object]) -> float:
+    # the garbage collector is disabled so that an execution does not pay for collecting the objects of the previous one
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        function()
+        return time.perf_counter() - start
+    finally:
+        gc.enable()
+
+
+def measure_time(function: Callable[[], object], repetitions: int) -> float:
+    """
+    :param Callable[[], object] function: the function to measure
+    :param int repetitions: the number of executions
+    :return: the minimum number of seconds taken by an execution
+    """
+
+    return min(_time_execution(function) for _ in range(repetitions))
+
+
+def compare_time(baseline: Callable[[], object], candidate: Callable[[], object], repetitions: int) -> Tuple[float, float, float]:
+    """
+    Measure two functions alternating their executions, so that both are affected in the same way by the load of the machine
+
+    :param Callable[[], object] baseline: the function to compare with
+    :param Callable[[], object] candidate: the function to measure
+    :param int repetitions: the number of executions of each function
+    :return: the minimum number of seconds taken by an execution of each function and the median of the fraction of time saved by the candidate in each pair of executions
+    """
+
+    baseline_timings = []
+    candidate_timings = []
+    for _ in range(repetitions):
+        baseline_timings.append(_time_execution(baseline))
+        candidate_timings.append(_time_execution(candidate))
+
+    saved = statistics.median(1 - candidate_timing / baseline_timing for baseline_timing, candidate_timing in zip(baseline_timings, candidate_timings))
+    return min(baseline_timings), min(candidate_timings), saved
+
+
+def measure_memory(function: Callable[[], object]) -> int:
+    """
+    :param Callable[[], object] function: the function building the objects to measure
+    :return: the number of bytes allocated by the function and still held by its result
+    """
+
+    tracemalloc.start()
+    result = function()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+
+if __name__ == '__main__':
+
+    arg_parser = argparse.ArgumentParser(description="Measure the time and the memory taken to build the messages from their representations")
+    arg_parser.add_argument("-n", "--number_of_messages", type=int, default=10000, help="The number of messages")
+    arg_parser.add_argument("-r", "--repetitions", type=int, default=20, help="The number of executions of each measurement")
+    args = arg_parser.parse_args()
+
+    raw_messages = generate_raw_messages(args.number_of_messages)
+
+    validated_time, trusted_time, saved = compare_time(
+        lambda: [Message.from_repr(raw_message) for raw_message in raw_messages],
+        lambda: [Message.from_repr(raw_message, trusted=True) for raw_message in raw_messages],
+        args.repetitions
+    )
+    print(f"Building [{args.number_of_messages}] messages")
+    print(f"  validated: {validated_time * 1000:.1f} ms")
+    print(f"  trusted:   {trusted_time * 1000:.1f} ms ({saved * 100:.0f}% saved, median of the paired executions)")
+
+    messages = [Message.from_repr(raw_message, trusted=True) for raw_message in raw_messages]
+    slotted_size = sum(model_size(message) for message in messages)
+    dict_backed_size = sum(dict_backed_model_size(message) for message in messages)
+    print(f"Memory of the model objects of [{args.number_of_messages}] messages")
+    print(f"  with slots:  {slotted_size / 1024:.0f} KiB")
+    print(f"  with dicts:  {dict_backed_size / 1024:.0f} KiB ({(1 - slotted_size / dict_backed_size) * 100:.0f}% saved)")
+    print(f"  allocated when building the messages, attribute values included: {measure_memory(lambda: [Message.from_repr(raw_message, trusted=True) for raw_message in raw_messages]) / 1024:.0f} KiB")
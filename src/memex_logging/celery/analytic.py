@@ -16,55 +16,202 @@ from __future__ import absolute_import, annotations
 
 import logging
 import os
-from typing import Optional
+from typing import Optional, List
 
+from celery import chord
+from celery.canvas import Signature
 from elasticsearch import Elasticsearch
-from wenet.interface.client import ApikeyClient
-from wenet.interface.wenet import WeNet
 
 from memex_logging.celery import celery
+from memex_logging.celery.clients import clients
 from memex_logging.common.computation.analytic import AnalyticComputation
-from memex_logging.common.dao.collector import DaoCollector
+from memex_logging.common.computation.incremental import IncrementalCountComputation
+from memex_logging.common.computation.rollup import RollupComputation
+from memex_logging.common.dao.common import DocumentNotFound
+from memex_logging.common.dao.daily_count import DailyCountDao
+from memex_logging.common.dao.first_seen import FirstSeenDao
+from memex_logging.common.dao.profile_snapshot import ProfileSnapshotDao
+from memex_logging.common.dao.rollup import MessageRollupDao
+from memex_logging.common.model.analytic.analytic import Analytic
 from memex_logging.common.model.analytic.time import FixedTimeWindow
 
 
 logger = logging.getLogger("logger.celery.analytic")
 
 
+def build_analytic_computation(es: Elasticsearch) -> AnalyticComputation:
+    """
+    Build the computation of the analytics configured by the environment, shared by the tasks and the evaluation of the analytics in the web service
+
+    :param Elasticsearch es: a connector for Elasticsearch
+    :return: the computation of the analytics
+    """
+
+    wenet_interface = clients.wenet_interface
+    cardinality_precision_threshold = int(os.getenv("CARDINALITY_PRECISION_THRESHOLD", 40000))
+    incremental_computation = None
+    if os.getenv("INCREMENTAL_COUNTS", "false").lower() == "true":
+        incremental_computation = IncrementalCountComputation(es, DailyCountDao(es), cardinality_precision_threshold=cardinality_precision_threshold,
+                                                             lookback_days=int(os.getenv("INCREMENTAL_COUNTS_LOOKBACK_DAYS", 2)))
+    rollup_computation = None
+    if os.getenv("MESSAGE_ROLLUPS", "false").lower() == "true":
+        rollup_computation = RollupComputation(MessageRollupDao(es))
+    return AnalyticComputation(es, wenet_interface, cardinality_precision_threshold=cardinality_precision_threshold,
+                               incremental_computation=incremental_computation, rollup_computation=rollup_computation,
+                               max_searches_per_request=int(os.getenv("ANALYTIC_SEARCHES_PER_REQUEST", 50)),
+                               first_seen_dao=FirstSeenDao(es) if os.getenv("FIRST_SEEN_REGISTRY", "false").lower() == "true" else None,
+                               wenet_task_counter=clients.wenet_task_counter, profile_fetcher=clients.profile_fetcher,
+                               profile_snapshot_dao=ProfileSnapshotDao(es) if os.getenv("PROFILE_SNAPSHOTS", "false").lower() == "true" else None)
+
+
 @celery.task(name='tasks.update_analytic')
-def update_analytic(analytic_id: str):
+def update_analytic(analytic_id: str, bump_version: bool = True):
     logger.info(f"Updating analytic with id [{analytic_id}]")
 
-    es = Elasticsearch([{'host': os.getenv("EL_HOST", "localhost"), 'port': int(os.getenv("EL_PORT", 9200))}], http_auth=(os.getenv("EL_USERNAME", None), os.getenv("EL_PASSWORD", None)))
-    dao_collector = DaoCollector.build_dao_collector(es)
+    es = clients.es
+    dao_collector = clients.dao_collector
     analytic = dao_collector.analytic.get(analytic_id)
 
-    client = ApikeyClient(os.getenv("APIKEY"))
-    wenet_interface = WeNet.build(client, platform_url=os.getenv("INSTANCE"))
-    analytic_computation = AnalyticComputation(es, wenet_interface, cardinality_precision_threshold=int(os.getenv("CARDINALITY_PRECISION_THRESHOLD", 40000)))
+    analytic_computation = build_analytic_computation(es)
     analytic.result = analytic_computation.get_result(analytic.descriptor)
     dao_collector.analytic.update(analytic)
+    if bump_version:
+        dao_collector.analytic.bump_version()
     logger.info(f"Result of analytic with id [{analytic_id}] updated")
 
 
+@celery.task(name='tasks.update_shared_analytic')
+def update_shared_analytic(analytic_ids: List[str], bump_version: bool = True):
+    logger.info(f"Updating analytics with ids {analytic_ids} sharing the same descriptor")
+
+    es = clients.es
+    dao_collector = clients.dao_collector
+    # the analytics deleted since the task was scheduled are skipped, the others still share the result
+    analytics = []
+    for analytic_id in analytic_ids:
+        try:
+            analytics.append(dao_collector.analytic.get(analytic_id))
+        except DocumentNotFound:
+            logger.info(f"Analytic with id [{analytic_id}] deleted before the update, it is skipped")
+    if len(analytics) == 0:
+        return
+
+    analytic_computation = build_analytic_computation(es)
+    result = analytic_computation.get_result(analytics[0].descriptor)
+    for analytic in analytics:
+        analytic.result = result
+        try:
+            dao_collector.analytic.update(analytic)
+        except DocumentNotFound:
+            logger.info(f"Analytic with id [{analytic.analytic_id}] deleted during the update, its result is discarded")
+    if bump_version:
+        dao_collector.analytic.bump_version()
+    logger.info(f"Result of analytics with ids {analytic_ids} updated")
+
+
+@celery.task(name='tasks.bump_analytic_version')
+def bump_analytic_version():
+    logger.info("Changing the version of the analytics")
+    clients.dao_collector.analytic.bump_version()
+
+
+def _build_update(analytics: List[Analytic]) -> Signature:
+    if len(analytics) == 1:
+        return update_analytic.si(analytics[0].analytic_id, bump_version=False)
+    else:
+        return update_shared_analytic.si([analytic.analytic_id for analytic in analytics], bump_version=False)
+
+
+def _schedule_updates(groups: List[List[Analytic]]) -> None:
+    """
+    Schedule a task for updating each group of analytics sharing the same descriptor.
+    The version of the analytics is changed once all the tasks are done, even if some of them fail, instead of after each task, so that the caches of the web service are not discarded continuously during the update.
+    """
+
+    if len(groups) == 0:
+        return
+
+    callback = bump_analytic_version.si()
+    callback.link_error(bump_analytic_version.si())
+    chord([_build_update(group) for group in groups])(callback)
+
+
 @celery.task(name='tasks.update_analytics')
-def update_analytics(time_window_type: Optional[str] = None):
+def update_analytics(time_window_type: Optional[str] = None) -> dict:
     logger.info(f"Updating {time_window_type if time_window_type is not None else 'all'} analytics")
-    es = Elasticsearch([{'host': os.getenv("EL_HOST", "localhost"), 'port': int(os.getenv("EL_PORT", 9200))}], http_auth=(os.getenv("EL_USERNAME", None), os.getenv("EL_PASSWORD", None)))
-    dao_collector = DaoCollector.build_dao_collector(es)
+    es = clients.es
+    dao_collector = clients.dao_collector
     analytics = dao_collector.analytic.list(time_window_type=time_window_type)
 
-    for analytic in analytics:
-        update_analytic.delay(analytic.analytic_id)
+    # the analytics with the same descriptor are computed once and share the result
+    groups = [[analytics[position] for position in positions] for positions in AnalyticComputation.group([analytic.descriptor for analytic in analytics])]
+
+    # the analytics computed with a single aggregation over the messages are computed together, one search for each project and time range, the others are updated by separate tasks
+    analytic_computation = build_analytic_computation(es)
+    planned_groups = []
+    scheduled_groups = []
+    for group in groups:
+        try:
+            query = analytic_computation.build_query(group[0].descriptor)
+        except ValueError:
+            query = None
+
+        if query is not None:
+            planned_groups.append(group)
+        else:
+            scheduled_groups.append(group)
+
+    updated_analytics = 0
+    try:
+        try:
+            outcomes = analytic_computation.get_results([group[0].descriptor for group in planned_groups])
+        except Exception as e:
+            logger.exception(f"Could not compute [{len(planned_groups)}] analytics together, they are updated separately", exc_info=e)
+            outcomes = [(None, e)] * len(planned_groups)
+
+        for group, (result, error) in zip(planned_groups, outcomes):
+            if error is not None:
+                scheduled_groups.append(group)
+                continue
+
+            for analytic in group:
+                analytic.result = result
+                # an analytic may be deleted while the update is running, the other results are written anyway
+                try:
+                    dao_collector.analytic.update(analytic)
+                    updated_analytics += 1
+                except DocumentNotFound:
+                    logger.info(f"Analytic with id [{analytic.analytic_id}] deleted during the update, its result is discarded")
+                except Exception as e:
+                    logger.exception(f"Could not store the result of analytic with id [{analytic.analytic_id}]", exc_info=e)
+
+        if updated_analytics > 0:
+            dao_collector.analytic.bump_version()
+    finally:
+        # the groups scheduled separately do not depend on the ones updated together
+        _schedule_updates(scheduled_groups)
+
+    report = {
+        "analytics": len(analytics),
+        "distinctDescriptors": len(groups),
+        "computationsSaved": len(analytics) - len(groups),
+        "updatedTogether": updated_analytics,
+        "scheduledTasks": len(scheduled_groups)
+    }
+    logger.info(f"Updated [{len(analytics)}] analytics with [{len(groups)}] distinct descriptors, saving [{report['computationsSaved']}] computations: "
+                f"[{updated_analytics}] updated together, [{len(scheduled_groups)}] tasks scheduled separately")
+    return report
 
 
 @celery.task(name='tasks.update_not_concluded_fixed_time_window_analytics')
 def update_not_concluded_fixed_time_window_analytics():
     logger.info(f"Updating not concluded fixed time window analytics")
-    es = Elasticsearch([{'host': os.getenv("EL_HOST", "localhost"), 'port': int(os.getenv("EL_PORT", 9200))}], http_auth=(os.getenv("EL_USERNAME", None), os.getenv("EL_PASSWORD", None)))
-    dao_collector = DaoCollector.build_dao_collector(es)
+    es = clients.es
+    dao_collector = clients.dao_collector
     analytics = dao_collector.analytic.list(time_window_type=FixedTimeWindow.type())
 
-    for analytic in analytics:
-        if analytic.result is None or (isinstance(analytic.descriptor.time_span, FixedTimeWindow) and analytic.descriptor.time_span.end > analytic.result.creation_datetime):
-            update_analytic.delay(analytic.analytic_id)
+    not_concluded_analytics = [
+        analytic for analytic in analytics
+        if analytic.result is None or (isinstance(analytic.descriptor.time_span, FixedTimeWindow) and analytic.descriptor.time_span.end > analytic.result.creation_datetime)
+    ]
+    _schedule_updates([[not_concluded_analytics[position] for position in positions] for positions in AnalyticComputation.group([analytic.descriptor for analytic in not_concluded_analytics])])
@@ -0,0 +1,158 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, annotations
+
+import logging
+import os
+from threading import Lock
+from typing import Optional
+
+from celery.signals import worker_process_init, worker_process_shutdown
+from elasticsearch import Elasticsearch
+from wenet.interface.client import ApikeyClient
+from wenet.interface.wenet import WeNet
+
+from memex_logging.common.cache import TTLCache
+from memex_logging.common.computation.profiles import ProfileFetcher
+from memex_logging.common.computation.wenet_tasks import WeNetTaskCounter
+from memex_logging.common.dao.collector import DaoCollector
+
+
+logger = logging.getLogger("logger.celery.clients")
+
+
+class ClientRegistry:
+    """
+    The clients shared by all the tasks executed by a worker process, so that the connections to Elasticsearch and WeNet are kept alive across the tasks instead of being opened by each task
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._es: Optional[Elasticsearch] = None
+        self._dao_collector: Optional[DaoCollector] = None
+        self._wenet_interface: Optional[WeNet] = None
+        self._wenet_task_counter: Optional[WeNetTaskCounter] = None
+        self._profile_fetcher: Optional[ProfileFetcher] = None
+
+    @property
+    def es(self) -> Elasticsearch:
+        with self._lock:
+            if self._es is None:
+                self._es = Elasticsearch(
+                    [{'host': os.getenv("EL_HOST", "localhost"), 'port': int(os.getenv("EL_PORT", 9200))}],
+                    http_auth=(os.getenv("EL_USERNAME", None), os.getenv("EL_PASSWORD", None)),
+                    maxsize=int(os.getenv("EL_POOL_SIZE", 10))
+                )
+            return self._es
+
+    @property
+    def dao_collector(self) -> DaoCollector:
+        es = self.es
+        with self._lock:
+            if self._dao_collector is None:
+                self._dao_collector = DaoCollector.build_dao_collector(es)
+            return self._dao_collector
+
+    @property
+    def wenet_interface(self) -> WeNet:
+        with self._lock:
+            if self._wenet_interface is None:
+                self._wenet_interface = WeNet.build(ApikeyClient(os.getenv("APIKEY")), platform_url=os.getenv("INSTANCE"))
+            return self._wenet_interface
+
+    @property
+    def wenet_task_counter(self) -> WeNetTaskCounter:
+        wenet_interface = self.wenet_interface
+        with self._lock:
+            if self._wenet_task_counter is None:
+                self._wenet_task_counter = WeNetTaskCounter(wenet_interface, max_workers=int(os.getenv("WENET_CONCURRENCY", 4)))
+            return self._wenet_task_counter
+
+    @property
+    def profile_fetcher(self) -> ProfileFetcher:
+        wenet_interface = self.wenet_interface
+        with self._lock:
+            if self._profile_fetcher is None:
+                self._profile_fetcher = ProfileFetcher(
+                    wenet_interface,
+                    cache=TTLCache(max_size=int(os.getenv("PROFILE_CACHE_SIZE", 10000)), ttl=float(os.getenv("PROFILE_CACHE_TTL", 3600))),
+                    max_workers=int(os.getenv("PROFILE_FETCH_CONCURRENCY", 8)),
+                    demographics_ttl=60
+                )
+            return self._profile_fetcher
+
+    def initialize(self) -> None:
+        """
+        Create the clients that have not been created yet
+        """
+
+        self.dao_collector
+        self.wenet_task_counter
+        self.profile_fetcher
+
+    def reset(self) -> None:
+        """
+        Forget the clients without closing them, to be used in a forked process where the connections of the parent process must not be reused
+        """
+
+        with self._lock:
+            self._es = None
+            self._dao_collector = None
+            self._wenet_interface = None
+            self._wenet_task_counter = None
+            self._profile_fetcher = None
+
+    def close(self) -> None:
+        """
+        Close the connections of the clients
+        """
+
+        with self._lock:
+            if self._es is not None:
+                try:
+                    self._es.transport.close()
+                except Exception as e:
+                    logger.warning("Could not close the connections to Elasticsearch", exc_info=e)
+            if self._wenet_task_counter is not None:
+                self._wenet_task_counter.close()
+            if self._profile_fetcher is not None:
+                self._profile_fetcher.close()
+            self._es = None
+            self._dao_collector = None
+            self._wenet_interface = None
+            self._wenet_task_counter = None
+            self._profile_fetcher = None
+
+
+clients = ClientRegistry()
+
+
+@worker_process_init.connect
+def init_worker_clients(**kwargs) -> None:
+    clients.reset()
+    try:
+        clients.initialize()
+    except Exception as e:
+        # the clients are created again by the first task using them
+        logger.warning(f"Could not initialize the clients of worker process [{os.getpid()}]", exc_info=e)
+        return
+    logger.debug(f"Initialized the clients of worker process [{os.getpid()}]")
+
+
+@worker_process_shutdown.connect
+def close_worker_clients(**kwargs) -> None:
+    clients.close()
+    logger.debug(f"Closed the clients of worker process [{os.getpid()}]")
@@ -14,11 +14,15 @@
 
 from __future__ import absolute_import, annotations
 
+import os
+
 from celery import Celery
 from celery.schedules import crontab
 
 from memex_logging.celery import celery
 from memex_logging.celery.analytic import update_analytics, update_not_concluded_fixed_time_window_analytics
+from memex_logging.celery.profile import sync_profile_snapshots
+from memex_logging.celery.rollup import update_message_rollups
 from memex_logging.common.model.analytic.time import MovingTimeWindow
 from memex_logging.ws.main import build_interface_from_env
 
@@ -30,6 +34,12 @@ celery.conf.timezone = 'Europe/Rome'
 
 @celery.on_after_configure.connect
 def setup_periodic_tasks(sender: Celery, **kwargs):
+    if os.getenv("MESSAGE_ROLLUPS", "false").lower() == "true":
+        # the rollups of the previous day are ready before the analytics are updated
+        sender.add_periodic_task(crontab(minute=0, hour=3), update_message_rollups.s())
+    if os.getenv("PROFILE_SNAPSHOTS", "false").lower() == "true":
+        # as the rollups, the snapshots of the profiles are refreshed before the analytics are updated
+        sender.add_periodic_task(crontab(minute=30, hour=3), sync_profile_snapshots.s())
     sender.add_periodic_task(crontab(minute=0, hour=4), update_analytics.s(time_window_type=MovingTimeWindow.type()))
     sender.add_periodic_task(crontab(minute=0, hour=4), update_not_concluded_fixed_time_window_analytics.s())
 
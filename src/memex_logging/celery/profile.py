@@ -0,0 +1,45 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, annotations
+
+import logging
+
+from memex_logging.celery import celery
+from memex_logging.celery.clients import clients
+from memex_logging.common.computation.profiles import ProfileSnapshotSynchronizer
+from memex_logging.common.dao.profile_snapshot import ProfileSnapshotDao
+from memex_logging.common.model.analytic.descriptor.segmentation import UserSegmentationDescriptor
+
+
+logger = logging.getLogger("logger.celery.profile")
+
+
+@celery.task(name='tasks.sync_profile_snapshots')
+def sync_profile_snapshots():
+    logger.info("Synchronizing profile snapshots")
+    es = clients.es
+    analytics = clients.dao_collector.analytic.list()
+
+    # only the profiles of the applications with an age or gender segmentation are needed
+    projects = sorted({analytic.descriptor.project for analytic in analytics if isinstance(analytic.descriptor, UserSegmentationDescriptor)})
+    synchronizer = ProfileSnapshotSynchronizer(clients.wenet_interface, ProfileSnapshotDao(es), profile_fetcher=clients.profile_fetcher)
+    for project in projects:
+        try:
+            synchronized = synchronizer.sync(project)
+        except Exception as e:
+            logger.exception(f"Could not synchronize the profile snapshots of project [{project}]", exc_info=e)
+            continue
+        logger.info(f"Synchronized [{synchronized}] profile snapshots of project [{project}]")
@@ -0,0 +1,35 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+import logging
+import os
+
+from memex_logging.celery import celery
+from memex_logging.celery.clients import clients
+from memex_logging.common.computation.rollup import MessageRollupBuilder
+from memex_logging.common.dao.rollup import MessageRollupDao
+
+
+logger = logging.getLogger("logger.celery.rollup")
+
+
+@celery.task(name='tasks.update_message_rollups')
+def update_message_rollups():
+    logger.info("Updating message rollups")
+    es = clients.es
+    rollup_builder = MessageRollupBuilder(es, MessageRollupDao(es), lookback_days=int(os.getenv("MESSAGE_ROLLUP_LOOKBACK_DAYS", 2)))
+    summarized_days = rollup_builder.update()
+    logger.info(f"Message rollups updated for [{summarized_days}] days")
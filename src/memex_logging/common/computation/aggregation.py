@@ -20,6 +20,8 @@ from typing import Optional
 
 from elasticsearch import Elasticsearch
 
+from memex_logging.common.computation.planner import AnalyticQuery, AnalyticQueryPlanner
+from memex_logging.common.index import IndexResolver
 from memex_logging.common.model.analytic.descriptor.aggregation import AggregationDescriptor
 from memex_logging.common.model.analytic.result.aggregation import AggregationResult
 from memex_logging.common.utils import Utils
@@ -30,401 +32,100 @@ logger = logging.getLogger("logger.common.analytic.aggregation")
 
 class AggregationComputation:
 
-    def __init__(self, es: Elasticsearch, cardinality_precision_threshold: int = 40000) -> None:
+    def __init__(self, es: Elasticsearch, cardinality_precision_threshold: int = 40000, index_resolver: Optional[IndexResolver] = None) -> None:
         self.es = es
         self.cardinality_precision_threshold = cardinality_precision_threshold
+        self.index_resolver = index_resolver if index_resolver is not None else IndexResolver(es)
+        self.planner = AnalyticQueryPlanner(es, index_resolver=self.index_resolver)
+
+    def build_query(self, analytic: AggregationDescriptor) -> AnalyticQuery:
+        """
+        Build the query computing the analytic with a single aggregation over the messages, so that it can be executed together with the ones of other analytics
+
+        :param AggregationDescriptor analytic: the descriptor of the analytic
+        :return: the query computing the analytic
+        :raise ValueError: when the type of aggregation is not recognized
+        """
 
-    def get_result(self, analytic: AggregationDescriptor) -> Optional[AggregationResult]:
         if analytic.aggregation.lower() == "max":
-            result = self._max(analytic)
+            query = self._max(analytic)
         elif analytic.aggregation.lower() == "min":
-            result = self._min(analytic)
+            query = self._min(analytic)
         elif analytic.aggregation.lower() == "avg":
-            result = self._avg(analytic)
+            query = self._avg(analytic)
         elif analytic.aggregation.lower() == "stats":
-            result = self._stats(analytic)
+            query = self._stats(analytic)
         elif analytic.aggregation.lower() == "sum":
-            result = self._sum(analytic)
+            query = self._sum(analytic)
         elif analytic.aggregation.lower() == "value_count":
-            result = self._value_count(analytic)
+            query = self._value_count(analytic)
         elif analytic.aggregation.lower() == "cardinality":
-            result = self._cardinality(analytic)
+            query = self._cardinality(analytic)
         elif analytic.aggregation.lower() == "extended_stats":
-            result = self._extended_stats(analytic)
+            query = self._extended_stats(analytic)
         elif analytic.aggregation.lower() == "percentiles":
-            result = self._percentiles(analytic)
+            query = self._percentiles(analytic)
         else:
             logger.info(f"Unrecognized type [{analytic.aggregation}] of aggregation")
             raise ValueError(f"Unrecognized type [{analytic.aggregation}] of aggregation")
 
-        return result
-
-    def _max(self, analytic: AggregationDescriptor) -> Optional[AggregationResult]:
-        min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        body = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "match": {
-                                "project.keyword": analytic.project
-                            }
-                        }
-                    ],
-                    "filter": [
-                        {
-                            "range": {
-                                "timestamp": {
-                                    "gte": min_bound.isoformat() if min_bound is not None else None,
-                                    "lte": max_bound.isoformat()
-                                }
-                            }
-                        }
-                    ]
-                }
-            },
-            "aggs": {
-                "type_count": {
-                    "max": {
-                        "field": analytic.field
-                    }
-                }
-            }
-        }
-
-        index = Utils.generate_index(data_type="message")
-        response = self.es.search(index=index, body=body, size=0)
-        value = None
-        if 'aggregations' in response and 'type_count' in response['aggregations'] and 'value' in response['aggregations']['type_count']:
-            value = response['aggregations']['type_count']['value']
-
-        return AggregationResult({"max": value}, datetime.now(), min_bound, max_bound) if value is not None else None
-
-    def _min(self, analytic: AggregationDescriptor) -> Optional[AggregationResult]:
-        min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        body = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "match": {
-                                "project.keyword": analytic.project
-                            }
-                        }
-                    ],
-                    "filter": [
-                        {
-                            "range": {
-                                "timestamp": {
-                                    "gte": min_bound.isoformat() if min_bound is not None else None,
-                                    "lte": max_bound.isoformat()
-                                }
-                            }
-                        }
-                    ]
-                }
-            },
-            "aggs": {
-                "type_count": {
-                    "min": {
-                        "field": analytic.field
-                    }
-                }
-            }
-        }
-
-        index = Utils.generate_index(data_type="message")
-        response = self.es.search(index=index, body=body, size=0)
-        value = None
-        if 'aggregations' in response and 'type_count' in response['aggregations'] and 'value' in response['aggregations']['type_count']:
-            value = response['aggregations']['type_count']['value']
+        return query
 
-        return AggregationResult({"min": value}, datetime.now(), min_bound, max_bound) if value is not None else None
+    def get_result(self, analytic: AggregationDescriptor) -> Optional[AggregationResult]:
+        return self.planner.execute(self.build_query(analytic))
 
-    def _avg(self, analytic: AggregationDescriptor) -> Optional[AggregationResult]:
+    @staticmethod
+    def _single_value_query(analytic: AggregationDescriptor, name: str, aggregation: dict) -> AnalyticQuery:
         min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        body = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "match": {
-                                "project.keyword": analytic.project
-                            }
-                        }
-                    ],
-                    "filter": [
-                        {
-                            "range": {
-                                "timestamp": {
-                                    "gte": min_bound.isoformat() if min_bound is not None else None,
-                                    "lte": max_bound.isoformat()
-                                }
-                            }
-                        }
-                    ]
-                }
-            },
-            "aggs": {
-                "type_count": {
-                    "avg": {
-                        "field": analytic.field
-                    }
-                }
-            }
-        }
-
-        index = Utils.generate_index(data_type="message")
-        response = self.es.search(index=index, body=body, size=0)
-        value = None
-        if 'aggregations' in response and 'type_count' in response['aggregations'] and 'value' in response['aggregations']['type_count']:
-            value = response['aggregations']['type_count']['value']
 
-        return AggregationResult({"avg": value}, datetime.now(), min_bound, max_bound) if value is not None else None
+        def parse(aggregations: dict) -> Optional[AggregationResult]:
+            value = None
+            if 'type_count' in aggregations and 'value' in aggregations['type_count']:
+                value = aggregations['type_count']['value']
 
-    def _cardinality(self, analytic: AggregationDescriptor) -> Optional[AggregationResult]:
-        min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        body = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "match": {
-                                "project.keyword": analytic.project
-                            }
-                        }
-                    ],
-                    "filter": [
-                        {
-                            "range": {
-                                "timestamp": {
-                                    "gte": min_bound.isoformat() if min_bound is not None else None,
-                                    "lte": max_bound.isoformat()
-                                }
-                            }
-                        }
-                    ]
-                }
-            },
-            "aggs": {
-                "type_count": {
-                    "cardinality": {
-                        "field": analytic.field,
-                        "precision_threshold": self.cardinality_precision_threshold
-                    }
-                }
-            }
-        }
+            return AggregationResult({name: value}, datetime.now(), min_bound, max_bound) if value is not None else None
 
-        index = Utils.generate_index(data_type="message")
-        response = self.es.search(index=index, body=body, size=0)
-        value = None
-        if 'aggregations' in response and 'type_count' in response['aggregations'] and 'value' in response['aggregations']['type_count']:
-            value = response['aggregations']['type_count']['value']
+        return AnalyticQuery(analytic.project, min_bound, max_bound, {"type_count": aggregation}, parse)
 
-        return AggregationResult({"cardinality": value}, datetime.now(), min_bound, max_bound) if value is not None else None
-
-    def _extended_stats(self, analytic: AggregationDescriptor) -> Optional[AggregationResult]:
+    @staticmethod
+    def _multi_value_query(analytic: AggregationDescriptor, aggregation: dict, values_key: Optional[str] = None) -> AnalyticQuery:
         min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        body = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "match": {
-                                "project.keyword": analytic.project
-                            }
-                        }
-                    ],
-                    "filter": [
-                        {
-                            "range": {
-                                "timestamp": {
-                                    "gte": min_bound.isoformat() if min_bound is not None else None,
-                                    "lte": max_bound.isoformat()
-                                }
-                            }
-                        }
-                    ]
-                }
-            },
-            "aggs": {
-                "type_count": {
-                    "extended_stats": {
-                        "field": analytic.field
-                    }
-                }
-            }
-        }
-
-        index = Utils.generate_index(data_type="message")
-        response = self.es.search(index=index, body=body, size=0)
-        value = None
-        if 'aggregations' in response and 'type_count' in response['aggregations']:
-            value = response['aggregations']['type_count']
 
-        return AggregationResult(value, datetime.now(), min_bound, max_bound) if value is not None else None
+        def parse(aggregations: dict) -> Optional[AggregationResult]:
+            value = None
+            if 'type_count' in aggregations:
+                if values_key is None:
+                    value = aggregations['type_count']
+                elif values_key in aggregations['type_count']:
+                    value = aggregations['type_count'][values_key]
 
-    def _percentiles(self, analytic: AggregationDescriptor) -> Optional[AggregationResult]:
-        min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        body = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "match": {
-                                "project.keyword": analytic.project
-                            }
-                        }
-                    ],
-                    "filter": [
-                        {
-                            "range": {
-                                "timestamp": {
-                                    "gte": min_bound.isoformat() if min_bound is not None else None,
-                                    "lte": max_bound.isoformat()
-                                }
-                            }
-                        }
-                    ]
-                }
-            },
-            "aggs": {
-                "type_count": {
-                    "percentiles": {
-                        "field": analytic.field
-                    }
-                }
-            }
-        }
+            return AggregationResult(value, datetime.now(), min_bound, max_bound) if value is not None else None
 
-        index = Utils.generate_index(data_type="message")
-        response = self.es.search(index=index, body=body, size=0)
-        value = None
-        if 'aggregations' in response and 'type_count' in response['aggregations'] and 'values' in response['aggregations']['type_count']:
-            value = response['aggregations']['type_count']['values']
+        return AnalyticQuery(analytic.project, min_bound, max_bound, {"type_count": aggregation}, parse)
 
-        return AggregationResult(value, datetime.now(), min_bound, max_bound) if value is not None else None
+    def _max(self, analytic: AggregationDescriptor) -> AnalyticQuery:
+        return self._single_value_query(analytic, "max", {"max": {"field": analytic.field}})
 
-    def _stats(self, analytic: AggregationDescriptor) -> Optional[AggregationResult]:
-        min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        body = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "match": {
-                                "project.keyword": analytic.project
-                            }
-                        }
-                    ],
-                    "filter": [
-                        {
-                            "range": {
-                                "timestamp": {
-                                    "gte": min_bound.isoformat() if min_bound is not None else None,
-                                    "lte": max_bound.isoformat()
-                                }
-                            }
-                        }
-                    ]
-                }
-            },
-            "aggs": {
-                "type_count": {
-                    "stats": {
-                        "field": analytic.field
-                    }
-                }
-            }
-        }
+    def _min(self, analytic: AggregationDescriptor) -> AnalyticQuery:
+        return self._single_value_query(analytic, "min", {"min": {"field": analytic.field}})
 
-        index = Utils.generate_index(data_type="message")
-        response = self.es.search(index=index, body=body, size=0)
-        value = None
-        if 'aggregations' in response and 'type_count' in response['aggregations']:
-            value = response['aggregations']['type_count']
+    def _avg(self, analytic: AggregationDescriptor) -> AnalyticQuery:
+        return self._single_value_query(analytic, "avg", {"avg": {"field": analytic.field}})
 
-        return AggregationResult(value, datetime.now(), min_bound, max_bound) if value is not None else None
+    def _cardinality(self, analytic: AggregationDescriptor) -> AnalyticQuery:
+        return self._single_value_query(analytic, "cardinality", {"cardinality": {"field": analytic.field, "precision_threshold": self.cardinality_precision_threshold}})
 
-    def _sum(self, analytic: AggregationDescriptor) -> Optional[AggregationResult]:
-        min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        body = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "match": {
-                                "project.keyword": analytic.project
-                            }
-                        }
-                    ],
-                    "filter": [
-                        {
-                            "range": {
-                                "timestamp": {
-                                    "gte": min_bound.isoformat() if min_bound is not None else None,
-                                    "lte": max_bound.isoformat()
-                                }
-                            }
-                        }
-                    ]
-                }
-            },
-            "aggs": {
-                "type_count": {
-                    "sum": {
-                        "field": analytic.field
-                    }
-                }
-            }
-        }
+    def _extended_stats(self, analytic: AggregationDescriptor) -> AnalyticQuery:
+        return self._multi_value_query(analytic, {"extended_stats": {"field": analytic.field}})
 
-        index = Utils.generate_index(data_type="message")
-        response = self.es.search(index=index, body=body, size=0)
-        value = None
-        if 'aggregations' in response and 'type_count' in response['aggregations'] and 'value' in response['aggregations']['type_count']:
-            value = response['aggregations']['type_count']['value']
+    def _percentiles(self, analytic: AggregationDescriptor) -> AnalyticQuery:
+        return self._multi_value_query(analytic, {"percentiles": {"field": analytic.field}}, values_key="values")
 
-        return AggregationResult({"sum": value}, datetime.now(), min_bound, max_bound) if value is not None else None
-
-    def _value_count(self, analytic: AggregationDescriptor) -> Optional[AggregationResult]:
-        min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        body = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "match": {
-                                "project.keyword": analytic.project
-                            }
-                        }
-                    ],
-                    "filter": [
-                        {
-                            "range": {
-                                "timestamp": {
-                                    "gte": min_bound.isoformat() if min_bound is not None else None,
-                                    "lte": max_bound.isoformat()
-                                }
-                            }
-                        }
-                    ]
-                }
-            },
-            "aggs": {
-                "type_count": {
-                    "sum": {
-                        "field": analytic.field
-                    }
-                }
-            }
-        }
+    def _stats(self, analytic: AggregationDescriptor) -> AnalyticQuery:
+        return self._multi_value_query(analytic, {"stats": {"field": analytic.field}})
 
-        index = Utils.generate_index(data_type="message")
-        response = self.es.search(index=index, body=body, size=0)
-        value = None
-        if 'aggregations' in response and 'type_count' in response['aggregations'] and 'value' in response['aggregations']['type_count']:
-            value = response['aggregations']['type_count']['value']
+    def _sum(self, analytic: AggregationDescriptor) -> AnalyticQuery:
+        return self._single_value_query(analytic, "sum", {"sum": {"field": analytic.field}})
 
-        return AggregationResult({"value_count": value}, datetime.now(), min_bound, max_bound) if value is not None else None
+    def _value_count(self, analytic: AggregationDescriptor) -> AnalyticQuery:
+        return self._single_value_query(analytic, "value_count", {"sum": {"field": analytic.field}})
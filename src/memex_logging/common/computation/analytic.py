@@ -14,20 +14,31 @@
 
 from __future__ import absolute_import, annotations
 
+import hashlib
+import json
 import logging
-from typing import Optional
+from typing import Optional, List, Tuple, Dict
 
 from elasticsearch import Elasticsearch
 from wenet.interface.wenet import WeNet
 
 from memex_logging.common.computation.aggregation import AggregationComputation
 from memex_logging.common.computation.count import CountComputation
+from memex_logging.common.computation.incremental import IncrementalCountComputation
+from memex_logging.common.computation.planner import AnalyticQuery, AnalyticQueryPlanner
+from memex_logging.common.computation.profiles import ProfileFetcher
+from memex_logging.common.computation.rollup import RollupComputation
 from memex_logging.common.computation.segmentation import SegmentationComputation
+from memex_logging.common.computation.wenet_tasks import WeNetTaskCounter
+from memex_logging.common.dao.first_seen import FirstSeenDao
+from memex_logging.common.dao.profile_snapshot import ProfileSnapshotDao
+from memex_logging.common.index import IndexResolver
 from memex_logging.common.model.analytic.descriptor.aggregation import AggregationDescriptor
 from memex_logging.common.model.analytic.descriptor.common import CommonAnalyticDescriptor
 from memex_logging.common.model.analytic.descriptor.count import CountDescriptor
 from memex_logging.common.model.analytic.descriptor.segmentation import SegmentationDescriptor
 from memex_logging.common.model.analytic.result.common import CommonAnalyticResult
+from memex_logging.common.utils import Utils
 
 
 logger = logging.getLogger("logger.common.analytic.analytic")
@@ -35,22 +46,100 @@ logger = logging.getLogger("logger.common.analytic.analytic")
 
 class AnalyticComputation:
 
-    def __init__(self, es: Elasticsearch, wenet_interface: WeNet, cardinality_precision_threshold: int = 40000) -> None:
+    def __init__(self, es: Elasticsearch, wenet_interface: WeNet, cardinality_precision_threshold: int = 40000, index_resolver: Optional[IndexResolver] = None,
+                 incremental_computation: Optional[IncrementalCountComputation] = None, rollup_computation: Optional[RollupComputation] = None,
+                 max_searches_per_request: int = 50, first_seen_dao: Optional[FirstSeenDao] = None, wenet_task_counter: Optional[WeNetTaskCounter] = None,
+                 profile_fetcher: Optional[ProfileFetcher] = None, profile_snapshot_dao: Optional[ProfileSnapshotDao] = None) -> None:
         self.es = es
         self.wenet_interface = wenet_interface
         self.cardinality_precision_threshold = cardinality_precision_threshold
+        self.index_resolver = index_resolver if index_resolver is not None else IndexResolver(es)
+        self.incremental_computation = incremental_computation
+        self.rollup_computation = rollup_computation
+        self.first_seen_dao = first_seen_dao
+        self.wenet_task_counter = wenet_task_counter if wenet_task_counter is not None else WeNetTaskCounter(wenet_interface)
+        self.profile_fetcher = profile_fetcher if profile_fetcher is not None else ProfileFetcher(wenet_interface)
+        self.profile_snapshot_dao = profile_snapshot_dao
+        self.planner = AnalyticQueryPlanner(es, index_resolver=self.index_resolver, max_searches_per_request=max_searches_per_request)
+
+    @staticmethod
+    def build_key(analytic: CommonAnalyticDescriptor) -> str:
+        """
+        Build the key shared by the descriptors having the same result: the time span of the descriptor is replaced by the time range it currently resolves to, so that for example `7D` and `1W` have the same key
+
+        :param CommonAnalyticDescriptor analytic: the descriptor of the analytic
+        :return: the canonical key of the descriptor
+        :raise ValueError: when the time span of the descriptor can not be resolved
+        """
+
+        min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
+        raw_descriptor = analytic.to_repr()
+        raw_descriptor.pop('timespan', None)
+        canonical_repr = json.dumps({
+            "descriptor": raw_descriptor,
+            "bounds": [min_bound.isoformat() if min_bound is not None else None, max_bound.isoformat()]
+        }, sort_keys=True)
+        return hashlib.sha256(canonical_repr.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def group(cls, analytics: List[CommonAnalyticDescriptor]) -> List[List[int]]:
+        """
+        Group the descriptors having the same result, so that each group is computed once
+
+        :param List[CommonAnalyticDescriptor] analytics: the descriptors of the analytics
+        :return: the positions of the descriptors of each group, the descriptors whose time span can not be resolved are left alone
+        """
+
+        groups: Dict[str, List[int]] = {}
+        for position, analytic in enumerate(analytics):
+            try:
+                key = cls.build_key(analytic)
+            except ValueError:
+                key = f"position:{position}"
+            groups.setdefault(key, []).append(position)
+        return list(groups.values())
+
+    def build_query(self, analytic: CommonAnalyticDescriptor) -> Optional[AnalyticQuery]:
+        """
+        Build the query computing the analytic with a single aggregation over the messages, so that it can be executed together with the ones of other analytics
+
+        :param CommonAnalyticDescriptor analytic: the descriptor of the analytic
+        :return: the query computing the analytic, `None` if the analytic is not computed with a single aggregation over the messages
+        """
+
+        if isinstance(analytic, CountDescriptor):
+            count_computation = CountComputation(self.es, self.wenet_interface, self.cardinality_precision_threshold, index_resolver=self.index_resolver, incremental_computation=self.incremental_computation, rollup_computation=self.rollup_computation,
+                                                 first_seen_dao=self.first_seen_dao, wenet_task_counter=self.wenet_task_counter)
+            query = count_computation.build_query(analytic)
+
+        elif isinstance(analytic, SegmentationDescriptor):
+            segmentation_computation = SegmentationComputation(self.es, self.wenet_interface, index_resolver=self.index_resolver, rollup_computation=self.rollup_computation,
+                                                               profile_fetcher=self.profile_fetcher, profile_snapshot_dao=self.profile_snapshot_dao)
+            query = segmentation_computation.build_query(analytic)
+
+        elif isinstance(analytic, AggregationDescriptor):
+            aggregation_computation = AggregationComputation(self.es, self.cardinality_precision_threshold, index_resolver=self.index_resolver)
+            query = aggregation_computation.build_query(analytic)
+
+        else:
+            logger.info(f"Unrecognized class of AnalyticDescriptor [{type(analytic)}]")
+            raise ValueError(f"Unrecognized class of AnalyticDescriptor [{type(analytic)}]")
+
+        return query
 
     def get_result(self, analytic: CommonAnalyticDescriptor) -> Optional[CommonAnalyticResult]:
         if isinstance(analytic, CountDescriptor):
-            count_computation = CountComputation(self.es, self.wenet_interface, self.cardinality_precision_threshold)
+            count_computation = CountComputation(self.es, self.wenet_interface, self.cardinality_precision_threshold, index_resolver=self.index_resolver, incremental_computation=self.incremental_computation, rollup_computation=self.rollup_computation,
+                                                 first_seen_dao=self.first_seen_dao, wenet_task_counter=self.wenet_task_counter)
             result = count_computation.get_result(analytic)
 
         elif isinstance(analytic, SegmentationDescriptor):
-            segmentation_computation = SegmentationComputation(self.es, self.wenet_interface)
+            segmentation_computation = SegmentationComputation(self.es, self.wenet_interface, index_resolver=self.index_resolver, rollup_computation=self.rollup_computation,
+                                                               profile_fetcher=self.profile_fetcher, profile_snapshot_dao=self.profile_snapshot_dao)
             result = segmentation_computation.get_result(analytic)
 
         elif isinstance(analytic, AggregationDescriptor):
-            aggregation_computation = AggregationComputation(self.es, self.cardinality_precision_threshold)
+            aggregation_computation = AggregationComputation(self.es, self.cardinality_precision_threshold, index_resolver=self.index_resolver)
             result = aggregation_computation.get_result(analytic)
 
         else:
@@ -58,3 +147,36 @@ class AnalyticComputation:
             raise ValueError(f"Unrecognized class of AnalyticDescriptor [{type(analytic)}]")
 
         return result
+
+    def get_results(self, analytics: List[CommonAnalyticDescriptor]) -> List[Tuple[Optional[CommonAnalyticResult], Optional[Exception]]]:
+        """
+        Compute a set of analytics, the ones computed with a single aggregation over the messages are executed together in multi search requests while the others are computed one by one
+
+        :param List[CommonAnalyticDescriptor] analytics: the descriptors of the analytics
+        :return: for each analytic, in the same order, a tuple with its result and the error occurred (`None` when the computation succeeded)
+        """
+
+        outcomes: List[Tuple[Optional[CommonAnalyticResult], Optional[Exception]]] = [(None, None)] * len(analytics)
+        planned_positions = []
+        queries = []
+        for position, analytic in enumerate(analytics):
+            try:
+                query = self.build_query(analytic)
+            except Exception as e:
+                outcomes[position] = (None, e)
+                continue
+
+            if query is not None:
+                planned_positions.append(position)
+                queries.append(query)
+            else:
+                try:
+                    outcomes[position] = (self.get_result(analytic), None)
+                except Exception as e:
+                    logger.exception(f"Could not compute analytic [{analytic.to_repr()}]", exc_info=e)
+                    outcomes[position] = (None, e)
+
+        for position, outcome in zip(planned_positions, self.planner.execute_all(queries)):
+            outcomes[position] = outcome
+
+        return outcomes
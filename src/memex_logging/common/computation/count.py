@@ -16,10 +16,18 @@ from __future__ import absolute_import, annotations
 
 import logging
 from datetime import datetime
+from typing import Optional, List
 
 from elasticsearch import Elasticsearch
 from wenet.interface.wenet import WeNet
 
+from memex_logging.common.computation.incremental import IncrementalCountComputation
+from memex_logging.common.computation.planner import AnalyticQuery, AnalyticQueryPlanner
+from memex_logging.common.computation.rollup import RollupComputation
+from memex_logging.common.computation.wenet_tasks import WeNetTaskCounter
+from memex_logging.common.dao.first_seen import FirstSeenDao
+from memex_logging.common.dao.message import MessageDao
+from memex_logging.common.index import IndexResolver
 from memex_logging.common.model.analytic.descriptor.count import CountDescriptor, UserCountDescriptor, \
     MessageCountDescriptor, TaskCountDescriptor, TransactionCountDescriptor, ConversationCountDescriptor, \
     DialogueCountDescriptor, BotCountDescriptor
@@ -32,39 +40,76 @@ logger = logging.getLogger("logger.common.analytic.analytic")
 
 class CountComputation:
 
-    def __init__(self, es: Elasticsearch, wenet_interface: WeNet, cardinality_precision_threshold: int = 40000) -> None:
+    # the number of buckets retrieved by each page of a composite aggregation
+    COMPOSITE_PAGE_SIZE = 10000
+
+    def __init__(self, es: Elasticsearch, wenet_interface: WeNet, cardinality_precision_threshold: int = 40000, index_resolver: Optional[IndexResolver] = None,
+                 incremental_computation: Optional[IncrementalCountComputation] = None, rollup_computation: Optional[RollupComputation] = None,
+                 first_seen_dao: Optional[FirstSeenDao] = None, wenet_task_counter: Optional[WeNetTaskCounter] = None) -> None:
         self.es = es
         self.wenet_interface = wenet_interface
         self.cardinality_precision_threshold = cardinality_precision_threshold
+        self.index_resolver = index_resolver if index_resolver is not None else IndexResolver(es)
+        self.incremental_computation = incremental_computation
+        self.rollup_computation = rollup_computation
+        self.first_seen_dao = first_seen_dao
+        self.wenet_task_counter = wenet_task_counter if wenet_task_counter is not None else WeNetTaskCounter(wenet_interface)
+        self.planner = AnalyticQueryPlanner(es, index_resolver=self.index_resolver)
+
+    def build_query(self, analytic: CountDescriptor) -> Optional[AnalyticQuery]:
+        """
+        Build the query computing the analytic with a single aggregation over the messages, so that it can be executed together with the ones of other analytics
+
+        :param CountDescriptor analytic: the descriptor of the analytic
+        :return: the query computing the analytic, `None` if the analytic is not computed with a single aggregation over the messages
+        """
+
+        if self.rollup_computation is not None and self.rollup_computation.supports(analytic):
+            return None
+        if self.incremental_computation is not None and self.incremental_computation.supports(analytic):
+            return None
+        return self._build_query(analytic)
+
+    def _build_query(self, analytic: CountDescriptor) -> Optional[AnalyticQuery]:
+        query_builders = {
+            (UserCountDescriptor.DIMENSION, "total"): self._total_users,
+            (UserCountDescriptor.DIMENSION, "active"): self._active_users,
+            (UserCountDescriptor.DIMENSION, "engaged"): self._engaged_users,
+            (MessageCountDescriptor.DIMENSION, "requests"): self._request_messages,
+            (MessageCountDescriptor.DIMENSION, "responses"): self._response_messages,
+            (MessageCountDescriptor.DIMENSION, "notifications"): self._notification_messages,
+            (ConversationCountDescriptor.DIMENSION, "total"): self._total_conversations,
+            (DialogueCountDescriptor.DIMENSION, "fallback"): self._fallback,
+            (DialogueCountDescriptor.DIMENSION, "intents"): self._intents,
+            (DialogueCountDescriptor.DIMENSION, "domains"): self._domains,
+            (BotCountDescriptor.DIMENSION, "response"): self._bot_response,
+        }
+        query_builder = query_builders.get((analytic.dimension, analytic.metric.lower()))
+        return query_builder(analytic) if query_builder is not None else None
 
     def get_result(self, analytic: CountDescriptor) -> CountResult:
-        if isinstance(analytic, UserCountDescriptor):
-            if analytic.metric.lower() == "total":
-                result = self._total_users(analytic)
-            elif analytic.metric.lower() == "active":
-                result = self._active_users(analytic)
-            elif analytic.metric.lower() == "engaged":
-                result = self._engaged_users(analytic)
-            elif analytic.metric.lower() == "new":
+        if self.rollup_computation is not None and self.rollup_computation.supports(analytic):
+            result = self.rollup_computation.get_result(analytic)
+            if result is not None:
+                return result
+
+        query = self._build_query(analytic)
+        if self.incremental_computation is not None and self.incremental_computation.supports(analytic):
+            result = self.incremental_computation.get_result(analytic)
+
+        elif query is not None:
+            result = self.planner.execute(query)
+
+        elif isinstance(analytic, UserCountDescriptor):
+            if analytic.metric.lower() == "new":
                 result = self._new_users(analytic)
             else:
                 logger.info(f"Unknown value for metric [{analytic.metric}] for UserCountDescriptor")
                 raise ValueError(f"Unknown value for metric [{analytic.metric}] for UserCountDescriptor")
 
         elif isinstance(analytic, MessageCountDescriptor):
-            if analytic.metric.lower() == "requests":
-                result = self._request_messages(analytic)
-            # elif analytic.metric.lower() == "from_bot":
-            #     result = self._bot_messages(analytic)
-            elif analytic.metric.lower() == "responses":
-                result = self._response_messages(analytic)
-            elif analytic.metric.lower() == "notifications":
-                result = self._notification_messages(analytic)
-            # elif analytic.metric.lower() == "unhandled":
-            #     result = self._unhandled_messages(analytic)
-            else:
-                logger.info(f"Unknown value for metric [{analytic.metric}] for MessageCountDescriptor")
-                raise ValueError(f"Unknown value for metric [{analytic.metric}] for MessageCountDescriptor")
+            logger.info(f"Unknown value for metric [{analytic.metric}] for MessageCountDescriptor")
+            raise ValueError(f"Unknown value for metric [{analytic.metric}] for MessageCountDescriptor")
 
         elif isinstance(analytic, TaskCountDescriptor):
             if analytic.metric.lower() == "total":
@@ -91,9 +136,7 @@ class CountComputation:
                 raise ValueError(f"Unknown value for metric [{analytic.metric}] for TransactionCountDescriptor")
 
         elif isinstance(analytic, ConversationCountDescriptor):
-            if analytic.metric.lower() == "total":
-                result = self._total_conversations(analytic)
-            elif analytic.metric.lower() == "new":
+            if analytic.metric.lower() == "new":
                 result = self._new_conversations(analytic)
             # elif analytic.metric.lower() == "length":
             #     result = self._length_conversations(analytic)
@@ -104,22 +147,12 @@ class CountComputation:
                 raise ValueError(f"Unknown value for metric [{analytic.metric}] for ConversationCountDescriptor")
 
         elif isinstance(analytic, DialogueCountDescriptor):
-            if analytic.metric.lower() == "fallback":
-                result = self._fallback(analytic)
-            elif analytic.metric.lower() == "intents":
-                result = self._intents(analytic)
-            elif analytic.metric.lower() == "domains":
-                result = self._domains(analytic)
-            else:
-                logger.info(f"Unknown value for metric [{analytic.metric}] for DialogueCountDescriptor")
-                raise ValueError(f"Unknown value for metric [{analytic.metric}] for DialogueCountDescriptor")
+            logger.info(f"Unknown value for metric [{analytic.metric}] for DialogueCountDescriptor")
+            raise ValueError(f"Unknown value for metric [{analytic.metric}] for DialogueCountDescriptor")
 
         elif isinstance(analytic, BotCountDescriptor):
-            if analytic.metric.lower() == "response":
-                result = self._bot_response(analytic)
-            else:
-                logger.info(f"Unknown value for metric [{analytic.metric}] for BotCountDescriptor")
-                raise ValueError(f"Unknown value for metric [{analytic.metric}] for BotCountDescriptor")
+            logger.info(f"Unknown value for metric [{analytic.metric}] for BotCountDescriptor")
+            raise ValueError(f"Unknown value for metric [{analytic.metric}] for BotCountDescriptor")
 
         else:
             logger.info(f"Unrecognized class of CountDescriptor [{type(analytic)}]")
@@ -127,151 +160,51 @@ class CountComputation:
 
         return result
 
-    def _total_users(self, analytic: UserCountDescriptor) -> CountResult:
+    def _first_seen_registry_count(self, analytic: CountDescriptor, entry_type: str) -> CountResult:
         min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        body = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "match": {
-                                "project.keyword": analytic.project
-                            }
-                        }
-                    ],
-                    "filter": [
-                        {
-                            "range": {
-                                "timestamp": {
-                                    "gte": min_bound.isoformat() if min_bound is not None else None,
-                                    "lte": max_bound.isoformat()
-                                }
-                            }
-                        }
-                    ]
-                }
-            },
-            "aggs": {
-                "type_count": {
-                    "cardinality": {
-                        "field": "userId.keyword",
-                        "precision_threshold": self.cardinality_precision_threshold
-                    }
-                }
-            }
-        }
-
-        index = Utils.generate_index(data_type="message")
-        response = self.es.search(index=index, body=body, size=0)
-        number_of_users = 0
-        if 'aggregations' in response and 'type_count' in response['aggregations'] and 'value' in response['aggregations']['type_count']:
-            number_of_users = response['aggregations']['type_count']['value']
+        return CountResult(self.first_seen_dao.count(analytic.project, entry_type, min_bound, max_bound), datetime.now(), min_bound, max_bound)
 
-        return CountResult(number_of_users, datetime.now(), min_bound, max_bound)
+    def _first_seen_count(self, analytic: CountDescriptor, field: str) -> CountResult:
+        """
+        Count the values of a field whose first message falls in the time range of the analytic.
+        The values of the messages sent up to the end of the range are paged with a composite aggregation, a value is new when none of its messages was sent before the range, so the count is exact whatever the number of values.
+        """
 
-    def _active_users(self, analytic: UserCountDescriptor) -> CountResult:
         min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        body = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "match": {
-                                "type.keyword": "request"
-                            }
-                        },
-                        {
-                            "match": {
-                                "project.keyword": analytic.project
+        composite_aggregation = {
+            "composite": {
+                "size": self.COMPOSITE_PAGE_SIZE,
+                "sources": [
+                    {
+                        "value": {
+                            "terms": {
+                                "field": field
                             }
                         }
-                    ],
-                    "filter": [
-                        {
-                            "range": {
-                                "timestamp": {
-                                    "gte": min_bound.isoformat() if min_bound is not None else None,
-                                    "lte": max_bound.isoformat()
-                                }
-                            }
-                        }
-                    ]
-                }
-            },
-            "aggs": {
-                "type_count": {
-                    "cardinality": {
-                        "field": "userId.keyword",
-                        "precision_threshold": self.cardinality_precision_threshold
                     }
-                }
+                ]
             }
         }
-
-        index = Utils.generate_index(data_type="message")
-        response = self.es.search(index=index, body=body, size=0)
-        number_of_users = 0
-        if 'aggregations' in response and 'type_count' in response['aggregations'] and 'value' in response['aggregations']['type_count']:
-            number_of_users = response['aggregations']['type_count']['value']
-
-        return CountResult(number_of_users, datetime.now(), min_bound, max_bound)
-
-    def _engaged_users(self, analytic: UserCountDescriptor) -> CountResult:
-        min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        body = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "match": {
-                                "type.keyword": "notification"
-                            }
-                        },
-                        {
-                            "match": {
-                                "project.keyword": analytic.project
-                            }
-                        }
-                    ],
-                    "filter": [
-                        {
-                            "range": {
-                                "timestamp": {
-                                    "gte": min_bound.isoformat() if min_bound is not None else None,
-                                    "lte": max_bound.isoformat()
-                                }
+        if min_bound is not None:
+            composite_aggregation["aggs"] = {
+                "before": {
+                    "filter": {
+                        "range": {
+                            "timestamp": {
+                                "lt": min_bound.isoformat()
                             }
                         }
-                    ]
-                }
-            },
-            "aggs": {
-                "type_count": {
-                    "cardinality": {
-                        "field": "userId.keyword",
-                        "precision_threshold": self.cardinality_precision_threshold
                     }
                 }
             }
-        }
-
-        index = Utils.generate_index(data_type="message")
-        response = self.es.search(index=index, body=body, size=0)
-        number_of_users = 0
-        if 'aggregations' in response and 'type_count' in response['aggregations'] and 'value' in response['aggregations']['type_count']:
-            number_of_users = response['aggregations']['type_count']['value']
-
-        return CountResult(number_of_users, datetime.now(), min_bound, max_bound)
 
-    def _new_users(self, analytic: UserCountDescriptor) -> CountResult:
-        min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
         body = {
             "query": {
                 "bool": {
                     "must": [
                         {
                             "match": {
-                                "project.keyword": analytic.project
+                                "project": analytic.project
                             }
                         }
                     ],
@@ -279,7 +212,6 @@ class CountComputation:
                         {
                             "range": {
                                 "timestamp": {
-                                    "gte": min_bound.isoformat() if min_bound is not None else None,
                                     "lte": max_bound.isoformat()
                                 }
                             }
@@ -288,123 +220,62 @@ class CountComputation:
                 }
             },
             "aggs": {
-                "terms_count": {
-                    "terms": {
-                        "field": "userId.keyword",
-                        "size": 65535
-                    }
-                }
+                "first_seen": composite_aggregation
             }
         }
 
-        index = Utils.generate_index(data_type="message")
-        response = self.es.search(index=index, body=body, size=0)
-        users_in_period = []
-        if 'aggregations' in response and 'terms_count' in response['aggregations'] and 'buckets' in response['aggregations']['terms_count']:
-            for item in response['aggregations']['terms_count']['buckets']:
-                users_in_period.append(item['key'])
+        index = self.index_resolver.resolve(MessageDao.BASE_INDEX, None, max_bound)
+        total_new = 0
+        while True:
+            response = self.es.search(index=index, body=body, size=0)
+            first_seen = response.get('aggregations', {}).get('first_seen', {})
+            buckets = first_seen.get('buckets', [])
+            for bucket in buckets:
+                if min_bound is None or bucket['before']['doc_count'] == 0:
+                    total_new += 1
 
-        if 'aggregations' in response and 'terms_count' in response['aggregations'] and 'sum_other_doc_count' in response['aggregations']['terms_count']:
-            if response['aggregations']['terms_count']['sum_other_doc_count'] != 0:
-                logger.warning("The number of buckets is limited at `65535` but the number of users is higher")
+            if len(buckets) < self.COMPOSITE_PAGE_SIZE or 'after_key' not in first_seen:
+                break
+            composite_aggregation["composite"]["after"] = first_seen['after_key']
 
-        users_in_period = set(users_in_period)
+        return CountResult(total_new, datetime.now(), min_bound, max_bound)
 
-        users_out_period = []
-        if min_bound is not None:
-            body = {
-                "query": {
-                    "bool": {
-                        "must": [
-                            {
-                                "match": {
-                                    "project.keyword": analytic.project
-                                }
-                            }
-                        ],
-                        "filter": [
-                            {
-                                "range": {
-                                    "timestamp": {
-                                        "lt": min_bound.isoformat()
-                                    }
-                                }
-                            }
-                        ]
-                    }
-                },
-                "aggs": {
-                    "terms_count": {
-                        "terms": {
-                            "field": "userId.keyword",
-                            "size": 65535
-                        }
-                    }
+    def _cardinality_query(self, analytic: CountDescriptor, field: str, filters: Optional[List[dict]] = None) -> AnalyticQuery:
+        min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
+        aggs = {
+            "type_count": {
+                "cardinality": {
+                    "field": field,
+                    "precision_threshold": self.cardinality_precision_threshold
                 }
             }
+        }
 
-            index = Utils.generate_index(data_type="message")
-            response = self.es.search(index=index, body=body, size=0)
-            if 'aggregations' in response and 'terms_count' in response['aggregations'] and 'buckets' in response['aggregations']['terms_count']:
-                for item in response['aggregations']['terms_count']['buckets']:
-                    users_out_period.append(item['key'])
+        def parse(aggregations: dict) -> CountResult:
+            value = 0
+            if 'type_count' in aggregations and 'value' in aggregations['type_count']:
+                value = aggregations['type_count']['value']
 
-            if 'aggregations' in response and 'terms_count' in response['aggregations'] and 'sum_other_doc_count' in response['aggregations']['terms_count']:
-                if response['aggregations']['terms_count']['sum_other_doc_count'] != 0:
-                    logger.warning("The number of buckets is limited at `65535` but the number of users is higher")
+            return CountResult(value, datetime.now(), min_bound, max_bound)
 
-        users_out_period = set(users_out_period)
+        return AnalyticQuery(analytic.project, min_bound, max_bound, aggs, parse, filters=filters)
 
-        final_users = users_in_period - users_out_period
+    def _total_users(self, analytic: UserCountDescriptor) -> AnalyticQuery:
+        return self._cardinality_query(analytic, "userId")
 
-        return CountResult(len(final_users), datetime.now(), min_bound, max_bound)
+    def _active_users(self, analytic: UserCountDescriptor) -> AnalyticQuery:
+        return self._cardinality_query(analytic, "userId", filters=[{"match": {"type": "request"}}])
 
-    def _request_messages(self, analytic: MessageCountDescriptor) -> CountResult:
-        min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        body = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "match": {
-                                    "type.keyword": "request"
-                            }
-                        },
-                        {
-                            "match": {
-                                "project.keyword": analytic.project
-                            }
-                        }
-                    ],
-                    "filter": [
-                        {
-                            "range": {
-                                "timestamp": {
-                                    "gte": min_bound.isoformat() if min_bound is not None else None,
-                                    "lte": max_bound.isoformat()
-                                }
-                            }
-                        }
-                    ]
-                }
-            },
-            "aggs": {
-                "type_count": {
-                    "cardinality": {
-                        "field": "messageId.keyword",
-                        "precision_threshold": self.cardinality_precision_threshold
-                    }
-                }
-            }
-        }
+    def _engaged_users(self, analytic: UserCountDescriptor) -> AnalyticQuery:
+        return self._cardinality_query(analytic, "userId", filters=[{"match": {"type": "notification"}}])
 
-        index = Utils.generate_index(data_type="message")
-        response = self.es.search(index=index, body=body, size=0)
-        total_counter = 0
-        if 'aggregations' in response and 'type_count' in response['aggregations'] and 'value' in response['aggregations']['type_count']:
-            total_counter = response['aggregations']['type_count']['value']
+    def _new_users(self, analytic: UserCountDescriptor) -> CountResult:
+        if self.first_seen_dao is not None:
+            return self._first_seen_registry_count(analytic, FirstSeenDao.USER)
+        return self._first_seen_count(analytic, "userId")
 
-        return CountResult(total_counter, datetime.now(), min_bound, max_bound)
+    def _request_messages(self, analytic: MessageCountDescriptor) -> AnalyticQuery:
+        return self._cardinality_query(analytic, "messageId", filters=[{"match": {"type": "request"}}])
 
     # def _bot_messages(self, analytic: MessageCountDescriptor) -> CountResult:
     #     min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
@@ -414,12 +285,12 @@ class CountComputation:
     #                 "must": [
     #                     {
     #                         "match": {
-    #                             "type.keyword": "response"
+    #                             "type": "response"
     #                         }
     #                     },
     #                     {
     #                         "match": {
-    #                             "project.keyword": analytic.project
+    #                             "project": analytic.project
     #                         }
     #                     }
     #                 ],
@@ -438,7 +309,7 @@ class CountComputation:
     #         "aggs": {
     #             "type_count": {
     #                 "cardinality": {
-    #                     "field": "messageId.keyword",
+    #                     "field": "messageId",
     #                     "precision_threshold": self.cardinality_precision_threshold
     #                 }
     #             }
@@ -457,12 +328,12 @@ class CountComputation:
     #                 "must": [
     #                     {
     #                         "match": {
-    #                             "type.keyword": "notification"
+    #                             "type": "notification"
     #                         }
     #                     },
     #                     {
     #                         "match": {
-    #                             "project.keyword": analytic.project
+    #                             "project": analytic.project
     #                         }
     #                     }
     #                 ],
@@ -481,7 +352,7 @@ class CountComputation:
     #         "aggs": {
     #             "type_count": {
     #                 "cardinality": {
-    #                     "field": "messageId.keyword",
+    #                     "field": "messageId",
     #                     "precision_threshold": self.cardinality_precision_threshold
     #                 }
     #             }
@@ -495,99 +366,11 @@ class CountComputation:
     #
     #     return CountResult(total_len, datetime.now(), min_bound, max_bound)
 
-    def _response_messages(self, analytic: MessageCountDescriptor) -> CountResult:
-        min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        body = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "match": {
-                                "type.keyword": "response"
-                            }
-                        },
-                        {
-                            "match": {
-                                "project.keyword": analytic.project
-                            }
-                        }
-                    ],
-                    "filter": [
-                        {
-                            "range": {
-                                "timestamp": {
-                                    "gte": min_bound.isoformat() if min_bound is not None else None,
-                                    "lte": max_bound.isoformat()
-                                }
-                            }
-                        }
-                    ]
-                }
-            },
-            "aggs": {
-                "type_count": {
-                    "cardinality": {
-                        "field": "messageId.keyword",
-                        "precision_threshold": self.cardinality_precision_threshold
-                    }
-                }
-            }
-        }
-
-        index = Utils.generate_index(data_type="message")
-        response = self.es.search(index=index, body=body, size=0)
-        total_counter = 0
-        if 'aggregations' in response and 'type_count' in response['aggregations'] and 'value' in response['aggregations']['type_count']:
-            total_counter = response['aggregations']['type_count']['value']
-
-        return CountResult(total_counter, datetime.now(), min_bound, max_bound)
-
-    def _notification_messages(self, analytic: MessageCountDescriptor) -> CountResult:
-        min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        body = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "match": {
-                                "type.keyword": "notification"
-                            }
-                        },
-                        {
-                            "match": {
-                                "project.keyword": analytic.project
-                            }
-                        }
-                    ],
-                    "filter": [
-                        {
-                            "range": {
-                                "timestamp": {
-                                    "gte": min_bound.isoformat() if min_bound is not None else None,
-                                    "lte": max_bound.isoformat()
-                                }
-                            }
-                        }
-                    ]
-                }
-            },
-            "aggs": {
-                "type_count": {
-                    "cardinality": {
-                        "field": "messageId.keyword",
-                        "precision_threshold": self.cardinality_precision_threshold
-                    }
-                }
-            }
-        }
-
-        index = Utils.generate_index(data_type="message")
-        response = self.es.search(index=index, body=body, size=0)
-        total_counter = 0
-        if 'aggregations' in response and 'type_count' in response['aggregations'] and 'value' in response['aggregations']['type_count']:
-            total_counter = response['aggregations']['type_count']['value']
+    def _response_messages(self, analytic: MessageCountDescriptor) -> AnalyticQuery:
+        return self._cardinality_query(analytic, "messageId", filters=[{"match": {"type": "response"}}])
 
-        return CountResult(total_counter, datetime.now(), min_bound, max_bound)
+    def _notification_messages(self, analytic: MessageCountDescriptor) -> AnalyticQuery:
+        return self._cardinality_query(analytic, "messageId", filters=[{"match": {"type": "notification"}}])
 
     # def _unhandled_messages(self, analytic: MessageCountDescriptor) -> CountResult:
     #     min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
@@ -597,12 +380,12 @@ class CountComputation:
     #                 "must": [
     #                     {
     #                         "match": {
-    #                             "handled.keyword": True
+    #                             "handled": True
     #                         }
     #                     },
     #                     {
     #                         "match": {
-    #                             "project.keyword": analytic.project
+    #                             "project": analytic.project
     #                         }
     #                     }
     #                 ],
@@ -621,7 +404,7 @@ class CountComputation:
     #         "aggs": {
     #             "type_count": {
     #                 "cardinality": {
-    #                     "field": "messageId.keyword",
+    #                     "field": "messageId",
     #                     "precision_threshold": self.cardinality_precision_threshold
     #                 }
     #             }
@@ -645,11 +428,12 @@ class CountComputation:
         * the number of tasks closed in the time range.
         """
         min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        tasks = []
-        tasks.extend(self.wenet_interface.task_manager.get_all_tasks(app_id=analytic.project, creation_to=max_bound, has_close_ts=False))
-        tasks.extend(self.wenet_interface.task_manager.get_all_tasks(app_id=analytic.project, creation_to=max_bound, has_close_ts=True, closed_from=max_bound))
-        tasks.extend(self.wenet_interface.task_manager.get_all_tasks(app_id=analytic.project, has_close_ts=True, closed_from=min_bound, closed_to=max_bound))
-        return CountResult(len(tasks), datetime.now(), min_bound, max_bound)
+        total_tasks = self.wenet_task_counter.sum_task_counts([
+            dict(app_id=analytic.project, creation_to=max_bound, has_close_ts=False),
+            dict(app_id=analytic.project, creation_to=max_bound, has_close_ts=True, closed_from=max_bound),
+            dict(app_id=analytic.project, has_close_ts=True, closed_from=min_bound, closed_to=max_bound)
+        ])
+        return CountResult(total_tasks, datetime.now(), min_bound, max_bound)
 
     def _new_tasks(self, analytic: TaskCountDescriptor) -> CountResult:
         """
@@ -657,8 +441,8 @@ class CountComputation:
         The computation of this count is the number of tasks created in the time range.
         """
         min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        tasks = self.wenet_interface.task_manager.get_all_tasks(app_id=analytic.project, creation_from=min_bound, creation_to=max_bound)
-        return CountResult(len(tasks), datetime.now(), min_bound, max_bound)
+        total_tasks = self.wenet_task_counter.count_tasks(app_id=analytic.project, creation_from=min_bound, creation_to=max_bound)
+        return CountResult(total_tasks, datetime.now(), min_bound, max_bound)
 
     def _new_active_tasks(self, analytic: TaskCountDescriptor) -> CountResult:
         """
@@ -668,10 +452,11 @@ class CountComputation:
         * the number of tasks created in the time range that has been closed after the end of the time range.
         """
         min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        tasks = []
-        tasks.extend(self.wenet_interface.task_manager.get_all_tasks(app_id=analytic.project, creation_from=min_bound, creation_to=max_bound, has_close_ts=False))
-        tasks.extend(self.wenet_interface.task_manager.get_all_tasks(app_id=analytic.project, creation_from=min_bound, creation_to=max_bound, has_close_ts=True, closed_from=max_bound))
-        return CountResult(len(tasks), datetime.now(), min_bound, max_bound)
+        total_tasks = self.wenet_task_counter.sum_task_counts([
+            dict(app_id=analytic.project, creation_from=min_bound, creation_to=max_bound, has_close_ts=False),
+            dict(app_id=analytic.project, creation_from=min_bound, creation_to=max_bound, has_close_ts=True, closed_from=max_bound)
+        ])
+        return CountResult(total_tasks, datetime.now(), min_bound, max_bound)
 
     def _active_tasks(self, analytic: TaskCountDescriptor) -> CountResult:
         """
@@ -681,10 +466,11 @@ class CountComputation:
         * the number of tasks created up to the end of the time range that are closed after the end of the time range.
         """
         min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        tasks = []
-        tasks.extend(self.wenet_interface.task_manager.get_all_tasks(app_id=analytic.project, creation_to=max_bound, has_close_ts=False))
-        tasks.extend(self.wenet_interface.task_manager.get_all_tasks(app_id=analytic.project, creation_to=max_bound, has_close_ts=True, closed_from=max_bound))
-        return CountResult(len(tasks), datetime.now(), min_bound, max_bound)
+        total_tasks = self.wenet_task_counter.sum_task_counts([
+            dict(app_id=analytic.project, creation_to=max_bound, has_close_ts=False),
+            dict(app_id=analytic.project, creation_to=max_bound, has_close_ts=True, closed_from=max_bound)
+        ])
+        return CountResult(total_tasks, datetime.now(), min_bound, max_bound)
 
     def _new_closed_tasks(self, analytic: TaskCountDescriptor) -> CountResult:
         """
@@ -692,8 +478,8 @@ class CountComputation:
         The computation of this count is the number of tasks created in the time range that has been closed in that time range.
         """
         min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        tasks = self.wenet_interface.task_manager.get_all_tasks(app_id=analytic.project, creation_from=min_bound, creation_to=max_bound, has_close_ts=True, closed_to=max_bound)
-        return CountResult(len(tasks), datetime.now(), min_bound, max_bound)
+        total_tasks = self.wenet_task_counter.count_tasks(app_id=analytic.project, creation_from=min_bound, creation_to=max_bound, has_close_ts=True, closed_to=max_bound)
+        return CountResult(total_tasks, datetime.now(), min_bound, max_bound)
 
     def _closed_tasks(self, analytic: TaskCountDescriptor) -> CountResult:
         """
@@ -701,8 +487,8 @@ class CountComputation:
         The computation of this count is the number of tasks closed up to the end of a certain time range.
         """
         min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        tasks = self.wenet_interface.task_manager.get_all_tasks(app_id=analytic.project, has_close_ts=True, closed_to=max_bound)
-        return CountResult(len(tasks), datetime.now(), min_bound, max_bound)
+        total_tasks = self.wenet_task_counter.count_tasks(app_id=analytic.project, has_close_ts=True, closed_to=max_bound)
+        return CountResult(total_tasks, datetime.now(), min_bound, max_bound)
 
     def _total_transactions(self, analytic: TransactionCountDescriptor) -> CountResult:
         """
@@ -711,146 +497,16 @@ class CountComputation:
         Optionally if specified a task identifier the transactions are only relative to that task.
         """
         min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        transactions = self.wenet_interface.task_manager.get_all_transactions(app_id=analytic.project, creation_from=min_bound, creation_to=max_bound,  task_id=analytic.task_id)
-        return CountResult(len(transactions), datetime.now(), min_bound, max_bound)
+        total_transactions = self.wenet_task_counter.count_transactions(app_id=analytic.project, creation_from=min_bound, creation_to=max_bound, task_id=analytic.task_id)
+        return CountResult(total_transactions, datetime.now(), min_bound, max_bound)
 
-    def _total_conversations(self, analytic: ConversationCountDescriptor) -> CountResult:
-        min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        body = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "match": {
-                                "project.keyword": analytic.project
-                            }
-                        }
-                    ],
-                    "filter": [
-                        {
-                            "range": {
-                                "timestamp": {
-                                    "gte": min_bound.isoformat() if min_bound is not None else None,
-                                    "lte": max_bound.isoformat()
-                                }
-                            }
-                        }
-                    ]
-                }
-            },
-            "aggs": {
-                "type_count": {
-                    "cardinality": {
-                        "field": "conversationId.keyword",
-                        "precision_threshold": self.cardinality_precision_threshold
-                    }
-                }
-            }
-        }
-
-        index = Utils.generate_index(data_type="message")
-        response = self.es.search(index=index, body=body, size=0)
-        total_len = 0
-        if 'aggregations' in response and 'type_count' in response['aggregations'] and 'value' in response['aggregations']['type_count']:
-            total_len = response['aggregations']['type_count']['value']
-
-        return CountResult(total_len, datetime.now(), min_bound, max_bound)
+    def _total_conversations(self, analytic: ConversationCountDescriptor) -> AnalyticQuery:
+        return self._cardinality_query(analytic, "conversationId")
 
     def _new_conversations(self, analytic: ConversationCountDescriptor) -> CountResult:
-        min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        body = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "match": {
-                                "project.keyword": analytic.project
-                            }
-                        }
-                    ],
-                    "filter": [
-                        {
-                            "range": {
-                                "timestamp": {
-                                    "gte": min_bound.isoformat() if min_bound is not None else None,
-                                    "lte": max_bound.isoformat()
-                                }
-                            }
-                        }
-                    ]
-                }
-            },
-            "aggs": {
-                "terms_count": {
-                    "terms": {
-                        "field": "conversationId.keyword",
-                        "size": 65535
-                    }
-                }
-            }
-        }
-
-        index = Utils.generate_index(data_type="message")
-        response = self.es.search(index=index, body=body, size=0)
-        conv_in_period = []
-        if 'aggregations' in response and 'terms_count' in response['aggregations'] and 'buckets' in response['aggregations']['terms_count']:
-            for item in response['aggregations']['terms_count']['buckets']:
-                conv_in_period.append(item['key'])
-
-        if 'aggregations' in response and 'terms_count' in response['aggregations'] and 'sum_other_doc_count' in response['aggregations']['terms_count']:
-            if response['aggregations']['terms_count']['sum_other_doc_count'] != 0:
-                logger.warning("The number of buckets is limited at `65535` but the number of conversations is higher")
-
-        conv_in_period = set(conv_in_period)
-
-        conv_out_period = []
-        if min_bound is not None:
-            body = {
-                "query": {
-                    "bool": {
-                        "must": [
-                            {
-                                "match": {
-                                    "project.keyword": analytic.project
-                                }
-                            }
-                        ],
-                        "filter": [
-                            {
-                                "range": {
-                                    "timestamp": {
-                                        "lt": min_bound.isoformat()
-                                    }
-                                }
-                            }
-                        ]
-                    }
-                },
-                "aggs": {
-                    "terms_count": {
-                        "terms": {
-                            "field": "conversationId.keyword",
-                            "size": 65535
-                        }
-                    }
-                }
-            }
-
-            index = Utils.generate_index(data_type="message")
-            response = self.es.search(index=index, body=body, size=0)
-            if 'aggregations' in response and 'terms_count' in response['aggregations'] and 'buckets' in response['aggregations']['terms_count']:
-                for item in response['aggregations']['terms_count']['buckets']:
-                    conv_out_period.append(item['key'])
-
-            if 'aggregations' in response and 'terms_count' in response['aggregations'] and 'sum_other_doc_count' in response['aggregations']['terms_count']:
-                if response['aggregations']['terms_count']['sum_other_doc_count'] != 0:
-                    logger.warning("The number of buckets is limited at `65535` but the number of conversations is higher")
-
-        conv_out_period = set(conv_out_period)
-
-        final_conv = conv_in_period - conv_out_period
-
-        return CountResult(len(final_conv), datetime.now(), min_bound, max_bound)
+        if self.first_seen_dao is not None:
+            return self._first_seen_registry_count(analytic, FirstSeenDao.CONVERSATION)
+        return self._first_seen_count(analytic, "conversationId")
 
     # def _length_conversations(self, analytic: ConversationCountDescriptor) -> ConversationLengthCountResult:
     #     min_bound, max_bound = Utils.extract_range_timestamps(analytic.timespan)
@@ -860,7 +516,7 @@ class CountComputation:
     #                 "must": [
     #                     {
     #                         "match": {
-    #                             "project.keyword": analytic.project
+    #                             "project": analytic.project
     #                         }
     #                     }
     #                 ],
@@ -879,7 +535,7 @@ class CountComputation:
     #         "aggs": {
     #             "terms_count": {
     #                 "terms": {
-    #                     "field": "conversationId.keyword",
+    #                     "field": "conversationId",
     #                     "size": 65535
     #                 }
     #             }
@@ -909,7 +565,7 @@ class CountComputation:
     #                 "must": [
     #                     {
     #                         "match": {
-    #                             "project.keyword": analytic.project
+    #                             "project": analytic.project
     #                         }
     #                     }
     #                 ],
@@ -928,7 +584,7 @@ class CountComputation:
     #         "aggs": {
     #             "terms_count": {
     #                 "terms": {
-    #                     "field": "conversationId.keyword",
+    #                     "field": "conversationId",
     #                     "size": 65535
     #                 }
     #             }
@@ -956,12 +612,12 @@ class CountComputation:
     #                     "must": [
     #                         {
     #                             "match": {
-    #                                 "conversationId.keyword": item
+    #                                 "conversationId": item
     #                             }
     #                         },
     #                         {
     #                             "match": {
-    #                                 "project.keyword": analytic.project
+    #                                 "project": analytic.project
     #                             }
     #                         }
     #                     ],
@@ -980,7 +636,7 @@ class CountComputation:
     #             "aggs": {
     #                 "terms_count": {
     #                     "terms": {
-    #                         "field": "messageId.keyword",
+    #                         "field": "messageId",
     #                         "size": 65535
     #                     }
     #                 }
@@ -1002,181 +658,37 @@ class CountComputation:
     #
     #     return ConversationPathCountResult(len(paths), paths, datetime.now(), min_bound, max_bound)
 
-    def _fallback(self, analytic: DialogueCountDescriptor) -> CountResult:
-        min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        body = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "match": {
-                                "intent.keyword": "default"
-                            }
-                        },
-                        {
-                            "match": {
-                                "project.keyword": analytic.project
-                            }
-                        }
-                    ],
-                    "filter": [
-                        {
-                            "range": {
-                                "timestamp": {
-                                    "gte": min_bound.isoformat() if min_bound is not None else None,
-                                    "lte": max_bound.isoformat()
-                                }
-                            }
-                        }
-                    ]
-                }
-            },
-            "aggs": {
-                "type_count": {
-                    "cardinality": {
-                        "field": "messageId.keyword",
-                        "precision_threshold": self.cardinality_precision_threshold
-                    }
-                }
-            }
-        }
+    def _fallback(self, analytic: DialogueCountDescriptor) -> AnalyticQuery:
+        return self._cardinality_query(analytic, "messageId", filters=[{"match": {"intent.name": "default"}}])
 
-        index = Utils.generate_index(data_type="message")
-        response = self.es.search(index=index, body=body, size=0)
-        total_missed = 0
-        if 'aggregations' in response and 'type_count' in response['aggregations'] and 'value' in response['aggregations']['type_count']:
-            total_missed = response['aggregations']['type_count']['value']
+    def _intents(self, analytic: DialogueCountDescriptor) -> AnalyticQuery:
+        return self._cardinality_query(analytic, "intent.name")
 
-        return CountResult(total_missed, datetime.now(), min_bound, max_bound)
+    def _domains(self, analytic: DialogueCountDescriptor) -> AnalyticQuery:
+        return self._cardinality_query(analytic, "domain")
 
-    def _intents(self, analytic: DialogueCountDescriptor) -> CountResult:
+    def _bot_response(self, analytic: BotCountDescriptor) -> AnalyticQuery:
         min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        body = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "match": {
-                                "project.keyword": analytic.project
-                            }
-                        }
-                    ],
-                    "filter": [
-                        {
-                            "range": {
-                                "timestamp": {
-                                    "gte": min_bound.isoformat() if min_bound is not None else None,
-                                    "lte": max_bound.isoformat()
-                                }
-                            }
-                        }
-                    ]
-                }
-            },
-            "aggs": {
-                "type_count": {
-                    "cardinality": {
-                        "field": "intent.keyword",
-                        "precision_threshold": self.cardinality_precision_threshold
-                    }
+        aggs = {
+            "terms_count": {
+                "terms": {
+                    "field": "userId",
+                    "size": 65535
                 }
             }
         }
 
-        index = Utils.generate_index(data_type="message")
-        response = self.es.search(index=index, body=body, size=0)
-        value = 0
-        if 'aggregations' in response and 'type_count' in response['aggregations'] and 'value' in response['aggregations']['type_count']:
-            value = response['aggregations']['type_count']['value']
-
-        return CountResult(value, datetime.now(), min_bound, max_bound)
+        def parse(aggregations: dict) -> CountResult:
+            total_not_working = 0
+            if 'terms_count' in aggregations and 'buckets' in aggregations['terms_count']:
+                for item in aggregations['terms_count']['buckets']:
+                    if item['doc_count'] == 1:
+                        total_not_working = total_not_working + 1
 
-    def _domains(self, analytic: DialogueCountDescriptor) -> CountResult:
-        min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        body = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "match": {
-                                "project.keyword": analytic.project
-                            }
-                        }
-                    ],
-                    "filter": [
-                        {
-                            "range": {
-                                "timestamp": {
-                                    "gte": min_bound.isoformat() if min_bound is not None else None,
-                                    "lte": max_bound.isoformat()
-                                }
-                            }
-                        }
-                    ]
-                }
-            },
-            "aggs": {
-                "type_count": {
-                    "cardinality": {
-                        "field": "domain.keyword",
-                        "precision_threshold": self.cardinality_precision_threshold
-                    }
-                }
-            }
-        }
-
-        index = Utils.generate_index(data_type="message")
-        response = self.es.search(index=index, body=body, size=0)
-        value = 0
-        if 'aggregations' in response and 'type_count' in response['aggregations'] and 'value' in response['aggregations']['type_count']:
-            value = response['aggregations']['type_count']['value']
-
-        return CountResult(value, datetime.now(), min_bound, max_bound)
-
-    def _bot_response(self, analytic: BotCountDescriptor) -> CountResult:
-        min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        body = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "match": {
-                                "project.keyword": analytic.project
-                            }
-                        }
-                    ],
-                    "filter": [
-                        {
-                            "range": {
-                                "timestamp": {
-                                    "gte": min_bound.isoformat() if min_bound is not None else None,
-                                    "lte": max_bound.isoformat()
-                                }
-                            }
-                        }
-                    ]
-                }
-            },
-            "aggs": {
-                "terms_count": {
-                    "terms": {
-                        "field": "userId.keyword",
-                        "size": 65535
-                    }
-                }
-            }
-        }
-
-        index = Utils.generate_index(data_type="message")
-        response = self.es.search(index=index, body=body, size=0)
-        total_not_working = 0
-        if 'aggregations' in response and 'terms_count' in response['aggregations'] and 'buckets' in response['aggregations']['terms_count']:
-            for item in response['aggregations']['terms_count']['buckets']:
-                if item['doc_count'] == 1:
-                    total_not_working = total_not_working + 1
+            if 'terms_count' in aggregations and 'sum_other_doc_count' in aggregations['terms_count']:
+                if aggregations['terms_count']['sum_other_doc_count'] != 0:
+                    logger.warning("The number of buckets is limited at `65535` but the number of users is higher")
 
-        if 'aggregations' in response and 'terms_count' in response['aggregations'] and 'sum_other_doc_count' in response['aggregations']['terms_count']:
-            if response['aggregations']['terms_count']['sum_other_doc_count'] != 0:
-                logger.warning("The number of buckets is limited at `65535` but the number of users is higher")
+            return CountResult(total_not_working, datetime.now(), min_bound, max_bound)
 
-        return CountResult(total_not_working, datetime.now(), min_bound, max_bound)
+        return AnalyticQuery(analytic.project, min_bound, max_bound, aggs, parse)
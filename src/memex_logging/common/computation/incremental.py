@@ -0,0 +1,208 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+import logging
+from datetime import datetime, date, timedelta, timezone
+from typing import Optional, Dict, Tuple
+
+from elasticsearch import Elasticsearch
+
+from memex_logging.common.dao.daily_count import DailyCountDao
+from memex_logging.common.dao.message import MessageDao
+from memex_logging.common.index import IndexResolver
+from memex_logging.common.model.analytic.descriptor.count import CountDescriptor, MessageCountDescriptor, DialogueCountDescriptor
+from memex_logging.common.model.analytic.result.count import CountResult
+from memex_logging.common.utils import Utils
+
+
+logger = logging.getLogger("logger.common.analytic.incremental")
+
+
+class IncrementalCountComputation:
+    """
+    Compute the additive count metrics as the sum of their daily counts.
+    The daily counts of the days already concluded are stored, so that each computation only queries the messages of the days that have not been counted yet.
+    The counts created within `lookback_days` days from the end of their day are computed again, so that they include the messages stored late.
+    """
+
+    # the additional condition on the messages counted by each additive metric, identified by dimension and metric
+    METRIC_FILTERS: Dict[Tuple[str, str], dict] = {
+        (MessageCountDescriptor.DIMENSION, "requests"): {"match": {"type": "request"}},
+        (MessageCountDescriptor.DIMENSION, "responses"): {"match": {"type": "response"}},
+        (MessageCountDescriptor.DIMENSION, "notifications"): {"match": {"type": "notification"}},
+        (DialogueCountDescriptor.DIMENSION, "fallback"): {"match": {"intent.name": "default"}},
+    }
+
+    def __init__(self, es: Elasticsearch, daily_count_dao: DailyCountDao, cardinality_precision_threshold: int = 40000, index_resolver: Optional[IndexResolver] = None,
+                 lookback_days: int = 2) -> None:
+        self.es = es
+        self.daily_count_dao = daily_count_dao
+        self.cardinality_precision_threshold = cardinality_precision_threshold
+        self.index_resolver = index_resolver if index_resolver is not None else IndexResolver(es)
+        self.lookback_days = lookback_days
+
+    @classmethod
+    def supports(cls, analytic: CountDescriptor) -> bool:
+        """
+        :param CountDescriptor analytic: the descriptor of the analytic
+        :return: `True` if the metric of the analytic can be computed incrementally
+        """
+        return (analytic.dimension, analytic.metric) in cls.METRIC_FILTERS
+
+    def get_result(self, analytic: CountDescriptor) -> CountResult:
+        if not self.supports(analytic):
+            logger.info(f"The metric [{analytic.metric}] for dimension [{analytic.dimension}] can not be computed incrementally")
+            raise ValueError(f"The metric [{analytic.metric}] for dimension [{analytic.dimension}] can not be computed incrementally")
+
+        result_min_bound, result_max_bound = Utils.extract_range_timestamps(analytic.time_span)
+        # the bounds with an offset are converted to naive datetimes in UTC, the convention Elasticsearch applies to the timestamps without an offset
+        min_bound = self._to_utc(result_min_bound) if result_min_bound is not None else None
+        max_bound = self._to_utc(result_max_bound)
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+        # the range is split in the days entirely included in it and already concluded, that are counted day by day, and the remaining edges that are counted directly
+        if min_bound is not None:
+            first_day = self._ceil_day(min_bound)
+        else:
+            first_message_datetime = self._first_message_datetime(analytic, max_bound)
+            if first_message_datetime is None:
+                return CountResult(0, datetime.now(), result_min_bound, result_max_bound)
+            first_day = first_message_datetime.replace(hour=0, minute=0, second=0, microsecond=0)
+        last_day = min(max_bound.replace(hour=0, minute=0, second=0, microsecond=0), today)
+
+        if first_day >= last_day:
+            return CountResult(self._count(analytic, min_bound, max_bound), datetime.now(), result_min_bound, result_max_bound)
+
+        count = sum(self._get_daily_counts(analytic, first_day.date(), last_day.date()).values())
+        if min_bound is not None and min_bound < first_day:
+            count += self._count(analytic, min_bound, first_day, include_upper_bound=False)
+        if max_bound > last_day:
+            count += self._count(analytic, last_day, max_bound)
+
+        return CountResult(count, datetime.now(), result_min_bound, result_max_bound)
+
+    @staticmethod
+    def _to_utc(dt: datetime) -> datetime:
+        return dt.astimezone(timezone.utc).replace(tzinfo=None) if dt.tzinfo is not None else dt
+
+    @staticmethod
+    def _ceil_day(dt: datetime) -> datetime:
+        day = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+        return day if day == dt else day + timedelta(days=1)
+
+    def _get_daily_counts(self, analytic: CountDescriptor, from_day: date, to_day: date) -> Dict[date, int]:
+        daily_counts = self.daily_count_dao.get(analytic.project, analytic.dimension, analytic.metric, from_day, to_day, settling_time=timedelta(days=self.lookback_days))
+        missing_days = [from_day + timedelta(days=i) for i in range((to_day - from_day).days) if from_day + timedelta(days=i) not in daily_counts]
+        if len(missing_days) > 0:
+            logger.debug(f"Computing [{len(missing_days)}] daily counts of metric [{analytic.metric}] for dimension [{analytic.dimension}] of project [{analytic.project}]")
+            computed_counts = self._count_by_day(analytic, missing_days[0], missing_days[-1] + timedelta(days=1))
+            missing_counts = {day: computed_counts.get(day, 0) for day in missing_days}
+            self.daily_count_dao.add(analytic.project, analytic.dimension, analytic.metric, missing_counts)
+            daily_counts.update(missing_counts)
+        return daily_counts
+
+    def _build_body(self, analytic: CountDescriptor, from_datetime: Optional[datetime], to_datetime: datetime, include_upper_bound: bool = True) -> dict:
+        return {
+            "query": {
+                "bool": {
+                    "must": [
+                        self.METRIC_FILTERS[(analytic.dimension, analytic.metric)],
+                        {
+                            "match": {
+                                "project": analytic.project
+                            }
+                        }
+                    ],
+                    "filter": [
+                        {
+                            "range": {
+                                "timestamp": {
+                                    "gte": from_datetime.isoformat() if from_datetime is not None else None,
+                                    "lte" if include_upper_bound else "lt": to_datetime.isoformat()
+                                }
+                            }
+                        }
+                    ]
+                }
+            }
+        }
+
+    def _count(self, analytic: CountDescriptor, from_datetime: Optional[datetime], to_datetime: datetime, include_upper_bound: bool = True) -> int:
+        body = self._build_body(analytic, from_datetime, to_datetime, include_upper_bound=include_upper_bound)
+        body["aggs"] = {
+            "type_count": {
+                "cardinality": {
+                    "field": "messageId",
+                    "precision_threshold": self.cardinality_precision_threshold
+                }
+            }
+        }
+
+        index = self.index_resolver.resolve(MessageDao.BASE_INDEX, from_datetime, to_datetime)
+        response = self.es.search(index=index, body=body, size=0)
+        total_counter = 0
+        if 'aggregations' in response and 'type_count' in response['aggregations'] and 'value' in response['aggregations']['type_count']:
+            total_counter = response['aggregations']['type_count']['value']
+
+        return total_counter
+
+    def _count_by_day(self, analytic: CountDescriptor, from_day: date, to_day: date) -> Dict[date, int]:
+        from_datetime = datetime.combine(from_day, datetime.min.time())
+        to_datetime = datetime.combine(to_day, datetime.min.time())
+        body = self._build_body(analytic, from_datetime, to_datetime, include_upper_bound=False)
+        body["aggs"] = {
+            "day_count": {
+                "date_histogram": {
+                    "field": "timestamp",
+                    "calendar_interval": "day",
+                    "format": "yyyy-MM-dd"
+                },
+                "aggs": {
+                    "type_count": {
+                        "cardinality": {
+                            "field": "messageId",
+                            "precision_threshold": self.cardinality_precision_threshold
+                        }
+                    }
+                }
+            }
+        }
+
+        index = self.index_resolver.resolve(MessageDao.BASE_INDEX, from_datetime, to_datetime)
+        response = self.es.search(index=index, body=body, size=0)
+        daily_counts = {}
+        if 'aggregations' in response and 'day_count' in response['aggregations'] and 'buckets' in response['aggregations']['day_count']:
+            for bucket in response['aggregations']['day_count']['buckets']:
+                daily_counts[date.fromisoformat(bucket['key_as_string'])] = bucket['type_count']['value']
+
+        return daily_counts
+
+    def _first_message_datetime(self, analytic: CountDescriptor, max_bound: datetime) -> Optional[datetime]:
+        body = self._build_body(analytic, None, max_bound)
+        body["aggs"] = {
+            "first_message": {
+                "min": {
+                    "field": "timestamp"
+                }
+            }
+        }
+
+        index = self.index_resolver.resolve(MessageDao.BASE_INDEX, None, max_bound)
+        response = self.es.search(index=index, body=body, size=0)
+        if 'aggregations' in response and 'first_message' in response['aggregations'] and response['aggregations']['first_message'].get('value') is not None:
+            return datetime.utcfromtimestamp(response['aggregations']['first_message']['value'] / 1000)
+
+        return None
@@ -0,0 +1,283 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+import logging
+import time
+from datetime import datetime
+from typing import Optional, List, Callable, Tuple, Dict
+
+from elasticsearch import Elasticsearch
+from elasticsearch.exceptions import ConnectionError, TransportError
+
+from memex_logging.common.dao.message import MessageDao
+from memex_logging.common.index import IndexResolver
+from memex_logging.common.model.analytic.result.common import CommonAnalyticResult
+
+
+logger = logging.getLogger("logger.common.analytic.planner")
+
+
+class AnalyticQuery:
+    """
+    An analytic that can be computed with a single aggregation over the messages of a project in a time range
+    """
+
+    def __init__(self, project: str, min_bound: Optional[datetime], max_bound: datetime, aggs: dict,
+                 parser: Callable[[dict], Optional[CommonAnalyticResult]], filters: Optional[List[dict]] = None) -> None:
+        """
+        :param str project: the project of the messages
+        :param Optional[datetime] min_bound: the lower bound of the time range, if not specified the range is open
+        :param datetime max_bound: the upper bound of the time range
+        :param dict aggs: the aggregations computing the analytic
+        :param Callable[[dict], Optional[CommonAnalyticResult]] parser: the function building the result of the analytic from the aggregations of the response
+        :param Optional[List[dict]] filters: the additional conditions on the messages, besides the project and the time range
+        """
+
+        self.project = project
+        self.min_bound = min_bound
+        self.max_bound = max_bound
+        self.aggs = aggs
+        self.parser = parser
+        self.filters = filters if filters is not None else []
+
+    @property
+    def group_key(self) -> Tuple[str, Optional[datetime], datetime]:
+        """
+        :return: the key shared by the queries over the same messages, that can be executed together
+        """
+        return self.project, self.min_bound, self.max_bound
+
+    def build_body(self, filters: Optional[List[dict]] = None, aggs: Optional[dict] = None) -> dict:
+        """
+        Build the body of the search
+
+        :param Optional[List[dict]] filters: the additional conditions to use instead of the ones of the query
+        :param Optional[dict] aggs: the aggregations to use instead of the ones of the query
+        :return: the body of the search
+        """
+
+        return {
+            "query": {
+                "bool": {
+                    "must": (filters if filters is not None else self.filters) + [
+                        {
+                            "match": {
+                                "project": self.project
+                            }
+                        }
+                    ],
+                    "filter": [
+                        {
+                            "range": {
+                                "timestamp": {
+                                    "gte": self.min_bound.isoformat() if self.min_bound is not None else None,
+                                    "lte": self.max_bound.isoformat()
+                                }
+                            }
+                        }
+                    ]
+                }
+            },
+            "aggs": aggs if aggs is not None else self.aggs
+        }
+
+    def parse(self, response: dict) -> Optional[CommonAnalyticResult]:
+        """
+        Build the result of the analytic from the response of the search
+
+        :param dict response: the response of the search
+        :return: the result of the analytic
+        """
+        return self.parser(response.get('aggregations', {}))
+
+
+class AnalyticQueryPlanner:
+    """
+    Execute a set of analytic queries grouping the ones over the same messages, each group is executed with a single search having the aggregations of all its queries side by side.
+    The searches of the groups are sent together in multi search requests.
+    """
+
+    # the status codes of the multi search requests that may succeed if sent again
+    TRANSIENT_STATUS_CODES = (429, 502, 503, 504)
+
+    def __init__(self, es: Elasticsearch, index_resolver: Optional[IndexResolver] = None, max_searches_per_request: int = 50,
+                 max_retries: int = 2, retry_backoff: float = 1.0) -> None:
+        """
+        :param Elasticsearch es: a connector for Elasticsearch
+        :param Optional[IndexResolver] index_resolver: the resolver of the indices of the messages
+        :param int max_searches_per_request: the maximum number of searches sent in a single multi search request
+        :param int max_retries: the number of times a multi search request failed due to a transient error is sent again
+        :param float retry_backoff: the number of seconds waited before sending again a failed request, doubled at each retry
+        """
+
+        if max_searches_per_request < 1:
+            raise ValueError(f"The maximum number of searches per request must be positive, got [{max_searches_per_request}]")
+
+        self.es = es
+        self.index_resolver = index_resolver if index_resolver is not None else IndexResolver(es)
+        self.max_searches_per_request = max_searches_per_request
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+    def execute(self, query: AnalyticQuery) -> Optional[CommonAnalyticResult]:
+        """
+        Execute a single analytic query
+
+        :param AnalyticQuery query: the query to execute
+        :return: the result of the analytic
+        """
+
+        index = self.index_resolver.resolve(MessageDao.BASE_INDEX, query.min_bound, query.max_bound)
+        response = self.es.search(index=index, body=query.build_body(), size=0)
+        return query.parse(response)
+
+    @staticmethod
+    def plan(queries: List[AnalyticQuery]) -> List[List[int]]:
+        """
+        Group the queries over the same messages
+
+        :param List[AnalyticQuery] queries: the queries to execute
+        :return: the positions of the queries of each group
+        """
+
+        groups: Dict[Tuple[str, Optional[datetime], datetime], List[int]] = {}
+        for position, query in enumerate(queries):
+            groups.setdefault(query.group_key, []).append(position)
+        return list(groups.values())
+
+    @staticmethod
+    def build_group_body(queries: List[AnalyticQuery]) -> dict:
+        """
+        Build the body of the search executing a group of queries over the same messages, the aggregations of each query are nested in a filter aggregation with its additional conditions
+
+        :param List[AnalyticQuery] queries: the queries of the group
+        :return: the body of the search
+        """
+
+        if len(queries) == 1:
+            return queries[0].build_body()
+
+        aggs = {}
+        for position, query in enumerate(queries):
+            aggs[f"query_{position}"] = {
+                "filter": {"bool": {"must": query.filters}} if len(query.filters) > 0 else {"match_all": {}},
+                "aggs": query.aggs
+            }
+        return queries[0].build_body(filters=[], aggs=aggs)
+
+    @staticmethod
+    def parse_group_response(queries: List[AnalyticQuery], response: dict) -> List[Optional[CommonAnalyticResult]]:
+        """
+        Build the results of a group of queries from the response of its search
+
+        :param List[AnalyticQuery] queries: the queries of the group
+        :param dict response: the response of the search
+        :return: the results of the queries
+        """
+
+        if len(queries) == 1:
+            return [queries[0].parse(response)]
+
+        aggregations = response.get('aggregations', {})
+        return [query.parser(aggregations.get(f"query_{position}", {})) for position, query in enumerate(queries)]
+
+    def _execute_safely(self, query: AnalyticQuery) -> Tuple[Optional[CommonAnalyticResult], Optional[Exception]]:
+        try:
+            return self.execute(query), None
+        except Exception as e:
+            logger.exception(f"Could not compute an analytic of project [{query.project}]", exc_info=e)
+            return None, e
+
+    def execute_all(self, queries: List[AnalyticQuery]) -> List[Tuple[Optional[CommonAnalyticResult], Optional[Exception]]]:
+        """
+        Execute a set of analytic queries, the searches of the groups are sent in multi search requests of bounded size and the failure of a group does not affect the others.
+        When the search of a group fails, its queries are executed one by one so that only the failing ones are reported as failed.
+
+        :param List[AnalyticQuery] queries: the queries to execute
+        :return: for each query, in the same order, a tuple with its result and the error occurred (`None` when the query succeeded)
+        """
+
+        outcomes: List[Tuple[Optional[CommonAnalyticResult], Optional[Exception]]] = [(None, None)] * len(queries)
+        groups = self.plan(queries)
+        for batch_start in range(0, len(groups), self.max_searches_per_request):
+            self._execute_batch(queries, groups[batch_start:batch_start + self.max_searches_per_request], outcomes)
+
+        return outcomes
+
+    def _is_transient(self, error: Exception) -> bool:
+        return isinstance(error, ConnectionError) or (isinstance(error, TransportError) and error.status_code in self.TRANSIENT_STATUS_CODES)
+
+    def _multi_search(self, queries: List[AnalyticQuery], batch: List[List[int]]) -> List[dict]:
+        body = []
+        for positions in batch:
+            group = [queries[position] for position in positions]
+            body.append({"index": self.index_resolver.resolve(MessageDao.BASE_INDEX, group[0].min_bound, group[0].max_bound)})
+            body.append(dict(self.build_group_body(group), size=0))
+
+        retries = 0
+        while True:
+            try:
+                return self.es.msearch(body=body)['responses']
+            except Exception as e:
+                if retries >= self.max_retries or not self._is_transient(e):
+                    raise
+                delay = self.retry_backoff * 2 ** retries
+                logger.warning(f"Could not send a batch of [{len(batch)}] searches, retrying in [{delay}] seconds", exc_info=e)
+                time.sleep(delay)
+                retries += 1
+
+    def _execute_batch(self, queries: List[AnalyticQuery], batch: List[List[int]], outcomes: List[Tuple[Optional[CommonAnalyticResult], Optional[Exception]]]) -> None:
+        """
+        Execute the groups of a batch with a multi search request.
+        The request failed due to a transient error is sent again with an exponential backoff, while the batch rejected as a whole is split in halves that are sent separately, so that the error only affects the groups causing it.
+        """
+
+        try:
+            responses = self._multi_search(queries, batch)
+        except Exception as e:
+            # the transient errors that persist after the retries mean that Elasticsearch is not available, splitting the batch would only multiply the failed requests
+            if len(batch) > 1 and not self._is_transient(e):
+                logger.warning(f"Could not compute a batch of [{len(batch)}] groups of analytics, splitting it", exc_info=e)
+                middle = len(batch) // 2
+                self._execute_batch(queries, batch[:middle], outcomes)
+                self._execute_batch(queries, batch[middle:], outcomes)
+            else:
+                logger.exception(f"Could not compute a batch of [{len(batch)}] groups of analytics", exc_info=e)
+                for positions in batch:
+                    for position in positions:
+                        outcomes[position] = (None, e)
+            return
+
+        for positions, response in zip(batch, responses):
+            group = [queries[position] for position in positions]
+            try:
+                if 'error' in response:
+                    raise RuntimeError(f"The search failed with status [{response.get('status')}]: {response['error']}")
+                results = self.parse_group_response(group, response)
+            except Exception as e:
+                if len(group) > 1:
+                    # a single broken analytic makes the whole search fail, so the analytics of the group are computed separately to isolate it
+                    logger.warning(f"Could not compute a group of [{len(group)}] analytics of project [{group[0].project}], computing them one by one", exc_info=e)
+                    for position in positions:
+                        outcomes[position] = self._execute_safely(queries[position])
+                else:
+                    logger.exception(f"Could not compute an analytic of project [{group[0].project}]", exc_info=e)
+                    outcomes[positions[0]] = (None, e)
+                continue
+
+            for position, result in zip(positions, results):
+                outcomes[position] = (result, None)
+
@@ -0,0 +1,272 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, annotations
+
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, timedelta
+from typing import Optional, List, Tuple, Dict
+
+from wenet.interface.wenet import WeNet
+from wenet.model.user.common import Gender
+from wenet.model.user.profile import WeNetUserProfile
+
+from memex_logging.common.cache import TTLCache
+from memex_logging.common.dao.profile_snapshot import ProfileSnapshotDao
+from memex_logging.common.model.analytic.result.segmentation import Segmentation
+from memex_logging.common.utils import Utils
+
+
+logger = logging.getLogger("logger.common.analytic.profiles")
+
+
+class UserDemographics:
+    """
+    The histogram of the ages and of the genders of a set of users
+    """
+
+    # the label, lower and upper bound of each age segment
+    AGE_SEGMENTS = [
+        ("0-18", 0, 18),
+        ("19-25", 19, 25),
+        ("26-35", 26, 35),
+        ("36-45", 36, 45),
+        ("46-55", 46, 55),
+        ("55+", 56, None)
+    ]
+    GENDER_SEGMENTS = [
+        ("male", Gender.MALE),
+        ("female", Gender.FEMALE),
+        ("non-binary", Gender.NON_BINARY),
+        ("in-another-way", Gender.OTHER),
+        ("prefer-not-to-say", Gender.NOT_SAY)
+    ]
+    UNAVAILABLE = "unavailable"
+
+    def __init__(self) -> None:
+        self.ages = Counter()
+        self.genders = Counter()
+
+    def add(self, date_of_birth: Optional[datetime], gender: Optional[Gender]) -> None:
+        """
+        Add a user to the histogram
+
+        :param Optional[datetime] date_of_birth: the date of birth of the user, if available
+        :param Optional[Gender] gender: the gender of the user, if available
+        """
+
+        age_segment = self._age_segment(Utils.compute_age(date_of_birth)) if date_of_birth is not None else self.UNAVAILABLE
+        # the users with an inconsistent date of birth are not counted in any age segment
+        if age_segment is not None:
+            self.ages[age_segment] += 1
+        self.genders[self._gender_segment(gender)] += 1
+
+    def _age_segment(self, age: int) -> Optional[str]:
+        for label, lower_bound, upper_bound in self.AGE_SEGMENTS:
+            if lower_bound <= age and (upper_bound is None or age <= upper_bound):
+                return label
+        return None
+
+    @classmethod
+    def _gender_segment(cls, gender: Optional[Gender]) -> str:
+        for label, segment_gender in cls.GENDER_SEGMENTS:
+            if gender == segment_gender:
+                return label
+        return cls.UNAVAILABLE
+
+    @staticmethod
+    def _years_before(day: date, years: int) -> date:
+        try:
+            return day.replace(year=day.year - years)
+        except ValueError:
+            # the 29th of February
+            return day.replace(year=day.year - years, day=28)
+
+    @classmethod
+    def date_of_birth_ranges(cls, today: date) -> List[Tuple[str, Optional[date], Optional[date]]]:
+        """
+        :param date today: the day in which the ages are computed
+        :return: the label, the first day and the day following the last one of the range of the dates of birth of each age segment, the open bounds are `None`
+        """
+
+        ranges = []
+        for label, lower_bound, upper_bound in cls.AGE_SEGMENTS:
+            # a user is `age` years old when born after the same day of `age + 1` years before and not after the same day of `age` years before
+            from_day = cls._years_before(today, upper_bound + 1) + timedelta(days=1) if upper_bound is not None else None
+            to_day = cls._years_before(today, lower_bound) + timedelta(days=1)
+            ranges.append((label, from_day, to_day))
+        return ranges
+
+    @classmethod
+    def from_counts(cls, users: int, with_date_of_birth: int, age_counts: Dict[str, int], gender_counts: Dict[str, int]) -> UserDemographics:
+        """
+        Build the histogram from the counts of the snapshots of the profiles
+
+        :param int users: the number of users
+        :param int with_date_of_birth: the number of users with a date of birth
+        :param Dict[str, int] age_counts: the number of users in each age segment
+        :param Dict[str, int] gender_counts: the number of users in each gender segment
+        :return: the histogram
+        """
+
+        demographics = cls()
+        demographics.ages.update({label: count for label, count in age_counts.items() if count > 0})
+        demographics.ages[cls.UNAVAILABLE] += users - with_date_of_birth
+        for label, _ in cls.GENDER_SEGMENTS:
+            demographics.genders[label] += gender_counts.get(label, 0)
+        demographics.genders[cls.UNAVAILABLE] += users - sum(demographics.genders.values())
+        return demographics
+
+    def age_segments(self) -> List[Segmentation]:
+        return [Segmentation(label, self.ages[label]) for label, _, _ in self.AGE_SEGMENTS] + [Segmentation(self.UNAVAILABLE, self.ages[self.UNAVAILABLE])]
+
+    def gender_segments(self) -> List[Segmentation]:
+        return [Segmentation(label, self.genders[label]) for label, _ in self.GENDER_SEGMENTS] + [Segmentation(self.UNAVAILABLE, self.genders[self.UNAVAILABLE])]
+
+
+class ProfileFetcher:
+    """
+    Retrieve the profiles of the users of the WeNet platform with a bounded number of concurrent requests.
+    Only the fields needed by the analytics are kept, in a cache shared by all the analytics computed with the same fetcher.
+    """
+
+    def __init__(self, wenet_interface: WeNet, cache: Optional[TTLCache] = None, max_workers: int = 8, demographics_ttl: float = 0) -> None:
+        """
+        :param WeNet wenet_interface: the interface of the WeNet platform
+        :param Optional[TTLCache] cache: the cache of the fields of the profiles, by default up to 10000 profiles are cached for an hour
+        :param int max_workers: the maximum number of profiles retrieved concurrently
+        :param float demographics_ttl: the number of seconds for which the histogram of the users of an application in a time range is reused, so that the age and the gender analytics updated together share the same pass over the profiles, by default it is not reused
+        """
+
+        self.wenet_interface = wenet_interface
+        self.cache = cache if cache is not None else TTLCache()
+        self._demographics_cache = TTLCache(max_size=100, ttl=demographics_ttl)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="profile-fetcher")
+
+    def _fetch_profile(self, user_id: str) -> WeNetUserProfile:
+        user_profile = self.wenet_interface.profile_manager.get_user_profile(user_id)
+        date_of_birth = user_profile.date_of_birth.date_dt if user_profile.date_of_birth is not None else None
+        self.cache.put(user_id, (date_of_birth, user_profile.gender))
+        return user_profile
+
+    def _fetch(self, user_id: str) -> Tuple[Optional[datetime], Optional[Gender]]:
+        user_profile = self._fetch_profile(user_id)
+        return user_profile.date_of_birth.date_dt if user_profile.date_of_birth is not None else None, user_profile.gender
+
+    def get_profiles(self, user_ids: List[str]) -> List[WeNetUserProfile]:
+        """
+        :param List[str] user_ids: the identifiers of the users
+        :return: the whole profile of each user, in the same order, all the profiles are retrieved concurrently and the cache is refreshed with them
+        """
+
+        futures = [self._executor.submit(self._fetch_profile, user_id) for user_id in user_ids]
+        return [future.result() for future in futures]
+
+    def get_fields(self, user_ids: List[str]) -> List[Tuple[Optional[datetime], Optional[Gender]]]:
+        """
+        :param List[str] user_ids: the identifiers of the users
+        :return: the date of birth and the gender of each user, in the same order, the profiles that are not cached are retrieved concurrently
+        """
+
+        fields: List[Optional[Tuple[Optional[datetime], Optional[Gender]]]] = [self.cache.get(user_id) for user_id in user_ids]
+        futures = {position: self._executor.submit(self._fetch, user_id) for position, user_id in enumerate(user_ids) if fields[position] is None}
+        for position, future in futures.items():
+            fields[position] = future.result()
+
+        logger.debug(f"Retrieved [{len(futures)}] profiles, [{len(user_ids) - len(futures)}] were cached")
+        return fields
+
+    def get_demographics(self, project: str, min_bound: Optional[datetime], max_bound: datetime) -> UserDemographics:
+        """
+        :param str project: the application of the users
+        :param Optional[datetime] min_bound: the lower bound of the time range in which the users have been active
+        :param datetime max_bound: the upper bound of the time range in which the users have been active
+        :return: the histogram of the ages and of the genders of the users, computed with a single pass over their profiles
+        """
+
+        key = (project, min_bound, max_bound)
+        demographics = self._demographics_cache.get(key)
+        if demographics is not None:
+            return demographics
+
+        user_ids = self.wenet_interface.hub.get_user_ids_for_app(project, from_datetime=min_bound, to_datetime=max_bound)
+        demographics = UserDemographics()
+        for date_of_birth, gender in self.get_fields(user_ids):
+            demographics.add(date_of_birth, gender)
+        self._demographics_cache.put(key, demographics)
+        return demographics
+
+    def close(self) -> None:
+        """
+        Stop the threads of the pool
+        """
+        self._executor.shutdown(wait=False)
+
+
+class ProfileSnapshotSynchronizer:
+    """
+    Keep the snapshots of the fields of the user profiles needed by the analytics up to date, so that the age and gender segmentations are computed with a single search instead of retrieving the profiles.
+    The snapshots of new users are always created, while the other ones are refreshed only when older than a maximum age.
+    """
+
+    def __init__(self, wenet_interface: WeNet, snapshot_dao: ProfileSnapshotDao, profile_fetcher: Optional[ProfileFetcher] = None, max_age: timedelta = timedelta(days=1)) -> None:
+        """
+        :param WeNet wenet_interface: the interface of the WeNet platform
+        :param ProfileSnapshotDao snapshot_dao: the dao of the snapshots
+        :param Optional[ProfileFetcher] profile_fetcher: the fetcher of the profiles
+        :param timedelta max_age: the maximum age of a snapshot before it is refreshed
+        """
+
+        self.wenet_interface = wenet_interface
+        self.snapshot_dao = snapshot_dao
+        self.profile_fetcher = profile_fetcher if profile_fetcher is not None else ProfileFetcher(wenet_interface)
+        self.max_age = max_age
+
+    @staticmethod
+    def build_snapshot(project: str, user_id: str, user_profile: WeNetUserProfile, sync_dt: datetime) -> dict:
+        date_of_birth = user_profile.date_of_birth.date_dt if user_profile.date_of_birth is not None else None
+        gender = UserDemographics._gender_segment(user_profile.gender)
+        return ProfileSnapshotDao.build_repr(
+            project,
+            user_id,
+            date_of_birth.date() if date_of_birth is not None else None,
+            gender if gender != UserDemographics.UNAVAILABLE else None,
+            user_profile.locale,
+            user_profile.nationality,
+            user_profile.last_update_ts,
+            sync_dt
+        )
+
+    def sync(self, project: str, batch_size: int = 500) -> int:
+        """
+        Synchronize the snapshots of the profiles of the users of an application
+
+        :param str project: the application of the users
+        :param int batch_size: the number of profiles retrieved and stored together
+        :return: the number of snapshots created or refreshed
+        """
+
+        now = datetime.now()
+        sync_datetimes = self.snapshot_dao.get_sync_datetimes(project)
+        user_ids = [user_id for user_id in self.wenet_interface.hub.get_user_ids_for_app(project) if user_id not in sync_datetimes or sync_datetimes[user_id] <= now - self.max_age]
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            user_profiles = self.profile_fetcher.get_profiles(batch)
+            self.snapshot_dao.add([self.build_snapshot(project, user_id, user_profile, now) for user_id, user_profile in zip(batch, user_profiles)])
+
+        logger.debug(f"Synchronized [{len(user_ids)}] profile snapshots of project [{project}], [{len(sync_datetimes)}] were already stored")
+        return len(user_ids)
@@ -0,0 +1,270 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+import logging
+from datetime import datetime, date, timedelta
+from typing import Optional, List, Dict
+
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import scan
+
+from memex_logging.common.dao.message import MessageDao
+from memex_logging.common.dao.rollup import MessageRollupDao
+from memex_logging.common.index import IndexResolver
+from memex_logging.common.model.analytic.descriptor.common import CommonAnalyticDescriptor
+from memex_logging.common.model.analytic.descriptor.count import CountDescriptor, UserCountDescriptor, MessageCountDescriptor, \
+    ConversationCountDescriptor, DialogueCountDescriptor
+from memex_logging.common.model.analytic.descriptor.segmentation import SegmentationDescriptor, MessageSegmentationDescriptor
+from memex_logging.common.model.analytic.result.common import CommonAnalyticResult
+from memex_logging.common.model.analytic.result.count import CountResult
+from memex_logging.common.model.analytic.result.segmentation import SegmentationResult, Segmentation
+from memex_logging.common.model.rollup import MessageRollup
+from memex_logging.common.utils import Utils
+
+
+logger = logging.getLogger("logger.common.analytic.rollup")
+
+
+class MessageRollupBuilder:
+    """
+    Summarize the messages of each project day by day
+    """
+
+    SOURCE_FIELDS = ["project", "type", "messageId", "userId", "conversationId", "channel", "content.type", "intent.name", "domain"]
+
+    def __init__(self, es: Elasticsearch, rollup_dao: MessageRollupDao, index_resolver: Optional[IndexResolver] = None, lookback_days: int = 2) -> None:
+        """
+        :param Elasticsearch es: a connector for Elasticsearch
+        :param MessageRollupDao rollup_dao: the dao storing the summaries
+        :param Optional[IndexResolver] index_resolver: the resolver of the indices of the messages
+        :param int lookback_days: the number of days already summarized that are summarized again at each update, so that the messages stored late are included
+        """
+
+        self.es = es
+        self.rollup_dao = rollup_dao
+        self.index_resolver = index_resolver if index_resolver is not None else IndexResolver(es)
+        self.lookback_days = lookback_days
+
+    def build(self, day: date) -> List[MessageRollup]:
+        """
+        Summarize the messages of a day
+
+        :param date day: the day of the messages
+        :return: the summaries of the projects with at least a message in the day
+        """
+
+        from_datetime = datetime.combine(day, datetime.min.time())
+        to_datetime = from_datetime + timedelta(days=1)
+        query = {
+            "_source": self.SOURCE_FIELDS,
+            "query": {
+                "bool": {
+                    "filter": [
+                        {
+                            "range": {
+                                "timestamp": {
+                                    "gte": from_datetime.isoformat(),
+                                    "lt": to_datetime.isoformat()
+                                }
+                            }
+                        }
+                    ]
+                }
+            }
+        }
+
+        rollups: Dict[str, MessageRollup] = {}
+        message_ids: Dict[str, Dict[str, set]] = {}
+        index = self.index_resolver.resolve(MessageDao.BASE_INDEX, from_datetime, to_datetime)
+        for hit in scan(self.es, index=index, query=query, size=1000):
+            raw_message = hit['_source']
+            project = raw_message.get('project')
+            if project is None:
+                continue
+
+            rollup = rollups.setdefault(project, MessageRollup(project, day))
+            message_type = raw_message.get('type')
+            if message_type is not None:
+                rollup.types[message_type] += 1
+                message_ids.setdefault(project, {}).setdefault(message_type, set()).add(raw_message.get('messageId'))
+            if raw_message.get('channel') is not None:
+                rollup.channels[raw_message['channel']] += 1
+            if raw_message.get('domain') is not None:
+                rollup.domains[raw_message['domain']] += 1
+            if isinstance(raw_message.get('intent'), dict) and raw_message['intent'].get('name') is not None:
+                rollup.intents[raw_message['intent']['name']] += 1
+
+            user_id = raw_message.get('userId')
+            if user_id is not None:
+                rollup.users.add(user_id)
+                if message_type == "request":
+                    rollup.active_users.add(user_id)
+                elif message_type == "notification":
+                    rollup.engaged_users.add(user_id)
+            if raw_message.get('conversationId') is not None:
+                rollup.conversations.add(raw_message['conversationId'])
+            if message_type == "request" and isinstance(raw_message.get('content'), dict) and raw_message['content'].get('type') is not None:
+                rollup.request_content_types[raw_message['content']['type']] += 1
+
+        for project, ids_by_type in message_ids.items():
+            for message_type, ids in ids_by_type.items():
+                rollups[project].distinct_messages[message_type] = len(ids)
+
+        return list(rollups.values())
+
+    def update(self) -> int:
+        """
+        Summarize the messages of the concluded days that have not been summarized yet, together with the last `lookback_days` days already summarized.
+        The summary of a day is replaced when it is summarized again, the messages stored after the day has left the lookback are not included in the summaries.
+
+        :return: the number of days summarized
+        """
+
+        first_day, last_day = self.rollup_dao.get_state()
+        if last_day is None:
+            first_day = self._first_message_day()
+            if first_day is None:
+                logger.info("There are no messages to summarize")
+                return 0
+            day = first_day
+        else:
+            day = max(first_day, last_day - timedelta(days=self.lookback_days - 1))
+
+        summarized_days = 0
+        yesterday = datetime.now().date() - timedelta(days=1)
+        while day <= yesterday:
+            rollups = self.build(day)
+            self.rollup_dao.add(rollups)
+            if last_day is None or day > last_day:
+                self.rollup_dao.set_state(first_day, day)
+            logger.debug(f"Summarized the messages of [{len(rollups)}] projects for day [{day.isoformat()}]")
+            summarized_days += 1
+            day += timedelta(days=1)
+
+        return summarized_days
+
+    def _first_message_day(self) -> Optional[date]:
+        body = {
+            "aggs": {
+                "first_message": {
+                    "min": {
+                        "field": "timestamp"
+                    }
+                }
+            }
+        }
+
+        response = self.es.search(index=Utils.generate_index(MessageDao.BASE_INDEX), body=body, size=0)
+        if 'aggregations' in response and 'first_message' in response['aggregations'] and response['aggregations']['first_message'].get('value') is not None:
+            return datetime.utcfromtimestamp(response['aggregations']['first_message']['value'] / 1000).date()
+
+        return None
+
+
+class RollupComputation:
+    """
+    Compute the analytics from the daily summaries of the messages, when the time range of the analytic is made of entire days that have all been summarized
+    """
+
+    # the metrics, identified by dimension and metric, that can be computed from the summaries
+    COUNT_METRICS = [
+        (UserCountDescriptor.DIMENSION, "total"),
+        (UserCountDescriptor.DIMENSION, "active"),
+        (UserCountDescriptor.DIMENSION, "engaged"),
+        (MessageCountDescriptor.DIMENSION, "requests"),
+        (MessageCountDescriptor.DIMENSION, "responses"),
+        (MessageCountDescriptor.DIMENSION, "notifications"),
+        (ConversationCountDescriptor.DIMENSION, "total"),
+        (DialogueCountDescriptor.DIMENSION, "domains"),
+    ]
+    SEGMENTATION_METRICS = [
+        (MessageSegmentationDescriptor.DIMENSION, "all"),
+        (MessageSegmentationDescriptor.DIMENSION, "requests"),
+    ]
+
+    def __init__(self, rollup_dao: MessageRollupDao) -> None:
+        self.rollup_dao = rollup_dao
+
+    @classmethod
+    def supports(cls, analytic: CommonAnalyticDescriptor) -> bool:
+        """
+        :param CommonAnalyticDescriptor analytic: the descriptor of the analytic
+        :return: `True` if the metric of the analytic can be computed from the summaries
+        """
+
+        if isinstance(analytic, CountDescriptor):
+            return (analytic.dimension, analytic.metric) in cls.COUNT_METRICS
+        elif isinstance(analytic, SegmentationDescriptor):
+            return (analytic.dimension, analytic.metric) in cls.SEGMENTATION_METRICS
+        else:
+            return False
+
+    @staticmethod
+    def _is_midnight(dt: datetime) -> bool:
+        return dt == dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def get_result(self, analytic: CommonAnalyticDescriptor) -> Optional[CommonAnalyticResult]:
+        """
+        :param CommonAnalyticDescriptor analytic: the descriptor of the analytic
+        :return: the result of the analytic, `None` if it can not be computed from the summaries
+        """
+
+        if not self.supports(analytic):
+            return None
+
+        min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
+        if (min_bound is not None and not self._is_midnight(min_bound)) or not self._is_midnight(max_bound):
+            return None
+
+        _, last_day = self.rollup_dao.get_state()
+        if last_day is None or max_bound.date() > last_day + timedelta(days=1):
+            logger.debug(f"The messages up to [{max_bound.isoformat()}] have not been summarized yet")
+            return None
+
+        rollup = MessageRollup(analytic.project, max_bound.date())
+        for daily_rollup in self.rollup_dao.search(analytic.project, min_bound.date() if min_bound is not None else None, max_bound.date()):
+            rollup.merge(daily_rollup)
+
+        if isinstance(analytic, CountDescriptor):
+            return CountResult(self._count(analytic, rollup), datetime.now(), min_bound, max_bound)
+        else:
+            return SegmentationResult(self._segments(analytic, rollup), datetime.now(), min_bound, max_bound)
+
+    @staticmethod
+    def _count(analytic: CountDescriptor, rollup: MessageRollup) -> int:
+        if analytic.dimension == UserCountDescriptor.DIMENSION:
+            if analytic.metric == "total":
+                return rollup.users.cardinality()
+            elif analytic.metric == "active":
+                return rollup.active_users.cardinality()
+            else:
+                return rollup.engaged_users.cardinality()
+        elif analytic.dimension == MessageCountDescriptor.DIMENSION:
+            # the metrics are in the plural form while the types of the messages are in the singular one
+            return rollup.distinct_messages.get(analytic.metric[:-1], 0)
+        elif analytic.dimension == ConversationCountDescriptor.DIMENSION:
+            return rollup.conversations.cardinality()
+        else:
+            return len(rollup.domains)
+
+    @staticmethod
+    def _segments(analytic: SegmentationDescriptor, rollup: MessageRollup) -> List[Segmentation]:
+        # the segments are limited and sorted as the buckets of the terms aggregation used when computing them from the messages
+        if analytic.metric == "all":
+            counts, size = rollup.types, 5
+        else:
+            counts, size = rollup.request_content_types, 10
+        return [Segmentation(key, count) for key, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:size]]
@@ -16,11 +16,16 @@ from __future__ import absolute_import, annotations
 
 import logging
 from datetime import datetime
+from typing import Optional, List
 
 from elasticsearch import Elasticsearch
 from wenet.interface.wenet import WeNet
-from wenet.model.user.common import Gender
 
+from memex_logging.common.computation.planner import AnalyticQuery, AnalyticQueryPlanner
+from memex_logging.common.computation.profiles import ProfileFetcher, UserDemographics
+from memex_logging.common.computation.rollup import RollupComputation
+from memex_logging.common.dao.profile_snapshot import ProfileSnapshotDao
+from memex_logging.common.index import IndexResolver
 from memex_logging.common.model.analytic.descriptor.segmentation import SegmentationDescriptor, \
     UserSegmentationDescriptor, MessageSegmentationDescriptor, TransactionSegmentationDescriptor
 from memex_logging.common.model.analytic.result.segmentation import SegmentationResult, Segmentation
@@ -32,12 +37,47 @@ logger = logging.getLogger("logger.common.analytic.analytic")
 
 class SegmentationComputation:
 
-    def __init__(self, es: Elasticsearch, wenet_interface: WeNet) -> None:
+    def __init__(self, es: Elasticsearch, wenet_interface: WeNet, index_resolver: Optional[IndexResolver] = None, rollup_computation: Optional[RollupComputation] = None,
+                 profile_fetcher: Optional[ProfileFetcher] = None, profile_snapshot_dao: Optional[ProfileSnapshotDao] = None) -> None:
         self.es = es
         self.wenet_interface = wenet_interface
+        self.profile_fetcher = profile_fetcher if profile_fetcher is not None else ProfileFetcher(wenet_interface)
+        self.profile_snapshot_dao = profile_snapshot_dao
+        self.index_resolver = index_resolver if index_resolver is not None else IndexResolver(es)
+        self.rollup_computation = rollup_computation
+        self.planner = AnalyticQueryPlanner(es, index_resolver=self.index_resolver)
+
+    def build_query(self, analytic: SegmentationDescriptor) -> Optional[AnalyticQuery]:
+        """
+        Build the query computing the analytic with a single aggregation over the messages, so that it can be executed together with the ones of other analytics
+
+        :param SegmentationDescriptor analytic: the descriptor of the analytic
+        :return: the query computing the analytic, `None` if the analytic is not computed with a single aggregation over the messages
+        """
+
+        if self.rollup_computation is not None and self.rollup_computation.supports(analytic):
+            return None
+        return self._build_query(analytic)
+
+    def _build_query(self, analytic: SegmentationDescriptor) -> Optional[AnalyticQuery]:
+        query_builders = {
+            (MessageSegmentationDescriptor.DIMENSION, "all"): self._messages_segmentation,
+            (MessageSegmentationDescriptor.DIMENSION, "requests"): self._requests_segmentation,
+        }
+        query_builder = query_builders.get((analytic.dimension, analytic.metric.lower()))
+        return query_builder(analytic) if query_builder is not None else None
 
     def get_result(self, analytic: SegmentationDescriptor) -> SegmentationResult:
-        if isinstance(analytic, UserSegmentationDescriptor):
+        if self.rollup_computation is not None and self.rollup_computation.supports(analytic):
+            result = self.rollup_computation.get_result(analytic)
+            if result is not None:
+                return result
+
+        query = self._build_query(analytic)
+        if query is not None:
+            result = self.planner.execute(query)
+
+        elif isinstance(analytic, UserSegmentationDescriptor):
             if analytic.metric.lower() == "age":
                 result = self._user_age_segmentation(analytic)
             elif analytic.metric.lower() == "gender":
@@ -47,13 +87,8 @@ class SegmentationComputation:
                 raise ValueError(f"Unknown value for metric [{analytic.metric}] for SegmentationDescriptor")
 
         elif isinstance(analytic, MessageSegmentationDescriptor):
-            if analytic.metric.lower() == "all":
-                result = self._messages_segmentation(analytic)
-            elif analytic.metric.lower() == "requests":
-                result = self._requests_segmentation(analytic)
-            else:
-                logger.info(f"Unknown value for metric [{analytic.metric}] for MessageSegmentationDescriptor")
-                raise ValueError(f"Unknown value for metric [{analytic.metric}] for MessageSegmentationDescriptor")
+            logger.info(f"Unknown value for metric [{analytic.metric}] for MessageSegmentationDescriptor")
+            raise ValueError(f"Unknown value for metric [{analytic.metric}] for MessageSegmentationDescriptor")
 
         elif isinstance(analytic, TransactionSegmentationDescriptor):
             if analytic.metric.lower() == "label":
@@ -68,141 +103,55 @@ class SegmentationComputation:
 
         return result
 
+    def _user_demographics(self, project: str, min_bound: Optional[datetime], max_bound: datetime) -> UserDemographics:
+        if self.profile_snapshot_dao is None:
+            return self.profile_fetcher.get_demographics(project, min_bound, max_bound)
+
+        # the users without a snapshot, not synchronized yet, are counted as unavailable
+        user_ids = list(set(self.wenet_interface.hub.get_user_ids_for_app(project, from_datetime=min_bound, to_datetime=max_bound)))
+        with_date_of_birth, age_counts, gender_counts = self.profile_snapshot_dao.count_demographics(project, user_ids, UserDemographics.date_of_birth_ranges(datetime.now().date()))
+        return UserDemographics.from_counts(len(user_ids), with_date_of_birth, age_counts, gender_counts)
+
     def _user_age_segmentation(self, analytic: UserSegmentationDescriptor) -> SegmentationResult:
         min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        user_ids = self.wenet_interface.hub.get_user_ids_for_app(analytic.project, from_datetime=min_bound, to_datetime=max_bound)
-        ages = []
-        for user_id in user_ids:
-            user_profile = self.wenet_interface.profile_manager.get_user_profile(user_id)
-            ages.append(Utils.compute_age(user_profile.date_of_birth.date_dt) if user_profile.date_of_birth is not None and user_profile.date_of_birth.date_dt is not None else None)
-
-        type_counter = [
-            Segmentation("0-18", len([age for age in ages if age is not None and 0 <= age <= 18])),
-            Segmentation("19-25", len([age for age in ages if age is not None and 19 <= age <= 25])),
-            Segmentation("26-35", len([age for age in ages if age is not None and 26 <= age <= 35])),
-            Segmentation("36-45", len([age for age in ages if age is not None and 36 <= age <= 45])),
-            Segmentation("46-55", len([age for age in ages if age is not None and 46 <= age <= 55])),
-            Segmentation("55+", len([age for age in ages if age is not None and 55 < age])),
-            Segmentation("unavailable", ages.count(None))
-        ]
-        return SegmentationResult(type_counter, datetime.now(), min_bound, max_bound)
+        demographics = self._user_demographics(analytic.project, min_bound, max_bound)
+        return SegmentationResult(demographics.age_segments(), datetime.now(), min_bound, max_bound)
 
     def _user_gender_segmentation(self, analytic: UserSegmentationDescriptor) -> SegmentationResult:
         min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        user_ids = self.wenet_interface.hub.get_user_ids_for_app(analytic.project, from_datetime=min_bound, to_datetime=max_bound)
-        genders = []
-        for user_id in user_ids:
-            user_profile = self.wenet_interface.profile_manager.get_user_profile(user_id)
-            genders.append(user_profile.gender)
-
-        type_counter = [
-            Segmentation("male", genders.count(Gender.MALE)),
-            Segmentation("female", genders.count(Gender.FEMALE)),
-            Segmentation("non-binary", genders.count(Gender.NON_BINARY)),
-            Segmentation("in-another-way", genders.count(Gender.OTHER)),
-            Segmentation("prefer-not-to-say", genders.count(Gender.NOT_SAY)),
-            Segmentation("unavailable", genders.count(None))
-        ]
-        return SegmentationResult(type_counter, datetime.now(), min_bound, max_bound)
+        demographics = self._user_demographics(analytic.project, min_bound, max_bound)
+        return SegmentationResult(demographics.gender_segments(), datetime.now(), min_bound, max_bound)
 
-    def _messages_segmentation(self, analytic: MessageSegmentationDescriptor) -> SegmentationResult:
+    def _terms_query(self, analytic: SegmentationDescriptor, field: str, size: int, description: str, filters: Optional[List[dict]] = None) -> AnalyticQuery:
         min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        body = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "match": {
-                                "project.keyword": analytic.project
-                            }
-                        }
-                    ],
-                    "filter": [
-                        {
-                            "range": {
-                                "timestamp": {
-                                    "gte": min_bound.isoformat() if min_bound is not None else None,
-                                    "lte": max_bound.isoformat()
-                                }
-                            }
-                        }
-                    ]
-                }
-            },
-            "aggs": {
-                "terms_count": {
-                    "terms": {
-                        "field": "type.keyword",
-                        "size": 5
-                    }
+        aggs = {
+            "terms_count": {
+                "terms": {
+                    "field": field,
+                    "size": size
                 }
             }
         }
 
-        index = Utils.generate_index(data_type="message")
-        response = self.es.search(index=index, body=body, size=0)
-        type_counter = []
-        if 'aggregations' in response and 'terms_count' in response['aggregations'] and 'buckets' in response['aggregations']['terms_count']:
-            for item in response['aggregations']['terms_count']['buckets']:
-                type_counter.append(Segmentation(item['key'], item['doc_count']))
+        def parse(aggregations: dict) -> SegmentationResult:
+            type_counter = []
+            if 'terms_count' in aggregations and 'buckets' in aggregations['terms_count']:
+                for item in aggregations['terms_count']['buckets']:
+                    type_counter.append(Segmentation(item['key'], item['doc_count']))
 
-        if 'aggregations' in response and 'terms_count' in response['aggregations'] and 'sum_other_doc_count' in response['aggregations']['terms_count']:
-            if response['aggregations']['terms_count']['sum_other_doc_count'] != 0:
-                logger.warning("The number of buckets is limited at `5` but the number of types is higher")
+            if 'terms_count' in aggregations and 'sum_other_doc_count' in aggregations['terms_count']:
+                if aggregations['terms_count']['sum_other_doc_count'] != 0:
+                    logger.warning(f"The number of buckets is limited at `{size}` but the number of {description} is higher")
 
-        return SegmentationResult(type_counter, datetime.now(), min_bound, max_bound)
+            return SegmentationResult(type_counter, datetime.now(), min_bound, max_bound)
 
-    def _requests_segmentation(self, analytic: MessageSegmentationDescriptor) -> SegmentationResult:
-        min_bound, max_bound = Utils.extract_range_timestamps(analytic.time_span)
-        body = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "match": {
-                                "type.keyword": "request"
-                            }
-                        },
-                        {
-                            "match": {
-                                "project.keyword": analytic.project
-                            }
-                        }
-                    ],
-                    "filter": [
-                        {
-                            "range": {
-                                "timestamp": {
-                                    "gte": min_bound.isoformat() if min_bound is not None else None,
-                                    "lte": max_bound.isoformat()
-                                }
-                            }
-                        }
-                    ]
-                }
-            },
-            "aggs": {
-                "terms_count": {
-                    "terms": {
-                        "field": "content.type.keyword",
-                        "size": 10
-                    }
-                }
-            }
-        }
+        return AnalyticQuery(analytic.project, min_bound, max_bound, aggs, parse, filters=filters)
 
-        index = Utils.generate_index(data_type="message")
-        response = self.es.search(index=index, body=body, size=0)
-        type_counter = []
-        if 'aggregations' in response and 'terms_count' in response['aggregations'] and 'buckets' in response['aggregations']['terms_count']:
-            for item in response['aggregations']['terms_count']['buckets']:
-                type_counter.append(Segmentation(item['key'], item['doc_count']))
+    def _messages_segmentation(self, analytic: MessageSegmentationDescriptor) -> AnalyticQuery:
+        return self._terms_query(analytic, "type", 5, "types")
 
-        if 'aggregations' in response and 'terms_count' in response['aggregations'] and 'sum_other_doc_count' in response['aggregations']['terms_count']:
-            if response['aggregations']['terms_count']['sum_other_doc_count'] != 0:
-                logger.warning("The number of buckets is limited at `10` but the number of content types is higher")
-
-        return SegmentationResult(type_counter, datetime.now(), min_bound, max_bound)
+    def _requests_segmentation(self, analytic: MessageSegmentationDescriptor) -> AnalyticQuery:
+        return self._terms_query(analytic, "content.type", 10, "content types", filters=[{"match": {"type": "request"}}])
 
     def _transactions_segmentation(self, analytic: TransactionSegmentationDescriptor) -> SegmentationResult:
         """
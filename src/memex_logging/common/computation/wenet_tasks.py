@@ -0,0 +1,72 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, annotations
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from wenet.interface.wenet import WeNet
+
+
+logger = logging.getLogger("logger.common.analytic.wenet_tasks")
+
+
+class WeNetTaskCounter:
+    """
+    Count the tasks and the transactions of the WeNet platform without retrieving them, reading the total of a single-item page.
+    The independent counts needed by an analytic are requested concurrently on a bounded pool of threads.
+    """
+
+    def __init__(self, wenet_interface: WeNet, max_workers: int = 4) -> None:
+        """
+        :param WeNet wenet_interface: the interface of the WeNet platform
+        :param int max_workers: the maximum number of requests to the WeNet platform sent concurrently
+        """
+
+        self.wenet_interface = wenet_interface
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="wenet-task-counter")
+
+    def count_tasks(self, **filters) -> int:
+        """
+        :param filters: the filters of the tasks, as accepted by the task manager of the WeNet platform
+        :return: the number of tasks matching the filters
+        """
+        return self.wenet_interface.task_manager.get_task_page(offset=0, limit=1, **filters).total
+
+    def count_transactions(self, **filters) -> int:
+        """
+        :param filters: the filters of the transactions, as accepted by the task manager of the WeNet platform
+        :return: the number of transactions matching the filters
+        """
+        return self.wenet_interface.task_manager.get_transaction_page(offset=0, limit=1, **filters).total
+
+    def sum_task_counts(self, filters: List[dict]) -> int:
+        """
+        Count concurrently the tasks matching each set of filters
+
+        :param List[dict] filters: the sets of filters, they are expected to match disjoint sets of tasks
+        :return: the sum of the numbers of tasks matching each set of filters
+        """
+
+        futures = [self._executor.submit(self.count_tasks, **task_filters) for task_filters in filters]
+        return sum(future.result() for future in futures)
+
+    def close(self) -> None:
+        """
+        Stop the threads of the pool
+        """
+        self._executor.shutdown(wait=False)
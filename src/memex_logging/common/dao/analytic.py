@@ -19,6 +19,7 @@ from datetime import datetime
 from typing import List, Optional
 
 from elasticsearch import Elasticsearch
+from elasticsearch.exceptions import NotFoundError
 from elasticsearch.helpers import scan
 
 from memex_logging.common.dao.common import CommonDao, DocumentNotFound
@@ -30,8 +31,16 @@ logger = logging.getLogger("logger.common.dao.analytic")
 
 
 class AnalyticDao(CommonDao):
+    """
+    A dao for the management of the analytics, each analytic is stored with its id as id of the document in the index behind the `analytic` alias
+    """
 
     BASE_INDEX = "analytic"
+    # the index holding the analytics, created by the migrator together with its alias
+    STORE_INDEX = "analytic-store"
+    # the index holding the stamp changed whenever the results of the analytics are updated
+    VERSION_INDEX = "analytic_version"
+    VERSION_ID = "version"
 
     def __init__(self, es: Elasticsearch) -> None:
         """
@@ -39,16 +48,6 @@ class AnalyticDao(CommonDao):
         """
         super().__init__(es, self.BASE_INDEX)
 
-    @staticmethod
-    def _build_query_by_analytic_id(analytic_id: str) -> dict:
-        return {
-            "query": {
-                "match": {
-                    "id.keyword": analytic_id
-                }
-            }
-        }
-
     def add(self, analytic: Analytic) -> None:
         """
         Add an analytic to Elasticsearch
@@ -56,20 +55,20 @@ class AnalyticDao(CommonDao):
         :param Analytic analytic: the analytic to add
         """
 
-        index = self._generate_index(dt=datetime.now())
-        self._add_document(index, analytic.to_repr())
+        self._es.index(index=self.BASE_INDEX, id=analytic.analytic_id, body=analytic.to_repr())
 
     def update(self, analytic: Analytic) -> None:
         """
         Update an analytic in Elasticsearch
 
         :param Analytic analytic: the updated analytic
+        :raise DocumentNotFound: when could not find the analytic
         """
 
-        index = self._generate_index()
-        query = self._build_query_by_analytic_id(analytic.analytic_id)
-        raw_analytic, trace_id, index, doc_type = self._get_document(index, query)
-        self._update_document(index, trace_id, analytic.to_repr(), doc_type=doc_type)
+        try:
+            self._es.update(index=self.BASE_INDEX, id=analytic.analytic_id, body={"doc": analytic.to_repr()})
+        except NotFoundError:
+            raise DocumentNotFound(f"Analytic with id [{analytic.analytic_id}] was not found")
 
     def get(self, analytic_id: str) -> Analytic:
         """
@@ -77,18 +76,15 @@ class AnalyticDao(CommonDao):
 
         :param str analytic_id: the id of the analytic to retrieve
         :return: the analytic
-        :raise EntryNotFound: when could not find any analytic
+        :raise DocumentNotFound: when could not find any analytic
         """
 
-        index = self._generate_index()
-        query = self._build_query_by_analytic_id(analytic_id)
-        raw_documents = self._search_documents(index, query)
-        if len(raw_documents) == 0:
+        try:
+            response = self._es.get(index=self.BASE_INDEX, id=analytic_id)
+        except NotFoundError:
             raise DocumentNotFound(f"Analytic with id [{analytic_id}] was not found")
-        elif len(raw_documents) > 1:
-            logger.warning(f"More than one analytic with id [{analytic_id}] was found")
 
-        return Analytic.from_repr(raw_documents[0])
+        return Analytic.from_repr(response['_source'])
 
     def delete(self, analytic_id: str) -> None:
         """
@@ -97,9 +93,24 @@ class AnalyticDao(CommonDao):
         :param str analytic_id: the id of the analytic to delete
         """
 
-        index = self._generate_index()
-        query = self._build_query_by_analytic_id(analytic_id)
-        self._delete_document(index, query)
+        self._es.delete(index=self.BASE_INDEX, id=analytic_id, ignore=404)
+
+    def bump_version(self) -> None:
+        """
+        Change the version stamp of the analytics, so that the copies cached by the web service workers are discarded
+        """
+
+        self._es.index(index=self.VERSION_INDEX, id=self.VERSION_ID, body={"updateDt": datetime.now().isoformat()})
+
+    def get_version(self) -> int:
+        """
+        :return: the version stamp of the analytics, `0` if the analytics have never been updated
+        """
+
+        try:
+            return self._es.get(index=self.VERSION_INDEX, id=self.VERSION_ID, _source=False)['_version']
+        except NotFoundError:
+            return 0
 
     def list(self, time_window_type: Optional[str] = None) -> List[Analytic]:
         """
@@ -109,13 +120,13 @@ class AnalyticDao(CommonDao):
         :return: a list of analytics
         """
 
-        index = self._generate_index()
+        index = self.BASE_INDEX
         if time_window_type is None:
             results = scan(self._es, index=index, query={"query": {"match_all": {}}})
         elif time_window_type == MovingTimeWindow.type() or time_window_type == MovingTimeWindow.deprecated_type():
-            results = scan(self._es, index=index, query={"query": {"match": {"descriptor.timespan.type.keyword": MovingTimeWindow.type()}}})
+            results = scan(self._es, index=index, query={"query": {"match": {"descriptor.timespan.type": MovingTimeWindow.type()}}})
         elif time_window_type == FixedTimeWindow.type() or time_window_type == FixedTimeWindow.deprecated_type():
-            results = scan(self._es, index=index, query={"query": {"match": {"descriptor.timespan.type.keyword": FixedTimeWindow.type()}}})
+            results = scan(self._es, index=index, query={"query": {"match": {"descriptor.timespan.type": FixedTimeWindow.type()}}})
         else:
             logger.info(f"Unrecognized type [{time_window_type}] for TimeWindow")
             raise ValueError(f"Unrecognized type [{time_window_type}] for TimeWindow")
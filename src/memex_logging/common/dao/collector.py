@@ -17,6 +17,7 @@ from __future__ import absolute_import, annotations
 from elasticsearch import Elasticsearch
 
 from memex_logging.common.dao.analytic import AnalyticDao
+from memex_logging.common.dao.first_seen import FirstSeenDao
 from memex_logging.common.dao.message import MessageDao
 
 
@@ -35,8 +36,8 @@ class DaoCollector:
         self.analytic = analytic_dao
 
     @staticmethod
-    def build_dao_collector(es: Elasticsearch) -> DaoCollector:
+    def build_dao_collector(es: Elasticsearch, first_seen_registry: bool = False) -> DaoCollector:
         return DaoCollector(
-            MessageDao(es),
+            MessageDao(es, first_seen_dao=FirstSeenDao(es) if first_seen_registry else None),
             AnalyticDao(es)
         )
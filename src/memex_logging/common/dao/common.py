@@ -16,9 +16,10 @@ from __future__ import absolute_import, annotations
 
 import logging
 from datetime import datetime
-from typing import Optional, Tuple, List
+from typing import Optional, Tuple, List, Iterable
 
 from elasticsearch import Elasticsearch
+from elasticsearch.helpers import streaming_bulk
 
 from memex_logging.common.utils import Utils
 
@@ -98,7 +99,7 @@ class CommonDao:
         query["query"]["bool"]["must"].append(
             {
                 "match_phrase": {
-                    "project.keyword": project
+                    "project": project
                 }
             }
         )
@@ -129,6 +130,48 @@ class CommonDao:
 
         self._es.index(index=index, id=trace_id, doc_type=doc_type, body=object_repr)
 
+    @staticmethod
+    def _build_index_action(index: str, object_repr: dict, trace_id: Optional[str] = None) -> dict:
+        """
+        Build the action for indexing a document through the bulk API
+
+        :param str index: the index where to add the document
+        :param dict object_repr: the document to add
+        :param Optional[str] trace_id: the id of the document, if not specified it is generated by Elasticsearch
+        :return: the bulk action
+        """
+
+        action = {
+            "_op_type": "index",
+            "_index": index,
+            "_source": object_repr
+        }
+        if trace_id is not None:
+            action["_id"] = trace_id
+        return action
+
+    def _bulk_documents(self, actions: Iterable[dict], chunk_size: int = 500) -> List[Tuple[Optional[str], Optional[str]]]:
+        """
+        Execute a set of actions through the Elasticsearch bulk API.
+        The failure of a single action does not abort the others, the outcome is reported for each action instead.
+
+        :param Iterable[dict] actions: the bulk actions to execute
+        :param int chunk_size: the number of actions to send to Elasticsearch in a single request
+        :return: a list containing, in the same order of the actions, a tuple with the trace_id of the document and the error occurred (`None` when the action succeeded)
+        """
+
+        results = []
+        for succeeded, item in streaming_bulk(self._es, actions, chunk_size=chunk_size, raise_on_error=False):
+            outcome = next(iter(item.values()))
+            if succeeded:
+                results.append((outcome.get("_id"), None))
+            else:
+                error = outcome.get("error")
+                if isinstance(error, dict):
+                    error = f"{error.get('type')}: {error.get('reason')}"
+                results.append((outcome.get("_id"), str(error)))
+        return results
+
     def _get_document(self, index: str, query: dict) -> Tuple[dict, str, str, str]:
         """
         Retrieve a document from Elasticsearch
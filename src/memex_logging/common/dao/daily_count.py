@@ -0,0 +1,130 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+import logging
+from datetime import datetime, date, timedelta
+from typing import Dict
+
+from elasticsearch import Elasticsearch
+
+from memex_logging.common.dao.common import CommonDao
+
+
+logger = logging.getLogger("logger.common.dao.daily_count")
+
+
+class DailyCountDao(CommonDao):
+    """
+    A dao for the management of the partial results of the count analytics, each document holds the count of a metric of a project for a single day.
+    The counts are stored in a single index, created by the migrator, since each day only has a few small documents.
+    """
+
+    INDEX = "daily_count"
+
+    def __init__(self, es: Elasticsearch) -> None:
+        """
+        :param Elasticsearch es: a connector for Elasticsearch
+        """
+        super().__init__(es, self.INDEX)
+
+    @staticmethod
+    def _build_trace_id(project: str, dimension: str, metric: str, day: date) -> str:
+        return f"{project}:{dimension}:{metric}:{day.isoformat()}"
+
+    def get(self, project: str, dimension: str, metric: str, from_day: date, to_day: date, settling_time: timedelta = timedelta(0)) -> Dict[date, int]:
+        """
+        Retrieve the daily counts of a metric stored for a range of days
+
+        :param str project: the project of the counts
+        :param str dimension: the dimension of the metric
+        :param str metric: the metric
+        :param date from_day: the first day of the range
+        :param date to_day: the day following the last one of the range
+        :param timedelta settling_time: the minimum time between the end of a day and the creation of its count, the counts created earlier are not returned since they may miss the messages stored late
+        :return: a dictionary containing the count of each day of the range that has been stored
+        """
+
+        query = {
+            "size": max((to_day - from_day).days, 1),
+            "query": {
+                "bool": {
+                    "filter": [
+                        {
+                            "term": {
+                                "project": project
+                            }
+                        },
+                        {
+                            "term": {
+                                "dimension": dimension
+                            }
+                        },
+                        {
+                            "term": {
+                                "metric": metric
+                            }
+                        },
+                        {
+                            "range": {
+                                "day": {
+                                    "gte": from_day.isoformat(),
+                                    "lt": to_day.isoformat()
+                                }
+                            }
+                        }
+                    ]
+                }
+            }
+        }
+
+        # until the migrator creates the index there are no stored counts, and all the days are counted from the messages
+        response = self._es.search(index=self.INDEX, body=query, ignore_unavailable=True)
+        counts = {}
+        for hit in response['hits']['hits']:
+            day = date.fromisoformat(hit['_source']['day'])
+            if datetime.fromisoformat(hit['_source']['creationDt']) >= datetime.combine(day + timedelta(days=1), datetime.min.time()) + settling_time:
+                counts[day] = hit['_source']['count']
+        return counts
+
+    def add(self, project: str, dimension: str, metric: str, counts: Dict[date, int]) -> None:
+        """
+        Store the daily counts of a metric, the count already stored for a day is replaced
+
+        :param str project: the project of the counts
+        :param str dimension: the dimension of the metric
+        :param str metric: the metric
+        :param Dict[date, int] counts: the count of each day
+        """
+
+        creation_datetime = datetime.now().isoformat()
+        actions = [
+            self._build_index_action(
+                self.INDEX,
+                {
+                    "project": project,
+                    "dimension": dimension,
+                    "metric": metric,
+                    "day": day.isoformat(),
+                    "count": count,
+                    "creationDt": creation_datetime
+                },
+                trace_id=self._build_trace_id(project, dimension, metric, day)
+            ) for day, count in counts.items()
+        ]
+
+        for trace_id, error in self._bulk_documents(actions):
+            if error is not None:
+                logger.warning(f"Could not store the daily count [{trace_id}]: {error}")
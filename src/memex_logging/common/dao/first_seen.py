@@ -0,0 +1,175 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, annotations
+
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from elasticsearch import Elasticsearch
+
+from memex_logging.common.dao.common import CommonDao
+from memex_logging.common.model.message import Message
+
+
+logger = logging.getLogger("logger.common.dao.first_seen")
+
+
+class FirstSeenDao(CommonDao):
+    """
+    A dao for the management of the registry of the users and conversations of each project, each document holds the datetime of the first message of a user or a conversation.
+    A document is only updated when a message earlier than the registered one is stored, so the registry does not depend on the order in which the messages are stored.
+    """
+
+    INDEX = "first_seen"
+    # the registered datetime is kept if not later than the one of the message, the datetimes stored by the migrator are in UTC while the other ones keep the offset of the message
+    # and the ones without an offset are in UTC as for Elasticsearch
+    UPSERT_SCRIPT = """
+        String registered = ctx._source.firstSeen.toString();
+        long registeredMillis;
+        try {
+            registeredMillis = ZonedDateTime.parse(registered).toInstant().toEpochMilli();
+        } catch (DateTimeParseException e) {
+            registeredMillis = LocalDateTime.parse(registered).toInstant(ZoneOffset.UTC).toEpochMilli();
+        }
+        if (params.firstSeenMillis < registeredMillis) {
+            ctx._source.firstSeen = params.firstSeen;
+        } else {
+            ctx.op = 'none';
+        }
+    """
+
+    USER = "user"
+    CONVERSATION = "conversation"
+
+    def __init__(self, es: Elasticsearch) -> None:
+        """
+        :param Elasticsearch es: a connector for Elasticsearch
+        """
+        super().__init__(es, self.INDEX)
+
+    @staticmethod
+    def build_trace_id(project: str, entry_type: str, value: str) -> str:
+        return f"{project}:{entry_type}:{value}"
+
+    @staticmethod
+    def build_repr(project: str, entry_type: str, value: str, first_seen: str) -> dict:
+        return {
+            "project": project,
+            "type": entry_type,
+            "value": value,
+            "firstSeen": first_seen
+        }
+
+    def build_upsert_actions(self, messages: List[Message]) -> List[dict]:
+        """
+        Build the bulk actions registering the users and the conversations of a list of messages, only the earliest message of each user and conversation is considered
+
+        :param List[Message] messages: the messages
+        :return: the bulk actions, creating the entries that are not registered yet and moving back the ones registered with a later message
+        """
+
+        first_seen: Dict[Tuple[str, str, str], datetime] = {}
+        for message in messages:
+            if message.project is None:
+                continue
+            for entry_type, value in ((self.USER, message.user_id), (self.CONVERSATION, message.conversation_id)):
+                if value is None:
+                    continue
+                key = (message.project, entry_type, value)
+                if key not in first_seen or message.timestamp < first_seen[key]:
+                    first_seen[key] = message.timestamp
+
+        return [
+            {
+                "_op_type": "update",
+                "_index": self.INDEX,
+                "_id": self.build_trace_id(project, entry_type, value),
+                # the concurrent registrations of the same entry are applied one after the other
+                "retry_on_conflict": 3,
+                "script": {
+                    "lang": "painless",
+                    "source": self.UPSERT_SCRIPT,
+                    "params": {
+                        "firstSeen": timestamp.isoformat(),
+                        "firstSeenMillis": self._to_millis(timestamp)
+                    }
+                },
+                "upsert": self.build_repr(project, entry_type, value, timestamp.isoformat())
+            } for (project, entry_type, value), timestamp in first_seen.items()
+        ]
+
+    @staticmethod
+    def _to_millis(timestamp: datetime) -> int:
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        return int(timestamp.timestamp() * 1000)
+
+    def add(self, messages: List[Message]) -> int:
+        """
+        Register the users and the conversations of a list of messages, keeping the earliest message of the ones already registered
+
+        :param List[Message] messages: the messages
+        :return: the number of entries registered or confirmed
+        """
+
+        registered = 0
+        for _, error in self._bulk_documents(self.build_upsert_actions(messages)):
+            if error is None:
+                registered += 1
+            else:
+                logger.warning(f"Could not register a first seen entry: {error}")
+        return registered
+
+    def count(self, project: str, entry_type: str, from_time: Optional[datetime], to_time: datetime) -> int:
+        """
+        Count the users or the conversations of a project first seen in a time range
+
+        :param str project: the project
+        :param str entry_type: the type of the entries, either `user` or `conversation`
+        :param Optional[datetime] from_time: the lower bound of the range, if not specified the range is open
+        :param datetime to_time: the upper bound of the range
+        :return: the number of entries first seen in the range
+        """
+
+        body = {
+            "query": {
+                "bool": {
+                    "filter": [
+                        {
+                            "term": {
+                                "project": project
+                            }
+                        },
+                        {
+                            "term": {
+                                "type": entry_type
+                            }
+                        },
+                        {
+                            "range": {
+                                "firstSeen": {
+                                    "gte": from_time.isoformat() if from_time is not None else None,
+                                    "lte": to_time.isoformat()
+                                }
+                            }
+                        }
+                    ]
+                }
+            }
+        }
+
+        return self._es.count(index=self.INDEX, body=body)['count']
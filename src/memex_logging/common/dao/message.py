@@ -16,11 +16,14 @@ from __future__ import absolute_import, annotations
 
 import logging
 from datetime import datetime
-from typing import Tuple, List, Optional
+from typing import Tuple, List, Optional, Iterator, Union
 
 from elasticsearch import Elasticsearch
+from elasticsearch.helpers import scan
 
 from memex_logging.common.dao.common import CommonDao
+from memex_logging.common.dao.first_seen import FirstSeenDao
+from memex_logging.common.index import IndexResolver
 from memex_logging.common.model.message import Message
 
 
@@ -34,11 +37,25 @@ class MessageDao(CommonDao):
 
     BASE_INDEX = "message"
 
-    def __init__(self, es: Elasticsearch) -> None:
+    def __init__(self, es: Elasticsearch, index_resolver: Optional[IndexResolver] = None, first_seen_dao: Optional[FirstSeenDao] = None) -> None:
         """
         :param Elasticsearch es: a connector for Elasticsearch
+        :param Optional[IndexResolver] index_resolver: the resolver of the daily indices to query for a time range
+        :param Optional[FirstSeenDao] first_seen_dao: the registry of the users and conversations to keep up to date with the stored messages, if not specified no registry is kept
         """
         super().__init__(es, self.BASE_INDEX)
+        self._index_resolver = index_resolver if index_resolver is not None else IndexResolver(es)
+        self._first_seen_dao = first_seen_dao
+
+    def _register_first_seen(self, messages: List[Message]) -> None:
+        if self._first_seen_dao is None or len(messages) == 0:
+            return
+
+        # the messages are already stored, so a failure of the registry must not be reported as a failure of the messages
+        try:
+            self._first_seen_dao.add(messages)
+        except Exception as e:
+            logger.exception(f"Could not register the users and conversations of [{len(messages)}] messages", exc_info=e)
 
     @staticmethod
     def _build_query_by_message_id(message_id: str) -> dict:
@@ -49,7 +66,7 @@ class MessageDao(CommonDao):
                     "must": [
                         {
                             "match_phrase": {
-                                "messageId.keyword": message_id
+                                "messageId": message_id
                             }
                         }
                     ]
@@ -66,7 +83,7 @@ class MessageDao(CommonDao):
                     "must": [
                         {
                             "match_phrase": {
-                                "userId.keyword": user_id
+                                "userId": user_id
                             }
                         }
                     ]
@@ -79,7 +96,7 @@ class MessageDao(CommonDao):
         query["query"]["bool"]["must"].append(
             {
                 "match_phrase": {
-                    "userId.keyword": user_id
+                    "userId": user_id
                 }
             }
         )
@@ -90,7 +107,7 @@ class MessageDao(CommonDao):
         query["query"]["bool"]["must"].append(
             {
                 "match_phrase": {
-                    "channel.keyword": channel
+                    "channel": channel
                 }
             }
         )
@@ -101,7 +118,7 @@ class MessageDao(CommonDao):
         query["query"]["bool"]["must"].append(
             {
                 "match_phrase": {
-                    "type.keyword": message_type
+                    "type": message_type
                 }
             }
         )
@@ -116,7 +133,47 @@ class MessageDao(CommonDao):
         """
 
         index = self._generate_index(dt=message.timestamp)
-        return self._add_document(index, message.to_repr())
+        trace_id = self._add_document(index, message.to_repr())
+        self._register_first_seen([message])
+        return trace_id
+
+    def build_bulk_action(self, message: Message, trace_id: Optional[str] = None) -> dict:
+        """
+        Build the bulk action for adding a message to Elasticsearch
+
+        :param Message message: the message to add
+        :param Optional[str] trace_id: the trace_id to assign to the message, if not specified it is generated by Elasticsearch
+        :return: the bulk action
+        """
+
+        return self._build_index_action(self._generate_index(dt=message.timestamp), message.to_repr(), trace_id=trace_id)
+
+    def build_first_seen_actions(self, messages: List[Message]) -> List[dict]:
+        """
+        Build the bulk actions for registering the users and conversations of the messages
+
+        :param List[Message] messages: the messages to add
+        :return: the bulk actions, empty if no registry is kept
+        """
+
+        return self._first_seen_dao.build_upsert_actions(messages) if self._first_seen_dao is not None else []
+
+    def add_batch(self, messages: List[Message]) -> List[Tuple[Optional[str], Optional[str]]]:
+        """
+        Add a batch of messages to Elasticsearch using the bulk API.
+        The messages are grouped by their daily index, the failure of a message does not prevent the others from being stored.
+
+        :param List[Message] messages: the messages to add
+        :return: a list containing, in the same order of the messages, a tuple with the trace_id of the message and the error occurred while storing it (`None` when the message has been stored)
+        """
+
+        actions = [self.build_bulk_action(message) for message in messages]
+        positions = sorted(range(len(actions)), key=lambda position: actions[position]["_index"])
+        results = [(None, None)] * len(actions)
+        for position, result in zip(positions, self._bulk_documents(actions[position] for position in positions)):
+            results[position] = result
+        self._register_first_seen([message for message, (_, error) in zip(messages, results) if error is None])
+        return results
 
     def _build_query_based_on_parameters(self, trace_id: Optional[str] = None, message_id: Optional[str] = None, user_id: Optional[str] = None) -> dict:
         """
@@ -141,7 +198,8 @@ class MessageDao(CommonDao):
             raise ValueError("Missing required parameter: you have to specify only the `trace_id` or the `message_id` and the `user_id`")
 
     def get(self, project: Optional[str] = None, message_id: Optional[str] = None,
-            user_id: Optional[str] = None, trace_id: Optional[str] = None) -> Tuple[Message, str]:  # TODO check the usage of trace_id in messages
+            user_id: Optional[str] = None, trace_id: Optional[str] = None, raw: bool = False,
+            source_includes: Optional[List[str]] = None, source_excludes: Optional[List[str]] = None) -> Tuple[Union[Message, dict], str]:  # TODO check the usage of trace_id in messages
         """
         Retrieve a message from Elasticsearch specifying only the `trace_id` or the `project`, the `message_id` and the `user_id`
 
@@ -149,6 +207,9 @@ class MessageDao(CommonDao):
         :param Optional[str] message_id: the id of the message to retrieve
         :param Optional[str] user_id: the id of the user of the message to retrieve
         :param Optional[str] trace_id: the trace_id of the message to retrieve
+        :param bool raw: whether to return the message as stored in Elasticsearch instead of building the model
+        :param Optional[List[str]] source_includes: the fields of the raw message to return, if not specified all the fields are returned
+        :param Optional[List[str]] source_excludes: the fields of the raw message not to return
         :return: a tuple containing the message and the trace_id of that massage
         :raise EntryNotFound: when could not find any message
         :raise ValueError: when specified neither the `trace_id` or the `message_id` and the `user_id`
@@ -158,9 +219,9 @@ class MessageDao(CommonDao):
         query = self._build_query_based_on_parameters(trace_id=trace_id, message_id=message_id, user_id=user_id)
         if project:
             query = self._add_project_to_query(query, project)
+        query = self._add_source_filter_to_query(query, raw, source_includes, source_excludes)
         raw_message, trace_id, index, doc_type = self._get_document(index, query)
-        message = Message.from_repr(raw_message)
-        return message, trace_id
+        return self._decode(raw_message, raw), trace_id
 
     def delete(self, project: Optional[str] = None, message_id: Optional[str] = None,
                user_id: Optional[str] = None, trace_id: Optional[str] = None) -> None:
@@ -185,26 +246,32 @@ class MessageDao(CommonDao):
         query = self._build_query_by_user_id(user_id)
         self._delete_document(index, query)
 
-    def search(self, project: str, from_time: datetime, to_time: datetime, max_size: int, user_id: Optional[str] = None,
-               channel: Optional[str] = None, message_type: Optional[str] = None) -> List[Message]:
-        """
-        Search messages in Elasticsearch
+    @staticmethod
+    def _add_source_filter_to_query(query: dict, raw: bool, source_includes: Optional[List[str]], source_excludes: Optional[List[str]]) -> dict:
+        if source_includes is None and source_excludes is None:
+            return query
+
+        if not raw:
+            raise ValueError("The fields of the messages can be selected only when retrieving the raw messages")
+
+        source_filter = {}
+        if source_includes is not None:
+            source_filter["includes"] = source_includes
+        if source_excludes is not None:
+            source_filter["excludes"] = source_excludes
+        query["_source"] = source_filter
+        return query
 
-        :param str project: the project from which to search for messages
-        :param datetime from_time: the time from which to search for messages
-        :param datetime to_time: the time up to which to search for messages
-        :param int max_size: the maximum number of messages to retrieve
-        :param Optional[str] user_id: the id of the user to search for messages for
-        :param Optional[str] channel: the channel from which to search for messages
-        :param Optional[str] message_type: the type of the messages to search for
-        :return: a list containing the messages
-        :raise ValueError: when `fromTime` is greater than `toTime`
-        """
+    @staticmethod
+    def _decode(raw_message: dict, raw: bool) -> Union[Message, dict]:
+        # the stored messages have been validated when they were received
+        return raw_message if raw else Message.from_repr(raw_message, trusted=True)
 
+    def _build_search_query(self, project: str, from_time: datetime, to_time: datetime, max_size: int, user_id: Optional[str] = None,
+                            channel: Optional[str] = None, message_type: Optional[str] = None) -> dict:
         if from_time > to_time:
             raise ValueError("`fromTime` is greater than `toTime`: `fromTime` must be is smaller than `toTime`")
 
-        index = self._generate_index()
         query = self._build_time_range_query(from_time, to_time, max_size)
         query = self._add_project_to_query(query, project)
 
@@ -217,7 +284,96 @@ class MessageDao(CommonDao):
         if message_type:
             query = self._add_message_type_to_query(query, message_type)
 
+        return query
+
+    def search(self, project: str, from_time: datetime, to_time: datetime, max_size: int, user_id: Optional[str] = None,
+               channel: Optional[str] = None, message_type: Optional[str] = None, raw: bool = False,
+               source_includes: Optional[List[str]] = None, source_excludes: Optional[List[str]] = None) -> List[Union[Message, dict]]:
+        """
+        Search messages in Elasticsearch
+
+        :param str project: the project from which to search for messages
+        :param datetime from_time: the time from which to search for messages
+        :param datetime to_time: the time up to which to search for messages
+        :param int max_size: the maximum number of messages to retrieve
+        :param Optional[str] user_id: the id of the user to search for messages for
+        :param Optional[str] channel: the channel from which to search for messages
+        :param Optional[str] message_type: the type of the messages to search for
+        :param bool raw: whether to return the messages as stored in Elasticsearch instead of building the model
+        :param Optional[List[str]] source_includes: the fields of the raw messages to return, if not specified all the fields are returned
+        :param Optional[List[str]] source_excludes: the fields of the raw messages not to return
+        :return: a list containing the messages
+        :raise ValueError: when `fromTime` is greater than `toTime`
+        """
+
+        query = self._build_search_query(project, from_time, to_time, max_size, user_id=user_id, channel=channel, message_type=message_type)
+        query = self._add_source_filter_to_query(query, raw, source_includes, source_excludes)
+        index = self._index_resolver.resolve(self.BASE_INDEX, from_time, to_time)
         messages_repr = self._search_documents(index, query)
         if len(messages_repr) == max_size:
             logger.warning(f"The number of messages retrieved has reached the maximum size of `{max_size}`")
-        return [Message.from_repr(message_repr) for message_repr in messages_repr]
+        return [self._decode(message_repr, raw) for message_repr in messages_repr]
+
+    def search_page(self, project: str, from_time: datetime, to_time: datetime, max_size: int, search_after: Optional[list] = None,
+                    user_id: Optional[str] = None, channel: Optional[str] = None, message_type: Optional[str] = None, raw: bool = False,
+                    source_includes: Optional[List[str]] = None, source_excludes: Optional[List[str]] = None) -> Tuple[List[Union[Message, dict]], Optional[list]]:
+        """
+        Search a page of messages in Elasticsearch, the messages are sorted by timestamp, message id, user id and project
+
+        :param str project: the project from which to search for messages
+        :param datetime from_time: the time from which to search for messages
+        :param datetime to_time: the time up to which to search for messages
+        :param int max_size: the maximum number of messages in the page
+        :param Optional[list] search_after: the sort values of the last message of the previous page, if not specified the first page is retrieved
+        :param Optional[str] user_id: the id of the user to search for messages for
+        :param Optional[str] channel: the channel from which to search for messages
+        :param Optional[str] message_type: the type of the messages to search for
+        :param bool raw: whether to return the messages as stored in Elasticsearch instead of building the model
+        :param Optional[List[str]] source_includes: the fields of the raw messages to return, if not specified all the fields are returned
+        :param Optional[List[str]] source_excludes: the fields of the raw messages not to return
+        :return: a tuple containing the messages and the sort values to use for retrieving the next page (`None` if there are no more messages)
+        :raise ValueError: when `fromTime` is greater than `toTime`
+        """
+
+        query = self._build_search_query(project, from_time, to_time, max_size, user_id=user_id, channel=channel, message_type=message_type)
+        # a message is identified by its id together with the user and the project, they break the ties between messages with the same timestamp so that each message belongs to exactly one page
+        query["sort"].extend([{"messageId": {"order": "asc"}}, {"userId": {"order": "asc"}}, {"project": {"order": "asc"}}])
+        if search_after is not None:
+            query["search_after"] = search_after
+        query = self._add_source_filter_to_query(query, raw, source_includes, source_excludes)
+
+        index = self._index_resolver.resolve(self.BASE_INDEX, from_time, to_time)
+        response = self._es.search(index=index, body=query)
+        hits = response['hits']['hits']
+        messages = [self._decode(hit['_source'], raw) for hit in hits]
+        next_search_after = hits[-1]['sort'] if len(hits) > 0 and len(hits) == max_size else None
+        return messages, next_search_after
+
+    def scan(self, project: str, from_time: datetime, to_time: datetime, user_id: Optional[str] = None, channel: Optional[str] = None,
+             message_type: Optional[str] = None, page_size: int = 1000, raw: bool = False,
+             source_includes: Optional[List[str]] = None, source_excludes: Optional[List[str]] = None) -> Iterator[Union[Message, dict]]:
+        """
+        Lazily iterate over all the messages in a time range, the messages are fetched from Elasticsearch one page at a time with a scroll and they are not sorted
+
+        :param str project: the project from which to retrieve the messages
+        :param datetime from_time: the time from which to retrieve the messages
+        :param datetime to_time: the time up to which to retrieve the messages
+        :param Optional[str] user_id: the id of the user to retrieve the messages for
+        :param Optional[str] channel: the channel from which to retrieve the messages
+        :param Optional[str] message_type: the type of the messages to retrieve
+        :param int page_size: the number of messages fetched from Elasticsearch with each request
+        :param bool raw: whether to return the messages as stored in Elasticsearch instead of building the model
+        :param Optional[List[str]] source_includes: the fields of the raw messages to return, if not specified all the fields are returned
+        :param Optional[List[str]] source_excludes: the fields of the raw messages not to return
+        :return: an iterator over the messages
+        :raise ValueError: when `fromTime` is greater than `toTime`
+        """
+
+        # the query is built before starting the iteration so that an invalid range is reported to the caller straight away
+        query = self._build_search_query(project, from_time, to_time, page_size, user_id=user_id, channel=channel, message_type=message_type)
+        # the size of the pages is specified to the scroll, while the sort is replaced by the index order that is the most efficient one for scrolling
+        query.pop("size")
+        query.pop("sort")
+        query = self._add_source_filter_to_query(query, raw, source_includes, source_excludes)
+        index = self._index_resolver.resolve(self.BASE_INDEX, from_time, to_time)
+        return (self._decode(hit['_source'], raw) for hit in scan(self._es, query=query, index=index, size=page_size))
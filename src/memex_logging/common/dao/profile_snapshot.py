@@ -0,0 +1,174 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, annotations
+
+import logging
+from datetime import datetime, date
+from typing import Dict, List, Optional, Tuple
+
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import scan
+
+from memex_logging.common.dao.common import CommonDao
+
+
+logger = logging.getLogger("logger.common.dao.profile_snapshot")
+
+
+class ProfileSnapshotDao(CommonDao):
+    """
+    A dao for the management of the snapshots of the fields of the user profiles needed by the analytics, each document holds the fields of a user of a project
+    """
+
+    INDEX = "profile_snapshot"
+    # the maximum number of users filtered by a single search, below the limit of the terms of a query (`index.max_terms_count`, 65536 by default)
+    MAX_USERS_PER_SEARCH = 10000
+
+    def __init__(self, es: Elasticsearch) -> None:
+        """
+        :param Elasticsearch es: a connector for Elasticsearch
+        """
+        super().__init__(es, self.INDEX)
+
+    @staticmethod
+    def build_trace_id(project: str, user_id: str) -> str:
+        return f"{project}:{user_id}"
+
+    @staticmethod
+    def build_repr(project: str, user_id: str, date_of_birth: Optional[date], gender: Optional[str], locale: Optional[str], nationality: Optional[str],
+                   last_update_ts: Optional[int], sync_dt: datetime) -> dict:
+        return {
+            "project": project,
+            "userId": user_id,
+            "dateOfBirth": date_of_birth.isoformat() if date_of_birth is not None else None,
+            "gender": gender,
+            "locale": locale,
+            "nationality": nationality,
+            "lastUpdateTs": last_update_ts,
+            "syncDt": sync_dt.isoformat()
+        }
+
+    def add(self, snapshots: List[dict]) -> None:
+        """
+        Store the snapshots of the profiles, the snapshot already stored for the same project and user is replaced
+
+        :param List[dict] snapshots: the representations of the snapshots
+        :raise RuntimeError: when some snapshots could not be stored
+        """
+
+        actions = [self._build_index_action(self.INDEX, snapshot, trace_id=self.build_trace_id(snapshot["project"], snapshot["userId"])) for snapshot in snapshots]
+        errors = [error for _, error in self._bulk_documents(actions) if error is not None]
+        if len(errors) > 0:
+            raise RuntimeError(f"Could not store [{len(errors)}] profile snapshots: {errors[0]}")
+
+    def get_sync_datetimes(self, project: str) -> Dict[str, datetime]:
+        """
+        :param str project: the project of the users
+        :return: the datetime of the last synchronization of the snapshot of each user of the project
+        """
+
+        query = {
+            "_source": ["userId", "syncDt"],
+            "query": {
+                "bool": {
+                    "filter": [
+                        {
+                            "term": {
+                                "project": project
+                            }
+                        }
+                    ]
+                }
+            }
+        }
+
+        return {hit['_source']['userId']: datetime.fromisoformat(hit['_source']['syncDt']) for hit in scan(self._es, index=self.INDEX, query=query, size=1000)}
+
+    def count_demographics(self, project: str, user_ids: List[str], date_of_birth_ranges: List[Tuple[str, Optional[date], Optional[date]]]) -> Tuple[int, Dict[str, int], Dict[str, int]]:
+        """
+        Count the users with the date of birth in each range and with each gender, with a search for every `MAX_USERS_PER_SEARCH` users
+
+        :param str project: the project of the users
+        :param List[str] user_ids: the identifiers of the users
+        :param List[Tuple[str, Optional[date], Optional[date]]] date_of_birth_ranges: the key, the first day and the day following the last one of each range of dates of birth, the open bounds are `None`
+        :return: the number of users with a date of birth, the number of users in each range of dates of birth and the number of users of each gender
+        """
+
+        # a user repeated in the list could end up in more chunks and be counted more times
+        user_ids = list(dict.fromkeys(user_ids))
+        with_date_of_birth = 0
+        age_counts = {}
+        gender_counts = {}
+        for start in range(0, len(user_ids), self.MAX_USERS_PER_SEARCH):
+            chunk_with_date_of_birth, chunk_age_counts, chunk_gender_counts = self._count_chunk_demographics(project, user_ids[start:start + self.MAX_USERS_PER_SEARCH], date_of_birth_ranges)
+            with_date_of_birth += chunk_with_date_of_birth
+            for key, count in chunk_age_counts.items():
+                age_counts[key] = age_counts.get(key, 0) + count
+            for gender, count in chunk_gender_counts.items():
+                gender_counts[gender] = gender_counts.get(gender, 0) + count
+
+        return with_date_of_birth, age_counts, gender_counts
+
+    def _count_chunk_demographics(self, project: str, user_ids: List[str], date_of_birth_ranges: List[Tuple[str, Optional[date], Optional[date]]]) -> Tuple[int, Dict[str, int], Dict[str, int]]:
+        body = {
+            "query": {
+                "bool": {
+                    "filter": [
+                        {
+                            "term": {
+                                "project": project
+                            }
+                        },
+                        {
+                            "terms": {
+                                "userId": user_ids
+                            }
+                        }
+                    ]
+                }
+            },
+            "aggs": {
+                "with_date_of_birth": {
+                    "value_count": {
+                        "field": "dateOfBirth"
+                    }
+                },
+                "date_of_birth": {
+                    "date_range": {
+                        "field": "dateOfBirth",
+                        "format": "yyyy-MM-dd",
+                        "keyed": True,
+                        "ranges": [
+                            dict(key=key, **{bound: day.isoformat() for bound, day in (("from", from_day), ("to", to_day)) if day is not None})
+                            for key, from_day, to_day in date_of_birth_ranges
+                        ]
+                    }
+                },
+                "gender": {
+                    "terms": {
+                        "field": "gender",
+                        "size": 10
+                    }
+                }
+            }
+        }
+
+        response = self._es.search(index=self.INDEX, body=body, size=0)
+        aggregations = response.get('aggregations', {})
+        with_date_of_birth = int(aggregations.get('with_date_of_birth', {}).get('value', 0))
+        age_counts = {key: bucket['doc_count'] for key, bucket in aggregations.get('date_of_birth', {}).get('buckets', {}).items()}
+        gender_counts = {bucket['key']: bucket['doc_count'] for bucket in aggregations.get('gender', {}).get('buckets', [])}
+        return with_date_of_birth, age_counts, gender_counts
@@ -0,0 +1,127 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+import logging
+from datetime import datetime, date
+from typing import List, Optional, Tuple
+
+from elasticsearch import Elasticsearch
+from elasticsearch.exceptions import NotFoundError
+from elasticsearch.helpers import scan
+
+from memex_logging.common.dao.common import CommonDao
+from memex_logging.common.model.rollup import MessageRollup
+
+
+logger = logging.getLogger("logger.common.dao.rollup")
+
+
+class MessageRollupDao(CommonDao):
+    """
+    A dao for the management of the daily summaries of the messages of each project.
+    The summaries are stored in a single index, created by the migrator, since each day only has a document for each project.
+    """
+
+    INDEX = "message_rollup"
+    # the index holding the range of days that have been summarized
+    STATE_INDEX = "message_rollup_state"
+    STATE_ID = "state"
+
+    def __init__(self, es: Elasticsearch) -> None:
+        """
+        :param Elasticsearch es: a connector for Elasticsearch
+        """
+        super().__init__(es, self.INDEX)
+
+    def add(self, rollups: List[MessageRollup]) -> None:
+        """
+        Store the daily summaries of the messages, the summary already stored for the same project and day is replaced
+
+        :param List[MessageRollup] rollups: the summaries to store
+        :raise RuntimeError: when some summaries could not be stored
+        """
+
+        actions = [
+            self._build_index_action(
+                self.INDEX,
+                rollup.to_repr(),
+                trace_id=f"{rollup.project}:{rollup.day.isoformat()}"
+            ) for rollup in rollups
+        ]
+
+        errors = [error for _, error in self._bulk_documents(actions, chunk_size=100) if error is not None]
+        if len(errors) > 0:
+            raise RuntimeError(f"Could not store [{len(errors)}] message rollups: {errors[0]}")
+
+    def search(self, project: str, from_day: Optional[date], to_day: date) -> List[MessageRollup]:
+        """
+        Retrieve the daily summaries of the messages of a project for a range of days
+
+        :param str project: the project of the messages
+        :param Optional[date] from_day: the first day of the range, if not specified the range is open
+        :param date to_day: the day following the last one of the range
+        :return: the summaries of the days of the range with at least a message
+        """
+
+        query = {
+            "query": {
+                "bool": {
+                    "filter": [
+                        {
+                            "term": {
+                                "project": project
+                            }
+                        },
+                        {
+                            "range": {
+                                "day": {
+                                    "gte": from_day.isoformat() if from_day is not None else None,
+                                    "lt": to_day.isoformat()
+                                }
+                            }
+                        }
+                    ]
+                }
+            }
+        }
+
+        return [MessageRollup.from_repr(hit['_source']) for hit in scan(self._es, index=self.INDEX, query=query, size=100, ignore_unavailable=True)]
+
+    def get_state(self) -> Tuple[Optional[date], Optional[date]]:
+        """
+        :return: the first and the last day that have been summarized, `None` if no day has been summarized yet
+        """
+
+        try:
+            raw_state = self._es.get(index=self.STATE_INDEX, id=self.STATE_ID)['_source']
+        except NotFoundError:
+            return None, None
+
+        return date.fromisoformat(raw_state['firstDay']), date.fromisoformat(raw_state['lastDay'])
+
+    def set_state(self, first_day: date, last_day: date) -> None:
+        """
+        Store the range of days that have been summarized
+
+        :param date first_day: the first day that has been summarized
+        :param date last_day: the last day that has been summarized
+        """
+
+        self._es.index(index=self.STATE_INDEX, id=self.STATE_ID, body={
+            "firstDay": first_day.isoformat(),
+            "lastDay": last_day.isoformat(),
+            "updateDt": datetime.now().isoformat()
+        })
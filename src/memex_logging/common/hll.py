@@ -0,0 +1,154 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+import base64
+import hashlib
+import math
+import struct
+import zlib
+from typing import Optional, Set
+
+
+class HyperLogLog:
+    """
+    A mergeable sketch estimating the number of distinct values.
+    As in HyperLogLog++, while the number of distinct hashes is below the sparse limit they are kept as they are and the estimation is exact, then the sketch switches to the dense registers.
+    The values are hashed on 32 bits, that is enough for estimating up to hundreds of millions of distinct values.
+    """
+
+    HASH_BITS = 32
+
+    SPARSE = 0
+    DENSE = 1
+
+    def __init__(self, precision: int = 14, sparse_limit: int = 512) -> None:
+        """
+        :param int precision: the number of bits of the hash used for selecting the register, the relative error is about `1.04 / sqrt(2 ** precision)`
+        :param int sparse_limit: the maximum number of hashes kept before switching to the dense registers
+        """
+
+        if not 4 <= precision <= 18:
+            raise ValueError(f"Unsupported precision [{precision}], it must be between 4 and 18")
+
+        self.precision = precision
+        self.sparse_limit = sparse_limit
+        self._hashes: Optional[Set[int]] = set()
+        self._registers: Optional[bytearray] = None
+
+    @property
+    def is_sparse(self) -> bool:
+        return self._registers is None
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return struct.unpack("<I", hashlib.blake2b(value.encode("utf-8"), digest_size=4).digest())[0]
+
+    def _add_hash_to_registers(self, value_hash: int) -> None:
+        index = value_hash >> (self.HASH_BITS - self.precision)
+        remaining = value_hash & ((1 << (self.HASH_BITS - self.precision)) - 1)
+        rank = (self.HASH_BITS - self.precision) - remaining.bit_length() + 1
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    def _to_dense(self) -> None:
+        self._registers = bytearray(1 << self.precision)
+        for value_hash in self._hashes:
+            self._add_hash_to_registers(value_hash)
+        self._hashes = None
+
+    def add(self, value: str) -> None:
+        """
+        Add a value to the sketch
+
+        :param str value: the value to add
+        """
+
+        value_hash = self._hash(value)
+        if self.is_sparse:
+            self._hashes.add(value_hash)
+            if len(self._hashes) > self.sparse_limit:
+                self._to_dense()
+        else:
+            self._add_hash_to_registers(value_hash)
+
+    def merge(self, other: HyperLogLog) -> None:
+        """
+        Merge another sketch into this one, the result estimates the number of distinct values added to any of the two sketches
+
+        :param HyperLogLog other: the sketch to merge, it must have the same precision
+        :raise ValueError: when the sketches have a different precision
+        """
+
+        if other.precision != self.precision:
+            raise ValueError(f"Can not merge a sketch with precision [{other.precision}] into one with precision [{self.precision}]")
+
+        if other.is_sparse:
+            if self.is_sparse:
+                self._hashes.update(other._hashes)
+                if len(self._hashes) > self.sparse_limit:
+                    self._to_dense()
+            else:
+                for value_hash in other._hashes:
+                    self._add_hash_to_registers(value_hash)
+        else:
+            if self.is_sparse:
+                self._to_dense()
+            for index, rank in enumerate(other._registers):
+                if rank > self._registers[index]:
+                    self._registers[index] = rank
+
+    def cardinality(self) -> int:
+        """
+        :return: the estimated number of distinct values added to the sketch
+        """
+
+        if self.is_sparse:
+            return len(self._hashes)
+
+        registers = len(self._registers)
+        alpha = 0.7213 / (1 + 1.079 / registers)
+        raw_estimate = alpha * registers * registers / sum(2.0 ** -rank for rank in self._registers)
+
+        # the raw estimation is biased for small cardinalities, where linear counting is more accurate
+        zeros = self._registers.count(0)
+        if raw_estimate <= 2.5 * registers and zeros > 0:
+            return round(registers * math.log(registers / zeros))
+        return round(raw_estimate)
+
+    def to_repr(self) -> str:
+        if self.is_sparse:
+            payload = struct.pack(f"<{len(self._hashes)}I", *sorted(self._hashes))
+            header = struct.pack("<BBI", self.SPARSE, self.precision, self.sparse_limit)
+        else:
+            payload = bytes(self._registers)
+            header = struct.pack("<BBI", self.DENSE, self.precision, self.sparse_limit)
+        return base64.b64encode(zlib.compress(header + payload)).decode("ascii")
+
+    @staticmethod
+    def from_repr(raw_data: str) -> HyperLogLog:
+        data = zlib.decompress(base64.b64decode(raw_data))
+        representation, precision, sparse_limit = struct.unpack_from("<BBI", data)
+        payload = data[struct.calcsize("<BBI"):]
+
+        sketch = HyperLogLog(precision=precision, sparse_limit=sparse_limit)
+        if representation == HyperLogLog.SPARSE:
+            sketch._hashes = set(struct.unpack(f"<{len(payload) // 4}I", payload))
+        elif representation == HyperLogLog.DENSE:
+            sketch._hashes = None
+            sketch._registers = bytearray(payload)
+        else:
+            raise ValueError(f"Unrecognized representation [{representation}] for HyperLogLog")
+        return sketch
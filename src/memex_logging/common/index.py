@@ -0,0 +1,148 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+import calendar
+import logging
+import threading
+import time
+from datetime import datetime, date, timedelta
+from typing import Optional, List, Dict, Tuple
+
+from elasticsearch import Elasticsearch
+
+from memex_logging.common.model.analytic.time import TimeWindow
+from memex_logging.common.utils import Utils
+
+
+logger = logging.getLogger("logger.common.index")
+
+
+class IndexResolver:
+    """
+    Resolve the daily indices, in the format `data_type-%Y-%m-%d`, that may contain the documents of a time range.
+    The list of the existing indices is cached for `cache_ttl` seconds.
+    """
+
+    # the documents are stored in the daily index of their own timestamp, that may be expressed in a different timezone from the one of the bounds
+    TIMEZONE_MARGIN = timedelta(days=1)
+
+    def __init__(self, es: Elasticsearch, cache_ttl: float = 300) -> None:
+        """
+        :param Elasticsearch es: a connector for Elasticsearch
+        :param float cache_ttl: the number of seconds the list of the existing indices is cached
+        """
+        self._es = es
+        self._cache_ttl = cache_ttl
+        self._cache: Dict[str, Tuple[float, date, List[str]]] = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        """
+        Invalidate the cached list of the existing indices
+        """
+        with self._lock:
+            self._cache = {}
+
+    def _get_existing_indices(self, data_type: str) -> Tuple[date, List[str]]:
+        with self._lock:
+            cached = self._cache.get(data_type)
+            if cached is not None and time.monotonic() - cached[0] < self._cache_ttl:
+                return cached[1], cached[2]
+
+        indices = sorted(self._es.indices.get_alias(index=Utils.generate_index(data_type)).keys())
+        snapshot_date = datetime.now().date()
+        with self._lock:
+            self._cache[data_type] = (time.monotonic(), snapshot_date, indices)
+        return snapshot_date, indices
+
+    @staticmethod
+    def _parse_date(prefix: str, index: str) -> Optional[date]:
+        try:
+            return datetime.strptime(index[len(prefix):], "%Y-%m-%d").date()
+        except ValueError:
+            return None
+
+    def resolve(self, data_type: str, from_time: Optional[datetime] = None, to_time: Optional[datetime] = None) -> str:
+        """
+        Resolve the indices that may contain the documents with a timestamp in the range
+
+        :param str data_type: the type of data
+        :param Optional[datetime] from_time: the lower bound of the range, if not specified the range is open
+        :param Optional[datetime] to_time: the upper bound of the range, if not specified the range is open
+        :return: the comma separated list of indices to use in a query, a pattern matching all the indices of the type of data is returned only when the existing indices can not be retrieved
+        """
+
+        wildcard = Utils.generate_index(data_type)
+        if from_time is None and to_time is None:
+            return wildcard
+
+        try:
+            snapshot_date, existing_indices = self._get_existing_indices(data_type)
+        except Exception as e:
+            logger.warning(f"Could not retrieve the existing indices for [{data_type}], falling back to [{wildcard}]", exc_info=e)
+            return wildcard
+
+        prefix = wildcard[:-1]
+        from_date = (from_time - self.TIMEZONE_MARGIN).date() if from_time is not None else None
+        to_date = (to_time + self.TIMEZONE_MARGIN).date() if to_time is not None else None
+
+        def in_range(day: date) -> bool:
+            return (from_date is None or day >= from_date) and (to_date is None or day <= to_date)
+
+        daily_indices = {}
+        other_indices = []
+        for index in existing_indices:
+            day = self._parse_date(prefix, index)
+            if day is None:
+                other_indices.append(index)
+            elif in_range(day):
+                daily_indices.setdefault((day.year, day.month), []).append(index)
+
+        # the indices of the months entirely in the range are replaced by a monthly pattern in order to keep the list short
+        selected_indices = []
+        for (year, month), indices in sorted(daily_indices.items()):
+            last_day = calendar.monthrange(year, month)[1]
+            if in_range(date(year, month, 1)) and in_range(date(year, month, last_day)) and date(year, month, last_day) < snapshot_date:
+                selected_indices.append(f"{prefix}{year:04d}-{month:02d}-*")
+            else:
+                selected_indices.extend(indices)
+
+        # the indices of the days following the caching of the list may have been created in the meantime
+        day = max(from_date, snapshot_date) if from_date is not None else snapshot_date
+        last_day = min(to_date, snapshot_date + timedelta(days=1)) if to_date is not None else snapshot_date + timedelta(days=1)
+        while day <= last_day:
+            selected_indices.append(f"{prefix}{day:%Y-%m-%d}")
+            day += timedelta(days=1)
+
+        if len(other_indices) + len(selected_indices) == 0:
+            # none of the existing indices overlaps the range, the pattern of its first day does not match any index so that the query returns nothing without searching all the indices
+            return f"{prefix}{from_date if from_date is not None else to_date:%Y-%m-%d}*"
+
+        # every index is expressed as a pattern so that the query does not fail if the index has been deleted or not yet created
+        patterns = [index if index.endswith("*") else f"{index}*" for index in other_indices + selected_indices]
+        return ",".join(dict.fromkeys(patterns))
+
+    def resolve_time_window(self, data_type: str, time_window: TimeWindow) -> str:
+        """
+        Resolve the indices that may contain the documents with a timestamp in the time window
+
+        :param str data_type: the type of data
+        :param TimeWindow time_window: the time window
+        :return: the comma separated list of indices to use in a query
+        """
+
+        from_time, to_time = Utils.extract_range_timestamps(time_window)
+        return self.resolve(data_type, from_time, to_time)
@@ -25,6 +25,8 @@ logger = logging.getLogger("logger.common.model.message")
 
 class Intent:
 
+    __slots__ = ("name", "confidence")
+
     def __init__(self, name: Optional[str], confidence: Optional[float] = None) -> None:
         """
         The intent expressed by a user.
@@ -53,6 +55,8 @@ class Intent:
 
 class UserInfoRequest:
 
+    __slots__ = ("type", "value")
+
     def __init__(self, info_type: str, value: str) -> None:
         self.type = info_type
         self.value = value
@@ -73,6 +77,8 @@ class UserInfoRequest:
 
 class LocationRequest:
 
+    __slots__ = ("latitude", "longitude")
+
     def __init__(self, latitude: float, longitude: float) -> None:
         self.latitude = latitude
         self.longitude = longitude
@@ -94,6 +100,8 @@ class LocationRequest:
 
 class LocationResponse:
 
+    __slots__ = ("latitude", "longitude", "buttons")
+
     def __init__(self, latitude: float, longitude: float, buttons: Optional[List[ActionResponse]]) -> None:
         self.latitude = latitude
         self.longitude = longitude
@@ -130,6 +138,8 @@ class LocationResponse:
 
 class ActionRequest:
 
+    __slots__ = ("value",)
+
     def __init__(self, value: str) -> None:
         self.value: str = value
 
@@ -151,6 +161,8 @@ class ActionRequest:
 
 class ActionResponse:
 
+    __slots__ = ("button_text", "button_id")
+
     def __init__(self, button_text: str, button_id: Optional[str] = None) -> None:
         """
         Create an ActionResponse object. An action response is a button that suggest the user an action to perform.
@@ -182,6 +194,8 @@ class ActionResponse:
 
 class MultiActionResponse:
 
+    __slots__ = ("buttons",)
+
     def __init__(self, buttons: Optional[List[ActionResponse]]) -> None:
         self.buttons = buttons
 
@@ -214,6 +228,8 @@ class MultiActionResponse:
 
 class TextualRequest:
 
+    __slots__ = ("value",)
+
     def __init__(self, value: str) -> None:
         self.value = value
 
@@ -233,6 +249,8 @@ class TextualRequest:
 
 class TextualResponse:
 
+    __slots__ = ("value", "buttons")
+
     def __init__(self, value: str, buttons: Optional[List[ActionResponse]]) -> None:
         self.value = value
         self.buttons = buttons
@@ -267,6 +285,8 @@ class TextualResponse:
 
 class AttachmentRequest:
 
+    __slots__ = ("uri", "alternative_text")
+
     def __init__(self, uri: str, alternative_text: Optional[str]) -> None:
         self.uri = uri
         self.alternative_text = alternative_text
@@ -292,6 +312,8 @@ class AttachmentRequest:
 
 class AttachmentResponse:
 
+    __slots__ = ("uri", "alternative_text", "buttons")
+
     def __init__(self, uri: str, alternative_text: Optional[str], buttons: Optional[List[ActionResponse]]) -> None:
         """
         Create an AttachmentResponse Object. An attachment response is a response containing only a media
@@ -338,6 +360,8 @@ class AttachmentResponse:
 
 class CarouselCardResponse:
 
+    __slots__ = ("title", "image_url", "subtitle", "default_action", "buttons")
+
     def __init__(self, title: str, image_url: Optional[str], subtitle: Optional[str], default_action: Optional[dict], buttons: Optional[List[ActionResponse]]) -> None:
         """
         Create a CarouselCardResponse Object. A carousel is a scrollable list of medias. As a best-practice, carousels should be used with no more that 6 elements and when the elements can be ranked.
@@ -398,6 +422,8 @@ class CarouselCardResponse:
 
 class CarouselResponse:
 
+    __slots__ = ("cards",)
+
     def __init__(self, cards: List[CarouselCardResponse]) -> None:
         self.cards = cards
 
@@ -429,6 +455,8 @@ class CarouselResponse:
 
 class Entity:
 
+    __slots__ = ("type", "value", "confidence")
+
     def __init__(self, entity_type: str, value: str, confidence: float) -> None:
         """
         Method to create an Entity
@@ -472,8 +500,10 @@ class Message(ABC):
       - NotificationMessage
     """
 
+    __slots__ = ("message_id", "conversation_id", "channel", "user_id", "timestamp", "content", "metadata", "project")
+
     def __init__(self, message_id: str, conversation_id: Optional[str], channel: str, user_id: str, timestamp: datetime,
-                 content, metadata: Optional[dict], project: str) -> None:
+                 content, metadata: Optional[dict], project: str, validate: bool = True) -> None:
         """
         :param str message_id: the message id
         :param Optional[str] conversation_id: the conversation identifier
@@ -483,6 +513,7 @@ class Message(ABC):
         :param content: the content of the message
         :param Optional[dict] metadata: any metadata (key/value) associated to the message
         :param str project: the project associated to the conversation
+        :param bool validate: whether to check the types of the parameters, it can be disabled for the data of a trusted source such as the stored messages
         """
 
         self.message_id = message_id
@@ -494,19 +525,25 @@ class Message(ABC):
         self.metadata = metadata
         self.project = project
 
-        if metadata is not None:
+        if validate and metadata is not None:
             if not isinstance(metadata, dict):
                 raise ValueError("Parameter `metadata` is not a dict")
 
     @staticmethod
-    def from_repr(raw_data: dict) -> Message:
+    def from_repr(raw_data: dict, trusted: bool = False) -> Message:
+        """
+        :param dict raw_data: the representation of the message
+        :param bool trusted: whether the representation comes from a trusted source, such as the stored messages, so that the types of the parameters are not checked
+        :return: the message
+        """
+
         message_type = raw_data['type'].lower()
         if message_type == MessageType.REQUEST.value:
-            return RequestMessage.from_repr(raw_data)
+            return RequestMessage.from_repr(raw_data, trusted=trusted)
         elif message_type == MessageType.RESPONSE.value:
-            return ResponseMessage.from_repr(raw_data)
+            return ResponseMessage.from_repr(raw_data, trusted=trusted)
         elif message_type == MessageType.NOTIFICATION.value:
-            return NotificationMessage.from_repr(raw_data)
+            return NotificationMessage.from_repr(raw_data, trusted=trusted)
         else:
             logger.error(f"Not supported message type {message_type}")
             raise ValueError(f"Unable to build a Message of type [{message_type}]")
@@ -522,6 +559,8 @@ class Message(ABC):
 
 class RequestMessage(Message):
 
+    __slots__ = ("domain", "intent", "entities", "language")
+
     ALLOWED_CONTENT_TYPES = [
         TextualRequest,
         ActionRequest,
@@ -532,15 +571,18 @@ class RequestMessage(Message):
 
     def __init__(self, message_id: str, conversation_id: Optional[str], channel: str, user_id: str, timestamp: datetime,
                  content, domain: Optional[str], intent: Optional[Intent], entities: List[Entity], language: Optional[str],
-                 metadata: Optional[dict], project: str) -> None:
+                 metadata: Optional[dict], project: str, validate: bool = True) -> None:
 
-        super().__init__(message_id, conversation_id, channel, user_id, timestamp, content, metadata, project)
+        super().__init__(message_id, conversation_id, channel, user_id, timestamp, content, metadata, project, validate=validate)
 
         self.domain = domain
         self.intent = intent
         self.entities = entities
         self.language = language
 
+        if not validate:
+            return
+
         if intent is not None:
             if not isinstance(intent, Intent):
                 raise ValueError("Parameter `intent` is not a Intent")
@@ -586,7 +628,7 @@ class RequestMessage(Message):
         }
 
     @staticmethod
-    def from_repr(raw_data: dict) -> RequestMessage:
+    def from_repr(raw_data: dict, trusted: bool = False) -> RequestMessage:
         intent = raw_data.get("intent", None)
         if intent:
             intent = Intent.from_repr(intent)
@@ -623,12 +665,15 @@ class RequestMessage(Message):
             entities,
             raw_data.get("language", None),
             raw_data.get("metadata", None),
-            raw_data['project']
+            raw_data['project'],
+            validate=not trusted
         )
 
 
 class ResponseMessage(Message):
 
+    __slots__ = ("response_to",)
+
     ALLOWED_CONTENT_TYPES = [
         MultiActionResponse,
         CarouselResponse,
@@ -638,13 +683,13 @@ class ResponseMessage(Message):
     ]
 
     def __init__(self, message_id: str, conversation_id: Optional[str], channel: str, user_id: str, response_to: str,
-                 timestamp: datetime, content, metadata: Optional[dict], project: str) -> None:
+                 timestamp: datetime, content, metadata: Optional[dict], project: str, validate: bool = True) -> None:
 
-        super().__init__(message_id, conversation_id, channel, user_id, timestamp, content, metadata, project)
+        super().__init__(message_id, conversation_id, channel, user_id, timestamp, content, metadata, project, validate=validate)
 
         self.response_to = response_to
 
-        if content is not None:
+        if validate and content is not None:
             if type(content) not in self.ALLOWED_CONTENT_TYPES:
                 raise ValueError(f"Type for parameter `content` is not allowed - {type(content)}")
 
@@ -667,7 +712,7 @@ class ResponseMessage(Message):
         }
 
     @staticmethod
-    def from_repr(raw_data: dict) -> ResponseMessage:
+    def from_repr(raw_data: dict, trusted: bool = False) -> ResponseMessage:
         content = raw_data.get("content", None)
         if content:
             content_type = content['type'].lower()
@@ -693,12 +738,15 @@ class ResponseMessage(Message):
             Message.timestamp_str_to_datetime(raw_data['timestamp']),
             content,
             raw_data.get("metadata", None),
-            raw_data['project']
+            raw_data['project'],
+            validate=not trusted
         )
 
 
 class NotificationMessage(Message):
 
+    __slots__ = ()
+
     ALLOWED_CONTENT_TYPES = [
         MultiActionResponse,
         CarouselResponse,
@@ -708,11 +756,11 @@ class NotificationMessage(Message):
     ]
 
     def __init__(self, message_id: str, conversation_id: Optional[str], channel: str, user_id: str, timestamp: datetime,
-                 content, metadata: Optional[dict], project: str) -> None:
+                 content, metadata: Optional[dict], project: str, validate: bool = True) -> None:
 
-        super().__init__(message_id, conversation_id, channel, user_id, timestamp, content, metadata, project)
+        super().__init__(message_id, conversation_id, channel, user_id, timestamp, content, metadata, project, validate=validate)
 
-        if content is not None:
+        if validate and content is not None:
             if type(content) not in self.ALLOWED_CONTENT_TYPES:
                 raise ValueError(f"Type for parameter `content` is not allowed - {type(content)}")
 
@@ -735,7 +783,7 @@ class NotificationMessage(Message):
         }
 
     @staticmethod
-    def from_repr(raw_data: dict) -> NotificationMessage:
+    def from_repr(raw_data: dict, trusted: bool = False) -> NotificationMessage:
         content = raw_data.get("content", None)
         if content:
             content_type = content['type'].lower()
@@ -760,5 +808,6 @@ class NotificationMessage(Message):
             Message.timestamp_str_to_datetime(raw_data['timestamp']),
             content,
             raw_data.get("metadata", None),
-            raw_data['project']
+            raw_data['project'],
+            validate=not trusted
         )
@@ -0,0 +1,115 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+from collections import Counter
+from datetime import date
+from typing import Dict, Optional
+
+from memex_logging.common.hll import HyperLogLog
+
+
+class MessageRollup:
+    """
+    The summary of the messages of a project in a day
+    """
+
+    def __init__(self, project: str, day: date, types: Optional[Dict[str, int]] = None, distinct_messages: Optional[Dict[str, int]] = None,
+                 request_content_types: Optional[Dict[str, int]] = None, channels: Optional[Dict[str, int]] = None,
+                 intents: Optional[Dict[str, int]] = None, domains: Optional[Dict[str, int]] = None,
+                 users: Optional[HyperLogLog] = None, active_users: Optional[HyperLogLog] = None,
+                 engaged_users: Optional[HyperLogLog] = None, conversations: Optional[HyperLogLog] = None) -> None:
+        """
+        :param str project: the project of the messages
+        :param date day: the day of the messages
+        :param Optional[Dict[str, int]] types: the number of messages of each type
+        :param Optional[Dict[str, int]] distinct_messages: the number of distinct message ids of each type
+        :param Optional[Dict[str, int]] request_content_types: the number of requests with each type of content
+        :param Optional[Dict[str, int]] channels: the number of messages sent in each channel
+        :param Optional[Dict[str, int]] intents: the number of messages with each intent
+        :param Optional[Dict[str, int]] domains: the number of messages with each domain
+        :param Optional[HyperLogLog] users: the sketch of the users of the messages
+        :param Optional[HyperLogLog] active_users: the sketch of the users of the requests
+        :param Optional[HyperLogLog] engaged_users: the sketch of the users of the notifications
+        :param Optional[HyperLogLog] conversations: the sketch of the conversations of the messages
+        """
+
+        self.project = project
+        self.day = day
+        self.types = Counter(types) if types is not None else Counter()
+        self.distinct_messages = Counter(distinct_messages) if distinct_messages is not None else Counter()
+        self.request_content_types = Counter(request_content_types) if request_content_types is not None else Counter()
+        self.channels = Counter(channels) if channels is not None else Counter()
+        self.intents = Counter(intents) if intents is not None else Counter()
+        self.domains = Counter(domains) if domains is not None else Counter()
+        self.users = users if users is not None else HyperLogLog()
+        self.active_users = active_users if active_users is not None else HyperLogLog()
+        self.engaged_users = engaged_users if engaged_users is not None else HyperLogLog()
+        self.conversations = conversations if conversations is not None else HyperLogLog()
+
+    def merge(self, other: MessageRollup) -> None:
+        """
+        Merge the summary of other messages into this one
+
+        :param MessageRollup other: the summary to merge
+        """
+
+        self.types.update(other.types)
+        self.distinct_messages.update(other.distinct_messages)
+        self.request_content_types.update(other.request_content_types)
+        self.channels.update(other.channels)
+        self.intents.update(other.intents)
+        self.domains.update(other.domains)
+        self.users.merge(other.users)
+        self.active_users.merge(other.active_users)
+        self.engaged_users.merge(other.engaged_users)
+        self.conversations.merge(other.conversations)
+
+    def to_repr(self) -> dict:
+        return {
+            'project': self.project,
+            'day': self.day.isoformat(),
+            'counts': {
+                'types': dict(self.types),
+                'distinctMessages': dict(self.distinct_messages),
+                'requestContentTypes': dict(self.request_content_types),
+                'channels': dict(self.channels),
+                'intents': dict(self.intents),
+                'domains': dict(self.domains)
+            },
+            'sketches': {
+                'users': self.users.to_repr(),
+                'activeUsers': self.active_users.to_repr(),
+                'engagedUsers': self.engaged_users.to_repr(),
+                'conversations': self.conversations.to_repr()
+            }
+        }
+
+    @staticmethod
+    def from_repr(raw_data: dict) -> MessageRollup:
+        return MessageRollup(
+            raw_data['project'],
+            date.fromisoformat(raw_data['day']),
+            types=raw_data['counts']['types'],
+            distinct_messages=raw_data['counts']['distinctMessages'],
+            request_content_types=raw_data['counts']['requestContentTypes'],
+            channels=raw_data['counts']['channels'],
+            intents=raw_data['counts']['intents'],
+            domains=raw_data['counts']['domains'],
+            users=HyperLogLog.from_repr(raw_data['sketches']['users']),
+            active_users=HyperLogLog.from_repr(raw_data['sketches']['activeUsers']),
+            engaged_users=HyperLogLog.from_repr(raw_data['sketches']['engagedUsers']),
+            conversations=HyperLogLog.from_repr(raw_data['sketches']['conversations'])
+        )
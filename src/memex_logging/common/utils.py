@@ -20,6 +20,7 @@ import uuid
 from typing import Optional, Tuple
 
 import dateutil.parser
+import deprecation
 from dateutil.relativedelta import relativedelta
 from elasticsearch import Elasticsearch
 from flask_restful import abort
@@ -131,6 +132,7 @@ class Utils:
             return "memex"
 
     @staticmethod
+    @deprecation.deprecated(deprecated_in="2.5.0", details="Use the SessionTracker of the web service instead, it assigns the conversations without searching the messages")
     def compute_conversation_id(elastic: Elasticsearch, message) -> None:
         # 3 hours threshold
         delta = 90
@@ -249,10 +249,7 @@ if __name__ == '__main__':
     questions_file.close()
 
     # extracting messages dump
-    messages = [Message.from_repr(message) for message in logger_operations.get_messages(creation_from, creation_to, max_size=10000)]
-    while len(messages) < total_messages:
-        message = messages.pop(-1)
-        messages.extend([Message.from_repr(message) for message in logger_operations.get_messages(message.timestamp, creation_to, max_size=10000)])
+    messages = [Message.from_repr(message) for message in logger_operations.iter_messages(creation_from, creation_to, page_size=10000)]
 
     messages_file = open(args.message_file, "w")
     raw_messages = []
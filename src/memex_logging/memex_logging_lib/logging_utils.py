@@ -16,11 +16,15 @@ from __future__ import absolute_import, annotations
 
 import json
 import logging
+import threading
+from collections import deque
 from datetime import datetime
 from time import sleep
-from typing import Optional, List
+from typing import Optional, List, Iterator
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from memex_logging.common.model.analytic.descriptor.common import CommonAnalyticDescriptor
 from memex_logging.common.model.message import Entity, ActionResponse, CarouselCardResponse
@@ -31,21 +35,182 @@ logger = logging.getLogger("logger.memex_logging_lib.logging_utils")
 
 class LoggingUtility:
 
-    def __init__(self, service_host: str, project: str, custom_headers: Optional[dict] = None) -> None:
+    TRANSIENT_STATUS_CODES = (429, 502, 503, 504)
+    # the status codes meaning that the service has not processed the request, the POST requests are not idempotent so a gateway error is not retried since the service may have stored the payload
+    POST_RETRY_STATUS_CODES = (429, 503)
+
+    def __init__(self, service_host: str, project: str, custom_headers: Optional[dict] = None, batch_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None, max_buffer_size: int = 10000, max_retries: int = 3, backoff_factor: float = 0.5,
+                 pool_maxsize: int = 10) -> None:
         """
-        Initialize a logging Utility object by specifying the host, the port and the project
+        Initialize a logging Utility object by specifying the host, the port and the project.
+        The requests are sent through a session that keeps the connections to the service alive.
+        When the `batch_size` is set, the messages and the logs are not sent immediately but accumulated and sent in batches when the `batch_size` is reached, every `flush_interval` seconds (if set) or when calling `flush()`; in this case the `add_*` methods return `None` instead of the trace id.
         :param service_host: the host of the service as a string (e.g, https://www.test.com)
         :param project: the name of the project. It is used to create well-formed indexes in the database and to retrieve information from the right index
         :param custom_headers: a dictionary containing some custom headers
+        :param batch_size: the number of messages or logs to accumulate before sending them, if not set the batching mode is disabled
+        :param flush_interval: the maximum number of seconds the messages and the logs are kept before being sent in batching mode
+        :param max_buffer_size: the maximum number of messages and the maximum number of logs kept in batching mode, when the limit is reached the oldest ones are discarded
+        :param max_retries: the number of times a request failed due to a transient error is retried
+        :param backoff_factor: the factor used for computing the time to wait between retries, the time doubles at each retry
+        :param pool_maxsize: the maximum number of connections to the service kept alive
         """
         self._access_point = service_host
         self._project = project
         self._custom_headers = custom_headers if custom_headers else {}
 
+        self._max_retries = max_retries
+        self._backoff_factor = backoff_factor
+        self._session = requests.Session()
+        # the methods retried on the transient status codes and on the errors after the request is sent are the idempotent ones, which do not include POST
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=Retry(total=max_retries, backoff_factor=backoff_factor, status_forcelist=self.TRANSIENT_STATUS_CODES, raise_on_status=False))
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+        self._batch_size = batch_size
+        self._max_buffer_size = max_buffer_size
+        self._buffer_lock = threading.RLock()
+        self._message_buffer = deque()
+        self._log_buffer = deque()
+
+        self._flush_interval = flush_interval
+        self._stop_flusher = threading.Event()
+        self._flusher = None
+        if batch_size is not None and flush_interval is not None:
+            self._flusher = threading.Thread(target=self._run_flusher, name="logging-utility-flusher", daemon=True)
+            self._flusher.start()
+
+    def __enter__(self) -> LoggingUtility:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def _post(self, api_point: str, payload: list) -> requests.Response:
+        """
+        Post a payload to the service, retrying when the service has certainly not processed it
+        :param api_point: the url where to post the payload
+        :param payload: the payload to post
+        :return: the response of the service
+        """
+        headers = {
+            'Content-Type': 'application/json',
+        }
+
+        # the session adapter retries the POST requests only on the connection errors happening before the request is sent
+        response = self._session.post(api_point, headers={**headers, **self._custom_headers}, json=payload)
+        for attempt in range(self._max_retries):
+            if response.status_code not in self.POST_RETRY_STATUS_CODES:
+                break
+            logger.warning(f"The service could not process the request [{response.status_code}], retrying")
+            sleep(self._backoff_factor * (2 ** attempt))
+            response = self._session.post(api_point, headers={**headers, **self._custom_headers}, json=payload)
+
+        return response
+
+    def _add_message(self, message_generated: dict) -> Optional[str]:
+        if self._batch_size is None:
+            response = self._post(self._access_point + "/messages", [message_generated])
+            if response.status_code in [201, 202]:
+                dict_response = json.loads(response.text)
+                return dict_response['traceIds'][0]
+            else:
+                raise ValueError("The message has not been logged")
+
+        self._add_to_buffer(self._message_buffer, message_generated, "message")
+        return None
+
+    def _add_log(self, log_generated: dict) -> Optional[str]:
+        if self._batch_size is None:
+            response = self._post(self._access_point + "/logs", [log_generated])
+            if response.status_code in [201, 202]:
+                dict_response = json.loads(response.text)
+                return dict_response['traceIds'][0]
+            else:
+                raise ValueError("The log has not been logged")
+
+        self._add_to_buffer(self._log_buffer, log_generated, "log")
+        return None
+
+    def _add_to_buffer(self, buffer: deque, element: dict, element_type: str) -> None:
+        with self._buffer_lock:
+            if len(buffer) >= self._max_buffer_size:
+                buffer.popleft()
+                logger.warning(f"The buffer of the {element_type}s is full, the oldest {element_type} has been discarded")
+            buffer.append(element)
+            is_full = len(buffer) >= self._batch_size
+
+        if is_full:
+            try:
+                self.flush()
+            except ValueError as e:
+                logger.warning(f"Could not send the buffered {element_type}s, they will be sent with the next flush", exc_info=e)
+
+    def _flush_buffer(self, buffer: deque, api_point: str, element_type: str) -> None:
+        while True:
+            with self._buffer_lock:
+                batch = [buffer.popleft() for _ in range(min(self._batch_size, len(buffer)))]
+            if len(batch) == 0:
+                return
+
+            try:
+                response = self._post(api_point, batch)
+            except requests.exceptions.ConnectionError as e:
+                logger.warning(f"Could not send [{len(batch)}] {element_type}s", exc_info=e)
+                response = None
+            except requests.exceptions.RequestException as e:
+                # the request may have been processed by the service, so the batch is not sent again
+                logger.error(f"Could not send [{len(batch)}] {element_type}s, they have been discarded", exc_info=e)
+                continue
+
+            if response is not None and response.status_code in [201, 202]:
+                continue
+            elif response is not None and response.status_code == 207:
+                logger.error(f"Some {element_type}s have not been logged: {json.loads(response.text).get('errors')}")
+                continue
+            elif response is not None and response.status_code not in self.POST_RETRY_STATUS_CODES:
+                # a rejected batch would be rejected again and block the following ones, while the service may have processed a batch failed with a server error
+                logger.error(f"The {element_type}s have not been logged [{response.status_code}], they have been discarded: {response.text}")
+                continue
+
+            with self._buffer_lock:
+                # put the batch back in the buffer, discarding the oldest elements if there is no space left
+                buffer.extendleft(reversed(batch[max(0, len(batch) + len(buffer) - self._max_buffer_size):]))
+            raise ValueError(f"The {element_type}s have not been logged")
+
+    def flush(self) -> None:
+        """
+        Send all the messages and the logs accumulated in batching mode
+        :raise ValueError: when the messages or the logs could not be sent due to connection errors or to the service being unavailable, in this case they are kept for the next flush while the ones rejected by the service are discarded
+        """
+        self._flush_buffer(self._message_buffer, self._access_point + "/messages", "message")
+        self._flush_buffer(self._log_buffer, self._access_point + "/logs", "log")
+
+    def _run_flusher(self) -> None:
+        while not self._stop_flusher.wait(self._flush_interval):
+            try:
+                self.flush()
+            except ValueError as e:
+                logger.warning("Could not send the buffered messages and logs, they will be sent with the next flush", exc_info=e)
+
+    def close(self) -> None:
+        """
+        Send all the messages and the logs accumulated in batching mode and close the connections to the service
+        :raise ValueError: when the messages or the logs could not be sent
+        """
+        self._stop_flusher.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        try:
+            self.flush()
+        finally:
+            self._session.close()
+
     def add_location_request(self, latitude: float, longitude: float, message_id: str, user_id: str, channel: str,
                              timestamp: str, conversation_id: str = None, domain: str = None, intent_name: str = None,
                              intent_confidence: float = None,
-                             entities: object = Optional[List[Entity]], language: object = None, metadata: object = Optional[dict]) -> str:
+                             entities: object = Optional[List[Entity]], language: object = None, metadata: object = Optional[dict]) -> Optional[str]:
         """
         This method should be used to store a request message that contains text written by the user. A request message is a message from the user to the chatbot
         :param latitude: a float number representing the latitude of the location
@@ -82,8 +247,6 @@ class LoggingUtility:
         if not isinstance(metadata, dict):
             metadata = {}
 
-        api_point = self._access_point + "/messages"
-
         intent_dict = {
             'name': intent_name,
             'confidence': intent_confidence
@@ -113,24 +276,12 @@ class LoggingUtility:
             "type": "REQUEST"
         }
 
-        messages = [message_generated]
-
-        headers = {
-            'Content-Type': 'application/json',
-        }
-
-        response = requests.post(api_point, headers={**headers, **self._custom_headers}, json=messages)
-
-        if response.status_code == 201:
-            dict_response = json.loads(response.text)
-            return dict_response['traceIds'][0]
-        else:
-            raise ValueError("The message has not been logged")
+        return self._add_message(message_generated)
 
     def add_textual_request(self, message: str, message_id: str, user_id: str, channel: str,
                             timestamp: str, conversation_id: str = None, domain: str = None, intent_name: str = None,
                             intent_confidence: float = None,
-                            entities: object = Optional[List[Entity]], language: object = None, metadata: object = Optional[dict]) -> str:
+                            entities: object = Optional[List[Entity]], language: object = None, metadata: object = Optional[dict]) -> Optional[str]:
         """
         This method should be used to store a request message that contains text written by the user. A request message is a message from the user to the chatbot
         :param message: a string that indicates the text of the message
@@ -165,8 +316,6 @@ class LoggingUtility:
         if not isinstance(metadata, dict):
             metadata = {}
 
-        api_point = self._access_point + "/messages"
-
         intent_dict = {
             'name': intent_name,
             'confidence': intent_confidence
@@ -196,23 +345,11 @@ class LoggingUtility:
             "type": "REQUEST"
         }
 
-        messages = [message_generated]
-
-        headers = {
-            'Content-Type': 'application/json',
-        }
-
-        response = requests.post(api_point, headers={**headers, **self._custom_headers}, json=messages)
-
-        if response.status_code == 201:
-            dict_response = json.loads(response.text)
-            return dict_response['traceIds'][0]
-        else:
-            raise ValueError("The message has not been logged")
+        return self._add_message(message_generated)
 
     def add_action_request(self, message: str, message_id: str, user_id: str, channel: str,
                            timestamp: str, conversation_id=None, domain=None, intent_name=None, intent_confidence=None,
-                           entities=Optional[List[Entity]], language=None, metadata=Optional[dict]) -> str:
+                           entities=Optional[List[Entity]], language=None, metadata=Optional[dict]) -> Optional[str]:
         """
         This method should be used to store a request message. This method should be used when the request message is generated by pressing a quick action button. A request message is a message from the user to the chatbot
         :param message: a string that indicates the text of the message
@@ -247,8 +384,6 @@ class LoggingUtility:
         if not isinstance(metadata, dict):
             metadata = {}
 
-        api_point = self._access_point + "/messages"
-
         intent_dict = {
             'name': intent_name,
             'confidence': intent_confidence
@@ -281,23 +416,11 @@ class LoggingUtility:
             "type": "REQUEST"
         }
 
-        messages = [message_generated]
-
-        headers = {
-            'Content-Type': 'application/json',
-        }
-
-        response = requests.post(api_point, headers={**headers, **self._custom_headers}, json=messages)
-
-        if response.status_code == 201:
-            dict_response = json.loads(response.text)
-            return dict_response['traceIds'][0]
-        else:
-            raise ValueError("The message has not been logged")
+        return self._add_message(message_generated)
 
     def add_attachment_request(self, attachment_uri: str, message_id: str, user_id: str, channel: str, timestamp: str, conversation_id=None, alternative_text=None, domain=None, intent_name=None,
                                intent_confidence=None,
-                               entities=Optional[List[Entity]], language=None, metadata=Optional[dict]) -> str:
+                               entities=Optional[List[Entity]], language=None, metadata=Optional[dict]) -> Optional[str]:
         """
         This method should be used to store a request message that contains a file (e.g., an image) instead of text. A request message is a message from the user to the chatbot
         :param attachment_uri: the URI of the attached resource
@@ -333,8 +456,6 @@ class LoggingUtility:
         if not isinstance(metadata, dict):
             metadata = {}
 
-        api_point = self._access_point + "/messages"
-
         intent_dict = {
             'name': intent_name,
             'confidence': intent_confidence
@@ -365,23 +486,11 @@ class LoggingUtility:
             "type": "REQUEST"
         }
 
-        messages = [message_generated]
-
-        headers = {
-            'Content-Type': 'application/json',
-        }
-
-        response = requests.post(api_point, headers={**headers, **self._custom_headers}, json=messages)
-
-        if response.status_code == 201:
-            dict_response = json.loads(response.text)
-            return dict_response['traceIds'][0]
-        else:
-            raise ValueError("The message has not been logged")
+        return self._add_message(message_generated)
 
     def add_textual_response(self, message_text: str, message_id: str, channel: str, user_id: str,
                              response_to: str, timestamp: str, conversation_id=None, buttons=Optional[List],
-                             metadata=Optional[dict]) -> str:
+                             metadata=Optional[dict]) -> Optional[str]:
         """
         This method should be used to store a response message. A response message is a message from the bot to the user that represents an answer to a request message
         :param message_text: the text of the message. It is a string
@@ -419,8 +528,6 @@ class LoggingUtility:
         if not isinstance(metadata, dict):
             metadata = {}
 
-        api_point = self._access_point + "/messages"
-
         button_list = []
         for button in buttons:
             if button[1] == "" or button[1] is None:
@@ -448,23 +555,11 @@ class LoggingUtility:
             "type": "RESPONSE"
         }
 
-        messages = [message_generated]
-
-        headers = {
-            'Content-Type': 'application/json',
-        }
-
-        response = requests.post(api_point, headers={**headers, **self._custom_headers}, json=messages)
-
-        if response.status_code == 201:
-            dict_response = json.loads(response.text)
-            return dict_response['traceIds'][0]
-        else:
-            raise ValueError("The message has not been logged")
+        return self._add_message(message_generated)
 
     def add_attachment_response(self, attachment_uri: str, message_id: str, channel: str, user_id: str,
                                 response_to: str, timestamp: str, conversation_id=None, alternative_text=None,
-                                buttons=Optional[List], metadata=Optional[dict]) -> str:
+                                buttons=Optional[List], metadata=Optional[dict]) -> Optional[str]:
         """
         This method should be used to store a response message. A response message is a message from the bot to the user that represents an answer to a request message
         :param attachment_uri: the uri of the resource associated to the message
@@ -519,8 +614,6 @@ class LoggingUtility:
             'buttons': button_list
         }
 
-        api_point = self._access_point + "/messages"
-
         message_generated = {
             "messageId": message_id,
             "conversationId": conversation_id,
@@ -534,23 +627,11 @@ class LoggingUtility:
             "type": "RESPONSE"
         }
 
-        messages = [message_generated]
-
-        headers = {
-            'Content-Type': 'application/json',
-        }
-
-        response = requests.post(api_point, headers={**headers, **self._custom_headers}, json=messages)
-
-        if response.status_code == 201:
-            dict_response = json.loads(response.text)
-            return dict_response['traceIds'][0]
-        else:
-            raise ValueError("The message has not been logged")
+        return self._add_message(message_generated)
 
     def add_quick_reply_response(self, buttons: list, message_id: str, channel: str, user_id: str,
                                  response_to: str, timestamp: str, conversation_id=None,
-                                 metadata=Optional[dict]) -> str:
+                                 metadata=Optional[dict]) -> Optional[str]:
         """
         This method should be used to store a response message. A response message is a message from the bot to the user that represents an answer to a request message
         :param buttons: the list of the buttons
@@ -598,8 +679,6 @@ class LoggingUtility:
             "buttons": button_list
         }
 
-        api_point = self._access_point + "/messages"
-
         message_generated = {
             "messageId": message_id,
             "conversationId": conversation_id,
@@ -613,23 +692,11 @@ class LoggingUtility:
             "type": "RESPONSE"
         }
 
-        messages = [message_generated]
-
-        headers = {
-            'Content-Type': 'application/json',
-        }
-
-        response = requests.post(api_point, headers={**headers, **self._custom_headers}, json=messages)
-
-        if response.status_code == 201:
-            dict_response = json.loads(response.text)
-            return dict_response['traceIds'][0]
-        else:
-            raise ValueError("The message has not been logged")
+        return self._add_message(message_generated)
 
     def add_carousel_response(self, carousel_items: list, message_id: str, channel: str, user_id: str,
                               response_to: str, timestamp: str, conversation_id=None,
-                              metadata=Optional[dict]) -> str:
+                              metadata=Optional[dict]) -> Optional[str]:
         """
         This method should be used to store a response message. A response message is a message from the bot to the user that represents an answer to a request message
         :param carousel_items: a list of CarouselItem objects
@@ -671,8 +738,6 @@ class LoggingUtility:
             'cards': cards
         }
 
-        api_point = self._access_point + "/messages"
-
         message_generated = {
             "messageId": message_id,
             "conversationId": conversation_id,
@@ -686,23 +751,11 @@ class LoggingUtility:
             "type": "NOTIFICATION"
         }
 
-        messages = [message_generated]
-
-        headers = {
-            'Content-Type': 'application/json',
-        }
-
-        response = requests.post(api_point, headers={**headers, **self._custom_headers}, json=messages)
-
-        if response.status_code == 201:
-            dict_response = json.loads(response.text)
-            return dict_response['traceIds'][0]
-        else:
-            raise ValueError("The message has not been logged")
+        return self._add_message(message_generated)
 
     def add_textual_notification(self, message_text: str, message_id: str, channel: str, user_id: str,
                                  timestamp: str, conversation_id=None, buttons=Optional[List],
-                                 metadata=Optional[dict]) -> str:
+                                 metadata=Optional[dict]) -> Optional[str]:
         """
         This method should be used to store a notification message.
         :param message_text: the text of the message. It is a string
@@ -736,8 +789,6 @@ class LoggingUtility:
         if not isinstance(metadata, dict):
             metadata = {}
 
-        api_point = self._access_point + "/messages"
-
         button_list = []
         for button in buttons:
             if button[1] == "" or button[1] is None:
@@ -764,23 +815,11 @@ class LoggingUtility:
             "type": "NOTIFICATION"
         }
 
-        messages = [message_generated]
-
-        headers = {
-            'Content-Type': 'application/json',
-        }
-
-        response = requests.post(api_point, headers={**headers, **self._custom_headers}, json=messages)
-
-        if response.status_code == 201:
-            dict_response = json.loads(response.text)
-            return dict_response['traceIds'][0]
-        else:
-            raise ValueError("The message has not been logged")
+        return self._add_message(message_generated)
 
     def add_attachment_notification(self, attachment_uri: str, message_id: str, channel: str, user_id: str,
                                     timestamp: str, conversation_id=None, alternative_text=None,
-                                    buttons=Optional[List], metadata=Optional[dict]) -> str:
+                                    buttons=Optional[List], metadata=Optional[dict]) -> Optional[str]:
         """
         This method should be used to store a notification message.
         :param attachment_uri: the uri of the resource associated to the message
@@ -831,8 +870,6 @@ class LoggingUtility:
             'buttons': button_list
         }
 
-        api_point = self._access_point + "/messages"
-
         message_generated = {
             "messageId": message_id,
             "conversationId": conversation_id,
@@ -845,23 +882,11 @@ class LoggingUtility:
             "type": "NOTIFICATION"
         }
 
-        messages = [message_generated]
-
-        headers = {
-            'Content-Type': 'application/json',
-        }
-
-        response = requests.post(api_point, headers={**headers, **self._custom_headers}, json=messages)
-
-        if response.status_code == 201:
-            dict_response = json.loads(response.text)
-            return dict_response['traceIds'][0]
-        else:
-            raise ValueError("The message has not been logged")
+        return self._add_message(message_generated)
 
     def add_quick_reply_notification(self, buttons: list, message_id: str, channel: str, user_id: str,
                                      timestamp: str, conversation_id=None,
-                                     metadata=Optional[dict]) -> str:
+                                     metadata=Optional[dict]) -> Optional[str]:
         """
         This method should be used to store a notification message.
         :param buttons: the list of the buttons
@@ -905,8 +930,6 @@ class LoggingUtility:
             "buttons": button_list
         }
 
-        api_point = self._access_point + "/messages"
-
         message_generated = {
             "messageId": message_id,
             "conversationId": conversation_id,
@@ -919,23 +942,11 @@ class LoggingUtility:
             "type": "NOTIFICATION"
         }
 
-        messages = [message_generated]
-
-        headers = {
-            'Content-Type': 'application/json',
-        }
-
-        response = requests.post(api_point, headers={**headers, **self._custom_headers}, json=messages)
-
-        if response.status_code == 201:
-            dict_response = json.loads(response.text)
-            return dict_response['traceIds'][0]
-        else:
-            raise ValueError("The message has not been logged")
+        return self._add_message(message_generated)
 
     def add_carousel_notification(self, carousel_items: list, message_id: str, channel: str, user_id: str,
                                   timestamp: str, conversation_id=None,
-                                  metadata=Optional[dict]) -> str:
+                                  metadata=Optional[dict]) -> Optional[str]:
         """
         This method should be used to store a notification message.
         :param carousel_items: a list of CarouselItem objects
@@ -973,8 +984,6 @@ class LoggingUtility:
             'cards': cards
         }
 
-        api_point = self._access_point + "/messages"
-
         message_generated = {
             "messageId": message_id,
             "conversationId": conversation_id,
@@ -987,19 +996,7 @@ class LoggingUtility:
             "type": "NOTIFICATION"
         }
 
-        messages = [message_generated]
-
-        headers = {
-            'Content-Type': 'application/json',
-        }
-
-        response = requests.post(api_point, headers={**headers, **self._custom_headers}, json=messages)
-
-        if response.status_code == 201:
-            dict_response = json.loads(response.text)
-            return dict_response['traceIds'][0]
-        else:
-            raise ValueError("The message has not been logged")
+        return self._add_message(message_generated)
 
     def get_message_from_message_id_and_user_id(self, message_id: str, user_id: str) -> dict:
         """
@@ -1010,7 +1007,7 @@ class LoggingUtility:
         """
         api_point = self._access_point + "/message?project=" + self._project + "&messageId=" + message_id + "&userId=" + user_id
 
-        response = requests.get(api_point, headers=self._custom_headers)
+        response = self._session.get(api_point, headers=self._custom_headers)
 
         if response.status_code == 200:
             return json.loads(response.content)
@@ -1025,7 +1022,7 @@ class LoggingUtility:
         """
         api_point = self._access_point + "/message?traceId=" + trace_id
 
-        response = requests.get(api_point, headers=self._custom_headers)
+        response = self._session.get(api_point, headers=self._custom_headers)
 
         if response.status_code == 200:
             return json.loads(response.content)
@@ -1054,13 +1051,52 @@ class LoggingUtility:
         if message_type:
             api_point = api_point + "&type=" + message_type
 
-        response = requests.get(api_point, headers=self._custom_headers)
+        response = self._session.get(api_point, headers=self._custom_headers)
 
         if response.status_code == 200:
             return json.loads(response.content)
         else:
             raise ValueError("Cannot retrieve the messages")
 
+    def iter_messages(self, from_time: datetime, to_time: datetime, user_id: str = None, channel: str = None, message_type: str = None, page_size: int = 1000) -> Iterator[dict]:
+        """
+        Utils to iterate over all the messages in a time range, the messages are retrieved one page at a time
+        :param from_time: the time from which retrieve the messages
+        :param to_time:  the time up to which retrieve the messages
+        :param user_id: the id of the user related to the messages to retrieve
+        :param channel: the channel of the messages to retrieve
+        :param message_type: the type of the messages to retrieve
+        :param page_size: the number of messages to retrieve with each request (up to 10000)
+        :return: an iterator over the messages
+        """
+        params = {
+            "project": self._project,
+            "fromTime": from_time.isoformat(),
+            "toTime": to_time.isoformat(),
+            "maxSize": page_size,
+            "cursor": ""
+        }
+
+        if user_id:
+            params["userId"] = user_id
+
+        if channel:
+            params["channel"] = channel
+
+        if message_type:
+            params["type"] = message_type
+
+        while params["cursor"] is not None:
+            response = self._session.get(self._access_point + "/messages", headers=self._custom_headers, params=dict(params))
+
+            if response.status_code != 200:
+                raise ValueError("Cannot retrieve the messages")
+
+            page = json.loads(response.content)
+            for message in page["messages"]:
+                yield message
+            params["cursor"] = page["nextCursor"]
+
     def delete_message_from_message_id_and_user_id(self, message_id: str, user_id: str) -> dict:
         """
         Utils to delete a message from the database
@@ -1070,7 +1106,7 @@ class LoggingUtility:
         """
         api_point = self._access_point + "/message?project=" + self._project + "&messageId=" + message_id + "&userId=" + user_id
 
-        response = requests.delete(api_point, headers=self._custom_headers)
+        response = self._session.delete(api_point, headers=self._custom_headers)
 
         if response.status_code == 200:
             return json.loads(response.content)
@@ -1085,14 +1121,14 @@ class LoggingUtility:
         """
         api_point = self._access_point + "/message?traceId=" + trace_id
 
-        response = requests.delete(api_point, headers=self._custom_headers)
+        response = self._session.delete(api_point, headers=self._custom_headers)
 
         if response.status_code == 200:
             return json.loads(response.content)
         else:
             raise ValueError("Cannot delete the message")
 
-    def add_log(self, log_id: str, component: str, severity: str, log_content: str, timestamp: str, authority: str = None,  bot_version: str = None, metadata: dict = None) -> str:
+    def add_log(self, log_id: str, component: str, severity: str, log_content: str, timestamp: str, authority: str = None,  bot_version: str = None, metadata: dict = None) -> Optional[str]:
 
         logger.info("Starting logging a new message ")
 
@@ -1111,8 +1147,6 @@ class LoggingUtility:
         if timestamp == "" or timestamp is None:
             raise ValueError("timestamp is missing and is required")
 
-        api_point = self._access_point + "/logs"
-
         log_generated = {
             "logId": log_id,
             "project": self._project,
@@ -1125,21 +1159,37 @@ class LoggingUtility:
             "metadata": metadata
         }
 
-        logs = [log_generated]
+        return self._add_log(log_generated)
+
+    def get_analytic_result(self, analytic: CommonAnalyticDescriptor, sleep_time: int = 1, number_of_trials: int = 10) -> Optional[dict]:
+        """
+        Compute the result of an analytic through the evaluation endpoint, when the service does not provide it the analytic is stored, computed and deleted
+
+        :param CommonAnalyticDescriptor analytic: the descriptor of the analytic
+        :param int sleep_time: the number of seconds to wait between the checks of the result, when the analytic is stored
+        :param int number_of_trials: the maximum number of checks of the result, when the analytic is stored
+        :return: the result of the analytic
+        """
+
+        json_payload = analytic.to_repr()
+
+        api_point = self._access_point + "/analytic"
 
         headers = {
             'Content-Type': 'application/json',
         }
 
-        response = requests.post(api_point, headers={**headers, **self._custom_headers}, json=logs)
+        response = self._session.post(api_point + "/evaluate", headers={**headers, **self._custom_headers}, json=json_payload)
+        if response.status_code == 404:
+            logger.debug("The evaluation of the analytics is not available, storing the analytic to compute it")
+            return self._get_stored_analytic_result(analytic, sleep_time, number_of_trials)
 
         if response.status_code == 200:
-            dict_response = json.loads(response.text)
-            return dict_response['logId'][0]
+            return json.loads(response.content)["result"]
         else:
-            raise ValueError("The log has not been logged")
+            raise Exception(f"request has return a code {response.status_code} with content {response.content}")
 
-    def get_analytic_result(self, analytic: CommonAnalyticDescriptor, sleep_time: int = 1, number_of_trials: int = 10) -> Optional[dict]:
+    def _get_stored_analytic_result(self, analytic: CommonAnalyticDescriptor, sleep_time: int, number_of_trials: int) -> Optional[dict]:
 
         json_payload = analytic.to_repr()
 
@@ -1149,19 +1199,19 @@ class LoggingUtility:
             'Content-Type': 'application/json',
         }
 
-        response = requests.post(api_point, headers={**headers, **self._custom_headers}, json=json_payload)
+        response = self._session.post(api_point, headers={**headers, **self._custom_headers}, json=json_payload)
 
         analytic_id = json.loads(response.content)["id"]
 
         for i in range(number_of_trials):
             sleep(sleep_time)
-            requests.post(api_point + "/compute", headers=self._custom_headers, params={"id": analytic_id})
+            self._session.post(api_point + "/compute", headers=self._custom_headers, params={"id": analytic_id})
             sleep(sleep_time)
-            response = requests.get(api_point, headers=self._custom_headers, params={"id": analytic_id})
+            response = self._session.get(api_point, headers=self._custom_headers, params={"id": analytic_id})
             if response.status_code == 200 and json.loads(response.content)["result"] is not None:
                 break
 
-        requests.delete(api_point, headers={**headers, **self._custom_headers}, params={"id": analytic_id})
+        self._session.delete(api_point, headers={**headers, **self._custom_headers}, params={"id": analytic_id})
 
         if response.status_code == 200:
             return json.loads(response.content)["result"]
@@ -0,0 +1,87 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, annotations
+
+import logging
+from typing import Iterator
+
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import bulk, scan
+
+from memex_logging.common.dao.analytic import AnalyticDao
+from memex_logging.migration.migration import MigrationAction
+
+
+class AnalyticStoreMigration(MigrationAction):
+    """
+    Move the analytics from the daily indices, where they were stored with a random id, to a single index behind the `analytic` alias where the id of each document is the id of its analytic
+    """
+
+    def apply(self, es: Elasticsearch) -> None:
+        # a worker storing the analytics before the migration creates a concrete index in place of the alias, its analytics are moved as well
+        concrete_index = es.indices.exists(index=AnalyticDao.BASE_INDEX) and not es.indices.exists_alias(name=AnalyticDao.BASE_INDEX)
+        if concrete_index:
+            logging.warning(f"The index [{AnalyticDao.BASE_INDEX}] has been created before the migration, its analytics are moved to [{AnalyticDao.STORE_INDEX}]")
+
+        if not es.indices.exists(index=AnalyticDao.STORE_INDEX):
+            # the alias can not be created while there is an index with the same name
+            es.indices.create(index=AnalyticDao.STORE_INDEX, body={} if concrete_index else {
+                "aliases": {
+                    AnalyticDao.BASE_INDEX: {
+                        "is_write_index": True
+                    }
+                }
+            })
+
+        source_indices = [index for index in es.indices.get(index=f"{AnalyticDao.BASE_INDEX}-*", ignore_unavailable=True) if index != AnalyticDao.STORE_INDEX]
+        if concrete_index:
+            source_indices.append(AnalyticDao.BASE_INDEX)
+        if len(source_indices) == 0:
+            logging.info("There are no analytics to move")
+            return
+
+        moved, errors = bulk(es, self._move_actions(es, source_indices), raise_on_error=False, refresh=True)
+        if len(errors) > 0:
+            # the source indices are kept so that the migration can be applied again
+            raise RuntimeError(f"Could not move [{len(errors)}] analytics: {errors[0]}")
+
+        es.indices.delete(index=",".join(source_indices))
+        if concrete_index:
+            es.indices.put_alias(index=AnalyticDao.STORE_INDEX, name=AnalyticDao.BASE_INDEX, body={"is_write_index": True})
+        logging.info(f"Moved [{moved}] analytics from [{len(source_indices)}] indices")
+
+    @staticmethod
+    def _move_actions(es: Elasticsearch, indices: list) -> Iterator[dict]:
+        for hit in scan(es, index=",".join(indices), query={"query": {"match_all": {}}}):
+            analytic_id = hit['_source'].get('id')
+            if analytic_id is None:
+                logging.warning(f"Skipping the document [{hit['_id']}] of index [{hit['_index']}] without the id of the analytic")
+                continue
+
+            yield {
+                "_op_type": "index",
+                "_index": AnalyticDao.STORE_INDEX,
+                "_id": analytic_id,
+                "_source": hit['_source']
+            }
+
+    @property
+    def action_name(self) -> str:
+        return "analytic_store"
+
+    @property
+    def action_num(self) -> int:
+        return 12
@@ -0,0 +1,82 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+import logging
+
+from elasticsearch import Elasticsearch
+
+from memex_logging.common.dao.daily_count import DailyCountDao
+from memex_logging.migration.migration import MigrationAction
+
+
+class DailyCountStoreMigration(MigrationAction):
+    """
+    Move the daily counts from the daily indices to a single index with an explicit mapping, the id of each document identifies its project, metric and day
+    """
+
+    def apply(self, es: Elasticsearch) -> None:
+        if es.indices.exists(index=DailyCountDao.INDEX):
+            # the index has been created with a dynamic mapping by a worker storing the counts before the migration, its counts are computed again when missing
+            logging.warning(f"Deleting the index [{DailyCountDao.INDEX}] created before the migration")
+            es.indices.delete(index=DailyCountDao.INDEX)
+
+        es.indices.create(index=DailyCountDao.INDEX, body={
+            "mappings": {
+                "dynamic": "strict",
+                "properties": {
+                    "project": {
+                        "type": "keyword"
+                    },
+                    "dimension": {
+                        "type": "keyword"
+                    },
+                    "metric": {
+                        "type": "keyword"
+                    },
+                    "day": {
+                        "type": "date",
+                        "format": "date"
+                    },
+                    "count": {
+                        "type": "long"
+                    },
+                    "creationDt": {
+                        "type": "date"
+                    }
+                }
+            }
+        })
+
+        daily_indices = f"{DailyCountDao.INDEX}-*"
+        if len(es.indices.get(index=daily_indices, ignore_unavailable=True)) == 0:
+            logging.info("There are no daily counts to move")
+            return
+
+        response = es.reindex(body={"source": {"index": daily_indices}, "dest": {"index": DailyCountDao.INDEX}}, refresh=True, request_timeout=3600)
+        if len(response.get("failures", [])) > 0:
+            # the daily indices are kept so that the migration can be applied again
+            raise RuntimeError(f"Could not move [{len(response['failures'])}] daily counts: {response['failures'][0]}")
+
+        es.indices.delete(index=daily_indices)
+        logging.info(f"Moved [{response.get('total', 0)}] daily counts from the daily indices")
+
+    @property
+    def action_name(self) -> str:
+        return "daily_count_store"
+
+    @property
+    def action_num(self) -> int:
+        return 14
@@ -0,0 +1,103 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, annotations
+
+import logging
+from typing import Iterator
+
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import bulk
+
+from memex_logging.common.dao.first_seen import FirstSeenDao
+from memex_logging.common.utils import Utils
+from memex_logging.migration.migration import MigrationAction
+
+
+class FirstSeenMigration(MigrationAction):
+
+    PAGE_SIZE = 1000
+
+    def apply(self, es: Elasticsearch) -> None:
+        es.indices.create(index=FirstSeenDao.INDEX, ignore=400, body={
+            "mappings": {
+                "dynamic": "strict",
+                "properties": {
+                    "project": {
+                        "type": "keyword"
+                    },
+                    "type": {
+                        "type": "keyword"
+                    },
+                    "value": {
+                        "type": "keyword"
+                    },
+                    "firstSeen": {
+                        "type": "date"
+                    }
+                }
+            }
+        })
+
+        # the entries are indexed rather than created, since the first message of the whole history is never later than the one registered while storing a message
+        for entry_type, field in ((FirstSeenDao.USER, "userId.keyword"), (FirstSeenDao.CONVERSATION, "conversationId.keyword")):
+            registered, _ = bulk(es, self._backfill_actions(es, entry_type, field), raise_on_error=False)
+            logging.info(f"Registered [{registered}] entries of type [{entry_type}]")
+
+    def _backfill_actions(self, es: Elasticsearch, entry_type: str, field: str) -> Iterator[dict]:
+        body = {
+            "aggs": {
+                "first_seen": {
+                    "composite": {
+                        "size": self.PAGE_SIZE,
+                        "sources": [
+                            {"project": {"terms": {"field": "project.keyword"}}},
+                            {"value": {"terms": {"field": field}}}
+                        ]
+                    },
+                    "aggs": {
+                        "first_message": {
+                            "min": {
+                                "field": "timestamp"
+                            }
+                        }
+                    }
+                }
+            }
+        }
+
+        while True:
+            response = es.search(index=Utils.generate_index("message"), body=body, size=0)
+            first_seen = response.get('aggregations', {}).get('first_seen', {})
+            for bucket in first_seen.get('buckets', []):
+                project, value = bucket['key']['project'], bucket['key']['value']
+                yield {
+                    "_op_type": "index",
+                    "_index": FirstSeenDao.INDEX,
+                    "_id": FirstSeenDao.build_trace_id(project, entry_type, value),
+                    "_source": FirstSeenDao.build_repr(project, entry_type, value, bucket['first_message']['value_as_string'])
+                }
+
+            if len(first_seen.get('buckets', [])) < self.PAGE_SIZE or 'after_key' not in first_seen:
+                break
+            body["aggs"]["first_seen"]["composite"]["after"] = first_seen['after_key']
+
+    @property
+    def action_name(self) -> str:
+        return "first_seen"
+
+    @property
+    def action_num(self) -> int:
+        return 10
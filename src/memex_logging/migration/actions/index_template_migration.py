@@ -0,0 +1,241 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+import logging
+from typing import Optional
+
+from elasticsearch import Elasticsearch
+
+from memex_logging.migration.migration import MigrationAction
+
+
+class IndexTemplateMigration(MigrationAction):
+    """
+    Install the index templates of the messages, the analytics and the logs, replacing the dynamic mappings that index every string both as text and as keyword,
+    and reindex the existing indices so that the queries can use the same fields on all of them
+    """
+
+    COMPONENT_TEMPLATE = "logger_storage"
+    # the suffix of the index holding the documents of an index while it is recreated with the new mapping
+    REMAPPING_SUFFIX = "-remapping"
+
+    # the identifiers are only filtered and aggregated, the content of the messages and the metadata are only returned and the metadata keys are chosen by the projects
+    TEMPLATES = {
+        "message": {
+            "index_patterns": ["message-*"],
+            "composed_of": [COMPONENT_TEMPLATE],
+            "priority": 100,
+            "template": {
+                "settings": {
+                    "index": {
+                        "refresh_interval": "5s"
+                    }
+                },
+                "mappings": {
+                    "dynamic": False,
+                    "properties": {
+                        "messageId": {"type": "keyword"},
+                        "conversationId": {"type": "keyword"},
+                        "channel": {"type": "keyword"},
+                        "userId": {"type": "keyword"},
+                        "responseTo": {"type": "keyword"},
+                        "timestamp": {"type": "date"},
+                        "project": {"type": "keyword"},
+                        "type": {"type": "keyword"},
+                        "domain": {"type": "keyword"},
+                        "language": {"type": "keyword"},
+                        "intent": {
+                            "properties": {
+                                "name": {"type": "keyword"},
+                                "confidence": {"type": "float"}
+                            }
+                        },
+                        "content": {
+                            "type": "object",
+                            "dynamic": False,
+                            "properties": {
+                                "type": {"type": "keyword"}
+                            }
+                        },
+                        "entities": {
+                            "type": "object",
+                            "enabled": False
+                        },
+                        "metadata": {
+                            "type": "object",
+                            "enabled": False
+                        }
+                    }
+                }
+            }
+        },
+        "analytic": {
+            "index_patterns": ["analytic-*"],
+            "composed_of": [COMPONENT_TEMPLATE],
+            "priority": 100,
+            "template": {
+                "mappings": {
+                    "dynamic": False,
+                    "properties": {
+                        "id": {"type": "keyword"},
+                        "descriptor": {
+                            "type": "object",
+                            "dynamic": False,
+                            "properties": {
+                                "project": {"type": "keyword"},
+                                "type": {"type": "keyword"},
+                                "dimension": {"type": "keyword"},
+                                "metric": {"type": "keyword"},
+                                "timespan": {
+                                    "type": "object",
+                                    "dynamic": False,
+                                    "properties": {
+                                        "type": {"type": "keyword"}
+                                    }
+                                }
+                            }
+                        },
+                        "result": {
+                            "type": "object",
+                            "enabled": False
+                        }
+                    }
+                }
+            }
+        },
+        "logging": {
+            "index_patterns": ["logging-*"],
+            "composed_of": [COMPONENT_TEMPLATE],
+            "priority": 100,
+            "template": {
+                "settings": {
+                    "index": {
+                        "refresh_interval": "30s"
+                    }
+                },
+                "mappings": {
+                    "dynamic": False,
+                    "properties": {
+                        "logId": {"type": "keyword"},
+                        "project": {"type": "keyword"},
+                        "component": {"type": "keyword"},
+                        "authority": {"type": "keyword"},
+                        "severity": {"type": "keyword"},
+                        "botVersion": {"type": "keyword"},
+                        "timestamp": {"type": "date"},
+                        "logContent": {"type": "text"},
+                        "metadata": {
+                            "type": "object",
+                            "enabled": False
+                        }
+                    }
+                }
+            }
+        }
+    }
+
+    def apply(self, es: Elasticsearch) -> None:
+        es.cluster.put_component_template(name=self.COMPONENT_TEMPLATE, body={
+            "template": {
+                "settings": {
+                    "index": {
+                        "codec": "best_compression"
+                    }
+                }
+            }
+        })
+        for name, template in self.TEMPLATES.items():
+            es.indices.put_index_template(name=name, body=template)
+
+        for template in self.TEMPLATES.values():
+            indices = es.indices.get(index=",".join(template["index_patterns"]), ignore_unavailable=True)
+            for index, details in sorted(indices.items()):
+                if not index.endswith(self.REMAPPING_SUFFIX):
+                    self._remap(es, index, details.get("aliases", {}), indices.get(index + self.REMAPPING_SUFFIX))
+                elif index[:-len(self.REMAPPING_SUFFIX)] not in indices:
+                    self._recover(es, index[:-len(self.REMAPPING_SUFFIX)], details)
+
+    def _remap(self, es: Elasticsearch, index: str, aliases: dict, temporary_details: Optional[dict]) -> None:
+        """
+        Recreate an index with the mapping of its template, keeping its name and its aliases.
+        The documents are reindexed in a temporary index, created with the template, which is cloned in place of the original index only once it is verified to hold all the documents.
+        """
+
+        temporary_index = index + self.REMAPPING_SUFFIX
+        remapping = self._get_remapping(temporary_details)
+        if remapping is not None:
+            # the migration was interrupted after verifying the copy, the original index is either still there or it has been recreated by new documents that are added to the copy
+            aliases = remapping["aliases"]
+            es.indices.put_settings(index=temporary_index, body={"index.blocks.write": False})
+        elif temporary_details is not None:
+            # a temporary index left by a migration interrupted before the verification is incomplete, the original index is still there
+            es.indices.delete(index=temporary_index, ignore=404)
+
+        response = es.reindex(body={"source": {"index": index}, "dest": {"index": temporary_index}}, refresh=True, request_timeout=3600)
+        if len(response.get("failures", [])) > 0:
+            # the original index is kept so that the migration can be applied again
+            raise RuntimeError(f"Could not reindex [{len(response['failures'])}] documents of [{index}]: {response['failures'][0]}")
+
+        copied = es.count(index=temporary_index)["count"]
+        expected = es.count(index=index)["count"]
+        if copied < expected:
+            raise RuntimeError(f"Could not reindex the documents of [{index}]: [{copied}] documents copied out of [{expected}]")
+
+        # an index can only be cloned when it does not accept writes, the aliases are stored in the copy so that it can be restored if the migration is interrupted after deleting the original index
+        es.indices.put_settings(index=temporary_index, body={"index.blocks.write": True})
+        es.indices.put_mapping(index=temporary_index, body={"_meta": {"remapping": {"aliases": aliases}}})
+        es.indices.delete(index=index)
+        self._restore(es, index, aliases)
+        logging.info(f"Reindexed [{response.get('total', 0)}] documents of [{index}] with the mapping of its template")
+
+    def _recover(self, es: Elasticsearch, index: str, temporary_details: dict) -> None:
+        """
+        Restore an index deleted by an interrupted migration from its temporary index.
+        """
+
+        remapping = self._get_remapping(temporary_details)
+        if remapping is None:
+            logging.warning(f"Could not restore [{index}]: its temporary index [{index + self.REMAPPING_SUFFIX}] is incomplete")
+            return
+
+        self._restore(es, index, remapping["aliases"])
+        logging.info(f"Restored [{index}] from its temporary index")
+
+    def _restore(self, es: Elasticsearch, index: str, aliases: dict) -> None:
+        temporary_index = index + self.REMAPPING_SUFFIX
+        es.indices.clone(index=temporary_index, target=index, body={"aliases": aliases}, wait_for_active_shards=1)
+        es.indices.put_settings(index=index, body={"index.blocks.write": False})
+        # the clone inherits the metadata of the temporary index
+        es.indices.put_mapping(index=index, body={"_meta": {}})
+        es.indices.delete(index=temporary_index)
+
+    @staticmethod
+    def _get_remapping(details: Optional[dict]) -> Optional[dict]:
+        """
+        :return: the metadata stored in a temporary index once it is verified to hold all the documents of the original index, `None` if the index is missing or incomplete
+        """
+
+        if details is None:
+            return None
+        return details.get("mappings", {}).get("_meta", {}).get("remapping")
+
+    @property
+    def action_name(self) -> str:
+        return "index_template"
+
+    @property
+    def action_num(self) -> int:
+        return 13
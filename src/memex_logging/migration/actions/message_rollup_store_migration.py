@@ -0,0 +1,83 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+import logging
+
+from elasticsearch import Elasticsearch
+
+from memex_logging.common.dao.rollup import MessageRollupDao
+from memex_logging.migration.migration import MigrationAction
+
+
+class MessageRollupStoreMigration(MigrationAction):
+    """
+    Move the daily summaries of the messages from the daily indices to a single index with an explicit mapping, the id of each document identifies its project and day
+    """
+
+    def apply(self, es: Elasticsearch) -> None:
+        if es.indices.exists(index=MessageRollupDao.INDEX):
+            # the index has been created with a dynamic mapping by a worker storing the summaries before the migration, the state is removed as well so that every day is summarized again
+            logging.warning(f"Deleting the index [{MessageRollupDao.INDEX}] created before the migration")
+            es.indices.delete(index=MessageRollupDao.INDEX)
+            es.delete(index=MessageRollupDao.STATE_INDEX, id=MessageRollupDao.STATE_ID, ignore=404)
+
+        # the counts are keyed by values chosen by the projects (e.g. intents and domains) and the sketches are opaque strings, so neither of them is indexed
+        es.indices.create(index=MessageRollupDao.INDEX, body={
+            "mappings": {
+                "dynamic": "strict",
+                "properties": {
+                    "project": {
+                        "type": "keyword"
+                    },
+                    "day": {
+                        "type": "date",
+                        "format": "date"
+                    },
+                    "counts": {
+                        "type": "object",
+                        "enabled": False
+                    },
+                    "sketches": {
+                        "type": "object",
+                        "enabled": False
+                    }
+                }
+            }
+        })
+        # the template only matched the daily indices, it is a legacy template when installed by a version of the migration preceding the composable templates
+        es.indices.delete_index_template(name="message_rollup", ignore=404)
+        es.indices.delete_template(name="message_rollup", ignore=404)
+
+        daily_indices = f"{MessageRollupDao.INDEX}-*"
+        if len(es.indices.get(index=daily_indices, ignore_unavailable=True)) == 0:
+            logging.info("There are no message rollups to move")
+            return
+
+        response = es.reindex(body={"source": {"index": daily_indices}, "dest": {"index": MessageRollupDao.INDEX}}, refresh=True, request_timeout=3600)
+        if len(response.get("failures", [])) > 0:
+            # the daily indices are kept so that the migration can be applied again
+            raise RuntimeError(f"Could not move [{len(response['failures'])}] message rollups: {response['failures'][0]}")
+
+        es.indices.delete(index=daily_indices)
+        logging.info(f"Moved [{response.get('total', 0)}] message rollups from the daily indices")
+
+    @property
+    def action_name(self) -> str:
+        return "message_rollup_store"
+
+    @property
+    def action_num(self) -> int:
+        return 15
@@ -0,0 +1,59 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+from elasticsearch import Elasticsearch
+
+from memex_logging.migration.migration import MigrationAction
+
+
+class MessageRollupTemplateMigration(MigrationAction):
+
+    def apply(self, es: Elasticsearch) -> None:
+        # the counts are keyed by values chosen by the projects (e.g. intents and domains) and the sketches are opaque strings, so neither of them is indexed
+        es.indices.put_index_template(name="message_rollup", body={
+            "index_patterns": ["message_rollup-*"],
+            "priority": 100,
+            "template": {
+                "mappings": {
+                    "dynamic": "strict",
+                    "properties": {
+                        "project": {
+                            "type": "keyword"
+                        },
+                        "day": {
+                            "type": "date",
+                            "format": "date"
+                        },
+                        "counts": {
+                            "type": "object",
+                            "enabled": False
+                        },
+                        "sketches": {
+                            "type": "object",
+                            "enabled": False
+                        }
+                    }
+                }
+            }
+        })
+
+    @property
+    def action_name(self) -> str:
+        return "message_rollup_template"
+
+    @property
+    def action_num(self) -> int:
+        return 9
@@ -0,0 +1,67 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, annotations
+
+from elasticsearch import Elasticsearch
+
+from memex_logging.common.dao.profile_snapshot import ProfileSnapshotDao
+from memex_logging.migration.migration import MigrationAction
+
+
+class ProfileSnapshotMigration(MigrationAction):
+
+    def apply(self, es: Elasticsearch) -> None:
+        # the snapshots are filled by the periodic synchronization of the Celery workers
+        es.indices.create(index=ProfileSnapshotDao.INDEX, ignore=400, body={
+            "mappings": {
+                "dynamic": "strict",
+                "properties": {
+                    "project": {
+                        "type": "keyword"
+                    },
+                    "userId": {
+                        "type": "keyword"
+                    },
+                    "dateOfBirth": {
+                        "type": "date",
+                        "format": "date"
+                    },
+                    "gender": {
+                        "type": "keyword"
+                    },
+                    "locale": {
+                        "type": "keyword"
+                    },
+                    "nationality": {
+                        "type": "keyword"
+                    },
+                    "lastUpdateTs": {
+                        "type": "long"
+                    },
+                    "syncDt": {
+                        "type": "date"
+                    }
+                }
+            }
+        })
+
+    @property
+    def action_name(self) -> str:
+        return "profile_snapshot"
+
+    @property
+    def action_num(self) -> int:
+        return 11
@@ -0,0 +1,228 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import List, Optional, Tuple
+
+from elasticsearch import Elasticsearch
+from elasticsearch.exceptions import ConnectionError, TransportError
+from elasticsearch.helpers import bulk
+
+
+logger = logging.getLogger("logger.ws.buffer")
+
+
+class WriteBehindBuffer:
+    """
+    A bounded in-process buffer of Elasticsearch bulk actions.
+    The actions are drained to Elasticsearch by background flushers in bulk batches, a batch is sent as soon as it reaches the batch size or when the flush interval has elapsed.
+    A batch failed due to a transient error is sent again before the other actions, up to `max_attempts` times, while a batch failed for any other reason is dropped.
+    """
+
+    TRANSIENT_STATUS_CODES = (429, 502, 503, 504)
+
+    def __init__(self, es: Elasticsearch, max_size: int = 10000, batch_size: int = 500, flush_interval: float = 1.0, flushers: int = 1, max_attempts: int = 5) -> None:
+        """
+        :param Elasticsearch es: a connector for Elasticsearch
+        :param int max_size: the maximum number of actions that can be buffered
+        :param int batch_size: the maximum number of actions sent to Elasticsearch in a single bulk request
+        :param float flush_interval: the maximum number of seconds an action waits in the buffer before being flushed
+        :param int flushers: the number of background flushers
+        :param int max_attempts: the maximum number of times a batch is sent when it fails due to transient errors
+        """
+
+        self._es = es
+        self._max_size = max_size
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._max_attempts = max_attempts
+
+        self._actions = deque()
+        # the batches to send again, with the number of attempts already made
+        self._retries = deque()
+        self._retrying = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self._flush_requested = False
+        self._in_flight = 0
+
+        self._accepted = 0
+        self._rejected = 0
+        self._flushed = 0
+        self._failed = 0
+        self._flushes = 0
+        self._last_flush_latency = 0.0
+        self._total_flush_latency = 0.0
+        self._max_flush_latency = 0.0
+
+        self._flushers = [threading.Thread(target=self._run, name=f"write-behind-flusher-{i}", daemon=True) for i in range(flushers)]
+        for flusher in self._flushers:
+            flusher.start()
+
+    @property
+    def max_size(self) -> int:
+        """
+        :return: the maximum number of actions that can be buffered, a larger list of actions is always rejected
+        """
+
+        return self._max_size
+
+    def put(self, actions: List[dict]) -> bool:
+        """
+        Add a list of actions to the buffer, the actions are either all accepted or all rejected.
+
+        :param List[dict] actions: the bulk actions to buffer
+        :return: `True` if the actions have been accepted, `False` if the buffer is full or closed
+        """
+
+        with self._condition:
+            if self._closed or len(self._actions) + self._retrying + self._in_flight + len(actions) > self._max_size:
+                self._rejected += len(actions)
+                return False
+
+            self._actions.extend(actions)
+            self._accepted += len(actions)
+            if len(self._actions) >= self._batch_size:
+                self._condition.notify()
+            return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for all the buffered actions to be sent to Elasticsearch.
+
+        :param Optional[float] timeout: the maximum number of seconds to wait
+        :return: `True` if the buffer has been drained, `False` if the timeout expired
+        """
+
+        with self._condition:
+            self._flush_requested = True
+            self._condition.notify_all()
+            drained = self._condition.wait_for(lambda: len(self._actions) == 0 and self._retrying == 0 and self._in_flight == 0, timeout=timeout)
+            self._flush_requested = False
+            return drained
+
+    def close(self, timeout: Optional[float] = 30.0) -> None:
+        """
+        Stop accepting new actions, flush the buffered ones and stop the flushers.
+
+        :param Optional[float] timeout: the maximum number of seconds to wait for the buffer to be drained
+        """
+
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+
+        for flusher in self._flushers:
+            flusher.join(timeout=timeout)
+
+        if len(self._actions) + self._retrying > 0:
+            logger.error(f"Write-behind buffer closed with [{len(self._actions) + self._retrying}] actions not flushed to Elasticsearch")
+
+    def stats(self) -> dict:
+        """
+        :return: the counters of the buffer
+        """
+
+        with self._condition:
+            return {
+                "depth": len(self._actions) + self._retrying,
+                "maxSize": self._max_size,
+                "accepted": self._accepted,
+                "rejected": self._rejected,
+                "flushed": self._flushed,
+                "failed": self._failed,
+                "flushes": self._flushes,
+                "lastFlushLatency": self._last_flush_latency,
+                "averageFlushLatency": self._total_flush_latency / self._flushes if self._flushes > 0 else 0.0,
+                "maxFlushLatency": self._max_flush_latency
+            }
+
+    def _next_batch(self) -> Optional[Tuple[List[dict], int]]:
+        with self._condition:
+            deadline = time.monotonic() + self._flush_interval
+            while not self._closed and len(self._retries) == 0 and not (self._flush_requested and len(self._actions) > 0) and len(self._actions) < self._batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(timeout=remaining)
+
+            if len(self._retries) > 0:
+                batch, attempts = self._retries.popleft()
+                self._retrying -= len(batch)
+                self._in_flight += len(batch)
+                return batch, attempts
+
+            if len(self._actions) == 0:
+                return None if self._closed else ([], 0)
+
+            batch = [self._actions.popleft() for _ in range(min(self._batch_size, len(self._actions)))]
+            self._in_flight += len(batch)
+            return batch, 0
+
+    def _run(self) -> None:
+        while True:
+            next_batch = self._next_batch()
+            if next_batch is None:
+                return
+            batch, attempts = next_batch
+            if len(batch) > 0:
+                self._flush_batch(batch, attempts)
+
+    def _is_transient(self, error: Exception) -> bool:
+        return isinstance(error, ConnectionError) or (isinstance(error, TransportError) and error.status_code in self.TRANSIENT_STATUS_CODES)
+
+    def _flush_batch(self, batch: List[dict], attempts: int = 0) -> None:
+        start = time.monotonic()
+        try:
+            flushed, errors = bulk(self._es, batch, raise_on_error=False)
+        except Exception as e:
+            # a batch failing for other reasons, such as being malformed or too large, would fail again and block the following ones
+            retry = not self._closed and self._is_transient(e) and attempts + 1 < self._max_attempts
+            if retry:
+                logger.warning(f"Could not flush [{len(batch)}] actions to Elasticsearch due to a transient error, retrying", exc_info=e)
+            else:
+                logger.exception(f"Could not flush [{len(batch)}] actions to Elasticsearch, dropping them", exc_info=e)
+            with self._condition:
+                self._in_flight -= len(batch)
+                if retry:
+                    # the buffer stays bounded because new actions are rejected while it is full
+                    self._retries.append((batch, attempts + 1))
+                    self._retrying += len(batch)
+                else:
+                    self._failed += len(batch)
+                self._condition.notify_all()
+            if retry:
+                time.sleep(self._flush_interval)
+            return
+
+        latency = time.monotonic() - start
+        for error in errors:
+            logger.error(f"Could not store document: {error}")
+
+        with self._condition:
+            self._in_flight -= len(batch)
+            self._flushed += flushed
+            self._failed += len(errors)
+            self._flushes += 1
+            self._last_flush_latency = latency
+            self._total_flush_latency += latency
+            self._max_flush_latency = max(self._max_flush_latency, latency)
+            self._condition.notify_all()
@@ -0,0 +1,105 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, annotations
+
+import logging
+import time
+from threading import Lock
+from typing import Optional
+
+from memex_logging.common.cache import TTLCache
+from memex_logging.common.dao.analytic import AnalyticDao
+from memex_logging.common.model.analytic.analytic import Analytic
+
+
+logger = logging.getLogger("logger.ws.cache")
+
+
+class AnalyticCache:
+    """
+    A cache of the analytics retrieved by the web service worker.
+    The results of the analytics are updated by the Celery workers, that change the version stamp of the analytics when they do it: the stamp is checked at most once per interval and the whole cache is discarded when it changes.
+    """
+
+    def __init__(self, analytic_dao: AnalyticDao, max_size: int = 1000, ttl: float = 300, version_check_interval: float = 5) -> None:
+        """
+        :param AnalyticDao analytic_dao: the dao of the analytics
+        :param int max_size: the maximum number of cached analytics
+        :param float ttl: the maximum number of seconds for which an analytic is cached
+        :param float version_check_interval: the minimum number of seconds between two checks of the version stamp of the analytics
+        """
+
+        self._analytic_dao = analytic_dao
+        self._cache = TTLCache(max_size=max_size, ttl=ttl)
+        self._version_check_interval = version_check_interval
+        self._version: Optional[int] = None
+        self._version_checked_at: Optional[float] = None
+        self._invalidations = 0
+        self._lock = Lock()
+
+    def _check_version(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if self._version_checked_at is not None and now - self._version_checked_at < self._version_check_interval:
+                return
+            self._version_checked_at = now
+
+        try:
+            version = self._analytic_dao.get_version()
+        except Exception as e:
+            logger.warning("Could not check the version of the analytics", exc_info=e)
+            return
+
+        with self._lock:
+            if version != self._version:
+                if self._version is not None:
+                    self._invalidations += 1
+                    logger.debug(f"The version of the analytics changed from [{self._version}] to [{version}], discarding the cached analytics")
+                self._cache.clear()
+                self._version = version
+
+    def get(self, analytic_id: str) -> Analytic:
+        """
+        :param str analytic_id: the id of the analytic
+        :return: the analytic, retrieved from Elasticsearch if it is not cached
+        :raise DocumentNotFound: when could not find the analytic
+        """
+
+        self._check_version()
+        analytic = self._cache.get(analytic_id)
+        if analytic is None:
+            analytic = self._analytic_dao.get(analytic_id)
+            self._cache.put(analytic_id, analytic)
+        return analytic
+
+    def invalidate(self, analytic_id: str) -> None:
+        """
+        :param str analytic_id: the id of the analytic to discard
+        """
+        self._cache.invalidate(analytic_id)
+
+    def stats(self) -> dict:
+        """
+        :return: the counters of the cache
+        """
+
+        stats = self._cache.stats()
+        with self._lock:
+            stats.update({
+                "invalidations": self._invalidations,
+                "version": self._version
+            })
+        return stats
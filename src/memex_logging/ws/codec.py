@@ -0,0 +1,138 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+import json
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Optional, Union
+
+from flask import Request, Response, make_response
+
+
+logger = logging.getLogger("logger.ws.codec")
+
+
+class JsonCodec(ABC):
+    """
+    The codec encoding the bodies of the responses and decoding the bodies of the requests of the web service
+    """
+
+    NAME = None
+
+    @abstractmethod
+    def dumps(self, data: Any) -> bytes:
+        """
+        :param Any data: the data to encode
+        :return: the data encoded in JSON as UTF-8 bytes
+        """
+        pass
+
+    @abstractmethod
+    def loads(self, data: Union[bytes, str]) -> Any:
+        """
+        :param Union[bytes, str] data: the JSON to decode
+        :return: the decoded data
+        :raise ValueError: when the data is not valid JSON
+        """
+        pass
+
+    def output(self, data: Any, code: int, headers: Optional[dict] = None) -> Response:
+        """
+        The Flask-RESTful representation of the `application/json` media type
+
+        :param Any data: the body of the response
+        :param int code: the status code of the response
+        :param Optional[dict] headers: the additional headers of the response
+        :return: the response
+        """
+
+        # always end the body with a new line, as the default representation of Flask-RESTful
+        response = make_response(self.dumps(data) + b"\n", code)
+        response.headers.extend(headers or {})
+        return response
+
+    def build_request_class(self) -> type:
+        """
+        :return: the class of the Flask requests parsing their JSON body with this codec, so that `request.json` keeps its behaviour: `None` when the body is not JSON and `400` when it is malformed
+        """
+
+        class CodecRequest(Request):
+            json_module = self
+
+        return CodecRequest
+
+
+class StdlibJsonCodec(JsonCodec):
+    """
+    The codec based on the `json` module of the standard library, producing the same output of the default representation of Flask-RESTful
+    """
+
+    NAME = "stdlib"
+
+    def dumps(self, data: Any) -> bytes:
+        return json.dumps(data).encode("utf-8")
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    """
+    The codec based on `orjson`, the data that `orjson` can not encode, such as integers larger than 64 bits, is encoded with the standard library
+    """
+
+    NAME = "orjson"
+
+    def __init__(self) -> None:
+        """
+        :raise ImportError: when `orjson` is not installed
+        """
+
+        import orjson
+        self._orjson = orjson
+        self._fallback = StdlibJsonCodec()
+
+    def dumps(self, data: Any) -> bytes:
+        try:
+            return self._orjson.dumps(data, option=self._orjson.OPT_NON_STR_KEYS)
+        except TypeError as e:
+            logger.debug("Could not encode the data with orjson, using the standard library", exc_info=e)
+            return self._fallback.dumps(data)
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return self._orjson.loads(data)
+
+
+def build_codec(name: str = "auto") -> JsonCodec:
+    """
+    :param str name: the name of the codec, `auto` selects `orjson` when it is installed and the standard library otherwise
+    :return: the codec
+    :raise ValueError: when the name does not identify a codec
+    :raise ImportError: when `orjson` is explicitly selected but it is not installed
+    """
+
+    if name == "auto":
+        try:
+            return OrjsonCodec()
+        except ImportError:
+            logger.info("orjson is not installed, using the standard library for encoding and decoding JSON")
+            return StdlibJsonCodec()
+    elif name == OrjsonCodec.NAME:
+        return OrjsonCodec()
+    elif name == StdlibJsonCodec.NAME:
+        return StdlibJsonCodec()
+    else:
+        raise ValueError(f"Unrecognized JSON codec [{name}]")
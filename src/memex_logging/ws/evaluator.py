@@ -0,0 +1,112 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, annotations
+
+import logging
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeoutError
+from threading import Lock
+from typing import Callable, Dict, Optional
+
+from memex_logging.common.cache import TTLCache
+from memex_logging.common.computation.analytic import AnalyticComputation
+from memex_logging.common.model.analytic.descriptor.common import CommonAnalyticDescriptor
+from memex_logging.common.model.analytic.result.common import CommonAnalyticResult
+
+
+logger = logging.getLogger("logger.ws.evaluator")
+
+
+class AnalyticEvaluator:
+    """
+    Compute the result of an analytic descriptor while serving the request, without storing the analytic.
+    The results are cached by the canonical key of the descriptor, so that the same descriptor evaluated again in the same time range is not computed twice,
+    and the concurrent evaluations of the same descriptor wait for the computation already in progress.
+    """
+
+    def __init__(self, computation_builder: Callable[[], AnalyticComputation], timeout: float = 10, max_workers: int = 4,
+                 cache_size: int = 1000, cache_ttl: float = 300) -> None:
+        """
+        :param Callable[[], AnalyticComputation] computation_builder: the function building the computation of the analytics, called at the first evaluation
+        :param float timeout: the maximum number of seconds to wait for the computation of a result
+        :param int max_workers: the maximum number of results computed at the same time
+        :param int cache_size: the maximum number of cached results
+        :param float cache_ttl: the maximum number of seconds for which a result is cached
+        """
+
+        self._computation_builder = computation_builder
+        self._computation: Optional[AnalyticComputation] = None
+        self._timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analytic-evaluator")
+        self._cache = TTLCache(max_size=cache_size, ttl=cache_ttl)
+        self._timeouts = 0
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = Lock()
+
+    def _get_computation(self) -> AnalyticComputation:
+        with self._lock:
+            if self._computation is None:
+                self._computation = self._computation_builder()
+            return self._computation
+
+    def _complete(self, key: str, future: Future) -> None:
+        if future.exception() is None and future.result() is not None:
+            self._cache.put(key, future.result())
+        # the result is cached before the computation is removed, so that the following evaluations find one of the two
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def evaluate(self, descriptor: CommonAnalyticDescriptor) -> Optional[CommonAnalyticResult]:
+        """
+        :param CommonAnalyticDescriptor descriptor: the descriptor of the analytic
+        :return: the result of the analytic
+        :raise TimeoutError: when the result is not computed within the timeout, the computation is not interrupted and its result is cached when it completes
+        """
+
+        key = AnalyticComputation.build_key(descriptor)
+        result = self._cache.get(key)
+        if result is not None:
+            return result
+
+        computation = self._get_computation()
+        with self._lock:
+            future = self._in_flight.get(key)
+            submitted = future is None
+            if submitted:
+                future = self._executor.submit(computation.get_result, descriptor)
+                self._in_flight[key] = future
+        if submitted:
+            # the callback runs straight away when the computation has already completed, so it is added without holding the lock
+            future.add_done_callback(lambda completed: self._complete(key, completed))
+        try:
+            return future.result(timeout=self._timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self._timeouts += 1
+            raise TimeoutError(f"The result of the analytic was not computed within [{self._timeout}] seconds")
+
+    def stats(self) -> dict:
+        """
+        :return: the counters of the evaluator
+        """
+
+        stats = self._cache.stats()
+        with self._lock:
+            stats["timeouts"] = self._timeouts
+        return stats
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
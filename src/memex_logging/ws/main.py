@@ -15,6 +15,7 @@
 from __future__ import absolute_import, annotations
 
 import argparse
+import atexit
 import logging.config
 import os
 from typing import Optional
@@ -26,6 +27,12 @@ from sentry_sdk.integrations.logging import LoggingIntegration
 
 from memex_logging.common.dao.collector import DaoCollector
 from memex_logging.common.log.logging import get_logging_configuration
+from memex_logging.ws.buffer import WriteBehindBuffer
+from memex_logging.celery.analytic import build_analytic_computation
+from memex_logging.ws.cache import AnalyticCache
+from memex_logging.ws.codec import build_codec
+from memex_logging.ws.evaluator import AnalyticEvaluator
+from memex_logging.ws.session import SessionTracker, InMemorySessionStore, RedisSessionStore
 from memex_logging.ws.ws import WsInterface
 
 
@@ -50,12 +57,55 @@ def init_ws(
         elasticsearch_host: str,
         elasticsearch_port: int,
         elasticsearch_user: Optional[str],
-        elasticsearch_password: Optional[str]
+        elasticsearch_password: Optional[str],
+        write_behind: bool = False,
+        write_behind_max_size: int = 10000,
+        write_behind_batch_size: int = 500,
+        write_behind_flush_interval: float = 1.0,
+        write_behind_flushers: int = 1,
+        write_behind_max_attempts: int = 5,
+        first_seen_registry: bool = False,
+        analytic_cache_size: int = 0,
+        analytic_cache_ttl: float = 300,
+        analytic_evaluation_timeout: float = 10,
+        analytic_evaluation_cache_size: int = 1000,
+        analytic_evaluation_cache_ttl: float = 300,
+        session_tracking: bool = False,
+        session_timeout: float = 10800,
+        session_store: str = "memory",
+        session_store_size: int = 100000,
+        session_redis_url: Optional[str] = None,
+        json_codec: str = "auto"
         ) -> WsInterface:
 
     es = Elasticsearch([{'host': elasticsearch_host, 'port': elasticsearch_port}], http_auth=(elasticsearch_user, elasticsearch_password))
-    dao_collector = DaoCollector.build_dao_collector(es)
-    ws_interface = WsInterface(dao_collector, es)
+    dao_collector = DaoCollector.build_dao_collector(es, first_seen_registry=first_seen_registry)
+
+    write_behind_buffer = None
+    if write_behind:
+        write_behind_buffer = WriteBehindBuffer(es, max_size=write_behind_max_size, batch_size=write_behind_batch_size, flush_interval=write_behind_flush_interval, flushers=write_behind_flushers, max_attempts=write_behind_max_attempts)
+        # gunicorn workers exit through `sys.exit` on graceful shutdown, so the buffered messages are flushed before the worker terminates
+        atexit.register(write_behind_buffer.close)
+
+    analytic_cache = None
+    if analytic_cache_size > 0:
+        analytic_cache = AnalyticCache(dao_collector.analytic, max_size=analytic_cache_size, ttl=analytic_cache_ttl)
+
+    analytic_evaluator = AnalyticEvaluator(lambda: build_analytic_computation(es), timeout=analytic_evaluation_timeout,
+                                           cache_size=analytic_evaluation_cache_size, cache_ttl=analytic_evaluation_cache_ttl)
+
+    session_tracker = None
+    if session_tracking:
+        if session_store == "redis":
+            store = RedisSessionStore.from_url(session_redis_url, ttl=session_timeout)
+        elif session_store == "memory":
+            store = InMemorySessionStore(max_size=session_store_size, ttl=session_timeout)
+        else:
+            raise ValueError(f"Unrecognized session store [{session_store}]")
+        session_tracker = SessionTracker(store, timeout=session_timeout)
+
+    ws_interface = WsInterface(dao_collector, es, write_behind_buffer=write_behind_buffer, analytic_cache=analytic_cache, analytic_evaluator=analytic_evaluator,
+                               session_tracker=session_tracker, json_codec=build_codec(json_codec))
     return ws_interface
 
 
@@ -65,6 +115,24 @@ def build_interface_from_env():
         elasticsearch_port=int(os.getenv("EL_PORT", 9200)),
         elasticsearch_user=os.getenv("EL_USERNAME", None),
         elasticsearch_password=os.getenv("EL_PASSWORD", None),
+        write_behind=os.getenv("WRITE_BEHIND", "false").lower() == "true",
+        write_behind_max_size=int(os.getenv("WRITE_BEHIND_MAX_SIZE", 10000)),
+        write_behind_batch_size=int(os.getenv("WRITE_BEHIND_BATCH_SIZE", 500)),
+        write_behind_flush_interval=float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", 1.0)),
+        write_behind_flushers=int(os.getenv("WRITE_BEHIND_FLUSHERS", 1)),
+        write_behind_max_attempts=int(os.getenv("WRITE_BEHIND_MAX_ATTEMPTS", 5)),
+        first_seen_registry=os.getenv("FIRST_SEEN_REGISTRY", "false").lower() == "true",
+        analytic_cache_size=int(os.getenv("ANALYTIC_CACHE_SIZE", 1000)),
+        analytic_cache_ttl=float(os.getenv("ANALYTIC_CACHE_TTL", 300)),
+        analytic_evaluation_timeout=float(os.getenv("ANALYTIC_EVALUATION_TIMEOUT", 10)),
+        analytic_evaluation_cache_size=int(os.getenv("ANALYTIC_EVALUATION_CACHE_SIZE", 1000)),
+        analytic_evaluation_cache_ttl=float(os.getenv("ANALYTIC_EVALUATION_CACHE_TTL", 300)),
+        session_tracking=os.getenv("SESSION_TRACKING", "false").lower() == "true",
+        session_timeout=float(os.getenv("SESSION_TIMEOUT", 10800)),
+        session_store=os.getenv("SESSION_STORE", "memory").lower(),
+        session_store_size=int(os.getenv("SESSION_STORE_SIZE", 100000)),
+        session_redis_url=os.getenv("SESSION_REDIS_URL", os.getenv("CELERY_BROKER_URL")),
+        json_codec=os.getenv("JSON_CODEC", "auto").lower()
     )
 
     return ws_interface
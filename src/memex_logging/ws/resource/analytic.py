@@ -16,6 +16,7 @@ from __future__ import absolute_import, annotations
 
 import logging
 import uuid
+from typing import Optional
 
 from flask import request
 from flask_restful import Resource
@@ -26,16 +27,19 @@ from memex_logging.common.dao.common import DocumentNotFound
 from memex_logging.common.model.analytic.analytic import Analytic
 from memex_logging.common.model.analytic.descriptor.builder import AnalyticDescriptorBuilder
 from memex_logging.common.model.analytic.time import TimeWindow
+from memex_logging.ws.cache import AnalyticCache
+from memex_logging.ws.evaluator import AnalyticEvaluator
 
 logger = logging.getLogger("logger.resource.analytic")
 
 
 class AnalyticsResourceBuilder:
     @staticmethod
-    def routes(dao_collector: DaoCollector):
+    def routes(dao_collector: DaoCollector, analytic_evaluator: AnalyticEvaluator, analytic_cache: Optional[AnalyticCache] = None):
         return [
-            (AnalyticInterface, '/analytic', (dao_collector,)),
+            (AnalyticInterface, '/analytic', (dao_collector, analytic_cache)),
             (ComputeAnalyticInterface, '/analytic/compute', ()),
+            (EvaluateAnalyticInterface, '/analytic/evaluate', (analytic_evaluator,)),
             # (GetNoClickPerUser, '/analytic/usercount', (es,)),
             # (GetNoClickPerEvent, '/analytic/eventcount', (es,))
         ]
@@ -43,8 +47,9 @@ class AnalyticsResourceBuilder:
 
 class AnalyticInterface(Resource):
 
-    def __init__(self, dao_collector: DaoCollector):
+    def __init__(self, dao_collector: DaoCollector, analytic_cache: Optional[AnalyticCache] = None):
         self._dao_collector = dao_collector
+        self._analytic_cache = analytic_cache
 
     def get(self):
         analytic_id = request.args.get("id")
@@ -57,7 +62,10 @@ class AnalyticInterface(Resource):
             }, 400
 
         try:
-            analytic = self._dao_collector.analytic.get(analytic_id)
+            if self._analytic_cache is not None:
+                analytic = self._analytic_cache.get(analytic_id)
+            else:
+                analytic = self._dao_collector.analytic.get(analytic_id)
             return analytic.to_repr(), 200
         except DocumentNotFound as e:
             logger.debug(f"Analytic [{analytic_id}] not found", exc_info=e)
@@ -124,6 +132,8 @@ class AnalyticInterface(Resource):
 
         try:
             self._dao_collector.analytic.delete(analytic_id)
+            if self._analytic_cache is not None:
+                self._analytic_cache.invalidate(analytic_id)
             logger.debug(f"Analytic with id [{analytic_id}] deleted")
         except Exception as e:
             logger.exception(f"Analytic with id [{analytic_id}] could not be to be deleted", exc_info=e)
@@ -156,6 +166,63 @@ class ComputeAnalyticInterface(Resource):
         return {}, 200
 
 
+class EvaluateAnalyticInterface(Resource):
+
+    def __init__(self, analytic_evaluator: AnalyticEvaluator):
+        self._analytic_evaluator = analytic_evaluator
+
+    def post(self):
+        body = request.json
+        logger.info("Evaluating analytic")
+        if body is None:
+            logger.debug("Could not build analytic descriptor: no data was posted")
+            return {
+                "status": "Malformed request: data is missing",
+                "code": 400
+            }, 400
+
+        try:
+            descriptor = AnalyticDescriptorBuilder.build(body)
+        except (KeyError, ValueError, TypeError, AttributeError) as e:
+            logger.warning("Error while parsing input analytic data", exc_info=e)
+            return {
+                "status": f"Malformed request: analytic not valid.",
+                "code": 400
+            }, 400
+        except Exception as e:
+            logger.exception("Something went wrong while parsing the provided analytic description", exc_info=e)
+            return {
+                "status": "Something went wrong while parsing the posted analytic",
+                "code": 500
+            }, 500
+
+        try:
+            result = self._analytic_evaluator.evaluate(descriptor)
+        except TimeoutError as e:
+            logger.warning(f"The evaluation of analytic [{descriptor.to_repr()}] timed out", exc_info=e)
+            return {
+                "status": "The result of the analytic could not be computed in time",
+                "code": 504
+            }, 504
+        except ValueError as e:
+            logger.warning(f"Analytic [{descriptor.to_repr()}] can not be computed", exc_info=e)
+            return {
+                "status": "Malformed request: analytic not valid.",
+                "code": 400
+            }, 400
+        except Exception as e:
+            logger.exception(f"Something went wrong while evaluating analytic [{descriptor.to_repr()}]", exc_info=e)
+            return {
+                "status": "Something went wrong while evaluating the analytic",
+                "code": 500
+            }, 500
+
+        return {
+            "descriptor": descriptor.to_repr(),
+            "result": result.to_repr() if result is not None else None
+        }, 200
+
+
 # class GetNoClickPerUser(Resource):
 #
 #     def __init__(self, es: Elasticsearch):
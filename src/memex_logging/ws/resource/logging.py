@@ -15,6 +15,8 @@
 from __future__ import absolute_import, annotations
 
 import logging
+import uuid
+from typing import Optional
 
 from elasticsearch import Elasticsearch
 from flask import request
@@ -22,6 +24,7 @@ from flask_restful import Resource
 
 from memex_logging.common.model.log import Log
 from memex_logging.common.utils import Utils
+from memex_logging.ws.buffer import WriteBehindBuffer
 
 
 logger = logging.getLogger("logger.resource.logging")
@@ -32,10 +35,10 @@ class LoggingResourceBuilder(object):
     Logic class used to create enable the endpoints. This class is used in ws.py
     """
     @staticmethod
-    def routes(es: Elasticsearch):
+    def routes(es: Elasticsearch, write_behind_buffer: Optional[WriteBehindBuffer] = None):
         return [
             (LogGeneralLog, '/log', (es,)),
-            (LogGeneralLogs, '/logs', (es,))
+            (LogGeneralLogs, '/logs', (es, write_behind_buffer))
         ]
 
 
@@ -59,12 +62,20 @@ class LogGeneralLogs(Resource):
     This class can be used to log an array of log messages.
     """
 
-    def __init__(self, es: Elasticsearch):
+    def __init__(self, es: Elasticsearch, write_behind_buffer: Optional[WriteBehindBuffer] = None):
         """
         Function to gather the external parameters that are going to be used in the other methods
         :param es: the elasticsearch instance
+        :param write_behind_buffer: the buffer where to queue the logs, if set the logs are stored asynchronously
         """
         self._es = es
+        self._write_behind_buffer = write_behind_buffer
+
+    @staticmethod
+    def _build_index_name(log: dict) -> str:
+        project_name = Utils.extract_project_name(log)
+        date = Utils.extract_date(log)
+        return "logging-" + project_name + "-" + date
 
     def post(self):
         """
@@ -77,13 +88,37 @@ class LogGeneralLogs(Resource):
         logs_received = request.json
         log_ids = []
 
+        # a batch larger than the buffer would be rejected even by an empty buffer, so it is stored synchronously
+        if self._write_behind_buffer is not None and len(logs_received) <= self._write_behind_buffer.max_size:
+            actions = []
+            for log in logs_received:
+                try:
+                    temp_log = Log.from_repr(log)
+                    index_name = self._build_index_name(log)
+                    log_id = str(uuid.uuid4())
+                    actions.append({"_op_type": "index", "_index": index_name, "_id": log_id, "_source": temp_log.to_repr()})
+                    log_ids.append(log_id)
+                except Exception as e:
+                    logger.error(f"Failed to log: {log}", exc_info=e)
+
+            if not self._write_behind_buffer.put(actions):
+                logger.warning(f"Could not queue [{len(actions)}] logs: the write-behind buffer is full")
+                return {
+                    "status": "Too many requests: the write buffer is full, retry later",
+                    "code": 429
+                }, 429, {"Retry-After": "1"}
+
+            return {
+                "traceIds": log_ids,
+                "status": "Accepted: logs queued for storage",
+                "code": 202
+            }, 202
+
         for log in logs_received:
             # store the message in the database
             try:
                 temp_log = Log.from_repr(log)
-                project_name = Utils.extract_project_name(log)
-                date = Utils.extract_date(log)
-                index_name = "logging-" + project_name + "-" + date
+                index_name = self._build_index_name(log)
                 query = self._es.index(index=index_name, doc_type='_doc', body=temp_log.to_repr())
                 log_ids.append(query['_id'])
             except Exception as e:
@@ -14,15 +14,24 @@
 
 from __future__ import absolute_import, annotations
 
+import base64
+import itertools
+import json
 import logging
+import uuid
+import zlib
 from datetime import datetime
+from typing import Optional, List, Iterator
 
-from flask import request
+from flask import request, Response, stream_with_context
 from flask_restful import Resource
 
 from memex_logging.common.dao.collector import DaoCollector
 from memex_logging.common.dao.common import DocumentNotFound
 from memex_logging.common.model.message import Message
+from memex_logging.ws.buffer import WriteBehindBuffer
+from memex_logging.ws.codec import JsonCodec, StdlibJsonCodec
+from memex_logging.ws.session import SessionTracker
 
 
 logger = logging.getLogger("logger.resource.message")
@@ -31,10 +40,12 @@ logger = logging.getLogger("logger.resource.message")
 class MessageResourceBuilder(object):
 
     @staticmethod
-    def routes(dao_collector: DaoCollector):
+    def routes(dao_collector: DaoCollector, write_behind_buffer: Optional[WriteBehindBuffer] = None, session_tracker: Optional[SessionTracker] = None,
+               json_codec: Optional[JsonCodec] = None):
         return [
             (MessageInterface, '/message', (dao_collector,)),
-            (MessagesInterface, '/messages', (dao_collector,)),
+            (MessagesInterface, '/messages', (dao_collector, write_behind_buffer, session_tracker)),
+            (MessagesExportInterface, '/messages/export', (dao_collector, json_codec)),
         ]
 
 
@@ -54,7 +65,7 @@ class MessageInterface(Resource):
         trace_id = request.args.get('traceId', None)
 
         try:
-            message, trace_id = self._dao_collector.message.get(project=project, message_id=message_id, user_id=user_id, trace_id=trace_id)
+            raw_message, trace_id = self._dao_collector.message.get(project=project, message_id=message_id, user_id=user_id, trace_id=trace_id, raw=True)
         except ValueError as e:
             logger.debug("Missing required parameters", exc_info=e)
             return {
@@ -74,7 +85,7 @@ class MessageInterface(Resource):
                 "code": 500
             }, 500
 
-        json_response = message.to_repr()
+        json_response = dict(raw_message)
         json_response["traceId"] = trace_id
         return json_response, 200
 
@@ -111,8 +122,10 @@ class MessageInterface(Resource):
 
 class MessagesInterface(Resource):
 
-    def __init__(self, dao_collector: DaoCollector) -> None:
+    def __init__(self, dao_collector: DaoCollector, write_behind_buffer: Optional[WriteBehindBuffer] = None, session_tracker: Optional[SessionTracker] = None) -> None:
         self._dao_collector = dao_collector
+        self._write_behind_buffer = write_behind_buffer
+        self._session_tracker = session_tracker
 
     def post(self):
         """
@@ -127,8 +140,6 @@ class MessagesInterface(Resource):
                 "code": 400
             }, 400
 
-        trace_ids = []
-
         try:
             messages = [Message.from_repr(m_r) for m_r in messages_received]
         except (KeyError, ValueError, TypeError, AttributeError) as e:
@@ -144,23 +155,77 @@ class MessagesInterface(Resource):
                 "code": 500
             }, 500
 
-        for message in messages:
+        if self._session_tracker is not None:
             try:
-                trace_id = self._dao_collector.message.add(message)
-                trace_ids.append(trace_id)
+                self._session_tracker.assign(messages)
             except Exception as e:
-                logger.exception(f"Could not save message with id {message.message_id} could not be saved", exc_info=e)
-                logger.error(message)
+                # the messages are stored anyway, without the conversation
+                logger.exception("Could not assign the conversation to the messages", exc_info=e)
+
+        if self._write_behind_buffer is not None:
+            trace_ids = [str(uuid.uuid4()) for _ in messages]
+            actions = [self._dao_collector.message.build_bulk_action(message, trace_id=trace_id) for message, trace_id in zip(messages, trace_ids)]
+            actions.extend(self._dao_collector.message.build_first_seen_actions(messages))
+            if len(actions) > self._write_behind_buffer.max_size:
+                # the batch would be rejected even by an empty buffer, so it is stored synchronously
+                logger.info(f"Storing [{len(messages)}] messages synchronously: the batch is larger than the write-behind buffer")
+            else:
+                if not self._write_behind_buffer.put(actions):
+                    logger.warning(f"Could not queue [{len(messages)}] messages: the write-behind buffer is full")
+                    return {
+                        "status": "Too many requests: the write buffer is full, retry later",
+                        "code": 429
+                    }, 429, {"Retry-After": "1"}
+
                 return {
-                    "status": "Internal server error: something went wrong in storing messages",
-                    "code": 500
-                }, 500
+                    "traceIds": trace_ids,
+                    "status": "Accepted: messages queued for storage",
+                    "code": 202
+                }, 202
 
-        return {
-            "traceIds": trace_ids,
-            "status": "Created: messages stored",
-            "code": 201
-        }, 201
+        try:
+            results = self._dao_collector.message.add_batch(messages)
+        except Exception as e:
+            logger.exception("Could not save the batch of messages", exc_info=e)
+            return {
+                "status": "Internal server error: something went wrong in storing messages",
+                "code": 500
+            }, 500
+
+        trace_ids = []
+        errors = []
+        for position, (message, (trace_id, error)) in enumerate(zip(messages, results)):
+            if error is None:
+                trace_ids.append(trace_id)
+            else:
+                logger.error(f"Message with id {message.message_id} could not be saved: {error}")
+                trace_ids.append(None)
+                errors.append({
+                    "position": position,
+                    "messageId": message.message_id,
+                    "error": error
+                })
+
+        if len(errors) == 0:
+            return {
+                "traceIds": trace_ids,
+                "status": "Created: messages stored",
+                "code": 201
+            }, 201
+        elif len(errors) < len(messages):
+            return {
+                "traceIds": trace_ids,
+                "errors": errors,
+                "status": "Multi-Status: some messages could not be stored",
+                "code": 207
+            }, 207
+        else:
+            return {
+                "traceIds": trace_ids,
+                "errors": errors,
+                "status": "Internal server error: something went wrong in storing messages",
+                "code": 500
+            }, 500
 
     def get(self):
         """
@@ -188,6 +253,7 @@ class MessagesInterface(Resource):
         user_id = request.args.get('userId', None)
         channel = request.args.get('channel', None)
         message_type = request.args.get('type', None)
+        fields = self._parse_fields(request.args.get('fields', None))
 
         try:
             max_size = int(request.args.get('maxSize', 1000))
@@ -205,8 +271,19 @@ class MessagesInterface(Resource):
                 "code": 400
             }, 400
 
+        if max_size < 1:
+            logger.debug(f"`maxSize` is too small, must be greater than or equal to: [1] but was [{max_size}]")
+            return {
+                "status": f"Malformed request: `maxSize` is too small, must be greater than or equal to: [1] but was [{max_size}]",
+                "code": 400
+            }, 400
+
+        if 'cursor' in request.args:
+            return self._get_page(project, from_time, to_time, max_size, request.args['cursor'], user_id, channel, message_type, fields)
+
         try:
-            messages = self._dao_collector.message.search(project, from_time, to_time, max_size, user_id=user_id, channel=channel, message_type=message_type)
+            raw_messages = self._dao_collector.message.search(project, from_time, to_time, max_size, user_id=user_id, channel=channel, message_type=message_type,
+                                                              raw=True, source_includes=fields)
         except ValueError as e:
             logger.debug("`fromTime` is greater than `toTime`", exc_info=e)
             return {
@@ -220,7 +297,59 @@ class MessagesInterface(Resource):
                 "code": 500
             }, 500
 
-        return [message.to_repr() for message in messages], 200
+        return raw_messages, 200
+
+    @staticmethod
+    def _parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+        if fields is None or fields == "":
+            return None
+        return [field.strip() for field in fields.split(",") if field.strip() != ""]
+
+    @staticmethod
+    def _encode_cursor(search_after: List) -> str:
+        return base64.urlsafe_b64encode(json.dumps(search_after).encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Optional[List]:
+        if cursor == "":
+            return None
+
+        search_after = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+        if not isinstance(search_after, list):
+            raise ValueError(f"Malformed cursor [{cursor}]")
+        return search_after
+
+    def _get_page(self, project: str, from_time: datetime, to_time: datetime, max_size: int, cursor: str,
+                  user_id: Optional[str], channel: Optional[str], message_type: Optional[str], fields: Optional[List[str]]):
+        try:
+            search_after = self._decode_cursor(cursor)
+        except Exception as e:
+            logger.debug("Cannot parse the `cursor`", exc_info=e)
+            return {
+                "status": "Malformed request: `cursor` is not valid",
+                "code": 400
+            }, 400
+
+        try:
+            raw_messages, next_search_after = self._dao_collector.message.search_page(project, from_time, to_time, max_size, search_after=search_after, user_id=user_id, channel=channel,
+                                                                                      message_type=message_type, raw=True, source_includes=fields)
+        except ValueError as e:
+            logger.debug("`fromTime` is greater than `toTime`", exc_info=e)
+            return {
+                "status": "Malformed request: `fromTime` is greater than `toTime`",
+                "code": 400
+            }, 400
+        except Exception as e:
+            logger.exception("Message failed to be retrieved", exc_info=e)
+            return {
+                "status": "Internal server error: could not retrieve the message",
+                "code": 500
+            }, 500
+
+        return {
+            "messages": raw_messages,
+            "nextCursor": self._encode_cursor(next_search_after) if next_search_after is not None else None
+        }, 200
 
     def delete(self):
         """
@@ -248,4 +377,97 @@ class MessagesInterface(Resource):
         return {
             "status": "Ok: message deleted",
             "code": 200
-        }, 200
\ No newline at end of file
+        }, 200
+
+class MessagesExportInterface(Resource):
+
+    # the number of lines after which the compressed data is flushed to the client
+    GZIP_FLUSH_LINES = 1000
+
+    def __init__(self, dao_collector: DaoCollector, json_codec: Optional[JsonCodec] = None) -> None:
+        self._dao_collector = dao_collector
+        self._json_codec = json_codec if json_codec is not None else StdlibJsonCodec()
+
+    def get(self):
+        """
+        Export all the messages in a time range as newline delimited JSON, the response is streamed while the messages are retrieved.
+        """
+
+        project = request.args.get('project')
+        if project is None:
+            logger.debug("Missing required `project` parameter")
+            return {
+                "status": "Malformed request: missing required `project` parameter",
+                "code": 400
+            }, 400
+
+        try:
+            from_time = datetime.fromisoformat(request.args.get('fromTime'))
+            to_time = datetime.fromisoformat(request.args.get('toTime'))
+        except Exception as e:
+            logger.debug("Cannot parse `fromTime` and the `toTime` correctly", exc_info=e)
+            return {
+                "status": "Malformed request: missing required parameter, you have to specify the `fromTime` and the `toTime` in ISO format",
+                "code": 400
+            }, 400
+
+        user_id = request.args.get('userId', None)
+        channel = request.args.get('channel', None)
+        message_type = request.args.get('type', None)
+        fields = MessagesInterface._parse_fields(request.args.get('fields', None))
+
+        try:
+            raw_messages = self._dao_collector.message.scan(project, from_time, to_time, user_id=user_id, channel=channel, message_type=message_type, raw=True, source_includes=fields)
+        except ValueError as e:
+            logger.debug("`fromTime` is greater than `toTime`", exc_info=e)
+            return {
+                "status": "Malformed request: `fromTime` is greater than `toTime`",
+                "code": 400
+            }, 400
+        except Exception as e:
+            logger.exception("Messages failed to be exported", exc_info=e)
+            return {
+                "status": "Internal server error: could not export the messages",
+                "code": 500
+            }, 500
+
+        # the first page is retrieved before sending the status code, so that the failures of Elasticsearch in the most common case are reported with an error status
+        try:
+            first_message = next(raw_messages, None)
+        except Exception as e:
+            logger.exception("Messages failed to be exported", exc_info=e)
+            return {
+                "status": "Internal server error: could not export the messages",
+                "code": 500
+            }, 500
+
+        if first_message is not None:
+            raw_messages = itertools.chain([first_message], raw_messages)
+
+        lines = self._generate_lines(raw_messages)
+        headers = {}
+        if request.accept_encodings["gzip"] > 0:
+            lines = self._compress(lines)
+            headers["Content-Encoding"] = "gzip"
+            headers["Vary"] = "Accept-Encoding"
+
+        return Response(stream_with_context(lines), status=200, mimetype="application/x-ndjson", headers=headers)
+
+    def _generate_lines(self, raw_messages: Iterator[dict]) -> Iterator[bytes]:
+        try:
+            for raw_message in raw_messages:
+                yield self._json_codec.dumps(raw_message) + b"\n"
+        except Exception as e:
+            # the status code has already been sent, the exception aborts the response without the terminating chunk so that the client detects the failure
+            logger.exception("Messages export interrupted", exc_info=e)
+            raise
+
+    def _compress(self, lines: Iterator[bytes]) -> Iterator[bytes]:
+        compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+        for i, line in enumerate(lines, start=1):
+            chunk = compressor.compress(line)
+            if i % self.GZIP_FLUSH_LINES == 0:
+                chunk += compressor.flush(zlib.Z_SYNC_FLUSH)
+            if chunk:
+                yield chunk
+        yield compressor.flush()
@@ -63,7 +63,7 @@ class GetConversation(Resource):
         :return: the HTTP response
         """
 
-        response = self._es.search(index="message-*", body={"query": {"term": {"conversationId.keyword": {"value": conversation_id}}}})
+        response = self._es.search(index="message-*", body={"query": {"term": {"conversationId": {"value": conversation_id}}}})
 
         if response['hits']['total'] == 0:
             abort(404, message="resource not found")
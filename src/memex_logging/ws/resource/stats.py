@@ -0,0 +1,45 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+import logging
+from typing import Dict, Callable
+
+from flask_restful import Resource
+
+
+logger = logging.getLogger("logger.resource.stats")
+
+
+class StatsResourceBuilder(object):
+
+    @staticmethod
+    def routes(stats_providers: Dict[str, Callable[[], dict]]):
+        return [
+            (StatsInterface, '/stats', (stats_providers,))
+        ]
+
+
+class StatsInterface(Resource):
+
+    def __init__(self, stats_providers: Dict[str, Callable[[], dict]]) -> None:
+        self._stats_providers = stats_providers
+
+    def get(self):
+        """
+        Get the counters of the in-process components of the web service worker serving the request.
+        """
+
+        return {name: stats_provider() for name, stats_provider in self._stats_providers.items()}, 200
@@ -0,0 +1,225 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, annotations
+
+import json
+import logging
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Optional, Callable, List, Dict, Tuple
+
+from memex_logging.common.cache import TTLCache
+from memex_logging.common.model.message import Message
+
+
+logger = logging.getLogger("logger.ws.session")
+
+
+class Session:
+    """
+    The conversation of a user currently tracked, the instants are in seconds since the epoch
+    """
+
+    def __init__(self, conversation_id: str, first_timestamp: float, last_timestamp: float) -> None:
+        """
+        :param str conversation_id: the identifier of the conversation
+        :param float first_timestamp: the instant of the first message of the conversation
+        :param float last_timestamp: the instant of the last message of the conversation
+        """
+
+        self.conversation_id = conversation_id
+        self.first_timestamp = first_timestamp
+        self.last_timestamp = last_timestamp
+
+    def to_repr(self) -> dict:
+        return {
+            'conversationId': self.conversation_id,
+            'firstTimestamp': self.first_timestamp,
+            'lastTimestamp': self.last_timestamp
+        }
+
+    @staticmethod
+    def from_repr(raw_data: dict) -> Session:
+        return Session(raw_data['conversationId'], raw_data['firstTimestamp'], raw_data['lastTimestamp'])
+
+    def __eq__(self, o) -> bool:
+        if isinstance(o, Session):
+            return o.conversation_id == self.conversation_id and o.first_timestamp == self.first_timestamp and o.last_timestamp == self.last_timestamp
+        else:
+            return False
+
+
+class SessionStore(ABC):
+    """
+    The store of the sessions tracked for each project and user
+    """
+
+    @abstractmethod
+    def update(self, key: str, updater: Callable[[Optional[Session]], Session]) -> Session:
+        """
+        Atomically replace the session of a key
+
+        :param str key: the key of the session
+        :param Callable[[Optional[Session]], Session] updater: the function building the new session from the current one, `None` if there is no session for the key
+        :return: the new session
+        """
+        pass
+
+    def stats(self) -> dict:
+        """
+        :return: the counters of the store
+        """
+        return {}
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    A store keeping the sessions in the memory of the process, suitable when a single worker receives the messages
+    """
+
+    def __init__(self, max_size: int = 100000, ttl: float = 10800) -> None:
+        """
+        :param int max_size: the maximum number of sessions, the least recently used ones are discarded first
+        :param float ttl: the number of seconds after which a session that has not been updated is discarded
+        """
+
+        self._cache = TTLCache(max_size=max_size, ttl=ttl)
+        self._lock = Lock()
+
+    def update(self, key: str, updater: Callable[[Optional[Session]], Session]) -> Session:
+        with self._lock:
+            session = updater(self._cache.get(key))
+            self._cache.put(key, session)
+            return session
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+class RedisSessionStore(SessionStore):
+    """
+    A store keeping the sessions in Redis, shared by all the workers receiving the messages.
+    The sessions are updated with optimistic transactions, that are retried when another worker changes the same session concurrently.
+    """
+
+    def __init__(self, client, ttl: float = 10800, prefix: str = "session:", max_retries: int = 10) -> None:
+        """
+        :param client: the Redis client
+        :param float ttl: the number of seconds after which a session that has not been updated is discarded
+        :param str prefix: the prefix of the keys of the sessions
+        :param int max_retries: the maximum number of attempts of updating a session changed concurrently
+        """
+
+        self._client = client
+        self._ttl = int(ttl)
+        self._prefix = prefix
+        self._max_retries = max_retries
+
+    @staticmethod
+    def from_url(url: str, ttl: float = 10800) -> RedisSessionStore:
+        """
+        :param str url: the url of the Redis instance, in the format `redis://:password@hostname:port/db_number`
+        :param float ttl: the number of seconds after which a session that has not been updated is discarded
+        :return: the store
+        """
+
+        # the client is installed with the Redis transport of Celery, it is needed only when sharing the sessions
+        import redis
+        return RedisSessionStore(redis.Redis.from_url(url), ttl=ttl)
+
+    def update(self, key: str, updater: Callable[[Optional[Session]], Session]) -> Session:
+        from redis.exceptions import WatchError
+
+        redis_key = self._prefix + key
+        for _ in range(self._max_retries):
+            with self._client.pipeline() as pipeline:
+                try:
+                    pipeline.watch(redis_key)
+                    raw_session = pipeline.get(redis_key)
+                    session = updater(Session.from_repr(json.loads(raw_session)) if raw_session is not None else None)
+                    pipeline.multi()
+                    pipeline.set(redis_key, json.dumps(session.to_repr()), ex=self._ttl)
+                    pipeline.execute()
+                    return session
+                except WatchError:
+                    logger.debug(f"Session [{key}] changed concurrently, retrying")
+
+        raise RuntimeError(f"Could not update session [{key}] after [{self._max_retries}] attempts")
+
+
+class SessionTracker:
+    """
+    Assign the conversation to the messages received without one: the messages of a user belong to the same conversation until the user does not send messages for longer than the timeout.
+    The messages of a batch are assigned in chronological order, regardless of the order in which they are received. A message older than the tracked conversation of its user belongs to it when it is within the timeout from its first message, otherwise it is assigned a new conversation without changing the tracked one.
+    """
+
+    def __init__(self, store: SessionStore, timeout: float = 10800) -> None:
+        """
+        :param SessionStore store: the store of the sessions
+        :param float timeout: the maximum number of seconds between two messages of the same conversation
+        """
+
+        self._store = store
+        self._timeout = timeout
+
+    @staticmethod
+    def _to_seconds(timestamp: datetime) -> float:
+        # the timestamps without timezone are in UTC
+        return timestamp.replace(tzinfo=timezone.utc).timestamp() if timestamp.tzinfo is None else timestamp.timestamp()
+
+    @staticmethod
+    def _new_conversation_id() -> str:
+        return str(uuid.uuid4())
+
+    def _assign(self, session: Optional[Session], messages: List[Message]) -> Session:
+        for message in messages:
+            timestamp = self._to_seconds(message.timestamp)
+            if session is None or timestamp - session.last_timestamp > self._timeout:
+                session = Session(self._new_conversation_id(), timestamp, timestamp)
+            elif timestamp < session.first_timestamp - self._timeout:
+                message.conversation_id = self._new_conversation_id()
+                continue
+            else:
+                session.first_timestamp = min(session.first_timestamp, timestamp)
+                session.last_timestamp = max(session.last_timestamp, timestamp)
+
+            message.conversation_id = session.conversation_id
+
+        return session
+
+    def assign(self, messages: List[Message]) -> None:
+        """
+        Assign the conversation to the messages without one, the session of each user is read and updated once per batch
+
+        :param List[Message] messages: the messages to assign
+        """
+
+        messages_by_user: Dict[Tuple[str, str], List[Message]] = {}
+        for message in messages:
+            if message.conversation_id is None:
+                messages_by_user.setdefault((message.project, message.user_id), []).append(message)
+
+        for (project, user_id), user_messages in messages_by_user.items():
+            user_messages.sort(key=lambda message: self._to_seconds(message.timestamp))
+            self._store.update(f"{project}:{user_id}", lambda session: self._assign(session, user_messages))
+
+    def stats(self) -> dict:
+        """
+        :return: the counters of the store of the sessions
+        """
+        return self._store.stats()
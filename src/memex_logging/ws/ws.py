@@ -16,6 +16,7 @@ from __future__ import absolute_import, annotations
 
 import logging
 import os
+from typing import Optional
 
 from celery import Celery
 from elasticsearch import Elasticsearch
@@ -23,11 +24,18 @@ from flask import Flask
 from flask_restful import Api
 
 from memex_logging.common.dao.collector import DaoCollector
+from memex_logging.ws.buffer import WriteBehindBuffer
+from memex_logging.celery.analytic import build_analytic_computation
+from memex_logging.ws.cache import AnalyticCache
+from memex_logging.ws.codec import JsonCodec, build_codec
+from memex_logging.ws.evaluator import AnalyticEvaluator
+from memex_logging.ws.session import SessionTracker
 from memex_logging.ws.resource.analytic import AnalyticsResourceBuilder
 from memex_logging.ws.resource.documentation import DocumentationResourceBuilder
 from memex_logging.ws.resource.logging import LoggingResourceBuilder
 from memex_logging.ws.resource.message import MessageResourceBuilder
 from memex_logging.ws.resource.performance import PerformancesResourceBuilder
+from memex_logging.ws.resource.stats import StatsResourceBuilder
 
 
 logger = logging.getLogger("logger.ws.ws")
@@ -35,25 +43,43 @@ logger = logging.getLogger("logger.ws.ws")
 
 class WsInterface(object):
 
-    def __init__(self, dao_collector: DaoCollector, es: Elasticsearch) -> None:
+    def __init__(self, dao_collector: DaoCollector, es: Elasticsearch, write_behind_buffer: Optional[WriteBehindBuffer] = None, analytic_cache: Optional[AnalyticCache] = None,
+                 analytic_evaluator: Optional[AnalyticEvaluator] = None, session_tracker: Optional[SessionTracker] = None, json_codec: Optional[JsonCodec] = None) -> None:
         self._dao_collector = dao_collector
         self._es = es
+        self._write_behind_buffer = write_behind_buffer
+        self._analytic_cache = analytic_cache
+        self._analytic_evaluator = analytic_evaluator if analytic_evaluator is not None else AnalyticEvaluator(lambda: build_analytic_computation(es))
+        self._session_tracker = session_tracker
+        self._json_codec = json_codec if json_codec is not None else build_codec()
 
         self._app = Flask("logger-ws")
+        self._app.request_class = self._json_codec.build_request_class()
         self._app.config.update(
             result_backend=os.getenv("CELERY_RESULT_BACKEND"),
             broker_url=os.getenv("CELERY_BROKER_URL")
         )
         self._api = Api(app=self._app)
-        self._init_modules(self._dao_collector, self._es)
+        self._api.representation("application/json")(self._json_codec.output)
+        self._init_modules(self._dao_collector, self._es, self._write_behind_buffer, self._analytic_cache, self._analytic_evaluator, self._session_tracker, self._json_codec)
+
+    def _init_modules(self, dao_collector: DaoCollector, es: Elasticsearch, write_behind_buffer: Optional[WriteBehindBuffer], analytic_cache: Optional[AnalyticCache],
+                      analytic_evaluator: AnalyticEvaluator, session_tracker: Optional[SessionTracker], json_codec: JsonCodec) -> None:
+        stats_providers = {"analyticEvaluator": analytic_evaluator.stats}
+        if write_behind_buffer is not None:
+            stats_providers["writeBehindBuffer"] = write_behind_buffer.stats
+        if analytic_cache is not None:
+            stats_providers["analyticCache"] = analytic_cache.stats
+        if session_tracker is not None:
+            stats_providers["sessionTracker"] = session_tracker.stats
 
-    def _init_modules(self, dao_collector: DaoCollector, es: Elasticsearch) -> None:
         active_routes = [
-            (MessageResourceBuilder.routes(dao_collector), ""),
-            (LoggingResourceBuilder.routes(es), ""),
+            (MessageResourceBuilder.routes(dao_collector, write_behind_buffer, session_tracker, json_codec), ""),
+            (LoggingResourceBuilder.routes(es, write_behind_buffer), ""),
             (PerformancesResourceBuilder.routes(es), "/performance"),
-            (AnalyticsResourceBuilder.routes(dao_collector), ""),
-            (DocumentationResourceBuilder.routes(), "")
+            (AnalyticsResourceBuilder.routes(dao_collector, analytic_evaluator, analytic_cache), ""),
+            (DocumentationResourceBuilder.routes(), ""),
+            (StatsResourceBuilder.routes(stats_providers), "")
         ]
 
         for module_routes, prefix in active_routes:
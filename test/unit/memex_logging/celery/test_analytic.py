@@ -0,0 +1,103 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from memex_logging.celery.analytic import update_analytics, update_shared_analytic
+from memex_logging.common.computation.analytic import AnalyticComputation
+from memex_logging.common.dao.common import DocumentNotFound
+
+
+class TestUpdateAnalytics(TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.analytics = [Mock(analytic_id=f"analytic_id_{position}", descriptor=Mock()) for position in range(3)]
+        self.clients = Mock()
+        self.clients.dao_collector.analytic.list = Mock(return_value=self.analytics)
+        self.analytic_computation = Mock()
+        self.analytic_computation.build_query = Mock(side_effect=lambda descriptor: None if descriptor is self.analytics[2].descriptor else Mock())
+        self.analytic_computation.get_results = Mock(return_value=[("result_0", None), ("result_1", None)])
+
+    def _update_analytics(self) -> dict:
+        with patch("memex_logging.celery.analytic.clients", self.clients), \
+                patch("memex_logging.celery.analytic.build_analytic_computation", return_value=self.analytic_computation), \
+                patch.object(AnalyticComputation, "group", return_value=[[0], [1], [2]]), \
+                patch("memex_logging.celery.analytic._schedule_updates") as self.schedule_updates:
+            return update_analytics()
+
+    def test_update_analytics(self):
+        report = self._update_analytics()
+        self.assertEqual(2, report["updatedTogether"])
+        self.assertEqual(1, report["scheduledTasks"])
+        self.assertEqual(["result_0", "result_1"], [analytic.result for analytic in self.analytics[:2]])
+        self.clients.dao_collector.analytic.bump_version.assert_called_once()
+        self.schedule_updates.assert_called_once_with([[self.analytics[2]]])
+
+    def test_update_analytics_with_deleted_analytic(self):
+        self.clients.dao_collector.analytic.update = Mock(side_effect=[DocumentNotFound("deleted"), None])
+
+        report = self._update_analytics()
+        self.assertEqual(1, report["updatedTogether"])
+        self.assertEqual(2, self.clients.dao_collector.analytic.update.call_count)
+        self.clients.dao_collector.analytic.bump_version.assert_called_once()
+        self.schedule_updates.assert_called_once_with([[self.analytics[2]]])
+
+    def test_update_analytics_with_failing_computation(self):
+        self.analytic_computation.get_results = Mock(side_effect=ConnectionError)
+
+        report = self._update_analytics()
+        self.assertEqual(0, report["updatedTogether"])
+        self.clients.dao_collector.analytic.bump_version.assert_not_called()
+        self.schedule_updates.assert_called_once_with([[self.analytics[2]], [self.analytics[0]], [self.analytics[1]]])
+
+
+class TestUpdateSharedAnalytic(TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.analytics = {f"analytic_id_{position}": Mock(analytic_id=f"analytic_id_{position}", descriptor=Mock()) for position in range(3)}
+        self.clients = Mock()
+        self.analytic_computation = Mock()
+        self.analytic_computation.get_result = Mock(return_value="result")
+
+    def _get(self, analytic_id: str):
+        if analytic_id == "analytic_id_0":
+            raise DocumentNotFound("deleted")
+        return self.analytics[analytic_id]
+
+    def test_update_shared_analytic_with_deleted_analytics(self):
+        self.clients.dao_collector.analytic.get = Mock(side_effect=self._get)
+        self.clients.dao_collector.analytic.update = Mock(side_effect=[DocumentNotFound("deleted"), None])
+
+        with patch("memex_logging.celery.analytic.clients", self.clients), \
+                patch("memex_logging.celery.analytic.build_analytic_computation", return_value=self.analytic_computation):
+            update_shared_analytic(list(self.analytics.keys()))
+
+        self.analytic_computation.get_result.assert_called_once_with(self.analytics["analytic_id_1"].descriptor)
+        self.assertEqual(["analytic_id_1", "analytic_id_2"], [call.args[0].analytic_id for call in self.clients.dao_collector.analytic.update.call_args_list])
+        self.clients.dao_collector.analytic.bump_version.assert_called_once()
+
+    def test_update_shared_analytic_with_all_analytics_deleted(self):
+        self.clients.dao_collector.analytic.get = Mock(side_effect=DocumentNotFound("deleted"))
+
+        with patch("memex_logging.celery.analytic.clients", self.clients), \
+                patch("memex_logging.celery.analytic.build_analytic_computation", return_value=self.analytic_computation):
+            update_shared_analytic(list(self.analytics.keys()))
+
+        self.analytic_computation.get_result.assert_not_called()
+        self.clients.dao_collector.analytic.update.assert_not_called()
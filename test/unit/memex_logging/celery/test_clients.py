@@ -0,0 +1,113 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+import os
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from memex_logging.celery.clients import ClientRegistry, close_worker_clients, init_worker_clients
+
+
+class TestClientRegistry(TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.wenet = Mock()
+        self.wenet.build = Mock(side_effect=lambda *args, **kwargs: Mock())
+        self.wenet_patch = patch("memex_logging.celery.clients.WeNet", self.wenet)
+        self.apikey_client_patch = patch("memex_logging.celery.clients.ApikeyClient")
+        self.environ_patch = patch.dict(os.environ, {"EL_USERNAME": "username", "EL_PASSWORD": "password"})
+        self.wenet_patch.start()
+        self.apikey_client_patch.start()
+        self.environ_patch.start()
+        self.registry = ClientRegistry()
+
+    def tearDown(self) -> None:
+        self.registry.close()
+        self.wenet_patch.stop()
+        self.apikey_client_patch.stop()
+        self.environ_patch.stop()
+        super().tearDown()
+
+    def test_lazy_clients(self):
+        self.assertIsNone(self.registry._es)
+        self.wenet.build.assert_not_called()
+
+        es = self.registry.es
+        self.assertIs(es, self.registry.es)
+        self.assertIs(es, self.registry.dao_collector.message._es)
+        self.assertIs(self.registry.dao_collector, self.registry.dao_collector)
+        self.wenet.build.assert_not_called()
+
+        wenet_interface = self.registry.wenet_interface
+        self.assertIs(wenet_interface, self.registry.wenet_interface)
+        self.assertIs(wenet_interface, self.registry.wenet_task_counter.wenet_interface)
+        self.assertIs(self.registry.wenet_task_counter, self.registry.wenet_task_counter)
+        self.assertIs(self.registry.profile_fetcher, self.registry.profile_fetcher)
+        self.wenet.build.assert_called_once()
+
+    def test_reset(self):
+        self.registry.initialize()
+        es = self.registry.es
+        wenet_task_counter = self.registry.wenet_task_counter
+        wenet_task_counter.close = Mock()
+
+        # the clients of the parent process are forgotten without being closed
+        self.registry.reset()
+        wenet_task_counter.close.assert_not_called()
+        self.registry.initialize()
+        self.assertIsNot(es, self.registry.es)
+        self.assertIsNot(wenet_task_counter, self.registry.wenet_task_counter)
+        self.assertEqual(2, self.wenet.build.call_count)
+
+    def test_close(self):
+        self.registry.initialize()
+        es = self.registry.es
+        es.transport.close = Mock(side_effect=ConnectionError)
+        wenet_task_counter = self.registry.wenet_task_counter
+        wenet_task_counter.close = Mock()
+        profile_fetcher = self.registry.profile_fetcher
+        profile_fetcher.close = Mock()
+
+        self.registry.close()
+        es.transport.close.assert_called_once()
+        wenet_task_counter.close.assert_called_once()
+        profile_fetcher.close.assert_called_once()
+        self.assertIsNone(self.registry._es)
+        self.assertIsNone(self.registry._dao_collector)
+        self.assertIsNone(self.registry._wenet_interface)
+        self.assertIsNone(self.registry._wenet_task_counter)
+        self.assertIsNone(self.registry._profile_fetcher)
+
+        self.assertIsNot(es, self.registry.es)
+
+    def test_worker_process_signals(self):
+        with patch("memex_logging.celery.clients.clients", self.registry):
+            self.registry.initialize()
+            es = self.registry.es
+
+            init_worker_clients()
+            self.assertIsNot(es, self.registry._es)
+            self.assertIsNotNone(self.registry._wenet_task_counter)
+            self.assertIsNotNone(self.registry._profile_fetcher)
+
+            close_worker_clients()
+            self.assertIsNone(self.registry._es)
+
+            # the clients that could not be created are created by the first task using them
+            self.wenet.build = Mock(side_effect=ValueError)
+            init_worker_clients()
+            self.assertIsNone(self.registry._wenet_interface)
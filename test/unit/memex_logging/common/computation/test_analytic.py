@@ -16,19 +16,21 @@ from __future__ import absolute_import, annotations
 
 from datetime import datetime
 from unittest import TestCase
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 from elasticsearch import Elasticsearch
 from freezegun import freeze_time
 from wenet.interface.client import ApikeyClient
 from wenet.interface.wenet import WeNet
-from wenet.model.task.task import Task, TaskGoal
 from wenet.model.task.transaction import TaskTransaction
 from wenet.model.user.common import Date, Gender
 from wenet.model.user.profile import WeNetUserProfile
 
 from memex_logging.common.computation.analytic import AnalyticComputation
-from memex_logging.common.model.analytic.descriptor.count import UserCountDescriptor, MessageCountDescriptor, TaskCountDescriptor, TransactionCountDescriptor
+from memex_logging.common.computation.profiles import ProfileFetcher
+from memex_logging.common.dao.profile_snapshot import ProfileSnapshotDao
+from memex_logging.common.model.analytic.descriptor.count import UserCountDescriptor, MessageCountDescriptor, TaskCountDescriptor, TransactionCountDescriptor, \
+    ConversationCountDescriptor
 from memex_logging.common.model.analytic.descriptor.segmentation import UserSegmentationDescriptor, \
     MessageSegmentationDescriptor, TransactionSegmentationDescriptor
 from memex_logging.common.model.analytic.result.count import CountResult
@@ -79,29 +81,62 @@ class TestAnalyticComputation(TestCase):
         self.assertEqual(1, engaged_users.count)
 
     def test_compute_new_users(self):
-        self.es.search = Mock(return_value={'took': 1, 'timed_out': False, '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0}, 'hits': {'total': {'value': 0, 'relation': 'eq'}, 'max_score': None, 'hits': []}, 'aggregations': {'terms_count': {'doc_count_error_upper_bound': 0, 'sum_other_doc_count': 0, 'buckets': []}, 'type_count': {'value': 0}}})
-        new_users = self.analytic_computation.get_result(UserCountDescriptor(self.time_range, "project", "new"))
-        self.assertIsInstance(new_users, CountResult)
-        self.assertEqual(0, new_users.count)
-
-        self.es.search = Mock(return_value={'took': 1, 'timed_out': False, '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0}, 'hits': {'total': {'value': 1, 'relation': 'eq'}, 'max_score': None, 'hits': []}, 'aggregations': {'terms_count': {'doc_count_error_upper_bound': 0, 'sum_other_doc_count': 0, 'buckets': [{'key': 'user-id-1', 'doc_count': 1}]}, 'type_count': {'value': 1}}})
+        self.es.search = Mock(return_value={'took': 1, 'timed_out': False, '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0}, 'hits': {'total': {'value': 0, 'relation': 'eq'}, 'max_score': None, 'hits': []}, 'aggregations': {'first_seen': {'buckets': []}}})
         new_users = self.analytic_computation.get_result(UserCountDescriptor(self.time_range, "project", "new"))
         self.assertIsInstance(new_users, CountResult)
         self.assertEqual(0, new_users.count)
 
-        self.es.search = Mock(side_effect=[
-            {'took': 1, 'timed_out': False, '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0}, 'hits': {'total': {'value': 1, 'relation': 'eq'}, 'max_score': None, 'hits': []}, 'aggregations': {'terms_count': {'doc_count_error_upper_bound': 0, 'sum_other_doc_count': 0, 'buckets': [{'key': 'user-id-1', 'doc_count': 1}]}, 'type_count': {'value': 1}}},
-            {'took': 1, 'timed_out': False, '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0}, 'hits': {'total': {'value': 0, 'relation': 'eq'}, 'max_score': None, 'hits': []}, 'aggregations': {'terms_count': {'doc_count_error_upper_bound': 0, 'sum_other_doc_count': 0, 'buckets': []}, 'type_count': {'value': 0}}},
-        ])
+        self.es.search = Mock(return_value={'took': 1, 'timed_out': False, '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0}, 'hits': {'total': {'value': 3, 'relation': 'eq'}, 'max_score': None, 'hits': []}, 'aggregations': {'first_seen': {'after_key': {'value': 'user-id-2'}, 'buckets': [{'key': {'value': 'user-id-1'}, 'doc_count': 2, 'before': {'doc_count': 1}}, {'key': {'value': 'user-id-2'}, 'doc_count': 1, 'before': {'doc_count': 0}}]}}})
         new_users = self.analytic_computation.get_result(UserCountDescriptor(self.time_range, "project", "new"))
         self.assertIsInstance(new_users, CountResult)
         self.assertEqual(1, new_users.count)
+        body = self.es.search.call_args[1]['body']
+        self.assertEqual({'lte': '2021-12-31T00:00:00'}, body['query']['bool']['filter'][0]['range']['timestamp'])
+        self.assertEqual({'lt': '2021-01-01T00:00:00'}, body['aggs']['first_seen']['aggs']['before']['filter']['range']['timestamp'])
+
+    def test_compute_new_users_paging(self):
+        pages = [
+            {'aggregations': {'first_seen': {'after_key': {'value': 'user-id-2'}, 'buckets': [{'key': {'value': 'user-id-1'}, 'doc_count': 1, 'before': {'doc_count': 0}}, {'key': {'value': 'user-id-2'}, 'doc_count': 1, 'before': {'doc_count': 0}}]}}},
+            {'aggregations': {'first_seen': {'after_key': {'value': 'user-id-3'}, 'buckets': [{'key': {'value': 'user-id-3'}, 'doc_count': 1, 'before': {'doc_count': 0}}]}}},
+        ]
+        afters = []
+
+        def search(index, body, size):
+            afters.append(body['aggs']['first_seen']['composite'].get('after'))
+            return pages[len(afters) - 1]
+
+        self.es.search = Mock(side_effect=search)
+        with patch("memex_logging.common.computation.count.CountComputation.COMPOSITE_PAGE_SIZE", 2):
+            new_users = self.analytic_computation.get_result(UserCountDescriptor(self.time_range, "project", "new"))
+
+        self.assertEqual(3, new_users.count)
+        self.assertEqual([None, {'value': 'user-id-2'}], afters)
 
     def test_compute_new_users_all_time_period(self):
-        self.es.search = Mock(return_value={'took': 1, 'timed_out': False, '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0}, 'hits': {'total': {'value': 0, 'relation': 'eq'}, 'max_score': None, 'hits': []}, 'aggregations': {'terms_count': {'doc_count_error_upper_bound': 0, 'sum_other_doc_count': 0, 'buckets': [{'key': 'user-id-1', 'doc_count': 1}]}, 'type_count': {'value': 1}}})
+        self.es.search = Mock(return_value={'took': 1, 'timed_out': False, '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0}, 'hits': {'total': {'value': 0, 'relation': 'eq'}, 'max_score': None, 'hits': []}, 'aggregations': {'first_seen': {'after_key': {'value': 'user-id-1'}, 'buckets': [{'key': {'value': 'user-id-1'}, 'doc_count': 1}]}}})
         new_users = self.analytic_computation.get_result(UserCountDescriptor(MovingTimeWindow("all"), "project", "new"))
         self.assertIsInstance(new_users, CountResult)
         self.assertEqual(1, new_users.count)
+        self.assertNotIn('aggs', self.es.search.call_args[1]['body']['aggs']['first_seen'])
+
+    def test_compute_new_users_with_first_seen_registry(self):
+        first_seen_dao = Mock()
+        first_seen_dao.count = Mock(return_value=4)
+        analytic_computation = AnalyticComputation(self.es, self.wenet_interface, first_seen_dao=first_seen_dao)
+        self.es.search = Mock()
+
+        new_users = analytic_computation.get_result(UserCountDescriptor(self.time_range, "project", "new"))
+        self.assertIsInstance(new_users, CountResult)
+        self.assertEqual(4, new_users.count)
+        first_seen_dao.count.assert_called_once_with("project", "user", datetime(2021, 1, 1), datetime(2021, 12, 31))
+        self.es.search.assert_not_called()
+
+    def test_compute_new_conversations(self):
+        self.es.search = Mock(return_value={'took': 1, 'timed_out': False, '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0}, 'hits': {'total': {'value': 3, 'relation': 'eq'}, 'max_score': None, 'hits': []}, 'aggregations': {'first_seen': {'after_key': {'value': 'conversation-id-2'}, 'buckets': [{'key': {'value': 'conversation-id-1'}, 'doc_count': 2, 'before': {'doc_count': 0}}, {'key': {'value': 'conversation-id-2'}, 'doc_count': 1, 'before': {'doc_count': 0}}]}}})
+        new_conversations = self.analytic_computation.get_result(ConversationCountDescriptor(self.time_range, "project", "new"))
+        self.assertIsInstance(new_conversations, CountResult)
+        self.assertEqual(2, new_conversations.count)
+        self.assertEqual('conversationId', self.es.search.call_args[1]['body']['aggs']['first_seen']['composite']['sources'][0]['value']['terms']['field'])
 
     def test_compute_user_age_segmentation(self):
         self.wenet_interface.hub.get_user_ids_for_app = Mock(return_value=[])
@@ -173,6 +208,40 @@ class TestAnalyticComputation(TestCase):
             Segmentation("unavailable", 1)
         ], gender_segmentation.segments)
 
+    def test_compute_user_segmentations_with_cached_profiles(self):
+        self.wenet_interface.hub.get_user_ids_for_app = Mock(return_value=["1", "2"])
+        self.wenet_interface.profile_manager.get_user_profile = Mock(side_effect=[
+            WeNetUserProfile(None, None, Gender.MALE, None, None, None, None, None, None, None, None, "1", None, None, None, None, None, None, None, None),
+            WeNetUserProfile(None, None, Gender.MALE, None, None, None, None, None, None, None, None, "2", None, None, None, None, None, None, None, None),
+        ])
+        gender_segmentation = self.analytic_computation.get_result(UserSegmentationDescriptor(self.time_range, "project", "gender"))
+        self.assertEqual(Segmentation("male", 2), gender_segmentation.segments[0])
+        age_segmentation = self.analytic_computation.get_result(UserSegmentationDescriptor(self.time_range, "project", "age"))
+        self.assertEqual(Segmentation("unavailable", 2), age_segmentation.segments[-1])
+        self.assertEqual(2, self.wenet_interface.profile_manager.get_user_profile.call_count)
+
+    def test_compute_user_segmentations_with_shared_demographics(self):
+        self.analytic_computation = AnalyticComputation(self.es, self.wenet_interface, profile_fetcher=ProfileFetcher(self.wenet_interface, demographics_ttl=60))
+        self.wenet_interface.hub.get_user_ids_for_app = Mock(return_value=["1"])
+        self.wenet_interface.profile_manager.get_user_profile = Mock(return_value=WeNetUserProfile(None, None, Gender.FEMALE, None, None, None, None, None, None, None, None, "1", None, None, None, None, None, None, None, None))
+        self.analytic_computation.get_result(UserSegmentationDescriptor(self.time_range, "project", "gender"))
+        self.analytic_computation.get_result(UserSegmentationDescriptor(self.time_range, "project", "age"))
+        self.wenet_interface.hub.get_user_ids_for_app.assert_called_once()
+        self.wenet_interface.profile_manager.get_user_profile.assert_called_once()
+
+    def test_compute_user_segmentations_with_profile_snapshots(self):
+        profile_snapshot_dao = ProfileSnapshotDao(self.es)
+        profile_snapshot_dao.count_demographics = Mock(return_value=(2, {"0-18": 1, "19-25": 0, "26-35": 0, "36-45": 0, "46-55": 0, "55+": 1}, {"male": 1, "non-binary": 1}))
+        self.analytic_computation = AnalyticComputation(self.es, self.wenet_interface, profile_snapshot_dao=profile_snapshot_dao)
+        self.wenet_interface.hub.get_user_ids_for_app = Mock(return_value=["1", "2", "3"])
+        self.wenet_interface.profile_manager.get_user_profile = Mock()
+
+        age_segmentation = self.analytic_computation.get_result(UserSegmentationDescriptor(self.time_range, "project", "age"))
+        self.assertEqual([1, 0, 0, 0, 0, 1, 1], [segment.count for segment in age_segmentation.segments])
+        gender_segmentation = self.analytic_computation.get_result(UserSegmentationDescriptor(self.time_range, "project", "gender"))
+        self.assertEqual([1, 0, 1, 0, 0, 1], [segment.count for segment in gender_segmentation.segments])
+        self.wenet_interface.profile_manager.get_user_profile.assert_not_called()
+
     def test_compute_request_messages(self):
         self.es.search = Mock(return_value={'took': 1, 'timed_out': False, '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0}, 'hits': {'total': {'value': 0, 'relation': 'eq'}, 'max_score': None, 'hits': []}, 'aggregations': {'type_count': {'value': 0}}})
         request_messages = self.analytic_computation.get_result(MessageCountDescriptor(self.time_range, "project", "requests"))
@@ -261,152 +330,107 @@ class TestAnalyticComputation(TestCase):
         self.assertEqual(1, notification_messages.count)
 
     def test_compute_total_tasks(self):
-        self.wenet_interface.task_manager.get_all_tasks = Mock(return_value=[])
+        self.wenet_interface.task_manager.get_task_page = Mock(return_value=Mock(total=0))
         total_tasks = self.analytic_computation.get_result(TaskCountDescriptor(self.time_range, "app_id", "total"))
         self.assertIsInstance(total_tasks, CountResult)
         self.assertEqual(0, total_tasks.count)
+        self.assertEqual(3, self.wenet_interface.task_manager.get_task_page.call_count)
 
-        self.wenet_interface.task_manager.get_all_tasks = Mock(side_effect=[
-            [Task("task_id1", datetime(2021, 6, 12).timestamp(), datetime(2021, 6, 12).timestamp(), "ask4help", "requester_id", "app_id", None, TaskGoal("goal", ""))],
-            [],
-            []
-        ])
-        total_tasks = self.analytic_computation.get_result(TaskCountDescriptor(self.time_range, "app_id", "total"))
-        self.assertIsInstance(total_tasks, CountResult)
-        self.assertEqual(1, total_tasks.count)
-
-        self.wenet_interface.task_manager.get_all_tasks = Mock(side_effect=[
-            [],
-            [Task("task_id2", datetime(2021, 6, 12).timestamp(), datetime(2021, 6, 12).timestamp(), "ask4help", "requester_id", "app_id", None, TaskGoal("goal", ""), close_ts=datetime(2022, 1, 1).timestamp())],
-            []
-        ])
-        total_tasks = self.analytic_computation.get_result(TaskCountDescriptor(self.time_range, "app_id", "total"))
-        self.assertIsInstance(total_tasks, CountResult)
-        self.assertEqual(1, total_tasks.count)
-
-        self.wenet_interface.task_manager.get_all_tasks = Mock(side_effect=[
-            [],
-            [],
-            [Task("task_id3", datetime(2021, 6, 12).timestamp(), datetime(2021, 6, 12).timestamp(), "ask4help", "requester_id", "app_id", None, TaskGoal("goal", ""), close_ts=datetime(2021, 6, 12).timestamp())]
-        ])
+        self.wenet_interface.task_manager.get_task_page = Mock(side_effect=[Mock(total=1), Mock(total=0), Mock(total=0)])
         total_tasks = self.analytic_computation.get_result(TaskCountDescriptor(self.time_range, "app_id", "total"))
         self.assertIsInstance(total_tasks, CountResult)
         self.assertEqual(1, total_tasks.count)
 
-        self.wenet_interface.task_manager.get_all_tasks = Mock(side_effect=[
-            [Task("task_id1", datetime(2021, 6, 12).timestamp(), datetime(2021, 6, 12).timestamp(), "ask4help", "requester_id", "app_id", None, TaskGoal("goal", ""))],
-            [Task("task_id2", datetime(2021, 6, 12).timestamp(), datetime(2021, 6, 12).timestamp(), "ask4help", "requester_id", "app_id", None, TaskGoal("goal", ""), close_ts=datetime(2022, 1, 1).timestamp())],
-            [Task("task_id3", datetime(2021, 6, 12).timestamp(), datetime(2021, 6, 12).timestamp(), "ask4help", "requester_id", "app_id", None, TaskGoal("goal", ""), close_ts=datetime(2021, 6, 12).timestamp())]
-        ])
+        self.wenet_interface.task_manager.get_task_page = Mock(side_effect=[Mock(total=1), Mock(total=1), Mock(total=1)])
         total_tasks = self.analytic_computation.get_result(TaskCountDescriptor(self.time_range, "app_id", "total"))
         self.assertIsInstance(total_tasks, CountResult)
         self.assertEqual(3, total_tasks.count)
+        for call in self.wenet_interface.task_manager.get_task_page.call_args_list:
+            self.assertEqual(1, call.kwargs['limit'])
+            self.assertEqual("app_id", call.kwargs['app_id'])
 
     def test_compute_new_tasks(self):
-        self.wenet_interface.task_manager.get_all_tasks = Mock(return_value=[])
+        self.wenet_interface.task_manager.get_task_page = Mock(return_value=Mock(total=0))
         new_tasks = self.analytic_computation.get_result(TaskCountDescriptor(self.time_range, "app_id", "new"))
         self.assertIsInstance(new_tasks, CountResult)
         self.assertEqual(0, new_tasks.count)
 
-        self.wenet_interface.task_manager.get_all_tasks = Mock(side_effect=[
-            [Task("task_id", datetime(2021, 6, 12).timestamp(), datetime(2021, 6, 12).timestamp(), "ask4help", "requester_id", "app_id", None, TaskGoal("goal", ""))],
-        ])
+        self.wenet_interface.task_manager.get_task_page = Mock(return_value=Mock(total=1))
         new_tasks = self.analytic_computation.get_result(TaskCountDescriptor(self.time_range, "app_id", "new"))
         self.assertIsInstance(new_tasks, CountResult)
         self.assertEqual(1, new_tasks.count)
+        self.wenet_interface.task_manager.get_task_page.assert_called_once()
 
     def test_compute_new_active_tasks(self):
-        self.wenet_interface.task_manager.get_all_tasks = Mock(return_value=[])
+        self.wenet_interface.task_manager.get_task_page = Mock(return_value=Mock(total=0))
         new_active_tasks = self.analytic_computation.get_result(TaskCountDescriptor(self.time_range, "app_id", "new_active"))
         self.assertIsInstance(new_active_tasks, CountResult)
         self.assertEqual(0, new_active_tasks.count)
 
-        self.wenet_interface.task_manager.get_all_tasks = Mock(side_effect=[
-            [Task("task_id1", datetime(2021, 6, 12).timestamp(), datetime(2021, 6, 12).timestamp(), "ask4help", "requester_id", "app_id", None, TaskGoal("goal", ""))],
-            []
-        ])
+        self.wenet_interface.task_manager.get_task_page = Mock(side_effect=[Mock(total=1), Mock(total=0)])
         new_active_tasks = self.analytic_computation.get_result(TaskCountDescriptor(self.time_range, "app_id", "new_active"))
         self.assertIsInstance(new_active_tasks, CountResult)
         self.assertEqual(1, new_active_tasks.count)
 
-        self.wenet_interface.task_manager.get_all_tasks = Mock(side_effect=[
-            [],
-            [Task("task_id2", datetime(2021, 6, 12).timestamp(), datetime(2021, 6, 12).timestamp(), "ask4help", "requester_id", "app_id", None, TaskGoal("goal", ""), close_ts=datetime(2022, 1, 1).timestamp())]
-        ])
-        new_active_tasks = self.analytic_computation.get_result(TaskCountDescriptor(self.time_range, "app_id", "new_active"))
-        self.assertIsInstance(new_active_tasks, CountResult)
-        self.assertEqual(1, new_active_tasks.count)
-
-        self.wenet_interface.task_manager.get_all_tasks = Mock(side_effect=[
-            [Task("task_id1", datetime(2021, 6, 12).timestamp(), datetime(2021, 6, 12).timestamp(), "ask4help", "requester_id", "app_id", None, TaskGoal("goal", ""))],
-            [Task("task_id2", datetime(2021, 6, 12).timestamp(), datetime(2021, 6, 12).timestamp(), "ask4help", "requester_id", "app_id", None, TaskGoal("goal", ""), close_ts=datetime(2022, 1, 1).timestamp())]
-        ])
+        self.wenet_interface.task_manager.get_task_page = Mock(side_effect=[Mock(total=1), Mock(total=1)])
         new_active_tasks = self.analytic_computation.get_result(TaskCountDescriptor(self.time_range, "app_id", "new_active"))
         self.assertIsInstance(new_active_tasks, CountResult)
         self.assertEqual(2, new_active_tasks.count)
 
     def test_compute_active_tasks(self):
-        self.wenet_interface.task_manager.get_all_tasks = Mock(return_value=[])
+        self.wenet_interface.task_manager.get_task_page = Mock(return_value=Mock(total=0))
         active_tasks = self.analytic_computation.get_result(TaskCountDescriptor(self.time_range, "app_id", "active"))
         self.assertIsInstance(active_tasks, CountResult)
         self.assertEqual(0, active_tasks.count)
 
-        self.wenet_interface.task_manager.get_all_tasks = Mock(side_effect=[
-            [Task("task_id1", datetime(2020, 6, 12).timestamp(), datetime(2021, 6, 12).timestamp(), "ask4help", "requester_id", "app_id", None, TaskGoal("goal", ""))],
-            []
-        ])
+        self.wenet_interface.task_manager.get_task_page = Mock(side_effect=[Mock(total=0), Mock(total=1)])
         active_tasks = self.analytic_computation.get_result(TaskCountDescriptor(self.time_range, "app_id", "active"))
         self.assertIsInstance(active_tasks, CountResult)
         self.assertEqual(1, active_tasks.count)
 
-        self.wenet_interface.task_manager.get_all_tasks = Mock(side_effect=[
-            [],
-            [Task("task_id2", datetime(2021, 6, 12).timestamp(), datetime(2021, 6, 12).timestamp(), "ask4help", "requester_id", "app_id", None, TaskGoal("goal", ""), close_ts=datetime(2022, 1, 1).timestamp())]
-        ])
-        active_tasks = self.analytic_computation.get_result(TaskCountDescriptor(self.time_range, "app_id", "active"))
-        self.assertIsInstance(active_tasks, CountResult)
-        self.assertEqual(1, active_tasks.count)
-
-        self.wenet_interface.task_manager.get_all_tasks = Mock(side_effect=[
-            [Task("task_id1", datetime(2020, 6, 12).timestamp(), datetime(2021, 6, 12).timestamp(), "ask4help", "requester_id", "app_id", None, TaskGoal("goal", ""))],
-            [Task("task_id2", datetime(2021, 6, 12).timestamp(), datetime(2021, 6, 12).timestamp(), "ask4help", "requester_id", "app_id", None, TaskGoal("goal", ""), close_ts=datetime(2022, 1, 1).timestamp())]
-        ])
+        self.wenet_interface.task_manager.get_task_page = Mock(side_effect=[Mock(total=1), Mock(total=1)])
         active_tasks = self.analytic_computation.get_result(TaskCountDescriptor(self.time_range, "app_id", "active"))
         self.assertIsInstance(active_tasks, CountResult)
         self.assertEqual(2, active_tasks.count)
 
+    def test_compute_active_tasks_failing_request(self):
+        self.wenet_interface.task_manager.get_task_page = Mock(side_effect=[Mock(total=1), RuntimeError("unavailable")])
+        with self.assertRaises(RuntimeError):
+            self.analytic_computation.get_result(TaskCountDescriptor(self.time_range, "app_id", "active"))
+
     def test_compute_new_closed_tasks(self):
-        self.wenet_interface.task_manager.get_all_tasks = Mock(return_value=[])
+        self.wenet_interface.task_manager.get_task_page = Mock(return_value=Mock(total=0))
         new_closed_tasks = self.analytic_computation.get_result(TaskCountDescriptor(self.time_range, "app_id", "new_closed"))
         self.assertIsInstance(new_closed_tasks, CountResult)
         self.assertEqual(0, new_closed_tasks.count)
 
-        self.wenet_interface.task_manager.get_all_tasks = Mock(return_value=[Task("task_id", datetime(2021, 6, 12).timestamp(), datetime(2021, 9, 12).timestamp(), "ask4help", "requester_id", "app_id", None, TaskGoal("goal", ""), close_ts=datetime(2021, 9, 12).timestamp())])
+        self.wenet_interface.task_manager.get_task_page = Mock(return_value=Mock(total=1))
         new_closed_tasks = self.analytic_computation.get_result(TaskCountDescriptor(self.time_range, "app_id", "new_closed"))
         self.assertIsInstance(new_closed_tasks, CountResult)
         self.assertEqual(1, new_closed_tasks.count)
 
     def test_compute_closed_tasks(self):
-        self.wenet_interface.task_manager.get_all_tasks = Mock(return_value=[])
+        self.wenet_interface.task_manager.get_task_page = Mock(return_value=Mock(total=0))
         closed_tasks = self.analytic_computation.get_result(TaskCountDescriptor(self.time_range, "app_id", "closed"))
         self.assertIsInstance(closed_tasks, CountResult)
         self.assertEqual(0, closed_tasks.count)
 
-        self.wenet_interface.task_manager.get_all_tasks = Mock(return_value=[Task("task_id", datetime(2020, 6, 12).timestamp(), datetime(2020, 9, 12).timestamp(), "ask4help", "requester_id", "app_id", None, TaskGoal("goal", ""), close_ts=datetime(2020, 9, 12).timestamp())])
+        self.wenet_interface.task_manager.get_task_page = Mock(return_value=Mock(total=1))
         closed_tasks = self.analytic_computation.get_result(TaskCountDescriptor(self.time_range, "app_id", "closed"))
         self.assertIsInstance(closed_tasks, CountResult)
         self.assertEqual(1, closed_tasks.count)
 
     def test_compute_total_transactions(self):
-        self.wenet_interface.task_manager.get_all_transactions = Mock(return_value=[])
+        self.wenet_interface.task_manager.get_transaction_page = Mock(return_value=Mock(total=0))
         total_transactions = self.analytic_computation.get_result(TransactionCountDescriptor(self.time_range, "app_id", "total"))
         self.assertIsInstance(total_transactions, CountResult)
         self.assertEqual(0, total_transactions.count)
 
-        self.wenet_interface.task_manager.get_all_transactions = Mock(return_value=[TaskTransaction("transaction_id", "task_id", "label", int(datetime(2021, 6, 12).timestamp()), int(datetime(2021, 6, 12).timestamp()), "actioneer_id", None)])
+        self.wenet_interface.task_manager.get_transaction_page = Mock(return_value=Mock(total=1))
         total_transactions = self.analytic_computation.get_result(TransactionCountDescriptor(self.time_range, "app_id", "total"))
         self.assertIsInstance(total_transactions, CountResult)
         self.assertEqual(1, total_transactions.count)
+        self.assertEqual(1, self.wenet_interface.task_manager.get_transaction_page.call_args.kwargs['limit'])
 
     def test_compute_transactions_segmentation(self):
         self.wenet_interface.task_manager.get_all_transactions = Mock(return_value=[])
@@ -419,3 +443,35 @@ class TestAnalyticComputation(TestCase):
         self.assertIsInstance(transaction_segmentation, SegmentationResult)
         self.assertEqual(1, len(transaction_segmentation.segments))
         self.assertEqual([Segmentation("label", 1)], transaction_segmentation.segments)
+
+    def test_get_results(self):
+        self.es.msearch = Mock(return_value={'took': 1, 'responses': [{'took': 1, 'timed_out': False, 'hits': {'total': {'value': 3, 'relation': 'eq'}, 'max_score': None, 'hits': []}, 'aggregations': {'query_0': {'doc_count': 3, 'type_count': {'value': 2}}, 'query_1': {'doc_count': 1, 'type_count': {'value': 1}}}, 'status': 200}]})
+        self.wenet_interface.task_manager.get_transaction_page = Mock(return_value=Mock(total=0))
+        results = self.analytic_computation.get_results([
+            UserCountDescriptor(self.time_range, "project", "total"),
+            MessageCountDescriptor(self.time_range, "project", "requests"),
+            TransactionCountDescriptor(self.time_range, "project", "total")
+        ])
+
+        self.es.msearch.assert_called_once()
+        self.assertEqual([2, 1, 0], [result.count for result, _ in results])
+        self.assertEqual([None, None, None], [error for _, error in results])
+
+    @freeze_time("2021-06-15")
+    def test_build_key(self):
+        descriptor = UserCountDescriptor(MovingTimeWindow("7D"), "project", "total")
+        self.assertEqual(AnalyticComputation.build_key(descriptor), AnalyticComputation.build_key(UserCountDescriptor.from_repr(descriptor.to_repr())))
+        self.assertEqual(AnalyticComputation.build_key(descriptor), AnalyticComputation.build_key(UserCountDescriptor(MovingTimeWindow("1W"), "project", "total")))
+        self.assertEqual(AnalyticComputation.build_key(descriptor), AnalyticComputation.build_key(UserCountDescriptor(FixedTimeWindow(datetime(2021, 6, 8), datetime(2021, 6, 15)), "project", "total")))
+        self.assertNotEqual(AnalyticComputation.build_key(descriptor), AnalyticComputation.build_key(UserCountDescriptor(MovingTimeWindow("7D"), "project", "active")))
+        self.assertNotEqual(AnalyticComputation.build_key(descriptor), AnalyticComputation.build_key(UserCountDescriptor(MovingTimeWindow("7D"), "other_project", "total")))
+        self.assertNotEqual(AnalyticComputation.build_key(descriptor), AnalyticComputation.build_key(MessageCountDescriptor(MovingTimeWindow("7D"), "project", "total")))
+
+    def test_group(self):
+        groups = AnalyticComputation.group([
+            UserCountDescriptor(self.time_range, "project", "total"),
+            MessageCountDescriptor(self.time_range, "project", "requests"),
+            UserCountDescriptor(self.time_range, "project", "total"),
+            UserCountDescriptor(self.time_range, "other_project", "total")
+        ])
+        self.assertEqual([[0, 2], [1], [3]], groups)
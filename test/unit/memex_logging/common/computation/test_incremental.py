@@ -0,0 +1,125 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+from datetime import datetime, date, timedelta
+from unittest import TestCase
+from unittest.mock import Mock
+
+from elasticsearch import Elasticsearch
+from freezegun import freeze_time
+
+from memex_logging.common.computation.incremental import IncrementalCountComputation
+from memex_logging.common.dao.daily_count import DailyCountDao
+from memex_logging.common.model.analytic.descriptor.count import MessageCountDescriptor, BotCountDescriptor, DialogueCountDescriptor
+from memex_logging.common.model.analytic.result.count import CountResult
+from memex_logging.common.model.analytic.time import MovingTimeWindow, FixedTimeWindow
+
+
+class TestIncrementalCountComputation(TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.es = Elasticsearch()
+        self.daily_count_dao = DailyCountDao(self.es)
+        self.daily_count_dao.add = Mock()
+        self.index_resolver = Mock()
+        self.index_resolver.resolve = Mock(return_value="message-*")
+        self.incremental_computation = IncrementalCountComputation(self.es, self.daily_count_dao, index_resolver=self.index_resolver)
+
+    def test_supports(self):
+        self.assertTrue(IncrementalCountComputation.supports(MessageCountDescriptor(MovingTimeWindow("7D"), "project", "requests")))
+        self.assertTrue(IncrementalCountComputation.supports(DialogueCountDescriptor(MovingTimeWindow("7D"), "project", "fallback")))
+        self.assertFalse(IncrementalCountComputation.supports(DialogueCountDescriptor(MovingTimeWindow("7D"), "project", "intents")))
+        self.assertFalse(IncrementalCountComputation.supports(BotCountDescriptor(MovingTimeWindow("7D"), "project", "response")))
+
+        with self.assertRaises(ValueError):
+            self.incremental_computation.get_result(BotCountDescriptor(MovingTimeWindow("7D"), "project", "response"))
+
+    @freeze_time("2021-02-10T10:00:00")
+    def test_only_missing_days_are_computed(self):
+        self.daily_count_dao.get = Mock(return_value={date(2021, 2, day): 2 for day in range(3, 8)})
+        self.es.search = Mock(return_value={'aggregations': {'day_count': {'buckets': [{'key_as_string': '2021-02-08', 'key': 1612742400000, 'doc_count': 3, 'type_count': {'value': 3}}]}}})
+
+        result = self.incremental_computation.get_result(MessageCountDescriptor(MovingTimeWindow("7D"), "project", "requests"))
+        self.assertIsInstance(result, CountResult)
+        self.assertEqual(13, result.count)
+        self.assertEqual(datetime(2021, 2, 3), result.from_datetime)
+        self.assertEqual(datetime(2021, 2, 10), result.to_datetime)
+
+        self.daily_count_dao.get.assert_called_once_with("project", "message", "requests", date(2021, 2, 3), date(2021, 2, 10), settling_time=timedelta(days=2))
+        self.es.search.assert_called_once()
+        timestamp_range = self.es.search.call_args[1]["body"]["query"]["bool"]["filter"][0]["range"]["timestamp"]
+        self.assertEqual({"gte": "2021-02-08T00:00:00", "lt": "2021-02-10T00:00:00"}, timestamp_range)
+        self.daily_count_dao.add.assert_called_once_with("project", "message", "requests", {date(2021, 2, 8): 3, date(2021, 2, 9): 0})
+
+    @freeze_time("2021-02-10T10:00:00")
+    def test_recent_days_are_computed_again(self):
+        # the counts of the 8th and the 9th have been created within the lookback, they are computed again in order to count the messages stored late
+        self.es.search = Mock(side_effect=[
+            {"hits": {"hits": [
+                {"_source": {"day": f"2021-02-0{day}", "count": 2, "creationDt": "2021-02-10T04:00:00"}} for day in range(3, 10)
+            ]}},
+            {'aggregations': {'day_count': {'buckets': [{'key_as_string': '2021-02-08', 'key': 1612742400000, 'doc_count': 5, 'type_count': {'value': 5}}]}}}
+        ])
+
+        result = self.incremental_computation.get_result(MessageCountDescriptor(MovingTimeWindow("7D"), "project", "requests"))
+        self.assertEqual(15, result.count)
+        self.daily_count_dao.add.assert_called_once_with("project", "message", "requests", {date(2021, 2, 8): 5, date(2021, 2, 9): 0})
+
+    @freeze_time("2021-02-10T10:00:00")
+    def test_all_days_already_computed(self):
+        self.daily_count_dao.get = Mock(return_value={date(2021, 2, day): 1 for day in range(3, 10)})
+        self.es.search = Mock()
+
+        result = self.incremental_computation.get_result(MessageCountDescriptor(MovingTimeWindow("7D"), "project", "notifications"))
+        self.assertEqual(7, result.count)
+        self.es.search.assert_not_called()
+        self.daily_count_dao.add.assert_not_called()
+
+    @freeze_time("2021-02-10T10:00:00")
+    def test_partial_days_are_computed_directly(self):
+        self.daily_count_dao.get = Mock(return_value={date(2021, 2, 2): 4})
+        self.es.search = Mock(return_value={'aggregations': {'type_count': {'value': 1}}})
+
+        result = self.incremental_computation.get_result(MessageCountDescriptor(FixedTimeWindow(datetime(2021, 2, 1, 12), datetime(2021, 2, 3, 12)), "project", "responses"))
+        self.assertEqual(6, result.count)
+        self.daily_count_dao.get.assert_called_once_with("project", "message", "responses", date(2021, 2, 2), date(2021, 2, 3), settling_time=timedelta(days=2))
+        self.assertEqual(2, self.es.search.call_count)
+        self.assertEqual({"gte": "2021-02-01T12:00:00", "lt": "2021-02-02T00:00:00"}, self.es.search.call_args_list[0][1]["body"]["query"]["bool"]["filter"][0]["range"]["timestamp"])
+        self.assertEqual({"gte": "2021-02-03T00:00:00", "lte": "2021-02-03T12:00:00"}, self.es.search.call_args_list[1][1]["body"]["query"]["bool"]["filter"][0]["range"]["timestamp"])
+
+    @freeze_time("2021-02-10T10:00:00")
+    def test_window_with_offset(self):
+        self.daily_count_dao.get = Mock(return_value={date(2021, 2, 2): 4})
+        self.es.search = Mock(return_value={'aggregations': {'type_count': {'value': 1}}})
+
+        time_window = FixedTimeWindow.from_isoformat("2021-02-01T12:00:00+01:00", "2021-02-03T12:00:00+01:00")
+        result = self.incremental_computation.get_result(MessageCountDescriptor(time_window, "project", "responses"))
+        self.assertEqual(6, result.count)
+        self.assertEqual(time_window.start, result.from_datetime)
+        self.daily_count_dao.get.assert_called_once_with("project", "message", "responses", date(2021, 2, 2), date(2021, 2, 3), settling_time=timedelta(days=2))
+        self.assertEqual({"gte": "2021-02-01T11:00:00", "lt": "2021-02-02T00:00:00"}, self.es.search.call_args_list[0][1]["body"]["query"]["bool"]["filter"][0]["range"]["timestamp"])
+        self.assertEqual({"gte": "2021-02-03T00:00:00", "lte": "2021-02-03T11:00:00"}, self.es.search.call_args_list[1][1]["body"]["query"]["bool"]["filter"][0]["range"]["timestamp"])
+
+    @freeze_time("2021-02-10T10:00:00")
+    def test_ongoing_day_is_not_stored(self):
+        self.daily_count_dao.get = Mock()
+        self.es.search = Mock(return_value={'aggregations': {'type_count': {'value': 5}}})
+
+        result = self.incremental_computation.get_result(MessageCountDescriptor(MovingTimeWindow("TODAY"), "project", "requests"))
+        self.assertEqual(5, result.count)
+        self.daily_count_dao.get.assert_not_called()
+        self.daily_count_dao.add.assert_not_called()
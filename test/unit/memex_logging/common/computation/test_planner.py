@@ -0,0 +1,204 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, annotations
+
+from datetime import datetime
+from unittest import TestCase
+from unittest.mock import Mock
+
+from elasticsearch import Elasticsearch
+from elasticsearch.exceptions import ConnectionError, RequestError, TransportError
+
+from memex_logging.common.computation.aggregation import AggregationComputation
+from memex_logging.common.computation.planner import AnalyticQueryPlanner, AnalyticQuery
+from memex_logging.common.model.analytic.descriptor.aggregation import AggregationDescriptor
+from memex_logging.common.model.analytic.result.aggregation import AggregationResult
+from memex_logging.common.model.analytic.time import FixedTimeWindow
+
+
+class TestAnalyticQueryPlanner(TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.es = Elasticsearch()
+        self.index_resolver = Mock()
+        self.index_resolver.resolve = Mock(return_value="message-*")
+        self.planner = AnalyticQueryPlanner(self.es, index_resolver=self.index_resolver)
+        self.aggregation_computation = AggregationComputation(self.es, index_resolver=self.index_resolver)
+        self.time_span = FixedTimeWindow(datetime(2021, 1, 1), datetime(2021, 2, 1))
+
+    def _query(self, project: str, aggregation: str, field: str = "content.value") -> AnalyticQuery:
+        return self.aggregation_computation.build_query(AggregationDescriptor(self.time_span, project, field, aggregation))
+
+    def test_plan(self):
+        queries = [
+            self._query("project", "max"),
+            self._query("other", "max"),
+            self._query("project", "min"),
+            AnalyticQuery("project", datetime(2021, 1, 1), datetime(2021, 2, 1), {}, Mock(), filters=[{"match": {"type": "request"}}]),
+            AnalyticQuery("project", None, datetime(2021, 2, 1), {}, Mock()),
+        ]
+
+        self.assertEqual([[0, 2, 3], [1], [4]], self.planner.plan(queries))
+
+    def test_build_group_body(self):
+        filters = [{"match": {"type": "request"}}]
+        queries = [
+            self._query("project", "max"),
+            AnalyticQuery("project", datetime(2021, 1, 1), datetime(2021, 2, 1), {"type_count": {"cardinality": {"field": "userId"}}}, Mock(), filters=filters),
+        ]
+
+        body = self.planner.build_group_body(queries)
+        self.assertEqual([{"match": {"project": "project"}}], body["query"]["bool"]["must"])
+        self.assertEqual({"gte": "2021-01-01T00:00:00", "lte": "2021-02-01T00:00:00"}, body["query"]["bool"]["filter"][0]["range"]["timestamp"])
+        self.assertEqual({
+            "query_0": {
+                "filter": {"match_all": {}},
+                "aggs": {"type_count": {"max": {"field": "content.value"}}}
+            },
+            "query_1": {
+                "filter": {"bool": {"must": filters}},
+                "aggs": {"type_count": {"cardinality": {"field": "userId"}}}
+            }
+        }, body["aggs"])
+
+    def test_build_group_body_with_single_query(self):
+        query = AnalyticQuery("project", datetime(2021, 1, 1), datetime(2021, 2, 1), {"type_count": {"cardinality": {"field": "userId"}}}, Mock(), filters=[{"match": {"type": "request"}}])
+        self.assertEqual(query.build_body(), self.planner.build_group_body([query]))
+        self.assertEqual([{"match": {"type": "request"}}, {"match": {"project": "project"}}], query.build_body()["query"]["bool"]["must"])
+
+    @staticmethod
+    def _project(body: dict) -> str:
+        return body["query"]["bool"]["must"][-1]["match"]["project"]
+
+    def test_execute_all(self):
+        queries = [self._query("project", "max"), self._query("project", "min"), self._query("other", "max")]
+        responses = {
+            "project": {"aggregations": {"query_0": {"doc_count": 3, "type_count": {"value": 10}}, "query_1": {"doc_count": 3, "type_count": {"value": 2}}}},
+            "other": {"aggregations": {"type_count": {"value": None}}},
+        }
+        self.es.msearch = Mock(side_effect=lambda body: {"responses": [responses[self._project(search)] for search in body[1::2]]})
+
+        outcomes = self.planner.execute_all(queries)
+
+        self.es.msearch.assert_called_once()
+        body = self.es.msearch.call_args[1]["body"]
+        self.assertEqual([{"index": "message-*"}, {"index": "message-*"}], body[0::2])
+        self.assertEqual([0, 0], [search["size"] for search in body[1::2]])
+        self.assertIsInstance(outcomes[0][0], AggregationResult)
+        self.assertEqual({"max": 10}, outcomes[0][0].aggregation_result)
+        self.assertEqual({"min": 2}, outcomes[1][0].aggregation_result)
+        self.assertEqual((None, None), outcomes[2])
+
+    def test_execute_all_in_batches(self):
+        planner = AnalyticQueryPlanner(self.es, index_resolver=self.index_resolver, max_searches_per_request=2)
+        queries = [self._query(f"project-{i}", "max") for i in range(5)]
+        self.es.msearch = Mock(side_effect=lambda body: {"responses": [{"aggregations": {"type_count": {"value": 1}}} for _ in body[1::2]]})
+
+        outcomes = planner.execute_all(queries)
+
+        self.assertEqual([4, 4, 2], [len(call[1]["body"]) for call in self.es.msearch.call_args_list])
+        self.assertEqual([{"max": 1}] * 5, [result.aggregation_result for result, _ in outcomes])
+
+    def test_execute_all_with_failing_group(self):
+        queries = [self._query("project", "max"), self._query("other", "max")]
+        self.es.msearch = Mock(return_value={"responses": [
+            {"aggregations": {"type_count": {"value": 10}}},
+            {"error": {"type": "search_phase_execution_exception"}, "status": 400}
+        ]})
+
+        outcomes = self.planner.execute_all(queries)
+
+        self.assertEqual({"max": 10}, outcomes[0][0].aggregation_result)
+        self.assertIsNone(outcomes[0][1])
+        self.assertIsNone(outcomes[1][0])
+        self.assertIsInstance(outcomes[1][1], RuntimeError)
+
+    def test_execute_all_with_failing_query_in_group(self):
+        queries = [self._query("project", "max"), self._query("project", "min", field="content"), self._query("project", "avg")]
+        self.es.msearch = Mock(return_value={"responses": [{"error": {"type": "search_phase_execution_exception"}, "status": 400}]})
+
+        def search(index, body, size):
+            if body["aggs"]["type_count"].get("min", {}).get("field") == "content":
+                raise RequestError(400, "search_phase_execution_exception", {})
+            return {"aggregations": {"type_count": {"value": 10}}}
+
+        self.es.search = Mock(side_effect=search)
+
+        outcomes = self.planner.execute_all(queries)
+
+        self.assertEqual(3, self.es.search.call_count)
+        self.assertEqual({"max": 10}, outcomes[0][0].aggregation_result)
+        self.assertIsNone(outcomes[0][1])
+        self.assertIsNone(outcomes[1][0])
+        self.assertIsInstance(outcomes[1][1], RequestError)
+        self.assertEqual({"avg": 10}, outcomes[2][0].aggregation_result)
+        self.assertIsNone(outcomes[2][1])
+
+    def test_execute_all_with_failing_request(self):
+        planner = AnalyticQueryPlanner(self.es, index_resolver=self.index_resolver, max_searches_per_request=1, retry_backoff=0)
+        queries = [self._query("project", "max"), self._query("other", "max")]
+
+        def msearch(body):
+            if self._project(body[1]) == "other":
+                raise ConnectionError("N/A", "timeout", None)
+            return {"responses": [{"aggregations": {"type_count": {"value": 10}}}]}
+
+        self.es.msearch = Mock(side_effect=msearch)
+
+        outcomes = planner.execute_all(queries)
+
+        self.assertEqual({"max": 10}, outcomes[0][0].aggregation_result)
+        self.assertIsNone(outcomes[1][0])
+        self.assertIsInstance(outcomes[1][1], ConnectionError)
+
+    def test_execute_all_with_transient_error(self):
+        planner = AnalyticQueryPlanner(self.es, index_resolver=self.index_resolver, retry_backoff=0)
+        queries = [self._query("project", "max"), self._query("other", "max")]
+        self.es.msearch = Mock(side_effect=[
+            ConnectionError("N/A", "timeout", None),
+            TransportError(503, "unavailable", {}),
+            {"responses": [{"aggregations": {"type_count": {"value": 10}}}, {"aggregations": {"type_count": {"value": 5}}}]}
+        ])
+
+        outcomes = planner.execute_all(queries)
+
+        self.assertEqual(3, self.es.msearch.call_count)
+        self.assertEqual([{"max": 10}, {"max": 5}], [result.aggregation_result for result, _ in outcomes])
+
+    def test_execute_all_with_persistent_transient_error(self):
+        planner = AnalyticQueryPlanner(self.es, index_resolver=self.index_resolver, max_retries=1, retry_backoff=0)
+        queries = [self._query("project", "max"), self._query("other", "max")]
+        self.es.msearch = Mock(side_effect=ConnectionError("N/A", "timeout", None))
+
+        outcomes = planner.execute_all(queries)
+
+        self.assertEqual(2, self.es.msearch.call_count)
+        self.assertTrue(all(isinstance(error, ConnectionError) for _, error in outcomes))
+
+    def test_execute_all_with_rejected_batch(self):
+        queries = [self._query(f"project-{i}", "max") for i in range(3)]
+
+        def msearch(body):
+            if "project-1" in [self._project(search) for search in body[1::2]]:
+                raise RequestError(400, "parsing_exception", {})
+            return {"responses": [{"aggregations": {"type_count": {"value": 1}}} for _ in body[1::2]]}
+
+        self.es.msearch = Mock(side_effect=msearch)
+
+        outcomes = self.planner.execute_all(queries)
+
+        self.assertEqual({"max": 1}, outcomes[0][0].aggregation_result)
+        self.assertIsInstance(outcomes[1][1], RequestError)
+        self.assertEqual({"max": 1}, outcomes[2][0].aggregation_result)
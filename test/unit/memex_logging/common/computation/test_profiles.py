@@ -0,0 +1,78 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, annotations
+
+from datetime import date, datetime
+from unittest import TestCase
+
+from elasticsearch import Elasticsearch
+from freezegun import freeze_time
+from mock import Mock
+from wenet.interface.client import ApikeyClient
+from wenet.interface.wenet import WeNet
+from wenet.model.user.common import Date, Gender
+from wenet.model.user.profile import WeNetUserProfile
+
+from memex_logging.common.computation.profiles import UserDemographics, ProfileSnapshotSynchronizer
+from memex_logging.common.dao.profile_snapshot import ProfileSnapshotDao
+
+
+class TestUserDemographics(TestCase):
+
+    def test_date_of_birth_ranges(self):
+        self.assertEqual([
+            ("0-18", date(2002, 8, 1), date(2021, 8, 1)),
+            ("19-25", date(1995, 8, 1), date(2002, 8, 1)),
+            ("26-35", date(1985, 8, 1), date(1995, 8, 1)),
+            ("36-45", date(1975, 8, 1), date(1985, 8, 1)),
+            ("46-55", date(1965, 8, 1), date(1975, 8, 1)),
+            ("55+", None, date(1965, 8, 1))
+        ], UserDemographics.date_of_birth_ranges(date(2021, 7, 31)))
+
+    def test_from_counts(self):
+        demographics = UserDemographics.from_counts(4, 3, {"0-18": 1, "55+": 2}, {"male": 1, "female": 1})
+        self.assertEqual([1, 0, 0, 0, 0, 2, 1], [segment.count for segment in demographics.age_segments()])
+        self.assertEqual([1, 1, 0, 0, 0, 2], [segment.count for segment in demographics.gender_segments()])
+
+
+class TestProfileSnapshotSynchronizer(TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.wenet_interface = WeNet.build(ApikeyClient("apikey"), platform_url="platform_url")
+        self.snapshot_dao = ProfileSnapshotDao(Elasticsearch())
+        self.synchronizer = ProfileSnapshotSynchronizer(self.wenet_interface, self.snapshot_dao)
+
+    @freeze_time("2021-07-31")
+    def test_sync(self):
+        self.wenet_interface.hub.get_user_ids_for_app = Mock(return_value=["1", "2", "3"])
+        self.snapshot_dao.get_sync_datetimes = Mock(return_value={"1": datetime(2021, 7, 30, 12), "2": datetime(2021, 7, 29)})
+        self.wenet_interface.profile_manager.get_user_profile = Mock(return_value=WeNetUserProfile(None, Date(1991, 3, 10), Gender.FEMALE, None, None, "it_IT", None, "Italian", None, None, 1627000000, "2", None, None, None, None, None, None, None, None))
+        self.snapshot_dao.add = Mock()
+
+        self.assertEqual(2, self.synchronizer.sync("project"))
+        snapshots = self.snapshot_dao.add.call_args.args[0]
+        self.assertEqual(["2", "3"], [snapshot["userId"] for snapshot in snapshots])
+        self.assertEqual({
+            "project": "project",
+            "userId": "2",
+            "dateOfBirth": "1991-03-10",
+            "gender": "female",
+            "locale": "it_IT",
+            "nationality": "Italian",
+            "lastUpdateTs": 1627000000,
+            "syncDt": "2021-07-31T00:00:00"
+        }, snapshots[0])
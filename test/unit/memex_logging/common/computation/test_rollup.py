@@ -0,0 +1,169 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, annotations
+
+from datetime import datetime, date
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from elasticsearch import Elasticsearch
+from freezegun import freeze_time
+
+from memex_logging.common.computation.rollup import MessageRollupBuilder, RollupComputation
+from memex_logging.common.dao.rollup import MessageRollupDao
+from memex_logging.common.model.analytic.descriptor.count import UserCountDescriptor, MessageCountDescriptor, DialogueCountDescriptor, BotCountDescriptor
+from memex_logging.common.model.analytic.descriptor.segmentation import MessageSegmentationDescriptor
+from memex_logging.common.model.analytic.result.count import CountResult
+from memex_logging.common.model.analytic.result.segmentation import SegmentationResult, Segmentation
+from memex_logging.common.model.analytic.time import MovingTimeWindow, FixedTimeWindow
+from memex_logging.common.model.rollup import MessageRollup
+
+
+class TestMessageRollupBuilder(TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.es = Elasticsearch()
+        self.rollup_dao = MessageRollupDao(self.es)
+        self.index_resolver = Mock()
+        self.index_resolver.resolve = Mock(return_value="message-*")
+        self.rollup_builder = MessageRollupBuilder(self.es, self.rollup_dao, index_resolver=self.index_resolver)
+
+    def test_build(self):
+        hits = [
+            {"_source": {"project": "project", "type": "request", "messageId": "message-1", "userId": "user-1", "conversationId": "conversation-1", "channel": "telegram", "content": {"type": "text"}, "intent": {"name": "greeting"}, "domain": "chat"}},
+            {"_source": {"project": "project", "type": "request", "messageId": "message-1", "userId": "user-1", "conversationId": "conversation-1", "channel": "telegram", "content": {"type": "text"}, "intent": {"name": "greeting"}, "domain": "chat"}},
+            {"_source": {"project": "project", "type": "response", "messageId": "message-2", "userId": "user-1", "conversationId": "conversation-1", "channel": "telegram"}},
+            {"_source": {"project": "project", "type": "notification", "messageId": "message-3", "userId": "user-2", "channel": "telegram"}},
+            {"_source": {"project": "other", "type": "request", "messageId": "message-4", "userId": "user-3", "channel": "slack", "content": {"type": "action"}}},
+        ]
+
+        with patch("memex_logging.common.computation.rollup.scan", return_value=iter(hits)) as mock_scan:
+            rollups = {rollup.project: rollup for rollup in self.rollup_builder.build(date(2021, 2, 3))}
+
+        timestamp_range = mock_scan.call_args[1]["query"]["query"]["bool"]["filter"][0]["range"]["timestamp"]
+        self.assertEqual({"gte": "2021-02-03T00:00:00", "lt": "2021-02-04T00:00:00"}, timestamp_range)
+
+        self.assertEqual({"project", "other"}, set(rollups.keys()))
+        rollup = rollups["project"]
+        self.assertEqual(date(2021, 2, 3), rollup.day)
+        self.assertEqual({"request": 2, "response": 1, "notification": 1}, rollup.types)
+        self.assertEqual({"request": 1, "response": 1, "notification": 1}, rollup.distinct_messages)
+        self.assertEqual({"text": 2}, rollup.request_content_types)
+        self.assertEqual({"telegram": 4}, rollup.channels)
+        self.assertEqual({"greeting": 2}, rollup.intents)
+        self.assertEqual({"chat": 2}, rollup.domains)
+        self.assertEqual(2, rollup.users.cardinality())
+        self.assertEqual(1, rollup.active_users.cardinality())
+        self.assertEqual(1, rollup.engaged_users.cardinality())
+        self.assertEqual(1, rollup.conversations.cardinality())
+
+    @freeze_time("2021-02-10T03:00:00")
+    def test_update(self):
+        self.rollup_dao.get_state = Mock(return_value=(date(2021, 1, 1), date(2021, 2, 6)))
+        self.rollup_dao.add = Mock()
+        self.rollup_dao.set_state = Mock()
+        self.rollup_builder.build = Mock(return_value=[])
+
+        self.assertEqual(5, self.rollup_builder.update())
+        self.assertEqual([date(2021, 2, 5), date(2021, 2, 6), date(2021, 2, 7), date(2021, 2, 8), date(2021, 2, 9)],
+                         [call[0][0] for call in self.rollup_builder.build.call_args_list])
+        self.assertEqual([date(2021, 2, 7), date(2021, 2, 8), date(2021, 2, 9)], [call[0][1] for call in self.rollup_dao.set_state.call_args_list])
+
+        self.rollup_dao.get_state = Mock(return_value=(None, None))
+        self.es.search = Mock(return_value={"aggregations": {"first_message": {"value": None}}})
+        self.assertEqual(0, self.rollup_builder.update())
+
+    @freeze_time("2021-02-10T03:00:00")
+    def test_update_with_late_messages(self):
+        self.rollup_dao.get_state = Mock(return_value=(date(2021, 1, 1), date(2021, 2, 9)))
+        self.rollup_dao.add = Mock()
+        self.rollup_dao.set_state = Mock()
+        late_rollup = MessageRollup("project", date(2021, 2, 9), types={"request": 1})
+        self.rollup_builder.build = Mock(side_effect=lambda day: [late_rollup] if day == late_rollup.day else [])
+
+        # the days of the lookback are summarized again and their summaries replaced, the older days are not summarized again
+        self.assertEqual(2, self.rollup_builder.update())
+        self.assertEqual([date(2021, 2, 8), date(2021, 2, 9)], [call[0][0] for call in self.rollup_builder.build.call_args_list])
+        self.rollup_dao.add.assert_called_with([late_rollup])
+        self.rollup_dao.set_state.assert_not_called()
+
+        self.rollup_builder.build.reset_mock()
+        self.rollup_builder.lookback_days = 0
+        self.assertEqual(0, self.rollup_builder.update())
+        self.rollup_builder.build.assert_not_called()
+
+
+class TestRollupComputation(TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.rollup_dao = MessageRollupDao(Elasticsearch())
+        self.rollup_dao.get_state = Mock(return_value=(date(2021, 1, 1), date(2021, 2, 9)))
+        self.rollup_computation = RollupComputation(self.rollup_dao)
+
+        first_rollup = MessageRollup("project", date(2021, 2, 3), types={"request": 3, "response": 3}, distinct_messages={"request": 3, "response": 3},
+                                     request_content_types={"text": 2, "action": 1}, domains={"chat": 3})
+        second_rollup = MessageRollup("project", date(2021, 2, 4), types={"request": 2, "notification": 1}, distinct_messages={"request": 2, "notification": 1},
+                                      request_content_types={"action": 2}, domains={"chat": 1, "help": 1})
+        for user_id in ["user-1", "user-2"]:
+            first_rollup.users.add(user_id)
+            first_rollup.active_users.add(user_id)
+        for user_id in ["user-2", "user-3"]:
+            second_rollup.users.add(user_id)
+        self.rollup_dao.search = Mock(return_value=[first_rollup, second_rollup])
+
+    def test_supports(self):
+        self.assertTrue(RollupComputation.supports(UserCountDescriptor(MovingTimeWindow("7D"), "project", "total")))
+        self.assertTrue(RollupComputation.supports(MessageSegmentationDescriptor(MovingTimeWindow("7D"), "project", "requests")))
+        self.assertFalse(RollupComputation.supports(UserCountDescriptor(MovingTimeWindow("7D"), "project", "new")))
+        self.assertFalse(RollupComputation.supports(BotCountDescriptor(MovingTimeWindow("7D"), "project", "response")))
+
+    @freeze_time("2021-02-10T10:00:00")
+    def test_count(self):
+        result = self.rollup_computation.get_result(UserCountDescriptor(MovingTimeWindow("7D"), "project", "total"))
+        self.assertIsInstance(result, CountResult)
+        self.assertEqual(3, result.count)
+        self.assertEqual(datetime(2021, 2, 3), result.from_datetime)
+        self.assertEqual(datetime(2021, 2, 10), result.to_datetime)
+        self.rollup_dao.search.assert_called_once_with("project", date(2021, 2, 3), date(2021, 2, 10))
+
+        self.assertEqual(2, self.rollup_computation.get_result(UserCountDescriptor(MovingTimeWindow("7D"), "project", "active")).count)
+        self.assertEqual(5, self.rollup_computation.get_result(MessageCountDescriptor(MovingTimeWindow("7D"), "project", "requests")).count)
+        self.assertEqual(1, self.rollup_computation.get_result(MessageCountDescriptor(MovingTimeWindow("7D"), "project", "notifications")).count)
+        self.assertEqual(2, self.rollup_computation.get_result(DialogueCountDescriptor(MovingTimeWindow("7D"), "project", "domains")).count)
+
+        self.rollup_computation.get_result(UserCountDescriptor(MovingTimeWindow("ALL"), "project", "total"))
+        self.rollup_dao.search.assert_called_with("project", None, date(2021, 2, 10))
+
+    @freeze_time("2021-02-10T10:00:00")
+    def test_segmentation(self):
+        result = self.rollup_computation.get_result(MessageSegmentationDescriptor(MovingTimeWindow("7D"), "project", "all"))
+        self.assertIsInstance(result, SegmentationResult)
+        self.assertEqual([Segmentation("request", 5), Segmentation("response", 3), Segmentation("notification", 1)], result.segments)
+
+        result = self.rollup_computation.get_result(MessageSegmentationDescriptor(MovingTimeWindow("7D"), "project", "requests"))
+        self.assertEqual([Segmentation("action", 3), Segmentation("text", 2)], result.segments)
+
+    @freeze_time("2021-02-10T10:00:00")
+    def test_not_computable(self):
+        self.assertIsNone(self.rollup_computation.get_result(UserCountDescriptor(FixedTimeWindow(datetime(2021, 2, 3, 12), datetime(2021, 2, 5)), "project", "total")))
+        self.assertIsNone(self.rollup_computation.get_result(UserCountDescriptor(MovingTimeWindow("TODAY"), "project", "total")))
+
+        self.rollup_dao.get_state = Mock(return_value=(date(2021, 1, 1), date(2021, 2, 8)))
+        self.assertIsNone(self.rollup_computation.get_result(UserCountDescriptor(MovingTimeWindow("7D"), "project", "total")))
+
+        self.rollup_dao.get_state = Mock(return_value=(None, None))
+        self.assertIsNone(self.rollup_computation.get_result(UserCountDescriptor(MovingTimeWindow("7D"), "project", "total")))
+        self.rollup_dao.search.assert_not_called()
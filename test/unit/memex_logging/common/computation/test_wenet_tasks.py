@@ -0,0 +1,56 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+from unittest import TestCase
+
+from mock import Mock
+
+from memex_logging.common.computation.wenet_tasks import WeNetTaskCounter
+
+
+class TestWeNetTaskCounter(TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.wenet_interface = Mock()
+        self.counter = WeNetTaskCounter(self.wenet_interface, max_workers=2)
+
+    def tearDown(self) -> None:
+        self.counter.close()
+        super().tearDown()
+
+    def test_count_tasks(self):
+        self.wenet_interface.task_manager.get_task_page = Mock(return_value=Mock(total=42))
+        self.assertEqual(42, self.counter.count_tasks(app_id="app_id", has_close_ts=False))
+        self.wenet_interface.task_manager.get_task_page.assert_called_once_with(offset=0, limit=1, app_id="app_id", has_close_ts=False)
+
+    def test_count_transactions(self):
+        self.wenet_interface.task_manager.get_transaction_page = Mock(return_value=Mock(total=7))
+        self.assertEqual(7, self.counter.count_transactions(app_id="app_id", label="answerTransaction"))
+        self.wenet_interface.task_manager.get_transaction_page.assert_called_once_with(offset=0, limit=1, app_id="app_id", label="answerTransaction")
+
+    def test_sum_task_counts(self):
+        totals = {"task_type_1": 3, "task_type_2": 5}
+        self.wenet_interface.task_manager.get_task_page = Mock(side_effect=lambda offset, limit, task_type_id: Mock(total=totals[task_type_id]))
+
+        self.assertEqual(8, self.counter.sum_task_counts([{"task_type_id": "task_type_1"}, {"task_type_id": "task_type_2"}]))
+        self.assertEqual(2, self.wenet_interface.task_manager.get_task_page.call_count)
+        self.assertEqual(0, self.counter.sum_task_counts([]))
+
+    def test_sum_task_counts_failure(self):
+        self.wenet_interface.task_manager.get_task_page = Mock(side_effect=ValueError)
+        with self.assertRaises(ValueError):
+            self.counter.sum_task_counts([{"task_type_id": "task_type_1"}])
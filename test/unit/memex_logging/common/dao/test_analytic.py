@@ -0,0 +1,62 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, annotations
+
+from datetime import datetime
+from unittest import TestCase
+
+from elasticsearch import Elasticsearch
+from elasticsearch.exceptions import NotFoundError
+from mock import Mock
+
+from memex_logging.common.dao.analytic import AnalyticDao
+from memex_logging.common.dao.common import DocumentNotFound
+from memex_logging.common.model.analytic.analytic import Analytic
+from memex_logging.common.model.analytic.descriptor.count import UserCountDescriptor
+from memex_logging.common.model.analytic.result.count import CountResult
+from memex_logging.common.model.analytic.time import FixedTimeWindow
+
+
+class TestAnalyticDao(TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.analytic_dao = AnalyticDao(Elasticsearch())
+        self.analytic = Analytic("analytic_id", UserCountDescriptor(FixedTimeWindow(datetime(2021, 1, 1), datetime(2021, 12, 31)), "project", "total"),
+                                 result=CountResult(1, datetime(2022, 1, 1), datetime(2021, 1, 1), datetime(2021, 12, 31)))
+
+    def test_add(self):
+        self.analytic_dao._es.index = Mock(return_value={"_index": "analytic-store", "_id": "analytic_id", "result": "created"})
+        self.analytic_dao.add(self.analytic)
+        self.analytic_dao._es.index.assert_called_once_with(index="analytic", id="analytic_id", body=self.analytic.to_repr())
+
+    def test_get(self):
+        self.analytic_dao._es.get = Mock(return_value={"_index": "analytic-store", "_id": "analytic_id", "found": True, "_source": self.analytic.to_repr()})
+        self.assertEqual(self.analytic, self.analytic_dao.get("analytic_id"))
+        self.analytic_dao._es.get.assert_called_once_with(index="analytic", id="analytic_id")
+
+        self.analytic_dao._es.get = Mock(side_effect=NotFoundError(404, "not_found"))
+        with self.assertRaises(DocumentNotFound):
+            self.analytic_dao.get("analytic_id")
+
+    def test_update(self):
+        self.analytic_dao._es.update = Mock(return_value={"_index": "analytic-store", "_id": "analytic_id", "result": "updated"})
+        self.analytic_dao.update(self.analytic)
+        self.analytic_dao._es.update.assert_called_once_with(index="analytic", id="analytic_id", body={"doc": self.analytic.to_repr()})
+
+        self.analytic_dao._es.update = Mock(side_effect=NotFoundError(404, "document_missing_exception"))
+        with self.assertRaises(DocumentNotFound):
+            self.analytic_dao.update(self.analytic)
@@ -0,0 +1,63 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+from datetime import date, timedelta
+from unittest import TestCase
+
+from elasticsearch import Elasticsearch
+from mock import Mock
+
+from memex_logging.common.dao.daily_count import DailyCountDao
+
+
+class TestDailyCountDao(TestCase):
+
+    def test_get(self):
+        daily_count_dao = DailyCountDao(Elasticsearch())
+        daily_count_dao._es.search = Mock(return_value={
+            "hits": {
+                "hits": [
+                    {"_id": "project:message:requests:2021-02-03", "_source": {"project": "project", "dimension": "message", "metric": "requests", "day": "2021-02-03", "count": 4, "creationDt": "2021-02-05T04:00:00"}},
+                    {"_id": "project:message:requests:2021-02-04", "_source": {"project": "project", "dimension": "message", "metric": "requests", "day": "2021-02-04", "count": 0, "creationDt": "2021-02-05T04:00:00"}}
+                ]
+            }
+        })
+
+        counts = daily_count_dao.get("project", "message", "requests", date(2021, 2, 1), date(2021, 2, 8))
+        self.assertEqual({date(2021, 2, 3): 4, date(2021, 2, 4): 0}, counts)
+        self.assertEqual("daily_count", daily_count_dao._es.search.call_args[1]["index"])
+        self.assertEqual(7, daily_count_dao._es.search.call_args[1]["body"]["size"])
+
+        # the count of the 4th has been created a few hours after the end of the day, it may miss the messages stored late
+        counts = daily_count_dao.get("project", "message", "requests", date(2021, 2, 1), date(2021, 2, 8), settling_time=timedelta(days=1))
+        self.assertEqual({date(2021, 2, 3): 4}, counts)
+
+    def test_add(self):
+        daily_count_dao = DailyCountDao(Elasticsearch())
+        daily_count_dao._es.bulk = Mock(return_value={
+            "errors": False,
+            "items": [
+                {"index": {"_id": "project:message:requests:2021-02-03", "status": 201}},
+                {"index": {"_id": "project:message:requests:2021-02-04", "status": 201}}
+            ]
+        })
+
+        daily_count_dao.add("project", "message", "requests", {date(2021, 2, 3): 4, date(2021, 2, 4): 0})
+        daily_count_dao._es.bulk.assert_called_once()
+        bulk_body = daily_count_dao._es.bulk.call_args[0][0].split("\n")
+        self.assertIn('"_index":"daily_count"', bulk_body[0])
+        self.assertIn("project:message:requests:2021-02-03", bulk_body[0])
+        self.assertIn('"_index":"daily_count"', bulk_body[2])
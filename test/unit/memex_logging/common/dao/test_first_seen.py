@@ -0,0 +1,94 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, annotations
+
+from datetime import datetime
+from unittest import TestCase
+
+from elasticsearch import Elasticsearch
+from mock import Mock
+
+from memex_logging.common.dao.first_seen import FirstSeenDao
+from memex_logging.common.model.message import Message
+
+
+class TestFirstSeenDao(TestCase):
+
+    @staticmethod
+    def _build_message(user_id: str, conversation_id: str, timestamp: str) -> Message:
+        return Message.from_repr({
+            "messageId": "message_id",
+            "conversationId": conversation_id,
+            "channel": "channel",
+            "userId": user_id,
+            "timestamp": timestamp,
+            "content": {
+                "type": "text",
+                "value": "test"
+            },
+            "domain": None,
+            "intent": None,
+            "entities": [],
+            "language": None,
+            "metadata": {},
+            "project": "project",
+            "type": "request"
+        })
+
+    def test_build_upsert_actions(self):
+        first_seen_dao = FirstSeenDao(Elasticsearch())
+        actions = first_seen_dao.build_upsert_actions([
+            self._build_message("user_1", "conversation_1", "2021-01-22T17:55:33"),
+            self._build_message("user_1", "conversation_2", "2021-01-21T10:00:00"),
+            self._build_message("user_2", None, "2021-01-23T08:00:00")
+        ])
+
+        self.assertTrue(all(action["_op_type"] == "update" and action["_index"] == "first_seen" for action in actions))
+        self.assertEqual({
+            "project:user:user_1": "2021-01-21T10:00:00",
+            "project:user:user_2": "2021-01-23T08:00:00",
+            "project:conversation:conversation_1": "2021-01-22T17:55:33",
+            "project:conversation:conversation_2": "2021-01-21T10:00:00"
+        }, {action["_id"]: action["upsert"]["firstSeen"] for action in actions})
+
+        # an entry already registered with a later message is moved back to the earlier one
+        params = {action["_id"]: action["script"]["params"] for action in actions}
+        self.assertEqual({"firstSeen": "2021-01-21T10:00:00", "firstSeenMillis": 1611223200000}, params["project:user:user_1"])
+
+    def test_add(self):
+        first_seen_dao = FirstSeenDao(Elasticsearch())
+        first_seen_dao._es.bulk = Mock(return_value={
+            "took": 3,
+            "errors": True,
+            "items": [
+                {"update": {"_index": "first_seen", "_id": "project:user:user_1", "result": "created", "status": 201}},
+                {"update": {"_index": "first_seen", "_id": "project:conversation:conversation_1", "status": 429, "error": {"type": "es_rejected_execution_exception", "reason": "rejected execution"}}}
+            ]
+        })
+
+        self.assertEqual(1, first_seen_dao.add([self._build_message("user_1", "conversation_1", "2021-01-22T17:55:33")]))
+
+    def test_count(self):
+        first_seen_dao = FirstSeenDao(Elasticsearch())
+        first_seen_dao._es.count = Mock(return_value={"count": 3})
+
+        self.assertEqual(3, first_seen_dao.count("project", FirstSeenDao.USER, datetime(2021, 1, 1), datetime(2021, 2, 1)))
+        body = first_seen_dao._es.count.call_args[1]["body"]
+        self.assertEqual([
+            {"term": {"project": "project"}},
+            {"term": {"type": "user"}},
+            {"range": {"firstSeen": {"gte": "2021-01-01T00:00:00", "lte": "2021-02-01T00:00:00"}}}
+        ], body["query"]["bool"]["filter"])
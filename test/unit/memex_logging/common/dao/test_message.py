@@ -14,11 +14,14 @@
 
 from __future__ import absolute_import, annotations
 
+from datetime import datetime
 from unittest import TestCase
 
 from elasticsearch import Elasticsearch
+from mock import Mock, patch
 
 from memex_logging.common.dao.message import MessageDao
+from memex_logging.common.model.message import Message
 
 
 class TestMessageDao(TestCase):
@@ -50,12 +53,12 @@ class TestMessageDao(TestCase):
                     "must": [
                         {
                             "match_phrase": {
-                                "messageId.keyword": "message_id"
+                                "messageId": "message_id"
                             }
                         },
                         {
                             "match_phrase": {
-                                "userId.keyword": "user_id"
+                                "userId": "user_id"
                             }
                         }
                     ]
@@ -71,3 +74,195 @@ class TestMessageDao(TestCase):
 
         with self.assertRaises(ValueError):
             message_dao._build_query_based_on_parameters(trace_id=None, message_id=None, user_id="user_id")
+
+    def test_add_batch(self):
+        message_dao = MessageDao(Elasticsearch())
+        raw_message = {
+            "messageId": "message_id",
+            "conversationId": None,
+            "channel": "channel",
+            "userId": "user_id",
+            "timestamp": "2021-01-22T17:55:33.429203",
+            "content": {
+                "type": "action",
+                "value": "test"
+            },
+            "domain": None,
+            "intent": None,
+            "entities": [],
+            "language": None,
+            "metadata": {},
+            "project": "project",
+            "type": "request"
+        }
+        other_day_raw_message = dict(raw_message, timestamp="2021-01-21T17:55:33.429203")
+        messages = [Message.from_repr(raw_message), Message.from_repr(other_day_raw_message), Message.from_repr(raw_message)]
+
+        message_dao._es.bulk = Mock(return_value={
+            "took": 3,
+            "errors": True,
+            "items": [
+                {"index": {"_index": "message-2021-01-21", "_id": "trace_id_2", "status": 201}},
+                {"index": {"_index": "message-2021-01-22", "_id": "trace_id_1", "status": 201}},
+                {"index": {"_index": "message-2021-01-22", "_id": "trace_id_3", "status": 400, "error": {"type": "mapper_parsing_exception", "reason": "failed to parse"}}}
+            ]
+        })
+
+        results = message_dao.add_batch(messages)
+        self.assertEqual([
+            ("trace_id_1", None),
+            ("trace_id_2", None),
+            ("trace_id_3", "mapper_parsing_exception: failed to parse")
+        ], results)
+        message_dao._es.bulk.assert_called_once()
+        self.assertIn("message-2021-01-21", message_dao._es.bulk.call_args[0][0].split("\n")[0])
+
+    def test_add_batch_with_first_seen_registry(self):
+        first_seen_dao = Mock()
+        message_dao = MessageDao(Elasticsearch(), first_seen_dao=first_seen_dao)
+        raw_message = {
+            "messageId": "message_id",
+            "conversationId": None,
+            "channel": "channel",
+            "userId": "user_id",
+            "timestamp": "2021-01-22T17:55:33.429203",
+            "content": {
+                "type": "action",
+                "value": "test"
+            },
+            "domain": None,
+            "intent": None,
+            "entities": [],
+            "language": None,
+            "metadata": {},
+            "project": "project",
+            "type": "request"
+        }
+        messages = [Message.from_repr(raw_message), Message.from_repr(dict(raw_message, userId="other_user_id"))]
+
+        message_dao._es.bulk = Mock(return_value={
+            "took": 3,
+            "errors": True,
+            "items": [
+                {"index": {"_index": "message-2021-01-22", "_id": "trace_id_1", "status": 201}},
+                {"index": {"_index": "message-2021-01-22", "_id": "trace_id_2", "status": 400, "error": {"type": "mapper_parsing_exception", "reason": "failed to parse"}}}
+            ]
+        })
+
+        message_dao.add_batch(messages)
+        first_seen_dao.add.assert_called_once_with([messages[0]])
+
+    def test_search_page(self):
+        message_dao = MessageDao(Elasticsearch())
+        message_dao._index_resolver.resolve = Mock(return_value="message-2021-01-22*")
+        raw_message = {
+            "messageId": "message_id",
+            "conversationId": None,
+            "channel": "channel",
+            "userId": "user_id",
+            "timestamp": "2021-01-22T17:55:33.429203",
+            "content": {
+                "type": "action",
+                "value": "test"
+            },
+            "domain": None,
+            "intent": None,
+            "entities": [],
+            "language": None,
+            "metadata": {},
+            "project": "project",
+            "type": "request"
+        }
+
+        message_dao._es.search = Mock(return_value={
+            "hits": {
+                "hits": [
+                    {"_id": "trace_id_1", "_source": raw_message, "sort": [1611338133429, "message_id_1", "user_id", "project"]},
+                    {"_id": "trace_id_2", "_source": raw_message, "sort": [1611338133429, "message_id_2", "user_id", "project"]}
+                ]
+            }
+        })
+        messages, search_after = message_dao.search_page("project", datetime(2021, 1, 22), datetime(2021, 1, 23), 2)
+        self.assertEqual(2, len(messages))
+        self.assertEqual([1611338133429, "message_id_2", "user_id", "project"], search_after)
+        query = message_dao._es.search.call_args[1]["body"]
+        self.assertEqual([{"timestamp": {"order": "asc"}}, {"messageId": {"order": "asc"}}, {"userId": {"order": "asc"}}, {"project": {"order": "asc"}}], query["sort"])
+        self.assertNotIn("search_after", query)
+
+        message_dao._es.search = Mock(return_value={
+            "hits": {
+                "hits": [
+                    {"_id": "trace_id_3", "_source": raw_message, "sort": [1611338133430, "message_id_3", "user_id", "project"]}
+                ]
+            }
+        })
+        messages, search_after = message_dao.search_page("project", datetime(2021, 1, 22), datetime(2021, 1, 23), 2, search_after=[1611338133429, "message_id_2", "user_id", "project"])
+        self.assertEqual(1, len(messages))
+        self.assertIsNone(search_after)
+        self.assertEqual([1611338133429, "message_id_2", "user_id", "project"], message_dao._es.search.call_args[1]["body"]["search_after"])
+
+        message_dao._es.search = Mock(return_value={"hits": {"hits": []}})
+        messages, search_after = message_dao.search_page("project", datetime(2021, 1, 22), datetime(2021, 1, 23), 0)
+        self.assertEqual([], messages)
+        self.assertIsNone(search_after)
+
+        with self.assertRaises(ValueError):
+            message_dao.search_page("project", datetime(2021, 1, 23), datetime(2021, 1, 22), 2)
+
+    def test_scan(self):
+        message_dao = MessageDao(Elasticsearch())
+        message_dao._index_resolver.resolve = Mock(return_value="message-2021-01-22*")
+        raw_message = {
+            "messageId": "message_id",
+            "conversationId": None,
+            "channel": "channel",
+            "userId": "user_id",
+            "timestamp": "2021-01-22T17:55:33.429203",
+            "content": {
+                "type": "action",
+                "value": "test"
+            },
+            "domain": None,
+            "intent": None,
+            "entities": [],
+            "language": None,
+            "metadata": {},
+            "project": "project",
+            "type": "request"
+        }
+
+        with patch("memex_logging.common.dao.message.scan", return_value=iter([{"_id": "trace_id_1", "_source": raw_message}, {"_id": "trace_id_2", "_source": raw_message}])) as mock_scan:
+            messages = message_dao.scan("project", datetime(2021, 1, 22), datetime(2021, 1, 23), user_id="user_id", page_size=500)
+            self.assertEqual([raw_message, raw_message], [message.to_repr() for message in messages])
+            mock_scan.assert_called_once()
+            self.assertEqual("message-2021-01-22*", mock_scan.call_args[1]["index"])
+            self.assertEqual(500, mock_scan.call_args[1]["size"])
+            self.assertNotIn("size", mock_scan.call_args[1]["query"])
+            self.assertNotIn("sort", mock_scan.call_args[1]["query"])
+
+        with self.assertRaises(ValueError):
+            message_dao.scan("project", datetime(2021, 1, 23), datetime(2021, 1, 22))
+
+    def test_search_raw(self):
+        message_dao = MessageDao(Elasticsearch())
+        message_dao._index_resolver.resolve = Mock(return_value="message-2021-01-22*")
+        raw_message = {
+            "messageId": "message_id",
+            "userId": "user_id"
+        }
+
+        message_dao._es.search = Mock(return_value={"hits": {"hits": [{"_id": "trace_id_1", "_index": "message-2021-01-22", "_type": "_doc", "_source": raw_message}]}})
+        messages = message_dao.search("project", datetime(2021, 1, 22), datetime(2021, 1, 23), 10, raw=True, source_includes=["messageId", "userId"])
+        self.assertEqual([raw_message], messages)
+        self.assertEqual({"includes": ["messageId", "userId"]}, message_dao._es.search.call_args[1]["body"]["_source"])
+
+        message_dao.search("project", datetime(2021, 1, 22), datetime(2021, 1, 23), 10, raw=True)
+        self.assertNotIn("_source", message_dao._es.search.call_args[1]["body"])
+
+        message, trace_id = message_dao.get(trace_id="trace_id_1", raw=True, source_excludes=["metadata"])
+        self.assertEqual(raw_message, message)
+        self.assertEqual("trace_id_1", trace_id)
+        self.assertEqual({"excludes": ["metadata"]}, message_dao._es.search.call_args[1]["body"]["_source"])
+
+        with self.assertRaises(ValueError):
+            message_dao.search("project", datetime(2021, 1, 22), datetime(2021, 1, 23), 10, source_includes=["messageId"])
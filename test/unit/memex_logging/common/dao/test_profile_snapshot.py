@@ -0,0 +1,72 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, annotations
+
+from datetime import date
+from unittest import TestCase
+
+from elasticsearch import Elasticsearch
+from mock import Mock
+
+from memex_logging.common.dao.profile_snapshot import ProfileSnapshotDao
+
+
+class TestProfileSnapshotDao(TestCase):
+
+    def test_count_demographics(self):
+        profile_snapshot_dao = ProfileSnapshotDao(Elasticsearch())
+        profile_snapshot_dao._es.search = Mock(return_value={'took': 1, 'timed_out': False, 'hits': {'total': {'value': 3, 'relation': 'eq'}, 'max_score': None, 'hits': []}, 'aggregations': {
+            'with_date_of_birth': {'value': 2},
+            'date_of_birth': {'buckets': {'0-18': {'to': 1.0, 'to_as_string': '2021-08-01', 'doc_count': 0}, '55+': {'from': 1.0, 'from_as_string': '1965-08-01', 'to': 2.0, 'to_as_string': '2021-08-01', 'doc_count': 2}}},
+            'gender': {'doc_count_error_upper_bound': 0, 'sum_other_doc_count': 0, 'buckets': [{'key': 'female', 'doc_count': 2}]}
+        }})
+
+        with_date_of_birth, age_counts, gender_counts = profile_snapshot_dao.count_demographics("project", ["1", "2", "3"], [("0-18", date(2002, 8, 1), date(2021, 8, 1)), ("55+", None, date(1965, 8, 1))])
+        self.assertEqual(2, with_date_of_birth)
+        self.assertEqual({"0-18": 0, "55+": 2}, age_counts)
+        self.assertEqual({"female": 2}, gender_counts)
+
+        body = profile_snapshot_dao._es.search.call_args.kwargs['body']
+        self.assertEqual([{"key": "0-18", "from": "2002-08-01", "to": "2021-08-01"}, {"key": "55+", "to": "1965-08-01"}], body["aggs"]["date_of_birth"]["date_range"]["ranges"])
+        self.assertIn({"terms": {"userId": ["1", "2", "3"]}}, body["query"]["bool"]["filter"])
+
+    def test_count_demographics_with_many_users(self):
+        profile_snapshot_dao = ProfileSnapshotDao(Elasticsearch())
+        profile_snapshot_dao.MAX_USERS_PER_SEARCH = 2
+        profile_snapshot_dao._es.search = Mock(side_effect=[
+            {'hits': {'hits': []}, 'aggregations': {
+                'with_date_of_birth': {'value': 2},
+                'date_of_birth': {'buckets': {'0-18': {'doc_count': 1}, '55+': {'doc_count': 1}}},
+                'gender': {'buckets': [{'key': 'female', 'doc_count': 1}, {'key': 'male', 'doc_count': 1}]}
+            }},
+            {'hits': {'hits': []}, 'aggregations': {
+                'with_date_of_birth': {'value': 1},
+                'date_of_birth': {'buckets': {'0-18': {'doc_count': 1}, '55+': {'doc_count': 0}}},
+                'gender': {'buckets': [{'key': 'female', 'doc_count': 1}]}
+            }}
+        ])
+
+        with_date_of_birth, age_counts, gender_counts = profile_snapshot_dao.count_demographics("project", ["1", "2", "3", "1"], [("0-18", date(2002, 8, 1), date(2021, 8, 1)), ("55+", None, date(1965, 8, 1))])
+        self.assertEqual(3, with_date_of_birth)
+        self.assertEqual({"0-18": 2, "55+": 1}, age_counts)
+        self.assertEqual({"female": 2, "male": 1}, gender_counts)
+        self.assertEqual([["1", "2"], ["3"]], [call.kwargs['body']["query"]["bool"]["filter"][1]["terms"]["userId"] for call in profile_snapshot_dao._es.search.call_args_list])
+
+    def test_count_demographics_without_users(self):
+        profile_snapshot_dao = ProfileSnapshotDao(Elasticsearch())
+        profile_snapshot_dao._es.search = Mock()
+        self.assertEqual((0, {}, {}), profile_snapshot_dao.count_demographics("project", [], []))
+        profile_snapshot_dao._es.search.assert_not_called()
@@ -14,10 +14,11 @@
 
 from __future__ import absolute_import, annotations
 
+from datetime import datetime
 from unittest import TestCase
 
 from memex_logging.common.model.message import Intent, ActionRequest, Message, RequestMessage, ResponseMessage, \
-    NotificationMessage, TextualResponse, Entity
+    NotificationMessage, TextualResponse, Entity, ActionResponse
 
 
 class TestIntent(TestCase):
@@ -149,3 +150,48 @@ class TestMessage(TestCase):
         message = Message.from_repr(raw_data)
         self.assertIsInstance(message, NotificationMessage)
         self.assertEqual(raw_data, message.to_repr())
+
+    def test_trusted(self):
+        raw_data = {
+            "messageId": "message_id",
+            "conversationId": "conversation_id",
+            "channel": "channel",
+            "userId": "user_id",
+            "timestamp": "2021-01-22T17:55:33.429203",
+            "content": {
+                "type": "text",
+                "value": "test"
+            },
+            "domain": "domain",
+            "intent": {
+                "name": "intent",
+                "confidence": 0.9
+            },
+            "entities": [
+                {
+                    "type": "@city",
+                    "value": "Trento",
+                    "confidence": 0.8
+                }
+            ],
+            "language": "en",
+            "metadata": {},
+            "project": "project",
+            "type": "request"
+        }
+
+        message = Message.from_repr(raw_data, trusted=True)
+        self.assertIsInstance(message, RequestMessage)
+        self.assertEqual(raw_data, message.to_repr())
+        self.assertEqual(Message.from_repr(raw_data).to_repr(), message.to_repr())
+
+        with self.assertRaises(ValueError):
+            RequestMessage("message_id", None, "channel", "user_id", message.timestamp, None, None, None, [Intent("intent")], None, None, "project")
+        RequestMessage("message_id", None, "channel", "user_id", message.timestamp, None, None, None, [Intent("intent")], None, None, "project", validate=False)
+
+    def test_slots(self):
+        message = ResponseMessage("message_id", None, "channel", "user_id", "response_to", datetime(2021, 1, 22), TextualResponse("test", [ActionResponse("button")]), None, "project")
+        for value in [message, message.content, message.content.buttons[0]]:
+            self.assertFalse(hasattr(value, "__dict__"))
+        with self.assertRaises(AttributeError):
+            message.unknown = "value"
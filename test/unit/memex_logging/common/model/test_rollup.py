@@ -0,0 +1,46 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, annotations
+
+from datetime import date
+from unittest import TestCase
+
+from memex_logging.common.model.rollup import MessageRollup
+
+
+class TestMessageRollup(TestCase):
+
+    def test_repr(self):
+        rollup = MessageRollup("project", date(2021, 2, 3), types={"request": 2}, distinct_messages={"request": 2}, request_content_types={"text": 2},
+                               channels={"telegram": 2}, intents={"greeting": 1}, domains={"chat": 1})
+        rollup.users.add("user-1")
+        rollup.active_users.add("user-1")
+        rollup.conversations.add("conversation-1")
+
+        from_repr = MessageRollup.from_repr(rollup.to_repr())
+        self.assertEqual(rollup.to_repr(), from_repr.to_repr())
+        self.assertEqual(1, from_repr.users.cardinality())
+        self.assertEqual(0, from_repr.engaged_users.cardinality())
+
+    def test_merge(self):
+        rollup = MessageRollup("project", date(2021, 2, 3), types={"request": 2, "response": 1}, domains={"chat": 1})
+        rollup.users.add("user-1")
+        other = MessageRollup("project", date(2021, 2, 4), types={"request": 1}, domains={"help": 1})
+        other.users.add("user-1")
+        other.users.add("user-2")
+
+        rollup.merge(other)
+        self.assertEqual({"request": 3, "response": 1}, rollup.types)
+        self.assertEqual({"chat": 1, "help": 1}, rollup.domains)
+        self.assertEqual(2, rollup.users.cardinality())
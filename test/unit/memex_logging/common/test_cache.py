@@ -0,0 +1,67 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, annotations
+
+from unittest import TestCase
+
+from mock import patch
+
+from memex_logging.common.cache import TTLCache
+
+
+class TestTTLCache(TestCase):
+
+    def test_get(self):
+        cache = TTLCache(max_size=2, ttl=10)
+        self.assertIsNone(cache.get("key"))
+        cache.put("key", "value")
+        self.assertEqual("value", cache.get("key"))
+        self.assertEqual({"size": 1, "maxSize": 2, "hits": 1, "misses": 1}, cache.stats())
+
+    def test_expiration(self):
+        cache = TTLCache(max_size=2, ttl=10)
+        with patch("memex_logging.common.cache.time.monotonic", return_value=100):
+            cache.put("key", "value")
+        with patch("memex_logging.common.cache.time.monotonic", return_value=109):
+            self.assertEqual("value", cache.get("key"))
+        with patch("memex_logging.common.cache.time.monotonic", return_value=110):
+            self.assertIsNone(cache.get("key"))
+        self.assertEqual(0, len(cache))
+
+    def test_eviction(self):
+        cache = TTLCache(max_size=2, ttl=10)
+        cache.put("key1", "value1")
+        cache.put("key2", "value2")
+        cache.get("key1")
+        cache.put("key3", "value3")
+        self.assertEqual("value1", cache.get("key1"))
+        self.assertIsNone(cache.get("key2"))
+        self.assertEqual("value3", cache.get("key3"))
+
+    def test_disabled(self):
+        cache = TTLCache(max_size=0, ttl=10)
+        cache.put("key", "value")
+        self.assertIsNone(cache.get("key"))
+
+        cache = TTLCache(max_size=10, ttl=0)
+        cache.put("key", "value")
+        self.assertIsNone(cache.get("key"))
+
+    def test_invalidate(self):
+        cache = TTLCache()
+        cache.put("key", "value")
+        cache.invalidate("key")
+        self.assertIsNone(cache.get("key"))
@@ -0,0 +1,69 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import, annotations
+
+from unittest import TestCase
+
+from memex_logging.common.hll import HyperLogLog
+
+
+class TestHyperLogLog(TestCase):
+
+    def test_sparse_cardinality_is_exact(self):
+        sketch = HyperLogLog()
+        for i in range(300):
+            sketch.add(f"user-{i}")
+            sketch.add(f"user-{i}")
+        self.assertTrue(sketch.is_sparse)
+        self.assertEqual(300, sketch.cardinality())
+
+    def test_dense_cardinality(self):
+        sketch = HyperLogLog()
+        for i in range(50000):
+            sketch.add(f"user-{i}")
+        self.assertFalse(sketch.is_sparse)
+        self.assertAlmostEqual(50000, sketch.cardinality(), delta=50000 * 0.03)
+
+    def test_merge(self):
+        sparse_sketch = HyperLogLog()
+        for i in range(200):
+            sparse_sketch.add(f"user-{i}")
+        other_sparse_sketch = HyperLogLog()
+        for i in range(100, 300):
+            other_sparse_sketch.add(f"user-{i}")
+        sparse_sketch.merge(other_sparse_sketch)
+        self.assertTrue(sparse_sketch.is_sparse)
+        self.assertEqual(300, sparse_sketch.cardinality())
+
+        dense_sketch = HyperLogLog()
+        for i in range(10000):
+            dense_sketch.add(f"user-{i}")
+        dense_sketch.merge(sparse_sketch)
+        self.assertAlmostEqual(10000, dense_sketch.cardinality(), delta=10000 * 0.03)
+        sparse_sketch.merge(dense_sketch)
+        self.assertFalse(sparse_sketch.is_sparse)
+        self.assertEqual(dense_sketch.cardinality(), sparse_sketch.cardinality())
+
+        with self.assertRaises(ValueError):
+            dense_sketch.merge(HyperLogLog(precision=12))
+
+    def test_repr(self):
+        sketch = HyperLogLog()
+        for i in range(100):
+            sketch.add(f"user-{i}")
+        self.assertEqual(100, HyperLogLog.from_repr(sketch.to_repr()).cardinality())
+
+        for i in range(5000):
+            sketch.add(f"user-{i}")
+        self.assertEqual(sketch.cardinality(), HyperLogLog.from_repr(sketch.to_repr()).cardinality())
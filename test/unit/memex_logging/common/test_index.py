@@ -0,0 +1,82 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+from datetime import datetime
+from unittest import TestCase
+
+from elasticsearch import Elasticsearch
+from freezegun import freeze_time
+from mock import Mock
+
+from memex_logging.common.index import IndexResolver
+from memex_logging.common.model.analytic.time import MovingTimeWindow
+
+
+class TestIndexResolver(TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.es = Elasticsearch()
+        self.es.indices.get_alias = Mock(return_value={
+            index: {"aliases": {}} for index in [
+                "message-history",
+                "message-2021-06-29",
+                "message-2021-06-30",
+                "message-2021-07-01",
+                "message-2021-07-02",
+                "message-2021-07-25",
+                "message-2021-07-30",
+                "message-2021-07-31"
+            ]
+        })
+        self.index_resolver = IndexResolver(self.es)
+
+    def test_resolve(self):
+        with freeze_time("2021-07-31"):
+            self.assertEqual("message-*", self.index_resolver.resolve("message"))
+
+            self.assertEqual(
+                "message-history*,message-2021-07-25*,message-2021-07-30*,message-2021-07-31*,message-2021-08-01*",
+                self.index_resolver.resolve("message", datetime(2021, 7, 26), datetime(2021, 7, 31, 12))
+            )
+
+            self.assertEqual(
+                "message-history*,message-2021-06-29*,message-2021-06-30*,message-2021-07-01*",
+                self.index_resolver.resolve("message", datetime(2021, 6, 30), datetime(2021, 6, 30, 23, 59))
+            )
+
+            self.assertEqual(
+                "message-history*,message-2021-06-*,message-2021-07-01*,message-2021-07-02*,message-2021-07-25*,message-2021-07-30*,message-2021-07-31*,message-2021-08-01*",
+                self.index_resolver.resolve("message", None, datetime(2021, 7, 31))
+            )
+
+            self.assertEqual(
+                "message-history*,message-2021-07-25*,message-2021-07-30*,message-2021-07-31*,message-2021-08-01*",
+                self.index_resolver.resolve_time_window("message", MovingTimeWindow("7D"))
+            )
+
+        self.es.indices.get_alias.assert_called_once()
+
+    @freeze_time("2021-07-31")
+    def test_resolve_without_overlapping_indices(self):
+        self.es.indices.get_alias = Mock(return_value={"message-2021-07-30": {"aliases": {}}})
+        # none of the indices overlaps the range, the query must not be executed on all of them
+        self.assertEqual("message-2021-05-31*", self.index_resolver.resolve("message", datetime(2021, 6, 1), datetime(2021, 6, 10)))
+        self.assertEqual("message-2021-06-27*", self.index_resolver.resolve("message", None, datetime(2021, 6, 26)))
+
+    def test_resolve_failure(self):
+        self.es.indices.get_alias = Mock(side_effect=Exception)
+        self.assertEqual("message-*", self.index_resolver.resolve("message", datetime(2021, 7, 26), datetime(2021, 7, 31)))
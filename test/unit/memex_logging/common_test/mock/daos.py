@@ -15,7 +15,7 @@
 from __future__ import absolute_import, annotations
 
 from datetime import datetime
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Iterator
 
 from elasticsearch import Elasticsearch
 
@@ -34,6 +34,9 @@ class MockMessageDao(MessageDao):
     def add(self, message: Message, doc_type: str = "_doc") -> str:
         pass
 
+    def add_batch(self, messages: List[Message]) -> List[Tuple[Optional[str], Optional[str]]]:
+        pass
+
     def get(self, project: Optional[str] = None, message_id: Optional[str] = None,
             user_id: Optional[str] = None, trace_id: Optional[str] = None) -> Tuple[Message, str]:
         pass
@@ -47,6 +50,14 @@ class MockMessageDao(MessageDao):
                message_type: Optional[str] = None) -> List[Message]:
         pass
 
+    def search_page(self, project: str, from_time: datetime, to_time: datetime, max_size: int, search_after: Optional[list] = None,
+                    user_id: Optional[str] = None, channel: Optional[str] = None, message_type: Optional[str] = None) -> Tuple[List[Message], Optional[list]]:
+        pass
+
+    def scan(self, project: str, from_time: datetime, to_time: datetime, user_id: Optional[str] = None, channel: Optional[str] = None,
+             message_type: Optional[str] = None, page_size: int = 1000) -> Iterator[Message]:
+        pass
+
 
 class MockAnalyticDao(AnalyticDao):
     """
@@ -0,0 +1,158 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+import json
+from datetime import datetime
+from unittest import TestCase
+
+import requests
+from mock import Mock
+
+from memex_logging.common.model.analytic.descriptor.count import UserCountDescriptor
+from memex_logging.common.model.analytic.result.count import CountResult
+from memex_logging.common.model.analytic.time import FixedTimeWindow
+from memex_logging.memex_logging_lib.logging_utils import LoggingUtility
+
+
+class TestLoggingUtility(TestCase):
+
+    @staticmethod
+    def _build_response(status_code: int, content: dict) -> Mock:
+        return Mock(status_code=status_code, text=json.dumps(content))
+
+    def _add_textual_request(self, logging_utility: LoggingUtility, message_id: str):
+        return logging_utility.add_textual_request("text", message_id, "user_id", "channel", "2021-01-22T17:55:33.429203")
+
+    def test_add_message(self):
+        logging_utility = LoggingUtility("http://logger", "project", backoff_factor=0)
+        logging_utility._session.post = Mock(return_value=self._build_response(201, {"traceIds": ["trace_id"]}))
+
+        self.assertEqual("trace_id", self._add_textual_request(logging_utility, "message_id"))
+        logging_utility._session.post.assert_called_once()
+        self.assertFalse(logging_utility._session.get_adapter("http://logger").max_retries._is_method_retryable("POST"))
+        self.assertEqual("http://logger/messages", logging_utility._session.post.call_args[0][0])
+        self.assertEqual("message_id", logging_utility._session.post.call_args[1]["json"][0]["messageId"])
+
+        logging_utility._session.post = Mock(side_effect=[self._build_response(503, {}), self._build_response(201, {"traceIds": ["trace_id"]})])
+        self.assertEqual("trace_id", self._add_textual_request(logging_utility, "message_id"))
+        self.assertEqual(2, logging_utility._session.post.call_count)
+
+        logging_utility._session.post = Mock(return_value=self._build_response(400, {}))
+        with self.assertRaises(ValueError):
+            self._add_textual_request(logging_utility, "message_id")
+
+        # the service may have stored the message before the gateway error, so the request is not sent again
+        logging_utility._session.post = Mock(side_effect=[self._build_response(502, {}), self._build_response(201, {"traceIds": ["trace_id"]})])
+        with self.assertRaises(ValueError):
+            self._add_textual_request(logging_utility, "message_id")
+        logging_utility._session.post.assert_called_once()
+
+    def test_batching(self):
+        logging_utility = LoggingUtility("http://logger", "project", batch_size=2, backoff_factor=0)
+        logging_utility._session.post = Mock(return_value=self._build_response(201, {"traceIds": ["trace_id_1", "trace_id_2"]}))
+
+        self.assertIsNone(self._add_textual_request(logging_utility, "message_id_1"))
+        logging_utility._session.post.assert_not_called()
+
+        self.assertIsNone(self._add_textual_request(logging_utility, "message_id_2"))
+        logging_utility._session.post.assert_called_once()
+        self.assertEqual(["message_id_1", "message_id_2"], [message["messageId"] for message in logging_utility._session.post.call_args[1]["json"]])
+
+        logging_utility._session.post = Mock(return_value=self._build_response(201, {"traceIds": ["trace_id_3"]}))
+        self._add_textual_request(logging_utility, "message_id_3")
+        logging_utility.add_log("log_id", "component", "INFO", "content", "2021-01-22T17:55:33.429203")
+        logging_utility.close()
+        self.assertEqual(2, logging_utility._session.post.call_count)
+        self.assertEqual("http://logger/messages", logging_utility._session.post.call_args_list[0][0][0])
+        self.assertEqual("http://logger/logs", logging_utility._session.post.call_args_list[1][0][0])
+
+    def test_batching_failure(self):
+        logging_utility = LoggingUtility("http://logger", "project", batch_size=10, max_buffer_size=2, max_retries=1, backoff_factor=0)
+        logging_utility._session.post = Mock(return_value=self._build_response(503, {}))
+
+        self._add_textual_request(logging_utility, "message_id_1")
+        self._add_textual_request(logging_utility, "message_id_2")
+        self._add_textual_request(logging_utility, "message_id_3")
+        with self.assertRaises(ValueError):
+            logging_utility.flush()
+        self.assertEqual(2, logging_utility._session.post.call_count)
+
+        logging_utility._session.post = Mock(return_value=self._build_response(201, {"traceIds": ["trace_id_2", "trace_id_3"]}))
+        logging_utility.flush()
+        self.assertEqual(["message_id_2", "message_id_3"], [message["messageId"] for message in logging_utility._session.post.call_args[1]["json"]])
+
+        logging_utility._session.post = Mock(side_effect=[requests.exceptions.ConnectionError(), self._build_response(201, {"traceIds": ["trace_id_4"]})])
+        self._add_textual_request(logging_utility, "message_id_4")
+        with self.assertRaises(ValueError):
+            logging_utility.flush()
+        logging_utility.flush()
+        self.assertEqual(["message_id_4"], [message["messageId"] for message in logging_utility._session.post.call_args[1]["json"]])
+
+    def test_batching_rejected(self):
+        logging_utility = LoggingUtility("http://logger", "project", batch_size=2, max_retries=1, backoff_factor=0)
+        logging_utility._session.post = Mock(return_value=self._build_response(400, {}))
+
+        self._add_textual_request(logging_utility, "message_id_1")
+        self._add_textual_request(logging_utility, "message_id_2")
+        logging_utility._session.post.assert_called_once()
+        # the rejected batch is discarded instead of blocking the following ones
+        self.assertEqual(0, len(logging_utility._message_buffer))
+
+        logging_utility._session.post = Mock(return_value=self._build_response(201, {"traceIds": ["trace_id_3"]}))
+        self._add_textual_request(logging_utility, "message_id_3")
+        logging_utility.flush()
+        self.assertEqual(["message_id_3"], [message["messageId"] for message in logging_utility._session.post.call_args[1]["json"]])
+
+    def test_iter_messages(self):
+        logging_utility = LoggingUtility("http://logger", "project")
+        logging_utility._session.get = Mock(side_effect=[
+            Mock(status_code=200, content=json.dumps({"messages": [{"messageId": "message_id_1"}, {"messageId": "message_id_2"}], "nextCursor": "cursor"})),
+            Mock(status_code=200, content=json.dumps({"messages": [{"messageId": "message_id_3"}], "nextCursor": None}))
+        ])
+
+        messages = list(logging_utility.iter_messages(datetime(2021, 1, 22), datetime(2021, 1, 23), page_size=2))
+        self.assertEqual(["message_id_1", "message_id_2", "message_id_3"], [message["messageId"] for message in messages])
+        self.assertEqual(2, logging_utility._session.get.call_count)
+        self.assertEqual("cursor", logging_utility._session.get.call_args[1]["params"]["cursor"])
+
+    def test_get_analytic_result(self):
+        logging_utility = LoggingUtility("http://logger", "project")
+        descriptor = UserCountDescriptor(FixedTimeWindow(datetime(2021, 1, 1), datetime(2021, 12, 31)), "project", "total")
+        raw_result = CountResult(1, datetime(2022, 1, 1), datetime(2021, 1, 1), datetime(2021, 12, 31)).to_repr()
+        logging_utility._session.post = Mock(return_value=Mock(status_code=200, content=json.dumps({"descriptor": descriptor.to_repr(), "result": raw_result})))
+
+        self.assertEqual(raw_result, logging_utility.get_analytic_result(descriptor))
+        logging_utility._session.post.assert_called_once()
+        self.assertEqual("http://logger/analytic/evaluate", logging_utility._session.post.call_args[0][0])
+
+        logging_utility._session.post = Mock(return_value=Mock(status_code=504, content=json.dumps({})))
+        with self.assertRaises(Exception):
+            logging_utility.get_analytic_result(descriptor)
+
+    def test_get_analytic_result_without_evaluation(self):
+        logging_utility = LoggingUtility("http://logger", "project")
+        descriptor = UserCountDescriptor(FixedTimeWindow(datetime(2021, 1, 1), datetime(2021, 12, 31)), "project", "total")
+        raw_result = CountResult(1, datetime(2022, 1, 1), datetime(2021, 1, 1), datetime(2021, 12, 31)).to_repr()
+        logging_utility._session.post = Mock(side_effect=[
+            Mock(status_code=404, content=json.dumps({})),
+            Mock(status_code=200, content=json.dumps({"id": "analytic_id"})),
+            Mock(status_code=200, content=json.dumps({}))
+        ])
+        logging_utility._session.get = Mock(return_value=Mock(status_code=200, content=json.dumps({"id": "analytic_id", "result": raw_result})))
+        logging_utility._session.delete = Mock()
+
+        self.assertEqual(raw_result, logging_utility.get_analytic_result(descriptor, sleep_time=0))
+        self.assertEqual("http://logger/analytic", logging_utility._session.delete.call_args[0][0])
@@ -0,0 +1,89 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, annotations
+
+from unittest import TestCase
+from unittest.mock import Mock
+
+from elasticsearch import Elasticsearch
+
+from memex_logging.migration.actions.analytic_store_migration import AnalyticStoreMigration
+
+
+class TestAnalyticStoreMigration(TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.es = Elasticsearch()
+        self.es.indices.exists = Mock(return_value=False)
+        self.es.indices.exists_alias = Mock(return_value=False)
+        self.es.indices.create = Mock()
+        self.es.indices.delete = Mock()
+        self.es.indices.put_alias = Mock()
+        self.es.scroll = Mock(return_value={})
+        self.migration = AnalyticStoreMigration()
+
+    def test_apply_without_analytics(self):
+        self.es.indices.get = Mock(return_value={"analytic-store": {}})
+        self.es.bulk = Mock()
+        self.migration.apply(self.es)
+        self.es.indices.create.assert_called_once()
+        self.es.bulk.assert_not_called()
+        self.es.indices.delete.assert_not_called()
+
+    def test_apply(self):
+        self.es.indices.get = Mock(return_value={"analytic-store": {}, "analytic-2021-07-29": {}, "analytic-2021-07-30": {}})
+        self.es.search = Mock(return_value={'_scroll_id': 'scroll_id', 'took': 6, 'timed_out': False, '_shards': {'total': 2, 'successful': 2, 'skipped': 0, 'failed': 0}, 'hits': {'total': {'value': 2, 'relation': 'eq'}, 'max_score': None, 'hits': [
+            {'_index': 'analytic-2021-07-29', '_type': '_doc', '_id': 'pMuWzXoBKDx30EUdrHBt', '_score': None, '_source': {
+                'id': 'c48d5f6b-695e-4f34-9ba8-045ce2f68bb5',
+                'descriptor': {'timespan': {'type': 'fixed', 'start': '2021-07-29T00:00:00', 'end': '2021-07-30T00:00:00'}, 'project': 'project', 'type': 'count', 'dimension': 'user', 'metric': 'total'},
+                'result': None
+            }, 'sort': [0]},
+            {'_index': 'analytic-2021-07-30', '_type': '_doc', '_id': 'qMuWzXoBKDx30EUdrHBt', '_score': None, '_source': {'descriptor': {}, 'result': None}, 'sort': [1]}
+        ]}})
+        self.es.bulk = Mock(return_value={"took": 1, "errors": False, "items": [{"index": {"_index": "analytic-store", "_id": "c48d5f6b-695e-4f34-9ba8-045ce2f68bb5", "status": 201}}]})
+
+        self.migration.apply(self.es)
+        self.assertIn('"_id":"c48d5f6b-695e-4f34-9ba8-045ce2f68bb5"', self.es.bulk.call_args.args[0])
+        self.es.indices.delete.assert_called_once_with(index="analytic-2021-07-29,analytic-2021-07-30")
+        self.assertEqual({"aliases": {"analytic": {"is_write_index": True}}}, self.es.indices.create.call_args.kwargs["body"])
+        self.es.indices.put_alias.assert_not_called()
+
+    def test_apply_with_concrete_index(self):
+        self.es.indices.exists = Mock(side_effect=lambda index: index == "analytic")
+        self.es.indices.get = Mock(return_value={})
+        self.es.search = Mock(return_value={'_scroll_id': 'scroll_id', 'took': 6, 'timed_out': False, '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0}, 'hits': {'total': {'value': 1, 'relation': 'eq'}, 'max_score': None, 'hits': [
+            {'_index': 'analytic', '_type': '_doc', '_id': 'analytic_id', '_score': None, '_source': {'id': 'analytic_id', 'descriptor': {}, 'result': None}, 'sort': [0]}
+        ]}})
+        self.es.bulk = Mock(return_value={"took": 1, "errors": False, "items": [{"index": {"_index": "analytic-store", "_id": "analytic_id", "status": 201}}]})
+
+        # the alias can only be created once the concrete index has been replaced
+        self.migration.apply(self.es)
+        self.assertEqual({}, self.es.indices.create.call_args.kwargs["body"])
+        self.assertEqual("analytic", self.es.search.call_args.kwargs["index"])
+        self.es.indices.delete.assert_called_once_with(index="analytic")
+        self.es.indices.put_alias.assert_called_once_with(index="analytic-store", name="analytic", body={"is_write_index": True})
+
+    def test_apply_with_errors(self):
+        self.es.indices.get = Mock(return_value={"analytic-store": {}, "analytic-2021-07-29": {}})
+        self.es.search = Mock(return_value={'_scroll_id': 'scroll_id', 'took': 6, 'timed_out': False, '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0}, 'hits': {'total': {'value': 1, 'relation': 'eq'}, 'max_score': None, 'hits': [
+            {'_index': 'analytic-2021-07-29', '_type': '_doc', '_id': 'pMuWzXoBKDx30EUdrHBt', '_score': None, '_source': {'id': 'analytic_id', 'descriptor': {}, 'result': None}, 'sort': [0]}
+        ]}})
+        self.es.bulk = Mock(return_value={"took": 1, "errors": True, "items": [{"index": {"_index": "analytic-store", "_id": "analytic_id", "status": 400, "error": {"type": "mapper_parsing_exception", "reason": "failed to parse"}}}]})
+
+        with self.assertRaises(RuntimeError):
+            self.migration.apply(self.es)
+        self.es.indices.delete.assert_not_called()
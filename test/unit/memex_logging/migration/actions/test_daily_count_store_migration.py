@@ -0,0 +1,56 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+from unittest import TestCase
+from unittest.mock import Mock
+
+from elasticsearch import Elasticsearch
+
+from memex_logging.migration.actions.daily_count_store_migration import DailyCountStoreMigration
+
+
+class TestDailyCountStoreMigration(TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.es = Elasticsearch()
+        self.es.indices.exists = Mock(return_value=False)
+        self.es.indices.create = Mock()
+        self.es.indices.delete = Mock()
+        self.migration = DailyCountStoreMigration()
+
+    def test_apply_without_counts(self):
+        self.es.indices.get = Mock(return_value={})
+        self.es.reindex = Mock()
+        self.migration.apply(self.es)
+        self.es.indices.create.assert_called_once()
+        self.es.reindex.assert_not_called()
+        self.es.indices.delete.assert_not_called()
+
+    def test_apply(self):
+        self.es.indices.exists = Mock(return_value=True)
+        self.es.indices.get = Mock(return_value={"daily_count-2021-02-03": {}, "daily_count-2021-02-04": {}})
+        self.es.reindex = Mock(return_value={"total": 2, "failures": []})
+        self.migration.apply(self.es)
+        self.assertEqual({"source": {"index": "daily_count-*"}, "dest": {"index": "daily_count"}}, self.es.reindex.call_args.kwargs["body"])
+        self.assertEqual(["daily_count", "daily_count-*"], [kwargs["index"] for _, kwargs in self.es.indices.delete.call_args_list])
+
+    def test_apply_with_failures(self):
+        self.es.indices.get = Mock(return_value={"daily_count-2021-02-03": {}})
+        self.es.reindex = Mock(return_value={"total": 1, "failures": [{"index": "daily_count", "cause": {"type": "mapper_parsing_exception"}}]})
+        with self.assertRaises(RuntimeError):
+            self.migration.apply(self.es)
+        self.es.indices.delete.assert_not_called()
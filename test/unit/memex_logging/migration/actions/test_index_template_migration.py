@@ -0,0 +1,100 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+from unittest import TestCase
+from unittest.mock import Mock, call
+
+from elasticsearch import Elasticsearch
+
+from memex_logging.migration.actions.index_template_migration import IndexTemplateMigration
+
+
+class TestIndexTemplateMigration(TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.es = Elasticsearch()
+        self.es.cluster.put_component_template = Mock()
+        self.es.indices.put_index_template = Mock()
+        self.es.indices.put_settings = Mock()
+        self.es.indices.delete = Mock()
+        self.es.indices.clone = Mock()
+        self.es.indices.put_mapping = Mock()
+        self.es.count = Mock(return_value={"count": 1})
+        self.migration = IndexTemplateMigration()
+
+    def test_apply_without_indices(self):
+        self.es.indices.get = Mock(return_value={})
+        self.es.reindex = Mock()
+        self.migration.apply(self.es)
+        self.es.cluster.put_component_template.assert_called_once()
+        self.assertEqual(["message", "analytic", "logging"], [kwargs["name"] for _, kwargs in self.es.indices.put_index_template.call_args_list])
+        self.es.reindex.assert_not_called()
+
+    def test_apply(self):
+        self.es.indices.get = Mock(side_effect=[
+            {"message-2021-07-29": {"aliases": {}}, "message-2021-07-30-remapping": {"aliases": {}}},
+            {"analytic-store": {"aliases": {"analytic": {"is_write_index": True}}}},
+            {}
+        ])
+        self.es.reindex = Mock(return_value={"total": 1, "failures": []})
+
+        self.migration.apply(self.es)
+        self.assertEqual([
+            call(body={"source": {"index": "message-2021-07-29"}, "dest": {"index": "message-2021-07-29-remapping"}}, refresh=True, request_timeout=3600),
+            call(body={"source": {"index": "analytic-store"}, "dest": {"index": "analytic-store-remapping"}}, refresh=True, request_timeout=3600)
+        ], self.es.reindex.call_args_list)
+        self.es.indices.clone.assert_called_with(index="analytic-store-remapping", target="analytic-store", body={"aliases": {"analytic": {"is_write_index": True}}}, wait_for_active_shards=1)
+        self.es.indices.delete.assert_any_call(index="message-2021-07-29")
+        self.es.indices.delete.assert_called_with(index="analytic-store-remapping")
+
+    def test_apply_with_failures(self):
+        self.es.indices.get = Mock(return_value={"logging-project-2021-07-29": {"aliases": {}}})
+        self.es.reindex = Mock(return_value={"total": 1, "failures": [{"index": "logging-project-2021-07-29-remapping", "cause": {"type": "mapper_parsing_exception"}}]})
+
+        with self.assertRaises(RuntimeError):
+            self.migration.apply(self.es)
+        self.es.indices.delete.assert_not_called()
+        self.es.indices.clone.assert_not_called()
+
+    def test_apply_with_incomplete_copy(self):
+        self.es.indices.get = Mock(return_value={"logging-project-2021-07-29": {"aliases": {}}})
+        self.es.reindex = Mock(return_value={"total": 2, "failures": []})
+        self.es.count = Mock(side_effect=lambda index: {"count": 1 if index.endswith("-remapping") else 2})
+
+        with self.assertRaises(RuntimeError):
+            self.migration.apply(self.es)
+        self.es.indices.delete.assert_not_called()
+        self.es.indices.clone.assert_not_called()
+
+    def test_apply_after_interruption(self):
+        remapping = {"mappings": {"_meta": {"remapping": {"aliases": {"analytic": {"is_write_index": True}}}}}}
+        self.es.indices.get = Mock(side_effect=[
+            {"message-2021-07-29-remapping": {"aliases": {}, "mappings": {}}, "message-2021-07-30-remapping": remapping},
+            {"analytic-store": {"aliases": {}}, "analytic-store-remapping": remapping},
+            {}
+        ])
+        self.es.reindex = Mock(return_value={"total": 1, "failures": []})
+
+        self.migration.apply(self.es)
+        # the incomplete copy without the original index is kept, the verified one is restored
+        self.assertNotIn(call(index="message-2021-07-29-remapping"), self.es.indices.delete.call_args_list)
+        self.es.indices.clone.assert_any_call(index="message-2021-07-30-remapping", target="message-2021-07-30", body={"aliases": {"analytic": {"is_write_index": True}}}, wait_for_active_shards=1)
+        # the documents of the recreated index are added to the verified copy instead of deleting it
+        self.es.reindex.assert_called_once_with(body={"source": {"index": "analytic-store"}, "dest": {"index": "analytic-store-remapping"}}, refresh=True, request_timeout=3600)
+        self.assertNotIn(call(index="analytic-store-remapping", ignore=404), self.es.indices.delete.call_args_list)
+        self.es.indices.clone.assert_called_with(index="analytic-store-remapping", target="analytic-store", body={"aliases": {"analytic": {"is_write_index": True}}}, wait_for_active_shards=1)
+        self.es.indices.delete.assert_called_with(index="analytic-store-remapping")
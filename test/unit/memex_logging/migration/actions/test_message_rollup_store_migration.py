@@ -0,0 +1,63 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+from unittest import TestCase
+from unittest.mock import Mock
+
+from elasticsearch import Elasticsearch
+
+from memex_logging.migration.actions.message_rollup_store_migration import MessageRollupStoreMigration
+
+
+class TestMessageRollupStoreMigration(TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.es = Elasticsearch()
+        self.es.indices.exists = Mock(return_value=False)
+        self.es.indices.create = Mock()
+        self.es.indices.delete = Mock()
+        self.es.indices.delete_index_template = Mock()
+        self.es.indices.delete_template = Mock()
+        self.es.delete = Mock()
+        self.migration = MessageRollupStoreMigration()
+
+    def test_apply_without_rollups(self):
+        self.es.indices.get = Mock(return_value={})
+        self.es.reindex = Mock()
+        self.migration.apply(self.es)
+        self.es.indices.create.assert_called_once()
+        self.es.reindex.assert_not_called()
+        self.es.indices.delete.assert_not_called()
+        self.es.indices.delete_index_template.assert_called_once_with(name="message_rollup", ignore=404)
+        self.es.indices.delete_template.assert_called_once_with(name="message_rollup", ignore=404)
+        self.es.delete.assert_not_called()
+
+    def test_apply(self):
+        self.es.indices.exists = Mock(return_value=True)
+        self.es.indices.get = Mock(return_value={"message_rollup-2021-02-03": {}, "message_rollup-2021-02-04": {}})
+        self.es.reindex = Mock(return_value={"total": 2, "failures": []})
+        self.migration.apply(self.es)
+        self.assertEqual({"source": {"index": "message_rollup-*"}, "dest": {"index": "message_rollup"}}, self.es.reindex.call_args.kwargs["body"])
+        self.assertEqual(["message_rollup", "message_rollup-*"], [kwargs["index"] for _, kwargs in self.es.indices.delete.call_args_list])
+        self.es.delete.assert_called_once_with(index="message_rollup_state", id="state", ignore=404)
+
+    def test_apply_with_failures(self):
+        self.es.indices.get = Mock(return_value={"message_rollup-2021-02-03": {}})
+        self.es.reindex = Mock(return_value={"total": 1, "failures": [{"index": "message_rollup", "cause": {"type": "mapper_parsing_exception"}}]})
+        with self.assertRaises(RuntimeError):
+            self.migration.apply(self.es)
+        self.es.indices.delete.assert_not_called()
@@ -16,15 +16,19 @@ from __future__ import absolute_import, annotations
 
 import json
 from datetime import datetime
+from unittest import TestCase
 
+from elasticsearch import Elasticsearch
 from mock import Mock
 
 from memex_logging.common.dao.common import DocumentNotFound
 from memex_logging.common.model.analytic.analytic import Analytic
 from memex_logging.common.model.analytic.descriptor.count import UserCountDescriptor
 from memex_logging.common.model.analytic.result.count import CountResult
+from memex_logging.ws.ws import WsInterface
 from test.unit.memex_logging.common_test.common_test_ws import CommonWsTestCase
 from test.unit.memex_logging.common_test.generator.time import TimeGenerator
+from test.unit.memex_logging.common_test.mock.daos import MockDaoCollectorBuilder
 
 
 class TestAnalyticInterface(CommonWsTestCase):
@@ -75,3 +79,33 @@ class TestAnalyticInterface(CommonWsTestCase):
         self.dao_collector.analytic.delete = Mock(side_effect=Exception)
         response = self.client.delete(f"/analytic?id={analytic_id}")
         self.assertEqual(500, response.status_code)
+
+
+class TestEvaluateAnalyticInterface(TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.analytic_evaluator = Mock()
+        api = WsInterface(MockDaoCollectorBuilder.build_mock_daos(), Elasticsearch(), analytic_evaluator=self.analytic_evaluator)
+        api.get_application().testing = True
+        self.client = api.get_application().test_client()
+
+    def test_evaluate_analytic(self):
+        descriptor = UserCountDescriptor(TimeGenerator.generate_random(), "project", "total")
+        result = CountResult(1, datetime.now(), datetime.now(), datetime.now())
+        self.analytic_evaluator.evaluate = Mock(return_value=result)
+        response = self.client.post("/analytic/evaluate", json=descriptor.to_repr())
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(result.to_repr(), json.loads(response.data)["result"])
+        self.assertEqual(descriptor.to_repr(), self.analytic_evaluator.evaluate.call_args[0][0].to_repr())
+
+        response = self.client.post("/analytic/evaluate", json={})
+        self.assertEqual(400, response.status_code)
+
+        self.analytic_evaluator.evaluate = Mock(side_effect=TimeoutError)
+        response = self.client.post("/analytic/evaluate", json=descriptor.to_repr())
+        self.assertEqual(504, response.status_code)
+
+        self.analytic_evaluator.evaluate = Mock(side_effect=Exception)
+        response = self.client.post("/analytic/evaluate", json=descriptor.to_repr())
+        self.assertEqual(500, response.status_code)
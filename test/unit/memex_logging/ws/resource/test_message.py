@@ -14,14 +14,19 @@
 
 from __future__ import absolute_import, annotations
 
+import gzip
 import json
 from datetime import datetime
 
+from elasticsearch import Elasticsearch
 from mock import Mock
 
 from memex_logging.common.dao.common import DocumentNotFound
 from memex_logging.common.model.message import Message
+from memex_logging.ws.session import SessionTracker, InMemorySessionStore
+from memex_logging.ws.ws import WsInterface
 from test.unit.memex_logging.common_test.common_test_ws import CommonWsTestCase
+from test.unit.memex_logging.common_test.mock.daos import MockDaoCollectorBuilder
 
 
 class TestMessageInterface(CommonWsTestCase):
@@ -51,7 +56,7 @@ class TestMessageInterface(CommonWsTestCase):
             "type": "request"
         })
 
-        self.dao_collector.message.get = Mock(return_value=(message, trace_id))
+        self.dao_collector.message.get = Mock(return_value=(message.to_repr(), trace_id))
         response = self.client.get(f"/message?project={project}&messageId={message_id}&userId={user_id}")
         self.assertEqual(200, response.status_code)
         self.assertEqual({
@@ -160,7 +165,7 @@ class TestMessagesInterface(CommonWsTestCase):
             "type": "request"
         }]
 
-        self.dao_collector.message.add = Mock(return_value="trace_id")
+        self.dao_collector.message.add_batch = Mock(return_value=[("trace_id", None)])
         response = self.client.post("/messages", json=raw_messages)
         self.assertEqual(201, response.status_code)
         self.assertEqual({
@@ -172,10 +177,30 @@ class TestMessagesInterface(CommonWsTestCase):
         response = self.client.post("/messages")
         self.assertEqual(400, response.status_code)
 
-        self.dao_collector.message.add = Mock(side_effect=Exception)
+        self.dao_collector.message.add_batch = Mock(side_effect=Exception)
         response = self.client.post("/messages", json=raw_messages)
         self.assertEqual(500, response.status_code)
 
+        self.dao_collector.message.add_batch = Mock(return_value=[(None, "mapper_parsing_exception: failed to parse")])
+        response = self.client.post("/messages", json=raw_messages)
+        self.assertEqual(500, response.status_code)
+
+        self.dao_collector.message.add_batch = Mock(return_value=[("trace_id", None), (None, "mapper_parsing_exception: failed to parse")])
+        response = self.client.post("/messages", json=raw_messages + raw_messages)
+        self.assertEqual(207, response.status_code)
+        self.assertEqual({
+            "traceIds": ["trace_id", None],
+            "errors": [
+                {
+                    "position": 1,
+                    "messageId": "message_id",
+                    "error": "mapper_parsing_exception: failed to parse"
+                }
+            ],
+            "status": "Multi-Status: some messages could not be stored",
+            "code": 207
+        }, json.loads(response.data))
+
         raw_messages = [{
             "messageId": "message_id"
         }]
@@ -206,10 +231,16 @@ class TestMessagesInterface(CommonWsTestCase):
             "type": "request"
         })]
 
-        self.dao_collector.message.search = Mock(return_value=messages)
+        self.dao_collector.message.search = Mock(return_value=[message.to_repr() for message in messages])
         response = self.client.get(f"/messages?project={project}&fromTime={from_time}&toTime={to_time}")
         self.assertEqual(200, response.status_code)
         self.assertEqual([message.to_repr() for message in messages], json.loads(response.data))
+        self.assertTrue(self.dao_collector.message.search.call_args[1]["raw"])
+        self.assertIsNone(self.dao_collector.message.search.call_args[1]["source_includes"])
+
+        response = self.client.get(f"/messages?project={project}&fromTime={from_time}&toTime={to_time}&fields=messageId,userId")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(["messageId", "userId"], self.dao_collector.message.search.call_args[1]["source_includes"])
 
         response = self.client.get(f"/messages?project={project}&fromTime={from_time}")
         self.assertEqual(400, response.status_code)
@@ -235,6 +266,12 @@ class TestMessagesInterface(CommonWsTestCase):
         response = self.client.get(f"/messages?project={project}&fromTime={from_time}&toTime={to_time}&maxSize=10001")
         self.assertEqual(400, response.status_code)
 
+        response = self.client.get(f"/messages?project={project}&fromTime={from_time}&toTime={to_time}&maxSize=0")
+        self.assertEqual(400, response.status_code)
+
+        response = self.client.get(f"/messages?project={project}&fromTime={from_time}&toTime={to_time}&maxSize=-1&cursor=")
+        self.assertEqual(400, response.status_code)
+
         response = self.client.get(f"/messages?project={project}&fromTime={from_time}&toTime={to_time}&maxSize=30.5")
         self.assertEqual(400, response.status_code)
 
@@ -255,3 +292,230 @@ class TestMessagesInterface(CommonWsTestCase):
         to_time = "to_time"
         response = self.client.get(f"/messages?project={project}&fromTime={from_time}&toTime={to_time}")
         self.assertEqual(400, response.status_code)
+
+
+    def test_get_messages_page(self):
+        project = "project"
+        from_time = datetime(2021, 2, 4).isoformat()
+        to_time = datetime(2021, 2, 5).isoformat()
+        raw_message = {
+            "messageId": "message_id",
+            "conversationId": None,
+            "channel": "channel",
+            "userId": "user_id",
+            "timestamp": "2021-01-22T17:55:33.429203",
+            "content": {
+                "type": "action",
+                "value": "test"
+            },
+            "domain": None,
+            "intent": None,
+            "entities": [],
+            "language": None,
+            "metadata": {},
+            "project": "project",
+            "type": "request"
+        }
+
+        self.dao_collector.message.search_page = Mock(return_value=([raw_message], [1611338133429, "trace_id"]))
+        response = self.client.get(f"/messages?project={project}&fromTime={from_time}&toTime={to_time}&maxSize=1&cursor=")
+        self.assertEqual(200, response.status_code)
+        page = json.loads(response.data)
+        self.assertEqual([raw_message], page["messages"])
+        self.assertIsNone(self.dao_collector.message.search_page.call_args[1]["search_after"])
+
+        self.dao_collector.message.search_page = Mock(return_value=([], None))
+        response = self.client.get(f"/messages?project={project}&fromTime={from_time}&toTime={to_time}&maxSize=1&cursor={page['nextCursor']}")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({"messages": [], "nextCursor": None}, json.loads(response.data))
+        self.assertEqual([1611338133429, "trace_id"], self.dao_collector.message.search_page.call_args[1]["search_after"])
+
+        response = self.client.get(f"/messages?project={project}&fromTime={from_time}&toTime={to_time}&cursor=malformed")
+        self.assertEqual(400, response.status_code)
+
+
+class TestMessagesExportInterface(CommonWsTestCase):
+
+    def test_export_messages(self):
+        project = "project"
+        from_time = datetime(2021, 2, 4).isoformat()
+        to_time = datetime(2021, 2, 5).isoformat()
+
+        messages = [Message.from_repr({
+            "messageId": f"message_id_{i}",
+            "conversationId": None,
+            "channel": "channel",
+            "userId": "user_id",
+            "timestamp": "2021-01-22T17:55:33.429203",
+            "content": {
+                "type": "action",
+                "value": "test"
+            },
+            "domain": None,
+            "intent": None,
+            "entities": [],
+            "language": None,
+            "metadata": {},
+            "project": "project",
+            "type": "request"
+        }) for i in range(3)]
+
+        self.dao_collector.message.scan = Mock(return_value=iter([message.to_repr() for message in messages]))
+        response = self.client.get(f"/messages/export?project={project}&fromTime={from_time}&toTime={to_time}")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("application/x-ndjson", response.mimetype)
+        self.assertEqual([message.to_repr() for message in messages], [json.loads(line) for line in response.data.decode("utf-8").splitlines()])
+
+        self.dao_collector.message.scan = Mock(return_value=iter([message.to_repr() for message in messages]))
+        response = self.client.get(f"/messages/export?project={project}&fromTime={from_time}&toTime={to_time}", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("gzip", response.headers["Content-Encoding"])
+        self.assertEqual([message.to_repr() for message in messages], [json.loads(line) for line in gzip.decompress(response.data).decode("utf-8").splitlines()])
+
+        response = self.client.get(f"/messages/export?project={project}&fromTime={from_time}")
+        self.assertEqual(400, response.status_code)
+
+        response = self.client.get(f"/messages/export?fromTime={from_time}&toTime={to_time}")
+        self.assertEqual(400, response.status_code)
+
+        self.dao_collector.message.scan = Mock(side_effect=ValueError)
+        response = self.client.get(f"/messages/export?project={project}&fromTime={to_time}&toTime={from_time}")
+        self.assertEqual(400, response.status_code)
+
+    def test_export_messages_failure(self):
+        project = "project"
+        from_time = datetime(2021, 2, 4).isoformat()
+        to_time = datetime(2021, 2, 5).isoformat()
+
+        def failing_scan(fail_after: int):
+            for i in range(fail_after):
+                yield {"messageId": f"message_id_{i}", "project": project}
+            raise ConnectionError("Elasticsearch unavailable")
+
+        self.dao_collector.message.scan = Mock(return_value=failing_scan(0))
+        response = self.client.get(f"/messages/export?project={project}&fromTime={from_time}&toTime={to_time}")
+        self.assertEqual(500, response.status_code)
+
+        self.dao_collector.message.scan = Mock(return_value=failing_scan(2))
+        response = self.client.get(f"/messages/export?project={project}&fromTime={from_time}&toTime={to_time}", buffered=False)
+        self.assertEqual(200, response.status_code)
+        with self.assertRaises(ConnectionError):
+            b"".join(response.response)
+
+        self.dao_collector.message.scan = Mock(return_value=iter([]))
+        response = self.client.get(f"/messages/export?project={project}&fromTime={from_time}&toTime={to_time}")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(b"", response.data)
+
+
+class TestMessagesInterfaceWriteBehind(CommonWsTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.dao_collector = MockDaoCollectorBuilder.build_mock_daos()
+        self.write_behind_buffer = Mock()
+        self.write_behind_buffer.max_size = 10000
+        api = WsInterface(self.dao_collector, Elasticsearch(), write_behind_buffer=self.write_behind_buffer)
+        api.get_application().testing = True
+        self.client = api.get_application().test_client()
+
+    def test_post_messages(self):
+        raw_messages = [{
+            "messageId": "message_id",
+            "conversationId": None,
+            "channel": "channel",
+            "userId": "user_id",
+            "timestamp": "2021-01-22T17:55:33.429203",
+            "content": {
+                "type": "action",
+                "value": "test"
+            },
+            "domain": None,
+            "intent": None,
+            "entities": [],
+            "language": None,
+            "metadata": {},
+            "project": "project",
+            "type": "request"
+        }]
+
+        self.write_behind_buffer.put = Mock(return_value=True)
+        response = self.client.post("/messages", json=raw_messages)
+        self.assertEqual(202, response.status_code)
+        trace_ids = json.loads(response.data)["traceIds"]
+        self.assertEqual(1, len(trace_ids))
+        actions = self.write_behind_buffer.put.call_args[0][0]
+        self.assertEqual(1, len(actions))
+        self.assertEqual("message-2021-01-22", actions[0]["_index"])
+        self.assertEqual(trace_ids[0], actions[0]["_id"])
+        self.assertEqual(raw_messages[0], actions[0]["_source"])
+
+        self.write_behind_buffer.put = Mock(return_value=False)
+        response = self.client.post("/messages", json=raw_messages)
+        self.assertEqual(429, response.status_code)
+
+    def test_post_messages_larger_than_buffer(self):
+        raw_messages = [{
+            "messageId": f"message_id_{position}",
+            "conversationId": None,
+            "channel": "channel",
+            "userId": "user_id",
+            "timestamp": "2021-01-22T17:55:33.429203",
+            "content": {
+                "type": "action",
+                "value": "test"
+            },
+            "domain": None,
+            "intent": None,
+            "entities": [],
+            "language": None,
+            "metadata": {},
+            "project": "project",
+            "type": "request"
+        } for position in range(3)]
+
+        # the batch would never be accepted by the buffer, so it is stored synchronously instead of being rejected
+        self.write_behind_buffer.max_size = 2
+        self.write_behind_buffer.put = Mock(return_value=False)
+        self.dao_collector.message.add_batch = Mock(return_value=[("trace_id_1", None), ("trace_id_2", None), ("trace_id_3", None)])
+        response = self.client.post("/messages", json=raw_messages)
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(["trace_id_1", "trace_id_2", "trace_id_3"], json.loads(response.data)["traceIds"])
+        self.write_behind_buffer.put.assert_not_called()
+
+
+class TestMessagesInterfaceSessionTracking(CommonWsTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.dao_collector = MockDaoCollectorBuilder.build_mock_daos()
+        api = WsInterface(self.dao_collector, Elasticsearch(), session_tracker=SessionTracker(InMemorySessionStore()))
+        api.get_application().testing = True
+        self.client = api.get_application().test_client()
+
+    def test_post_messages(self):
+        raw_messages = [{
+            "messageId": f"message_id_{position}",
+            "conversationId": None,
+            "channel": "channel",
+            "userId": "user_id",
+            "timestamp": timestamp,
+            "content": {
+                "type": "action",
+                "value": "test"
+            },
+            "domain": None,
+            "intent": None,
+            "entities": [],
+            "language": None,
+            "metadata": {},
+            "project": "project",
+            "type": "request"
+        } for position, timestamp in enumerate(["2021-01-22T17:55:33.429203", "2021-01-22T17:56:33.429203"])]
+
+        self.dao_collector.message.add_batch = Mock(return_value=[("trace_id_1", None), ("trace_id_2", None)])
+        response = self.client.post("/messages", json=raw_messages)
+        self.assertEqual(201, response.status_code)
+        messages = self.dao_collector.message.add_batch.call_args[0][0]
+        self.assertIsNotNone(messages[0].conversation_id)
+        self.assertEqual(messages[0].conversation_id, messages[1].conversation_id)
@@ -0,0 +1,128 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+from unittest import TestCase
+
+from elasticsearch import Elasticsearch
+from elasticsearch.exceptions import ConnectionError, RequestError
+from mock import Mock
+
+from memex_logging.ws.buffer import WriteBehindBuffer
+
+
+class TestWriteBehindBuffer(TestCase):
+
+    @staticmethod
+    def _build_actions(number: int) -> list:
+        return [{"_op_type": "index", "_index": "message-2021-01-22", "_id": f"trace_id_{i}", "_source": {"messageId": f"message_id_{i}"}} for i in range(number)]
+
+    def test_put_and_flush(self):
+        es = Elasticsearch()
+        es.bulk = Mock(side_effect=lambda body, *args, **kwargs: {
+            "took": 1,
+            "errors": False,
+            "items": [{"index": {"_id": f"trace_id_{i}", "status": 201}} for i in range(body.count("\n") // 2)]
+        })
+        buffer = WriteBehindBuffer(es, max_size=10, batch_size=4, flush_interval=60)
+
+        self.assertTrue(buffer.put(self._build_actions(6)))
+        self.assertTrue(buffer.flush(timeout=5))
+        self.assertEqual(2, es.bulk.call_count)
+
+        stats = buffer.stats()
+        self.assertEqual(0, stats["depth"])
+        self.assertEqual(6, stats["accepted"])
+        self.assertEqual(6, stats["flushed"])
+        self.assertEqual(2, stats["flushes"])
+        buffer.close()
+
+    def test_backpressure(self):
+        es = Elasticsearch()
+        es.bulk = Mock()
+        buffer = WriteBehindBuffer(es, max_size=5, batch_size=10, flush_interval=60)
+
+        self.assertTrue(buffer.put(self._build_actions(3)))
+        self.assertFalse(buffer.put(self._build_actions(3)))
+        self.assertEqual(3, buffer.stats()["depth"])
+        self.assertEqual(3, buffer.stats()["rejected"])
+        es.bulk.assert_not_called()
+
+        es.bulk.return_value = {"took": 1, "errors": False, "items": [{"index": {"_id": f"trace_id_{i}", "status": 201}} for i in range(3)]}
+        buffer.close()
+
+    def test_close_flushes_pending_actions(self):
+        es = Elasticsearch()
+        es.bulk = Mock(return_value={
+            "took": 1,
+            "errors": False,
+            "items": [{"index": {"_id": "trace_id_0", "status": 201}}, {"index": {"_id": "trace_id_1", "status": 201}}]
+        })
+        buffer = WriteBehindBuffer(es, max_size=5, batch_size=10, flush_interval=60)
+
+        self.assertTrue(buffer.put(self._build_actions(2)))
+        buffer.close()
+        es.bulk.assert_called_once()
+        self.assertEqual(2, buffer.stats()["flushed"])
+        self.assertFalse(buffer.put(self._build_actions(1)))
+
+    def test_non_transient_error_drops_batch(self):
+        es = Elasticsearch()
+        es.bulk = Mock(side_effect=[
+            RequestError(400, "mapper_parsing_exception", {}),
+            {"took": 1, "errors": False, "items": [{"index": {"_id": "trace_id_0", "status": 201}}, {"index": {"_id": "trace_id_1", "status": 201}}]}
+        ])
+        buffer = WriteBehindBuffer(es, max_size=10, batch_size=2, flush_interval=0.01)
+
+        self.assertTrue(buffer.put(self._build_actions(4)))
+        self.assertTrue(buffer.flush(timeout=5))
+        self.assertEqual(2, es.bulk.call_count)
+
+        stats = buffer.stats()
+        self.assertEqual(0, stats["depth"])
+        self.assertEqual(2, stats["failed"])
+        self.assertEqual(2, stats["flushed"])
+        buffer.close()
+
+    def test_transient_error_retries_batch(self):
+        es = Elasticsearch()
+        es.bulk = Mock(side_effect=[
+            ConnectionError("N/A", "connection refused", Exception()),
+            {"took": 1, "errors": False, "items": [{"index": {"_id": "trace_id_0", "status": 201}}, {"index": {"_id": "trace_id_1", "status": 201}}]}
+        ])
+        buffer = WriteBehindBuffer(es, max_size=10, batch_size=2, flush_interval=0.01)
+
+        self.assertTrue(buffer.put(self._build_actions(2)))
+        self.assertTrue(buffer.flush(timeout=5))
+        self.assertEqual(2, es.bulk.call_count)
+
+        stats = buffer.stats()
+        self.assertEqual(0, stats["failed"])
+        self.assertEqual(2, stats["flushed"])
+        buffer.close()
+
+    def test_transient_error_attempts_are_capped(self):
+        es = Elasticsearch()
+        es.bulk = Mock(side_effect=ConnectionError("N/A", "connection refused", Exception()))
+        buffer = WriteBehindBuffer(es, max_size=10, batch_size=2, flush_interval=0.01, max_attempts=3)
+
+        self.assertTrue(buffer.put(self._build_actions(2)))
+        self.assertTrue(buffer.flush(timeout=5))
+        self.assertEqual(3, es.bulk.call_count)
+
+        stats = buffer.stats()
+        self.assertEqual(0, stats["depth"])
+        self.assertEqual(2, stats["failed"])
+        buffer.close()
@@ -0,0 +1,70 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, annotations
+
+from datetime import datetime
+from unittest import TestCase
+
+from elasticsearch import Elasticsearch
+from mock import Mock
+
+from memex_logging.common.dao.analytic import AnalyticDao
+from memex_logging.common.model.analytic.analytic import Analytic
+from memex_logging.common.model.analytic.descriptor.count import UserCountDescriptor
+from memex_logging.common.model.analytic.result.count import CountResult
+from memex_logging.common.model.analytic.time import FixedTimeWindow
+from memex_logging.ws.cache import AnalyticCache
+
+
+class TestAnalyticCache(TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.analytic_dao = AnalyticDao(Elasticsearch())
+        self.analytic = Analytic("analytic_id", UserCountDescriptor(FixedTimeWindow(datetime(2021, 1, 1), datetime(2021, 12, 31)), "project", "total"),
+                                 result=CountResult(1, datetime(2022, 1, 1), datetime(2021, 1, 1), datetime(2021, 12, 31)))
+        self.analytic_dao.get = Mock(return_value=self.analytic)
+        self.analytic_dao.get_version = Mock(return_value=1)
+
+    def test_get(self):
+        analytic_cache = AnalyticCache(self.analytic_dao, version_check_interval=60)
+        self.assertEqual(self.analytic, analytic_cache.get("analytic_id"))
+        self.assertEqual(self.analytic, analytic_cache.get("analytic_id"))
+        self.analytic_dao.get.assert_called_once()
+        self.analytic_dao.get_version.assert_called_once()
+
+        stats = analytic_cache.stats()
+        self.assertEqual(1, stats["hits"])
+        self.assertEqual(1, stats["misses"])
+        self.assertEqual(1, stats["version"])
+
+    def test_get_with_new_version(self):
+        analytic_cache = AnalyticCache(self.analytic_dao, version_check_interval=0)
+        analytic_cache.get("analytic_id")
+        analytic_cache.get("analytic_id")
+        self.analytic_dao.get.assert_called_once()
+
+        self.analytic_dao.get_version = Mock(return_value=2)
+        analytic_cache.get("analytic_id")
+        self.assertEqual(2, self.analytic_dao.get.call_count)
+        self.assertEqual(1, analytic_cache.stats()["invalidations"])
+
+    def test_invalidate(self):
+        analytic_cache = AnalyticCache(self.analytic_dao, version_check_interval=60)
+        analytic_cache.get("analytic_id")
+        analytic_cache.invalidate("analytic_id")
+        analytic_cache.get("analytic_id")
+        self.assertEqual(2, self.analytic_dao.get.call_count)
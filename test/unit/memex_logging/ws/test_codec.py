@@ -0,0 +1,60 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, annotations
+
+import importlib.util
+from unittest import TestCase, skipUnless
+
+from flask import Flask, request
+
+from memex_logging.ws.codec import StdlibJsonCodec, OrjsonCodec, build_codec
+
+
+class TestJsonCodec(TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.data = {"messageId": "message_id", "content": {"type": "text", "value": "città"}, "entities": [{"confidence": 0.8}], "metadata": None}
+
+    def test_stdlib(self):
+        codec = StdlibJsonCodec()
+        self.assertEqual(self.data, codec.loads(codec.dumps(self.data)))
+        self.assertEqual(self.data, codec.loads(codec.dumps(self.data).decode("utf-8")))
+
+    @skipUnless(importlib.util.find_spec("orjson") is not None, "orjson is not installed")
+    def test_orjson(self):
+        codec = OrjsonCodec()
+        self.assertEqual(self.data, codec.loads(codec.dumps(self.data)))
+        self.assertEqual(self.data, StdlibJsonCodec().loads(codec.dumps(self.data)))
+        self.assertEqual({"1": 2 ** 70}, codec.loads(codec.dumps({1: 2 ** 70})))
+
+    def test_build_codec(self):
+        self.assertIsInstance(build_codec("stdlib"), StdlibJsonCodec)
+        self.assertIsInstance(build_codec("auto"), OrjsonCodec if importlib.util.find_spec("orjson") is not None else StdlibJsonCodec)
+        with self.assertRaises(ValueError):
+            build_codec("other")
+
+    def test_request_class(self):
+        app = Flask("test")
+        app.request_class = StdlibJsonCodec().build_request_class()
+
+        @app.route("/", methods=["POST"])
+        def echo():
+            return {"body": request.json}
+
+        client = app.test_client()
+        self.assertEqual({"body": self.data}, client.post("/", json=self.data).get_json())
+        self.assertEqual({"body": None}, client.post("/", data="text").get_json())
+        self.assertEqual(400, client.post("/", data="{", content_type="application/json").status_code)
@@ -0,0 +1,107 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, annotations
+
+import time
+from datetime import datetime
+from threading import Event, Thread
+from unittest import TestCase
+
+from mock import Mock
+
+from memex_logging.common.model.analytic.descriptor.count import UserCountDescriptor
+from memex_logging.common.model.analytic.result.count import CountResult
+from memex_logging.common.model.analytic.time import FixedTimeWindow
+from memex_logging.ws.evaluator import AnalyticEvaluator
+
+
+class TestAnalyticEvaluator(TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.descriptor = UserCountDescriptor(FixedTimeWindow(datetime(2021, 1, 1), datetime(2021, 12, 31)), "project", "total")
+        self.result = CountResult(1, datetime(2022, 1, 1), datetime(2021, 1, 1), datetime(2021, 12, 31))
+        self.computation = Mock()
+        self.computation.get_result = Mock(return_value=self.result)
+
+    def test_evaluate(self):
+        computation_builder = Mock(return_value=self.computation)
+        evaluator = AnalyticEvaluator(computation_builder)
+        self.assertEqual(self.result, evaluator.evaluate(self.descriptor))
+        self.assertEqual(self.result, evaluator.evaluate(UserCountDescriptor.from_repr(self.descriptor.to_repr())))
+        computation_builder.assert_called_once()
+        self.computation.get_result.assert_called_once()
+        self.assertEqual(1, evaluator.stats()["hits"])
+
+        evaluator.evaluate(UserCountDescriptor(self.descriptor.time_span, "project", "active"))
+        self.assertEqual(2, self.computation.get_result.call_count)
+        evaluator.close()
+
+    def test_evaluate_failure(self):
+        self.computation.get_result = Mock(side_effect=ValueError)
+        evaluator = AnalyticEvaluator(Mock(return_value=self.computation))
+        with self.assertRaises(ValueError):
+            evaluator.evaluate(self.descriptor)
+        self.assertEqual(0, evaluator.stats()["size"])
+        evaluator.close()
+
+    def test_evaluate_timeout(self):
+        release = Event()
+
+        def get_result(descriptor):
+            release.wait(5)
+            return self.result
+
+        self.computation.get_result = Mock(side_effect=get_result)
+        evaluator = AnalyticEvaluator(Mock(return_value=self.computation), timeout=0.01)
+        with self.assertRaises(TimeoutError):
+            evaluator.evaluate(self.descriptor)
+        self.assertEqual(1, evaluator.stats()["timeouts"])
+
+        # the result computed after the timeout is cached for the following evaluations
+        release.set()
+        evaluator._executor.shutdown(wait=True)
+        self.assertEqual(1, evaluator.stats()["size"])
+
+    def test_evaluate_concurrently(self):
+        started = Event()
+        release = Event()
+
+        def get_result(descriptor):
+            started.set()
+            release.wait(5)
+            return self.result
+
+        self.computation.get_result = Mock(side_effect=get_result)
+        evaluator = AnalyticEvaluator(Mock(return_value=self.computation))
+        results = []
+        first = Thread(target=lambda: results.append(evaluator.evaluate(self.descriptor)))
+        first.start()
+        self.assertTrue(started.wait(5))
+
+        # the second evaluation waits for the computation started by the first one
+        second = Thread(target=lambda: results.append(evaluator.evaluate(UserCountDescriptor.from_repr(self.descriptor.to_repr()))))
+        second.start()
+        deadline = time.monotonic() + 5
+        while evaluator.stats()["misses"] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        first.join(5)
+        second.join(5)
+        self.assertEqual([self.result, self.result], results)
+        self.computation.get_result.assert_called_once()
+        self.assertEqual({}, evaluator._in_flight)
+        evaluator.close()
@@ -0,0 +1,105 @@
+# Copyright 2021 U-Hopper srl
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import absolute_import, annotations
+
+import importlib.util
+import json
+from datetime import datetime, timedelta
+from unittest import TestCase, skipUnless
+
+from mock import Mock, MagicMock
+
+from memex_logging.common.model.message import RequestMessage, ResponseMessage, TextualRequest, TextualResponse
+from memex_logging.ws.session import SessionTracker, InMemorySessionStore, RedisSessionStore, Session
+
+
+class TestSessionTracker(TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.store = InMemorySessionStore()
+        self.tracker = SessionTracker(self.store, timeout=3600)
+
+    @staticmethod
+    def _build_request(message_id: str, timestamp: datetime, user_id: str = "user_id", conversation_id: str = None) -> RequestMessage:
+        return RequestMessage(message_id, conversation_id, "channel", user_id, timestamp, TextualRequest("text"), None, None, [], None, None, "project")
+
+    def test_assign(self):
+        first_message = self._build_request("message_id_1", datetime(2021, 1, 22, 17, 0))
+        second_message = self._build_request("message_id_2", datetime(2021, 1, 22, 17, 30))
+        other_user_message = self._build_request("message_id_3", datetime(2021, 1, 22, 17, 30), user_id="other_user_id")
+        self.tracker.assign([first_message, second_message, other_user_message])
+        self.assertIsNotNone(first_message.conversation_id)
+        self.assertEqual(first_message.conversation_id, second_message.conversation_id)
+        self.assertNotEqual(first_message.conversation_id, other_user_message.conversation_id)
+
+        following_message = self._build_request("message_id_4", datetime(2021, 1, 22, 18, 0))
+        self.tracker.assign([following_message])
+        self.assertEqual(first_message.conversation_id, following_message.conversation_id)
+
+        late_message = self._build_request("message_id_5", datetime(2021, 1, 22, 20, 0))
+        self.tracker.assign([late_message])
+        self.assertNotEqual(first_message.conversation_id, late_message.conversation_id)
+
+    def test_assign_with_conversation(self):
+        message = self._build_request("message_id_1", datetime(2021, 1, 22, 17, 0), conversation_id="conversation_id")
+        self.tracker.assign([message])
+        self.assertEqual("conversation_id", message.conversation_id)
+        self.assertEqual(0, self.tracker.stats()["size"])
+
+    def test_assign_out_of_order(self):
+        start = datetime(2021, 1, 22, 17, 0)
+        messages = [self._build_request(f"message_id_{minutes}", start + timedelta(minutes=minutes)) for minutes in [50, 0, 100, 150, 30]]
+        self.tracker.assign(messages)
+        self.assertEqual(1, len({message.conversation_id for message in messages}))
+
+        # the messages sent long before the tracked conversation are not part of it
+        old_message = self._build_request("message_id_old", start - timedelta(hours=2))
+        self.tracker.assign([old_message])
+        self.assertNotEqual(messages[0].conversation_id, old_message.conversation_id)
+        following_message = self._build_request("message_id_following", start + timedelta(minutes=160))
+        self.tracker.assign([following_message])
+        self.assertEqual(messages[0].conversation_id, following_message.conversation_id)
+
+        # the messages sent shortly before the tracked conversation are part of it
+        early_message = self._build_request("message_id_early", start - timedelta(minutes=30))
+        self.tracker.assign([early_message])
+        self.assertEqual(messages[0].conversation_id, early_message.conversation_id)
+
+    def test_assign_with_timezones(self):
+        first_message = self._build_request("message_id_1", datetime(2021, 1, 22, 17, 0))
+        second_message = ResponseMessage("message_id_2", None, "channel", "user_id", "message_id_1", datetime.fromisoformat("2021-01-22T18:10:00+01:00"), TextualResponse("text", None), None, "project")
+        self.tracker.assign([first_message, second_message])
+        self.assertEqual(first_message.conversation_id, second_message.conversation_id)
+
+
+@skipUnless(importlib.util.find_spec("redis") is not None, "the Redis client is not installed")
+class TestRedisSessionStore(TestCase):
+
+    def test_update(self):
+        session = Session("conversation_id", 1.0, 2.0)
+        pipeline = MagicMock()
+        pipeline.__enter__ = Mock(return_value=pipeline)
+        pipeline.get = Mock(return_value=json.dumps(session.to_repr()))
+        client = Mock()
+        client.pipeline = Mock(return_value=pipeline)
+
+        store = RedisSessionStore(client, ttl=60)
+        updated_session = store.update("project:user_id", lambda current: Session(current.conversation_id, current.first_timestamp, 3.0))
+        self.assertEqual(Session("conversation_id", 1.0, 3.0), updated_session)
+        pipeline.watch.assert_called_once_with("session:project:user_id")
+        pipeline.set.assert_called_once_with("session:project:user_id", json.dumps(updated_session.to_repr()), ex=60)
+        pipeline.execute.assert_called_once()